@@ -0,0 +1,81 @@
+"""
+bench_chunking.py
+Compara la ruta de una sola llamada con la ruta por fragmentos (map-reduce)
+para documentos largos, usando un modelo simulado con latencia proporcional
+a los tokens de entrada.
+
+Uso:
+    python benchmarks/bench_chunking.py --pages 100 --chunk-tokens 6000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier  # noqa: E402
+from chunking import estimate_tokens  # noqa: E402
+
+PAGE = (
+    "En el año 1998 llegaron hombres armados a la vereda. "
+    "Se llevaron a mi hermano y nunca más supimos de él. "
+    "Tuvimos que salir hacia Medellín con lo que teníamos puesto. "
+) * 12  # ~2 KB por página
+
+RESPONSE = json.dumps({
+    "tipo_documento": "TD2", "tipo_hecho": ["TH1", "TH3"],
+    "territorio": ["Antioquia"], "periodo": "PER2",
+    "actores": ["ACT5"], "ruteo": "RU1", "highlights": ["se llevaron a mi hermano"],
+})
+
+
+def make_fake_llm(stats, base_ms, ms_per_1k_tokens, context_limit):
+    async def fake(system_prompt, user_prompt):
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        stats["calls"] += 1
+        stats["prompt_tokens"] += tokens
+        if tokens > context_limit:
+            raise RuntimeError(f"context_length_exceeded ({tokens} > {context_limit})")
+        await asyncio.sleep((base_ms + ms_per_1k_tokens * tokens / 1000) / 1000)
+        return RESPONSE
+    return fake
+
+
+def run(text, chunk_tokens, args):
+    stats = {"calls": 0, "prompt_tokens": 0, "error": None}
+    fake = make_fake_llm(stats, args.base_ms, args.ms_per_1k_tokens, args.context_limit)
+    start = time.perf_counter()
+    with patch.object(classifier, "CHUNK_TOKENS", chunk_tokens), \
+         patch.object(classifier, "call_llm_async", new=fake):
+        try:
+            asyncio.run(classifier.classify_document_async(text))
+        except RuntimeError as e:
+            stats["error"] = str(e)
+    stats["latency_ms"] = (time.perf_counter() - start) * 1000
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--chunk-tokens", type=int, default=classifier.CHUNK_TOKENS)
+    parser.add_argument("--base-ms", type=float, default=400.0)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=60.0)
+    parser.add_argument("--context-limit", type=int, default=128_000)
+    args = parser.parse_args()
+
+    text = PAGE * args.pages
+    print(f"Documento: {len(text) / 1024:.0f} KB, ~{estimate_tokens(text)} tokens")
+    print(f"{'modo':<12}{'llamadas':>10}{'tokens entrada':>16}{'latencia ms':>14}  error")
+    for name, budget in (("una llamada", 10 ** 9), ("fragmentos", args.chunk_tokens)):
+        s = run(text, budget, args)
+        print(f"{name:<12}{s['calls']:>10}{s['prompt_tokens']:>16}{s['latency_ms']:>14.0f}  {s['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
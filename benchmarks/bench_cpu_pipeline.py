@@ -0,0 +1,212 @@
+"""
+bench_cpu_pipeline.py
+Reproceso (replay) de un corpus con el modelo servido desde la caché:
+etapas de CPU en el proceso principal frente a pipeline.py (pool de
+procesos) con 1..N procesos.
+
+Una pasada previa, fuera de la medida, clasifica --unique documentos
+distintos con el backend local y deja sus respuestas en una
+ClassificationCache en memoria. El reproceso recorre --docs documentos
+(el corpus único repetido): ninguna llamada llega al modelo, así que el
+lote queda limitado por la CPU. Cada bloque de --block documentos se
+guarda con db.save_many contra pg_standin (adaptadores reales de psycopg2,
+sin servidor).
+
+- baseline: classify_documents_async + save_many (highlights en el guardado)
+- pipeline: classify_stream con CPUPool(N); save_many recibe los spans
+  calculados en el pool
+
+Por ejecución informa docs/s y el tiempo de CPU por documento del proceso
+principal (bucle asyncio: caché, guardado) y de los procesos del pool. Con
+esos costes proyecta los docs/s con --project-cores núcleos: el proceso
+principal es serie y los procesos del pool se reparten el resto
+(docs/s = 1 / max(CPU principal, CPU pool / núcleos)). Es una proyección,
+no una medida, salvo que la máquina tenga esos núcleos.
+
+Uso:
+    python benchmarks/bench_cpu_pipeline.py --docs 20000 --processes 1,2,4
+    python benchmarks/bench_cpu_pipeline.py --docs 1000000 --processes 8 --project-cores 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier  # noqa: E402
+import db  # noqa: E402
+from backends import RuleBasedBackend  # noqa: E402
+from cache import ClassificationCache  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from pg_standin import StandInConnection, StandInStats  # noqa: E402
+from pipeline import CPUPool, classify_stream  # noqa: E402
+
+
+def _cpu() -> Dict[str, float]:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"parent": own.ru_utime + own.ru_stime, "children": children.ru_utime + children.ru_stime}
+
+
+def _replay(unique: List[str], docs: int):
+    return (unique[n % len(unique)] for n in range(docs))
+
+
+async def _baseline(texts, concurrency: int, block: int) -> int:
+    errors = 0
+    pending: List[str] = []
+
+    async def flush():
+        nonlocal errors
+        results = await classifier.classify_documents_async(pending, concurrency=concurrency)
+        ok = [(text, r["classification"]) for text, r in zip(pending, results) if r["error"] is None]
+        errors += len(pending) - len(ok)
+        await asyncio.to_thread(db.save_many, ok)
+        pending.clear()
+
+    for text in texts:
+        pending.append(text)
+        if len(pending) >= block:
+            await flush()
+    if pending:
+        await flush()
+    return errors
+
+
+async def _pipelined(texts, pool: CPUPool, concurrency: int, block: int) -> int:
+    errors = 0
+    inputs: Dict[int, str] = {}
+    saves: List[asyncio.Task] = []
+    pending: List[dict] = []
+    slots = asyncio.Semaphore(2)  # guardados en curso
+
+    async def save(rows):
+        try:
+            await asyncio.to_thread(db.save_many, rows)
+        finally:
+            slots.release()
+
+    def indexed():
+        for index, text in enumerate(texts):
+            inputs[index] = text
+            yield text
+
+    async for result in classify_stream(indexed(), pool, concurrency, locate=True):
+        text = inputs.pop(result["index"])
+        if result["error"] is not None:
+            errors += 1
+            continue
+        pending.append({"text": text, "classification": result["classification"], "spans": result["spans"]})
+        if len(pending) >= block:
+            await slots.acquire()
+            saves.append(asyncio.ensure_future(save(pending)))
+            pending = []
+    if pending:
+        await slots.acquire()
+        saves.append(asyncio.ensure_future(save(pending)))
+    await asyncio.gather(*saves)
+    return errors
+
+
+def run(mode: str, processes: int, unique: List[str], args: argparse.Namespace) -> dict:
+    backend = classifier.get_backend()
+    calls = backend.calls
+    before = _cpu()
+    start = time.perf_counter()
+    texts = _replay(unique, args.docs)
+    if processes == 0:
+        errors = asyncio.run(_baseline(texts, args.concurrency, args.block))
+    else:
+        with CPUPool(processes, batch_size=args.batch_size) as pool:
+            errors = asyncio.run(_pipelined(texts, pool, args.concurrency, args.block))
+    elapsed = time.perf_counter() - start
+    after = _cpu()
+    parent_us = (after["parent"] - before["parent"]) * 1e6 / args.docs
+    worker_us = (after["children"] - before["children"]) * 1e6 / args.docs
+    return {
+        "mode": mode,
+        "processes": processes,
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_s": round(args.docs / elapsed, 1),
+        "parent_cpu_us_per_doc": round(parent_us, 1),
+        "worker_cpu_us_per_doc": round(worker_us, 1),
+        "llm_calls": backend.calls - calls,
+        "errors": errors,
+    }
+
+
+def project(row: dict, cores: int) -> float:
+    """docs/s con `cores` núcleos: uno para el proceso principal, el resto para el pool."""
+    if row["processes"] == 0:
+        busiest = row["parent_cpu_us_per_doc"]  # todo en un núcleo (GIL)
+    else:
+        pool_cores = min(row["processes"], max(1, cores - 1))
+        busiest = max(row["parent_cpu_us_per_doc"], row["worker_cpu_us_per_doc"] / pool_cores)
+    return round(1e6 / busiest, 1) if busiest else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000, help="Documentos del reproceso")
+    parser.add_argument("--unique", type=int, default=2000, help="Documentos distintos (en caché)")
+    parser.add_argument("--doc-bytes", type=int, default=2048)
+    parser.add_argument("--processes", type=str, default="1,2,4", help="Procesos del pool a medir")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documentos por envío al pool")
+    parser.add_argument("--block", type=int, default=500, help="Documentos por save_many")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--project-cores", type=int, default=8)
+    parser.add_argument("--skip-baseline", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    unique = list(generate_corpus(args.unique, args.doc_bytes, args.seed))
+    classifier.set_backend(RuleBasedBackend())
+    cache = ClassificationCache(":memory:", memory_entries=args.unique * 2)
+    classifier.set_cache(cache)
+    asyncio.run(classifier.classify_documents_async(unique, concurrency=args.concurrency))
+
+    stats = StandInStats()
+    db.close_pool()
+    rows = []
+    with patch.object(db, "get_connection", lambda: StandInConnection(stats, 0.0)):
+        if not args.skip_baseline:
+            rows.append(run("baseline", 0, unique, args))
+        for n in args.processes.split(","):
+            rows.append(run("pipeline", int(n), unique, args))
+        db.close_pool()
+
+    base = rows[0]
+    for row in rows:
+        row["speedup"] = round(row["docs_per_s"] / base["docs_per_s"], 2)
+        row[f"projected_docs_per_s_{args.project_cores}_cores"] = project(row, args.project_cores)
+    projected = [row[f"projected_docs_per_s_{args.project_cores}_cores"] for row in rows]
+    print(json.dumps({
+        "docs": args.docs,
+        "unique": args.unique,
+        "doc_bytes": args.doc_bytes,
+        "cpus": os.cpu_count(),
+        "db_rows": stats.rows,
+        "runs": rows,
+        "projection": {
+            "cores": args.project_cores,
+            "measured": os.cpu_count() >= args.project_cores,
+            "speedup_vs_first_run": round(max(projected) / projected[0], 2) if projected[0] else None,
+            "hours_per_1m_docs": {row["mode"] + str(row["processes"] or ""): round(1e6 / p / 3600, 2)
+                                  for row, p in zip(rows, projected) if p},
+        },
+    }, indent=2))
+    classifier.set_cache(None)
+    classifier.set_backend(None)
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+bench_dedup.py
+Mide la detección de casi duplicados (dedup.py) sobre el corpus sintético.
+
+1. Exactitud: se indexan N documentos originales y se consultan copias con
+   distintos niveles de ruido de OCR (caracteres sustituidos) más otros
+   tantos documentos nuevos. Informa recall (copias detectadas) y
+   precisión (detecciones que eran copias) por nivel de ruido.
+2. Escalado: latencia de consulta (p50/p95) y candidatos por consulta al
+   crecer el índice (se rellena con firmas aleatorias, que no colisionan
+   con los documentos reales). Si la búsqueda es sublineal, la latencia
+   apenas cambia entre tamaños.
+
+Uso:
+    python benchmarks/bench_dedup.py --docs 500 --sizes 10000,100000,1000000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from corpus import generate_corpus  # noqa: E402
+from dedup import NUM_PERM, DedupIndex  # noqa: E402
+from preprocessing import preprocess_text  # noqa: E402
+from runner import percentile  # noqa: E402
+
+
+NOISE_LEVELS = (0.0, 0.002, 0.005, 0.01, 0.02)
+_OCR_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789 .,"
+
+
+def add_noise(text: str, ratio: float, rng: random.Random) -> str:
+    """Sustituye una fracción `ratio` de los caracteres, como el OCR."""
+    chars = list(text)
+    for i in rng.sample(range(len(chars)), int(len(chars) * ratio)):
+        chars[i] = rng.choice(_OCR_CHARS)
+    return "".join(chars)
+
+
+def accuracy(docs: int, doc_bytes: int, threshold: float, seed: int) -> dict:
+    originals = list(generate_corpus(docs, doc_bytes, seed))
+    unseen = list(generate_corpus(docs, doc_bytes, seed + 1))
+    index = DedupIndex(":memory:", threshold=threshold)
+    for n, text in enumerate(originals):
+        index.add(index.signature(preprocess_text(text)), input=str(n))
+
+    rng = random.Random(seed)
+    false_hits = sum(index.query(index.signature(preprocess_text(text))) is not None for text in unseen)
+    report = {"false_positive_rate": round(false_hits / docs, 4)}
+    for ratio in NOISE_LEVELS:
+        start = time.perf_counter()
+        found = 0
+        for n, text in enumerate(originals):
+            match = index.query(index.signature(preprocess_text(add_noise(text, ratio, rng))))
+            found += match is not None and match.input == str(n)
+        elapsed = time.perf_counter() - start
+        report[f"noise_{ratio:.1%}"] = {
+            "recall": round(found / docs, 4),
+            "precision": round(found / (found + false_hits), 4) if found + false_hits else 1.0,
+            "ms_per_doc": round(1000 * elapsed / docs, 2),
+        }
+    index.close()
+    return report
+
+
+def scaling(sizes, queries: int, doc_bytes: int, path: str, seed: int) -> list:
+    rng = np.random.RandomState(seed)
+    index = DedupIndex(path)
+    texts = list(generate_corpus(queries, doc_bytes, seed))
+    signatures = [index.signature(preprocess_text(text)) for text in texts]
+    index.add_many((sig, str(n)) for n, sig in enumerate(signatures))
+
+    rows = []
+    for size in sizes:
+        missing = size - len(index)
+        while missing > 0:
+            batch = min(missing, 50_000)
+            fill = rng.randint(0, 1 << 32, size=(batch, NUM_PERM), dtype=np.uint64).astype(np.uint32)
+            index.add_many((sig, None) for sig in fill)
+            missing -= batch
+        latencies = []
+        hits = 0
+        lookups_before, candidates_before = index.lookups, index.candidates
+        for sig in signatures:
+            start = time.perf_counter()
+            hits += index.query(sig) is not None
+            latencies.append((time.perf_counter() - start) * 1000)
+        rows.append({
+            "index_size": len(index),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "candidates_per_query": round(
+                (index.candidates - candidates_before) / (index.lookups - lookups_before), 2
+            ),
+            "hit_rate": round(hits / len(signatures), 4),
+        })
+    index.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500, help="Originales para medir la exactitud")
+    parser.add_argument("--doc-bytes", type=int, default=3000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--sizes", type=str, default="10000,100000,1000000",
+                        help="Tamaños del índice para medir el escalado")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--db", type=str, default=":memory:", help="Archivo SQLite del índice de escalado")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = {
+        "accuracy": accuracy(args.docs, args.doc_bytes, args.threshold, args.seed),
+        "scaling": scaling(sizes, args.queries, args.doc_bytes, args.db, args.seed),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_highlights.py
+Mide la resolución de highlights a posiciones del texto original
+(highlights.py) sobre el corpus sintético.
+
+Para cada documento se toman snippets del texto preprocesado, como los
+copia el modelo: tal cual, con deriva (mayúsculas, sin tildes, espacios
+dobles, comillas y puntos suspensivos) y frases que no están en el
+documento. Informa la tasa de resolución por tipo, si el tramo del original
+empieza y termina en las palabras del snippet y el tiempo por MB
+(preprocesado con mapa de posiciones incluido).
+
+Uso:
+    python benchmarks/bench_highlights.py --docs 200 --doc-bytes 30000
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from corpus import generate_corpus  # noqa: E402
+from gazetteer import fold  # noqa: E402
+from highlights import HighlightLocator  # noqa: E402
+from preprocessing import preprocess_text  # noqa: E402
+
+
+SNIPPET_CHARS = 80
+
+
+def _ends(text: str) -> tuple:
+    words = re.findall(r"\w+", fold(text))
+    return words[0], words[-1]
+
+
+def drift(snippet: str, rng: random.Random) -> str:
+    """Deriva típica de un highlight reescrito por el modelo."""
+    out = fold(snippet) if rng.random() < 0.5 else snippet.upper()
+    out = out.replace(" ", "  ", 2)
+    return f'"{out}..."'
+
+
+def sample_snippets(clean: str, per_kind: int, rng: random.Random) -> dict:
+    def cut():
+        start = rng.randrange(max(1, len(clean) - SNIPPET_CHARS))
+        start = clean.find(" ", start) + 1
+        return clean[start:clean.rfind(" ", start, start + SNIPPET_CHARS)]
+
+    return {
+        "exact": [cut() for _ in range(per_kind)],
+        "drift": [drift(cut(), rng) for _ in range(per_kind)],
+        "absent": [f"texto inventado número {rng.randint(0, 10**9)} que no aparece" for _ in range(per_kind)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--doc-bytes", type=int, default=30000)
+    parser.add_argument("--per-kind", type=int, default=4, help="Snippets de cada tipo por documento")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    locator = HighlightLocator()
+    resolved = {"exact": 0, "drift": 0, "absent": 0}
+    correct = 0
+    total_chars = 0
+    elapsed = 0.0
+    for text in generate_corpus(args.docs, args.doc_bytes, args.seed):
+        kinds = sample_snippets(preprocess_text(text, record=False), args.per_kind, rng)
+        snippets = [snippet for group in kinds.values() for snippet in group]
+        start = time.perf_counter()
+        spans = locator.locate(text, snippets)
+        elapsed += time.perf_counter() - start
+        total_chars += len(text)
+
+        labels = [kind for kind, group in kinds.items() for _ in group]
+        for kind, snippet, span in zip(labels, snippets, spans):
+            if span is None:
+                continue
+            resolved[kind] += 1
+            # El tramo puede abarcar encabezados eliminados: se comprueban los extremos
+            correct += _ends(snippet) == _ends(text[span.start:span.end])
+
+    found = resolved["exact"] + resolved["drift"]
+    report = {
+        "docs": args.docs,
+        "mb": round(total_chars / 1e6, 2),
+        "resolution_rate": {kind: round(count / (args.docs * args.per_kind), 4) for kind, count in resolved.items()},
+        "spans_matching_snippet": round(correct / found, 4) if found else 0.0,
+        "ms_per_mb": round(1000 * elapsed / (total_chars / 1e6), 1),
+        "ms_per_doc": round(1000 * elapsed / args.docs, 3),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
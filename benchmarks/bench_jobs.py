@@ -0,0 +1,109 @@
+"""
+bench_jobs.py
+Escalado de la cola de trabajo (jobs.py) de 1 a N workers.
+
+Cada worker es un proceso aparte que corre jobs.work() con el backend local
+(RuleBasedBackend con latencia simulada) sobre la misma cola. La cola es
+queue_standin.SQLiteJobQueue: mismas reglas que PostgresJobQueue (leases,
+reintentos, resultados descartados si el job ya no es del worker) sin
+servidor PostgreSQL. Antes de arrancar, un worker "muerto" reclama
+--abandon jobs y nunca los termina: los demás deben retomarlos cuando
+vence su lease.
+
+Informa docs/s por número de workers, eficiencia frente a 1 worker
+(docs/s con N / (N · docs/s con 1)), jobs retomados y si cada job se
+completó exactamente una vez.
+
+Uso:
+    python benchmarks/bench_jobs.py --docs 2000 --workers 1,2,4,8 --latency-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from corpus import generate_corpus  # noqa: E402
+from jobs import work  # noqa: E402
+from queue_standin import SQLiteJobQueue  # noqa: E402
+
+
+def _worker(path: str, args: argparse.Namespace, barrier, results) -> None:
+    queue = SQLiteJobQueue(path, lease_s=args.lease_s)
+    barrier.wait()
+    results.put(asyncio.run(work(queue, args.batch_size, args.concurrency, until_empty=True, poll_s=0.1)))
+
+
+def run(n_workers: int, texts: list, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.sqlite")
+        queue = SQLiteJobQueue(path, lease_s=args.lease_s)
+        queue.enqueue_texts({"text": text} for text in texts)
+        # Worker muerto: su lease vence antes de que arranquen los demás
+        SQLiteJobQueue(path, worker_id="muerto", lease_s=0.01).claim(args.abandon)
+
+        ctx = multiprocessing.get_context("spawn")
+        barrier, results = ctx.Barrier(n_workers + 1), ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(path, args, barrier, results)) for _ in range(n_workers)]
+        for proc in procs:
+            proc.start()
+        barrier.wait()  # imports y arranque fuera de la medida
+        start = time.perf_counter()
+        stats = [results.get() for _ in procs]
+        elapsed = time.perf_counter() - start
+        for proc in procs:
+            proc.join()
+        final = queue.stats()
+
+    return {
+        "workers": n_workers,
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_s": round(len(texts) / elapsed, 1),
+        "retaken": sum(s["retried_claims"] for s in stats),
+        "per_worker_done": [s["done"] for s in stats],
+        "jobs": final["jobs"],
+        "exactly_once": final["completions"] == {"1": len(texts)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--doc-bytes", type=int, default=1000)
+    parser.add_argument("--workers", type=str, default="1,2,4,8")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--concurrency", type=int, default=4, help="Llamadas en vuelo por worker")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--lease-s", type=float, default=30.0)
+    parser.add_argument("--abandon", type=int, default=20, help="Jobs reclamados por un worker muerto")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Los procesos hijos heredan el entorno: backend local con latencia
+    os.environ["UBPD_LLM_BACKEND"] = "rules"
+    os.environ["UBPD_FAKE_LATENCY_MS"] = str(args.latency_ms)
+
+    texts = list(generate_corpus(args.docs, args.doc_bytes, args.seed))
+    rows = [run(int(n), texts, args) for n in args.workers.split(",")]
+    base = rows[0]["docs_per_s"] / rows[0]["workers"]
+    for row in rows:
+        row["efficiency"] = round(row["docs_per_s"] / (row["workers"] * base), 3)
+    print(json.dumps({
+        "docs": args.docs,
+        "latency_ms": args.latency_ms,
+        "concurrency_per_worker": args.concurrency,
+        "batch_size": args.batch_size,
+        "cpus": os.cpu_count(),
+        "runs": rows,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
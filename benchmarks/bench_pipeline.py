@@ -0,0 +1,381 @@
+"""
+bench_pipeline.py
+Prueba de rendimiento de extremo a extremo del pipeline de clasificación.
+
+Para cada ejecución mide:
+
+- Etapas (secuencial, documento a documento): preprocess_text,
+  split_into_chunks, build_user_prompt, call_llm, parse_model_response,
+  merge_predictions, validate_and_fix y save_document_and_classification,
+  con percentiles p50/p95/p99 por etapa.
+- Rendimiento (concurrente): classify_documents_async + db.save_many por
+  bloques, en documentos/s.
+- Pico de memoria residente (RSS) del proceso.
+
+El LLM es el backend local por reglas con latencia inyectable; la base de
+datos puede omitirse, sustituirse por una conexión local (pg_standin) o
+ser un PostgreSQL real (variables DB_*).
+
+Los resultados se guardan en benchmarks/results/<commit>.json, de modo que
+`compare` muestra las regresiones entre dos commits.
+
+Uso:
+    python benchmarks/bench_pipeline.py run --tier xs --db standin
+    python benchmarks/bench_pipeline.py run --tier long --latency-ms 300 --concurrency 64
+    python benchmarks/bench_pipeline.py compare a1b2c3d HEAD --threshold 0.10
+    python benchmarks/bench_pipeline.py list
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src" / "ubpd_classifier"))
+
+import classifier  # noqa: E402
+import db  # noqa: E402
+from backends import RuleBasedBackend  # noqa: E402
+from chunking import merge_predictions, split_into_chunks  # noqa: E402
+from classifier import parse_model_response, validate_and_fix  # noqa: E402
+from corpus import TIERS, tier_corpus  # noqa: E402
+from pg_standin import StandInConnection, StandInStats  # noqa: E402
+from preprocessing import preprocess_text  # noqa: E402
+from prompts import build_user_prompt, get_system_prompt  # noqa: E402
+from runner import percentile  # noqa: E402
+
+RESULTS_DIR = BENCH_DIR / "results"
+STAGES = ("preprocess", "chunk", "build_prompt", "call_llm", "parse", "merge", "validate", "save")
+SAVE_BLOCK = 500
+
+
+# ---------------------------------------------------------------------
+# Utilidades
+# ---------------------------------------------------------------------
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso (ru_maxrss: KB en Linux, bytes en macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def git_commit() -> str:
+    """Commit corto de HEAD, con sufijo -dirty si hay cambios sin confirmar."""
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BENCH_DIR, capture_output=True, text=True)
+
+    head = git("rev-parse", "--short", "HEAD")
+    if head.returncode != 0:
+        return "unknown"
+    dirty = git("diff", "--quiet", "HEAD", "--", "src").returncode != 0
+    return head.stdout.strip() + ("-dirty" if dirty else "")
+
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values_ms),
+        "mean_ms": sum(values_ms) / len(values_ms) if values_ms else 0.0,
+        "p50_ms": percentile(values_ms, 50),
+        "p95_ms": percentile(values_ms, 95),
+        "p99_ms": percentile(values_ms, 99),
+        "total_ms": sum(values_ms),
+    }
+
+
+@contextmanager
+def database(kind: str, rtt_ms: float) -> Iterator[Optional[StandInStats]]:
+    """Activa el destino de escritura: none | standin | postgres."""
+    if kind == "postgres":
+        db.create_tables()
+        yield None
+        db.close_pool()
+        return
+    stats = StandInStats()
+    db.close_pool()
+    with patch.object(db, "get_connection", lambda: StandInConnection(stats, rtt_ms / 1000.0)):
+        yield stats
+        db.close_pool()
+
+
+# ---------------------------------------------------------------------
+# Fases
+# ---------------------------------------------------------------------
+def run_stages(texts: Iterator[str], save: bool) -> Dict[str, object]:
+    """Un documento tras otro, cronometrando cada etapa por separado."""
+    timings: Dict[str, List[float]] = defaultdict(list)
+    clock = time.perf_counter
+    docs = 0
+    start = clock()
+
+    for text in texts:
+        t = clock()
+        clean = preprocess_text(text)
+        timings["preprocess"].append((clock() - t) * 1000)
+
+        t = clock()
+        chunks = split_into_chunks(clean, classifier.CHUNK_TOKENS) or [clean]
+        timings["chunk"].append((clock() - t) * 1000)
+
+        preds = []
+        for chunk in chunks:
+            t = clock()
+            user_prompt = build_user_prompt(chunk)
+            timings["build_prompt"].append((clock() - t) * 1000)
+
+            t = clock()
+            raw = classifier.call_llm(get_system_prompt(), user_prompt)
+            timings["call_llm"].append((clock() - t) * 1000)
+
+            t = clock()
+            preds.append(parse_model_response(raw))
+            timings["parse"].append((clock() - t) * 1000)
+
+        t = clock()
+        pred = merge_predictions(preds)
+        timings["merge"].append((clock() - t) * 1000)
+
+        t = clock()
+        fixed = validate_and_fix(pred, clean)
+        timings["validate"].append((clock() - t) * 1000)
+
+        if save:
+            t = clock()
+            db.save_document_and_classification(text, fixed, source_system="BENCH")
+            timings["save"].append((clock() - t) * 1000)
+        docs += 1
+
+    elapsed = clock() - start
+    return {
+        "docs": docs,
+        "elapsed_s": elapsed,
+        "docs_per_s": docs / elapsed if elapsed else 0.0,
+        "stages": {name: summarize(timings[name]) for name in STAGES if timings[name]},
+    }
+
+
+async def _run_throughput_async(texts: Iterator[str], concurrency: int, save: bool) -> Dict[str, object]:
+    docs = errors = 0
+    save_ms: List[float] = []
+    start = time.perf_counter()
+
+    block: List[str] = []
+
+    async def flush():
+        nonlocal docs, errors
+        results = await classifier.classify_documents_async(block, concurrency=concurrency)
+        ok = [(text, r["classification"]) for text, r in zip(block, results) if r["error"] is None]
+        errors += len(block) - len(ok)
+        if save and ok:
+            t = time.perf_counter()
+            await asyncio.to_thread(db.save_many, ok)
+            save_ms.append((time.perf_counter() - t) * 1000)
+        docs += len(block)
+        block.clear()
+
+    for text in texts:
+        block.append(text)
+        if len(block) >= SAVE_BLOCK:
+            await flush()
+    if block:
+        await flush()
+
+    elapsed = time.perf_counter() - start
+    result = {
+        "docs": docs,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "docs_per_s": docs / elapsed if elapsed else 0.0,
+        "concurrency": concurrency,
+    }
+    if save_ms:
+        result["save_many"] = summarize(save_ms)
+    return result
+
+
+def run_benchmark(args) -> Dict[str, object]:
+    """Ejecuta ambas fases sobre el mismo corpus y devuelve el resultado."""
+    classifier.set_cache(None)  # cada llamada llega al backend
+    classifier.set_backend(RuleBasedBackend(
+        latency_s=args.latency_ms / 1000.0,
+        jitter_s=args.jitter_ms / 1000.0,
+    ))
+    save = args.db != "none"
+    result: Dict[str, object] = {
+        "tier": args.tier,
+        "docs": args.limit or TIERS[args.tier].docs,
+        "doc_bytes": TIERS[args.tier].doc_bytes,
+        "latency_ms": args.latency_ms,
+        "db": args.db,
+    }
+    try:
+        with database(args.db, args.db_rtt_ms) as db_stats:
+            if not args.skip_stages:
+                result["stages"] = run_stages(tier_corpus(args.tier, args.seed, args.stage_limit), save)
+            result["throughput"] = asyncio.run(_run_throughput_async(
+                tier_corpus(args.tier, args.seed, args.limit), args.concurrency, save,
+            ))
+            if db_stats is not None and save:
+                result["db_standin"] = db_stats.as_dict()
+    finally:
+        classifier.set_backend(None)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# ---------------------------------------------------------------------
+# Resultados por commit
+# ---------------------------------------------------------------------
+def run_key(result: Dict[str, object]) -> str:
+    return f"{result['tier']}/db={result['db']}/lat={result['latency_ms']:g}ms/n={result['docs']}"
+
+
+def store_result(result: Dict[str, object], results_dir: Path, commit: str) -> Path:
+    """Añade (o reemplaza) la ejecución en results/<commit>.json."""
+    results_dir.mkdir(parents=True, exist_ok=True)
+    path = results_dir / f"{commit}.json"
+    data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {"commit": commit, "runs": {}}
+    data["machine"] = {"python": platform.python_version(), "platform": platform.platform()}
+    result["recorded_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    data["runs"][run_key(result)] = result
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _metrics(run: Dict[str, object]) -> Dict[str, tuple]:
+    """Métricas comparables: nombre → (valor, True si mayor es mejor)."""
+    metrics = {"throughput.docs_per_s": (run["throughput"]["docs_per_s"], True),
+               "peak_rss_mb": (run["peak_rss_mb"], False)}
+    stages = run.get("stages")
+    if stages:
+        metrics["stages.docs_per_s"] = (stages["docs_per_s"], True)
+        for name, s in stages["stages"].items():
+            metrics[f"{name}.p50_ms"] = (s["p50_ms"], False)
+            metrics[f"{name}.p95_ms"] = (s["p95_ms"], False)
+    return metrics
+
+
+def compare(base: Dict[str, object], head: Dict[str, object], threshold: float) -> List[str]:
+    """Imprime la comparación y devuelve las regresiones por encima del umbral."""
+    regressions = []
+    for key in sorted(set(base["runs"]) & set(head["runs"])):
+        print(f"\n{key}")
+        print(f"  {'métrica':<26}{base['commit']:>14}{head['commit']:>14}{'cambio':>10}")
+        base_m, head_m = _metrics(base["runs"][key]), _metrics(head["runs"][key])
+        for name in base_m:
+            if name not in head_m:
+                continue
+            (old, higher_better), (new, _) = base_m[name], head_m[name]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESIÓN"
+                regressions.append(f"{key} {name}: {change:+.1%}")
+            print(f"  {name:<26}{old:>14.3f}{new:>14.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def _resolve_commit(name: str, results_dir: Path) -> Path:
+    path = results_dir / f"{name}.json"
+    if path.exists():
+        return path
+    rev = subprocess.run(["git", "rev-parse", "--short", name], cwd=BENCH_DIR,
+                         capture_output=True, text=True).stdout.strip()
+    path = results_dir / f"{rev}.json"
+    if not rev or not path.exists():
+        raise SystemExit(f"No hay resultados para '{name}' en {results_dir}")
+    return path
+
+
+def format_run(result: Dict[str, object]) -> str:
+    lines = [run_key(result)]
+    stages = result.get("stages")
+    if stages:
+        lines.append(f"  etapas: {stages['docs']} docs, {stages['docs_per_s']:.0f} docs/s")
+        lines.append(f"    {'etapa':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'total %':>10}")
+        total = sum(s["total_ms"] for s in stages["stages"].values()) or 1.0
+        for name, s in stages["stages"].items():
+            lines.append(f"    {name:<14}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}"
+                         f"{s['p99_ms']:>10.3f}{s['total_ms'] / total:>10.1%}")
+    t = result["throughput"]
+    lines.append(f"  rendimiento: {t['docs']} docs, {t['docs_per_s']:.0f} docs/s "
+                 f"(concurrencia {t['concurrency']}, errores {t['errors']})")
+    if "db_standin" in result:
+        d = result["db_standin"]
+        lines.append(f"  bd sustituta: {d['statements']} sentencias, {d['rows']} filas, "
+                     f"{d['bytes_sent'] / 1e6:.1f} MB")
+    lines.append(f"  pico RSS: {result['peak_rss_mb']:.0f} MB")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de clasificación")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Ejecutar y guardar resultados del commit actual.")
+    p_run.add_argument("--tier", choices=sorted(TIERS), default="xs")
+    p_run.add_argument("--limit", type=int, default=None, help="Recortar el número de documentos.")
+    p_run.add_argument("--stage-limit", type=int, default=1_000,
+                       help="Documentos de la fase secuencial por etapas.")
+    p_run.add_argument("--skip-stages", action="store_true")
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada del LLM.")
+    p_run.add_argument("--jitter-ms", type=float, default=0.0)
+    p_run.add_argument("--concurrency", type=int, default=64)
+    p_run.add_argument("--db", choices=("none", "standin", "postgres"), default="standin")
+    p_run.add_argument("--db-rtt-ms", type=float, default=0.0,
+                       help="Latencia de ida y vuelta simulada (solo --db standin).")
+    p_run.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+    p_run.add_argument("--no-save", action="store_true", help="No guardar el resultado.")
+
+    p_cmp = sub.add_parser("compare", help="Comparar dos commits.")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("head", nargs="?", default="HEAD")
+    p_cmp.add_argument("--threshold", type=float, default=0.10,
+                       help="Empeoramiento relativo que cuenta como regresión.")
+    p_cmp.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+
+    p_list = sub.add_parser("list", help="Listar los resultados guardados.")
+    p_list.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = run_benchmark(args)
+        print(format_run(result))
+        if not args.no_save:
+            path = store_result(result, args.results_dir, git_commit())
+            print(f"Resultado guardado en {path}")
+
+    elif args.command == "compare":
+        base = json.loads(_resolve_commit(args.base, args.results_dir).read_text(encoding="utf-8"))
+        head = json.loads(_resolve_commit(args.head, args.results_dir).read_text(encoding="utf-8"))
+        regressions = compare(base, head, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones por encima del {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nSin regresiones.")
+
+    elif args.command == "list":
+        for path in sorted(args.results_dir.glob("*.json")):
+            data = json.loads(path.read_text(encoding="utf-8"))
+            print(f"{data['commit']}: {', '.join(sorted(data['runs']))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+bench_prompt_cache.py
+Mide el aprovechamiento de la caché de prefijos del proveedor: clasifica un
+corpus contra el servidor local compatible con OpenAI (fake_server.py, con
+caché de prefijos simulada y latencia por token de prompt no cacheado) y
+resume el usage de cada llamada con usage.usage_report: proporción de
+tokens en caché, tokens, coste y latencia por 1.000 documentos.
+
+Se comparan dos disposiciones del prompt:
+- prefix: la actual (build_user_prompt), con el documento al final.
+- legacy: documento entre la parte fija y una instrucción final, como la
+  plantilla anterior.
+y dos umbrales de caché: 1.024 tokens (OpenAI) y 0 (cachés por bloques de
+servidores propios).
+
+Uso:
+    python benchmarks/bench_prompt_cache.py --docs 300 --prefill-ms-per-1k 40 \\
+        --input-price 1.25 --cached-input-price 0.125 --output-price 10
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier  # noqa: E402
+from backends import OpenAIBackend  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from fake_server import MIN_CACHED_TOKENS, start_in_thread  # noqa: E402
+from prompts import USER_PREFIX, build_user_prompt  # noqa: E402
+from usage import Prices, UsageStats, read_log, usage_report  # noqa: E402
+
+
+LEGACY_SUFFIX = "\n\nDevuelve SOLO el JSON."
+
+
+def legacy_user_prompt(text: str) -> str:
+    """Documento en medio de la plantilla (parte fija antes y después)."""
+    return USER_PREFIX + text.strip() + LEGACY_SUFFIX
+
+
+LAYOUTS = {"prefix": build_user_prompt, "legacy": legacy_user_prompt}
+
+
+def run_config(texts: list, layout: str, min_cached_tokens: int, prefill_s_per_1k: float,
+               latency_s: float, concurrency: int, prices) -> dict:
+    server = start_in_thread(latency_s=latency_s, min_cached_tokens=min_cached_tokens,
+                             prefill_s_per_1k_tokens=prefill_s_per_1k)
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = str(Path(tmp) / "usage.jsonl")
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url, usage=UsageStats(log_path))
+        classifier.set_backend(backend)
+        try:
+            with patch.object(classifier, "build_user_prompt", LAYOUTS[layout]):
+                results = classifier.classify_documents(texts, concurrency=concurrency)
+        finally:
+            classifier.set_backend(None)
+            server.shutdown()
+            server.server_close()
+        records = read_log(log_path)
+    failed = sum(r["error"] is not None for r in results)
+    return dict(
+        {"layout": layout, "min_cached_tokens": min_cached_tokens, "failed_docs": failed},
+        **usage_report(records, docs=len(texts), prices=prices),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--doc-bytes", type=int, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0,
+                        help="Latencia simulada por cada 1.000 tokens de prompt no cacheados")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--input-price", type=float, help="USD por millón de tokens de prompt")
+    parser.add_argument("--cached-input-price", type=float, help="USD por millón de tokens en caché")
+    parser.add_argument("--output-price", type=float, help="USD por millón de tokens de respuesta")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    prices = None
+    if args.input_price is not None and args.output_price is not None:
+        cached_price = args.cached_input_price if args.cached_input_price is not None else args.input_price
+        prices = Prices(args.input_price, cached_price, args.output_price)
+
+    texts = list(generate_corpus(args.docs, args.doc_bytes, args.seed))
+    report = []
+    for min_cached_tokens in (MIN_CACHED_TOKENS, 0):
+        for layout in ("legacy", "prefix"):
+            report.append(run_config(texts, layout, min_cached_tokens, args.prefill_ms_per_1k / 1000.0,
+                                     args.latency_ms / 1000.0, args.concurrency, prices))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
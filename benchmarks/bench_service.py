@@ -0,0 +1,154 @@
+"""
+bench_service.py
+Prueba de carga del servicio HTTP (service.py) contra el servidor local
+compatible con OpenAI (fake_server.py).
+
+Varios clientes concurrentes envían POST /classify en bucle cerrado; una
+fracción de las peticiones (--dup-rate) repite documentos de un conjunto
+pequeño, como reenvíos de la misma interfaz. Tras un 429 el cliente espera
+--retry-ms y reintenta. Las peticiones entran por la
+interfaz ASGI de la aplicación FastAPI, en el mismo proceso (no hace falta
+uvicorn ni cliente HTTP). Informa docs/s, latencia p50/p95, respuestas 429
+y llamadas al modelo ahorradas por la deduplicación en curso.
+
+También mide el coste que el servicio evita: arrancar `python runner.py`
+por documento (intérprete, imports y ontología), como hace la interfaz de
+PowerShell, frente a la latencia de una petición al servicio ya caliente.
+
+Uso:
+    python benchmarks/bench_service.py --requests 2000 --clients 64 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).parent.parent / "src" / "ubpd_classifier"
+sys.path.insert(0, str(SRC))
+
+import classifier  # noqa: E402
+from backends import OpenAIBackend  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from fake_server import start_in_thread  # noqa: E402
+from runner import percentile  # noqa: E402
+from service import ClassificationService, create_app  # noqa: E402
+
+
+async def post(app, path: str, body: dict):
+    """Una petición por la interfaz ASGI; devuelve (status, json)."""
+    payload = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+    }
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    return status, b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+
+
+async def load(app, texts: list, hot: list, requests: int, clients: int, dup_rate: float, retry_s: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    plan = [rng.choice(hot) if rng.random() < dup_rate else texts[n % len(texts)] for n in range(requests)]
+    pending = iter(plan)
+    latencies, statuses = [], {}
+
+    async def client():
+        for text in pending:
+            start = time.perf_counter()
+            while True:
+                status, _ = await post(app, "/classify", {"text": text})
+                statuses[status] = statuses.get(status, 0) + 1
+                if status != 429:
+                    break
+                await asyncio.sleep(retry_s)
+            # Latencia vista por el cliente, reintentos incluidos
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "responses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def cold_start_ms(text: str, repeats: int) -> float:
+    """Mediana de `python runner.py --text ... --no-db` con el backend local."""
+    env = dict(os.environ, UBPD_LLM_BACKEND="rules")
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "runner.py", "--text", text, "--no-db"], cwd=SRC, env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return round(sorted(times)[len(times) // 2], 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--docs", type=int, default=1000, help="Documentos distintos del corpus")
+    parser.add_argument("--doc-bytes", type=int, default=2000)
+    parser.add_argument("--dup-rate", type=float, default=0.3, help="Fracción de peticiones repetidas")
+    parser.add_argument("--hot-docs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--retry-ms", type=float, default=50.0,
+                        help="Espera del cliente tras un 429 (en lugar del Retry-After completo)")
+    parser.add_argument("--cold-repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = list(generate_corpus(args.docs, args.doc_bytes, args.seed))
+    server = start_in_thread(latency_s=args.latency_ms / 1000.0, seed=args.seed)
+    classifier.set_backend(OpenAIBackend(api_key="local", base_url=server.base_url))
+    try:
+        service = ClassificationService(max_in_flight=args.max_in_flight, max_queue=args.max_queue)
+        app = create_app(service)
+        result = asyncio.run(load(app, texts, texts[:args.hot_docs], args.requests, args.clients,
+                                  args.dup_rate, args.retry_ms / 1000.0, args.seed))
+    finally:
+        classifier.set_backend(None)
+        server.shutdown()
+
+    stats = service.stats()
+    report = {
+        "requests": args.requests,
+        "clients": args.clients,
+        "dup_rate": args.dup_rate,
+        "latency_ms": args.latency_ms,
+        **result,
+        "llm_calls": stats["llm_calls"],
+        "coalesced": stats["coalesced"],
+        "rejected": stats["rejected"],
+        "cold_start_runner_ms": cold_start_ms(texts[0][:500], args.cold_repeats) if args.cold_repeats else None,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+bench_structured.py
+Compara la salida en texto libre con la salida estructurada (response_format
+json_schema generado desde la ontología) contra el servidor local
+compatible con OpenAI (fake_server.py), que estropea una fracción de las
+respuestas sin esquema.
+
+Para cada modo informa de la tasa de respuestas no parseables (documentos
+perdidos), la de respuestas fuera del esquema (etiquetas que
+validate_and_fix descarta en silencio) y la latencia de extremo a extremo
+por documento (p50/p95) y del lote completo.
+
+Uso:
+    python benchmarks/bench_structured.py --docs 500 --malformed-rate 0.08 --latency-ms 50
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier  # noqa: E402
+from backends import OpenAIBackend  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from fake_server import start_in_thread  # noqa: E402
+from runner import percentile  # noqa: E402
+
+
+def run_mode(texts: list, base_url: str, structured: bool, concurrency: int) -> dict:
+    """Clasifica el corpus con un modo y devuelve sus métricas."""
+    backend = OpenAIBackend(api_key="local", base_url=base_url, structured_output=structured)
+    classifier.SCHEMA_STATS.reset()
+    classifier.set_backend(backend)
+    try:
+        with patch.object(classifier, "STRUCTURED_OUTPUT", structured):
+            start = time.perf_counter()
+            results = classifier.classify_documents(texts, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+    finally:
+        classifier.set_backend(None)
+
+    latencies = [r["elapsed_ms"] for r in results]
+    failed = sum(r["error"] is not None for r in results)
+    stats = classifier.schema_stats()
+    return {
+        "mode": "structured" if structured else "free",
+        "docs": len(results),
+        "failed_docs": failed,
+        "parse_failure_rate": round(stats["parse_failure_rate"], 4),
+        "schema_violation_rate": round(stats["schema_violation_rate"], 4),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_s": round(len(results) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--doc-bytes", type=int, default=1024)
+    parser.add_argument("--malformed-rate", type=float, default=0.08,
+                        help="Fracción de respuestas sin esquema que el servidor estropea")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = list(generate_corpus(args.docs, args.doc_bytes, args.seed))
+    report = {"docs": args.docs, "malformed_rate": args.malformed_rate, "latency_ms": args.latency_ms, "modes": []}
+    for structured in (False, True):
+        server = start_in_thread(latency_s=args.latency_ms / 1000.0,
+                                 malformed_rate=args.malformed_rate, seed=args.seed)
+        try:
+            report["modes"].append(run_mode(texts, server.base_url, structured, args.concurrency))
+        finally:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_validation.py
+Compara validate_and_fix (una predicción por llamada) con
+validate_and_fix_batch (NumPy) re-procesando predicciones sintéticas como
+las que se guardan en raw_json, y comprueba que ambos resultados coinciden.
+
+Uso:
+    python benchmarks/bench_validation.py --n 1000000 --block 100000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from batch_validation import validate_and_fix_batch  # noqa: E402
+from classifier import validate_and_fix  # noqa: E402
+from ontology import get_ontology  # noqa: E402
+
+
+TERRITORIOS = ["Antioquia", "antioquia", "Cauca", "Bogota", "Medellín", "Valle", "Venezuela", "Quibdó"]
+
+
+def generate_predictions(rng: random.Random, n: int, invalid_rate: float) -> list:
+    """Predicciones como las del modelo: casi todas válidas, algunas con errores."""
+    ont = get_ontology()
+    codes = {dim: sorted(ont.codes(dim)) for dim in ("tipo_documento", "tipo_hecho", "periodo", "actores", "ruteo")}
+
+    def single(dim):
+        return "XX9" if rng.random() < invalid_rate else rng.choice(codes[dim])
+
+    def multi(dim):
+        values = rng.sample(codes[dim], rng.randint(0, 3))
+        if rng.random() < invalid_rate:
+            values.insert(rng.randint(0, len(values)), "XX9")
+        return values
+
+    preds = []
+    for _ in range(n):
+        pred = {
+            "tipo_documento": single("tipo_documento"),
+            "tipo_hecho": multi("tipo_hecho"),
+            "territorio": rng.sample(TERRITORIOS, rng.randint(0, 2)),
+            "periodo": single("periodo"),
+            "actores": multi("actores"),
+            "ruteo": single("ruteo"),
+            "highlights": ["se llevaron a mi hermano"],
+        }
+        if rng.random() < invalid_rate:
+            del pred[rng.choice(list(pred))]
+        preds.append(pred)
+    return preds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1_000_000, help="Predicciones en total")
+    parser.add_argument("--block", type=int, default=100_000, help="Predicciones por bloque")
+    parser.add_argument("--invalid-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    scalar_s = batch_s = 0.0
+    done = 0
+    block_index = 0
+    while done < args.n:
+        size = min(args.block, args.n - done)
+        # Misma semilla por bloque: dos copias idénticas (ambas rutas modifican los dicts)
+        scalar = generate_predictions(random.Random(args.seed + block_index), size, args.invalid_rate)
+        batch = generate_predictions(random.Random(args.seed + block_index), size, args.invalid_rate)
+
+        start = time.perf_counter()
+        for pred in scalar:
+            validate_and_fix(pred)
+        scalar_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        validate_and_fix_batch(batch)
+        batch_s += time.perf_counter() - start
+
+        if scalar != batch:
+            mismatch = next(i for i, (a, b) in enumerate(zip(scalar, batch)) if a != b)
+            sys.exit(f"Resultados distintos en la predicción {done + mismatch}: "
+                     f"{scalar[mismatch]} != {batch[mismatch]}")
+        done += size
+        block_index += 1
+
+    print(json.dumps({
+        "predictions": args.n,
+        "scalar_s": round(scalar_s, 3),
+        "batch_s": round(batch_s, 3),
+        "scalar_us_per_pred": round(scalar_s / args.n * 1e6, 3),
+        "batch_us_per_pred": round(batch_s / args.n * 1e6, 3),
+        "speedup": round(scalar_s / batch_s, 2),
+        "identical": True,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+corpus.py
+Generador determinista de un corpus sintético de testimonios en español
+(y algunos oficios no testimoniales) para las pruebas de rendimiento.
+
+Los documentos se generan bajo demanda: un corpus de 100k documentos no
+se materializa en memoria.
+
+Uso:
+    python benchmarks/corpus.py --tier s --out /tmp/corpus
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple
+
+
+class Tier(NamedTuple):
+    docs: int
+    doc_bytes: int
+
+
+# Niveles de tamaño: número de documentos × tamaño aproximado de cada uno
+TIERS: Dict[str, Tier] = {
+    "xs": Tier(1_000, 1_024),
+    "s": Tier(10_000, 4_096),
+    "m": Tier(100_000, 1_024),
+    "long": Tier(1_000, 64 * 1_024),
+    "xl": Tier(100, 1_024 * 1_024),
+}
+
+NOMBRES = ["María", "José", "Luz Marina", "Carlos", "Ana Lucía", "Pedro", "Rosa", "Jorge Eliécer",
+           "Esperanza", "Luis Alberto", "Gloria", "Hernán", "Marleny", "Fabio", "Nelly"]
+PARENTESCOS = ["esposo", "hijo", "hija", "hermano", "hermana", "padre", "compañero"]
+LUGARES = [("San Carlos", "Antioquia"), ("El Salado", "Bolívar"), ("Bojayá", "Chocó"),
+           ("Mapiripán", "Meta"), ("Trujillo", "Valle del Cauca"), ("Granada", "Antioquia"),
+           ("Tumaco", "Nariño"), ("San Vicente del Caguán", "Caquetá"), ("Ocaña", "Norte de Santander"),
+           ("Puerto Asís", "Putumayo"), ("El Carmen de Bolívar", "Bolívar"), ("Tibú", "Norte de Santander")]
+ACTORES = ["hombres armados", "la guerrilla", "los paramilitares", "el Ejército",
+           "unos encapuchados", "las autodefensas", "un grupo armado"]
+HECHOS = [
+    "se llevaron a mi {p} y nunca más volvimos a saber de él",
+    "mataron a varios vecinos en la plaza",
+    "tuvimos que salir huyendo con lo que teníamos puesto",
+    "golpearon y amarraron a los hombres del caserío",
+    "reclutaron a los muchachos de la vereda",
+    "desaparecieron a mi {p} cuando iba para la finca",
+]
+RELLENO = [
+    "Yo vivía con mi familia en la vereda y trabajábamos la tierra.",
+    "Los vecinos no decían nada porque tenían miedo.",
+    "Pusimos la denuncia en la Personería pero nadie nos dio razón.",
+    "Desde entonces lo seguimos buscando en hospitales y cementerios.",
+    "Mi mamá se enfermó de la tristeza y murió esperando noticias.",
+    "Los niños dejaron de ir a la escuela durante meses.",
+    "Volvimos años después y la casa estaba destruida.",
+    "En la comunidad todos recuerdan ese día con mucho dolor.",
+]
+CABECERA = "UNIDAD DE BÚSQUEDA - Documento {n} - Página {pag}"
+OFICIO = (
+    "Bogotá D.C., {anio}\nOficio No. {n}\nAsunto: remisión de información\n\n"
+    "Cordial saludo. Por medio del presente se remite el informe técnico solicitado "
+    "mediante radicado {n}, con la relación de expedientes del municipio de {lugar}, {dep}. "
+)
+
+
+def _testimony_paragraph(rng: random.Random) -> str:
+    lugar, dep = rng.choice(LUGARES)
+    hecho = rng.choice(HECHOS).format(p=rng.choice(PARENTESCOS))
+    return (
+        f"En el año {rng.randint(1985, 2015)}, en {lugar}, {dep}, llegaron {rng.choice(ACTORES)} "
+        f"y {hecho}. " + " ".join(rng.sample(RELLENO, 3))
+    )
+
+
+def generate_document(rng: random.Random, target_bytes: int, index: int = 0) -> str:
+    """Un documento de aproximadamente `target_bytes` bytes (UTF-8)."""
+    if rng.random() < 0.1:
+        lugar, dep = rng.choice(LUGARES)
+        parts = [OFICIO.format(anio=rng.randint(2005, 2023), n=index, lugar=lugar, dep=dep)]
+    else:
+        parts = [f"Mi nombre es {rng.choice(NOMBRES)} y quiero contar lo que nos pasó."]
+    size = len(parts[0].encode("utf-8"))
+    page = 1
+    while size < target_bytes:
+        if size // 3_000 >= page:
+            page += 1
+            parts.append(CABECERA.format(n=index, pag=page))
+        paragraph = _testimony_paragraph(rng)
+        parts.append(paragraph)
+        size += len(paragraph.encode("utf-8")) + 2
+    return "\n\n".join(parts)
+
+
+def generate_corpus(docs: int, doc_bytes: int, seed: int = 0) -> Iterator[str]:
+    """Itera `docs` documentos deterministas (mismo seed → mismo corpus)."""
+    rng = random.Random(seed)
+    for index in range(docs):
+        yield generate_document(rng, doc_bytes, index)
+
+
+def tier_corpus(name: str, seed: int = 0, limit: int = None) -> Iterator[str]:
+    """Corpus de un nivel de TIERS, opcionalmente recortado a `limit` docs."""
+    tier = TIERS[name]
+    docs = tier.docs if limit is None else min(limit, tier.docs)
+    return generate_corpus(docs, tier.doc_bytes, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus sintético de testimonios")
+    parser.add_argument("--tier", choices=sorted(TIERS), default="xs")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, required=True, help="Directorio de salida (.txt)")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for count, text in enumerate(tier_corpus(args.tier, args.seed, args.limit), start=1):
+        (out / f"doc_{count:06d}.txt").write_text(text, encoding="utf-8")
+    print(f"{count} documentos escritos en {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
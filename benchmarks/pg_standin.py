@@ -0,0 +1,126 @@
+"""
+pg_standin.py
+Sustituto local de una conexión psycopg2 para las pruebas de rendimiento.
+
+No guarda nada: adapta los parámetros con los adaptadores reales de
+psycopg2 (coste de serialización del cliente), cuenta sentencias, filas y
+bytes, y puede simular la latencia de ida y vuelta al servidor.
+"""
+
+import threading
+import time
+import uuid
+from typing import Dict
+
+from psycopg2.extensions import QuotedString, adapt
+from psycopg2.extras import Json
+
+
+class StandInStats:
+    """Contadores compartidos por todas las conexiones sustitutas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.transactions = 0
+        self.statements = 0
+        self.rows = 0
+        self.bytes_sent = 0
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "connections": self.connections,
+            "transactions": self.transactions,
+            "statements": self.statements,
+            "rows": self.rows,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+def _quote(value) -> bytes:
+    if isinstance(value, Json):
+        value = value.dumps(value.adapted)
+    adapted = adapt(value)
+    if isinstance(adapted, QuotedString):
+        adapted.encoding = "utf8"
+    return adapted.getquoted()
+
+
+class StandInCursor:
+    def __init__(self, conn: "StandInConnection"):
+        self.connection = conn
+        self._result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args) -> bytes:
+        if isinstance(template, str):
+            template = template.encode("utf-8")
+        return template % tuple(_quote(a) for a in args)
+
+    def execute(self, sql, params=None) -> None:
+        data = self.mogrify(sql, params) if params is not None else sql
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.connection._roundtrip()
+        rows = data.count(b"),(") + 1 if b" VALUES " in data.upper() else 0
+        self.connection.stats.add(statements=1, rows=rows, bytes_sent=len(data))
+        # RETURNING doc_id / run_id de la ruta documento a documento
+        self._result = (str(uuid.uuid4()),)
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return [self._result] if self._result else []
+
+
+class StandInConnection:
+    """Conexión con la interfaz que usan db.py y el pool."""
+
+    encoding = "UTF8"
+
+    def __init__(self, stats: StandInStats, rtt_s: float = 0.0):
+        self.stats = stats
+        self.rtt_s = rtt_s
+        self.closed = 0
+        stats.add(connections=1)
+
+    def _roundtrip(self) -> None:
+        if self.rtt_s:
+            time.sleep(self.rtt_s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self)
+
+    def commit(self) -> None:
+        self._roundtrip()
+        self.stats.add(transactions=1)
+
+    def rollback(self) -> None:
+        pass
+
+    def get_transaction_status(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        self.closed = 1
@@ -0,0 +1,174 @@
+"""
+queue_standin.py
+Sustituto local de jobs.PostgresJobQueue sobre un archivo SQLite, para medir
+varios workers (procesos) sin servidor PostgreSQL.
+
+Misma interfaz y mismas reglas: lease por job, reclamo de leases vencidos,
+reintentos con espera exponencial y descarte de resultados de un job que ya
+no es del worker. SQLite no tiene SKIP LOCKED: cada reclamo toma el bloqueo
+de escritura (BEGIN IMMEDIATE), que también impide que dos workers tomen el
+mismo job. Los resultados no se guardan: complete() construye las filas con
+db.build_run_rows (coste de cliente, highlights incluidos) y cuenta cuántas
+veces se completa cada job.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import db
+from jobs import DONE, FAILED, LEASE_S, MAX_ATTEMPTS, PENDING, RETRY_BASE_S, RUNNING, Job, default_worker_id
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    job_id        INTEGER PRIMARY KEY,
+    text          TEXT NOT NULL,
+    source_system TEXT,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    run_after     REAL NOT NULL DEFAULT 0,
+    leased_by     TEXT,
+    lease_until   REAL,
+    completions   INTEGER NOT NULL DEFAULT 0,
+    last_error    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_status ON job(status, job_id);
+"""
+
+
+class SQLiteJobQueue:
+    def __init__(
+        self,
+        path: str,
+        worker_id: Optional[str] = None,
+        lease_s: float = LEASE_S,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_base_s: float = RETRY_BASE_S,
+    ):
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _transaction(self, fn):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(cur)
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return result
+
+    def enqueue_texts(self, docs: Iterable[Dict[str, Any]]) -> List[int]:
+        rows = [(doc["text"], doc.get("source_system"), self.max_attempts) for doc in docs]
+
+        def run(cur):
+            first = cur.execute("SELECT COALESCE(MAX(job_id), 0) FROM job").fetchone()[0] + 1
+            cur.executemany("INSERT INTO job (text, source_system, max_attempts) VALUES (?, ?, ?)", rows)
+            return list(range(first, first + len(rows)))
+
+        return self._transaction(run)
+
+    def claim(self, limit: int) -> List[Job]:
+        def run(cur):
+            now = time.time()
+            cur.execute(
+                "UPDATE job SET status = ?, last_error = 'lease vencido', leased_by = NULL, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                (FAILED, RUNNING, now),
+            )
+            rows = cur.execute(
+                "SELECT job_id, attempts, text, source_system FROM job "
+                "WHERE (status = ? AND run_after <= ?) "
+                "   OR (status = ? AND lease_until < ? AND attempts < max_attempts) "
+                "ORDER BY job_id LIMIT ?",
+                (PENDING, now, RUNNING, now, limit),
+            ).fetchall()
+            cur.executemany(
+                "UPDATE job SET status = ?, attempts = attempts + 1, leased_by = ?, lease_until = ? "
+                "WHERE job_id = ?",
+                [(RUNNING, self.worker_id, now + self.lease_s, job_id) for job_id, *_ in rows],
+            )
+            return [Job(job_id, str(job_id), attempts + 1, text, source) for job_id, attempts, text, source in rows]
+
+        return self._transaction(run)
+
+    def _owned(self, cur, job_ids: Sequence[int]) -> set:
+        marks = ",".join("?" * len(job_ids))
+        rows = cur.execute(
+            f"SELECT job_id FROM job WHERE job_id IN ({marks}) AND leased_by = ? AND status = ?",
+            (*job_ids, self.worker_id, RUNNING),
+        ).fetchall()
+        return {job_id for (job_id,) in rows}
+
+    def extend(self, jobs: Sequence[Job]) -> int:
+        def run(cur):
+            owned = self._owned(cur, [job.job_id for job in jobs])
+            cur.executemany("UPDATE job SET lease_until = ? WHERE job_id = ?",
+                            [(time.time() + self.lease_s, job_id) for job_id in owned])
+            return len(owned)
+
+        return self._transaction(run) if jobs else 0
+
+    def complete(self, results: Sequence[Tuple[Job, Dict[str, Any]]]) -> Dict[int, str]:
+        if not results:
+            return {}
+        run_ids, _ = db.build_run_rows(
+            {"doc_id": job.doc_id, "text": job.text, "classification": classification,
+             "source_system": job.source_system or "LOCAL_DEMO"}
+            for job, classification in results
+        )
+
+        def run(cur):
+            owned = self._owned(cur, [job.job_id for job, _ in results])
+            done = {job.job_id: run_id for (job, _), run_id in zip(results, run_ids) if job.job_id in owned}
+            cur.executemany(
+                "UPDATE job SET status = ?, leased_by = NULL, lease_until = NULL, "
+                "completions = completions + 1 WHERE job_id = ?",
+                [(DONE, job_id) for job_id in done],
+            )
+            return done
+
+        return self._transaction(run)
+
+    def fail(self, failures: Sequence[Tuple[Job, str]]) -> int:
+        if not failures:
+            return 0
+
+        def run(cur):
+            owned = self._owned(cur, [job.job_id for job, _ in failures])
+            now = time.time()
+            for job, error in failures:
+                if job.job_id not in owned:
+                    continue
+                status = FAILED if job.attempts >= self.max_attempts else PENDING
+                cur.execute(
+                    "UPDATE job SET status = ?, run_after = ?, last_error = ?, leased_by = NULL, "
+                    "lease_until = NULL WHERE job_id = ?",
+                    (status, now + self.retry_base_s * 2 ** (job.attempts - 1), error, job.job_id),
+                )
+            return len(owned)
+
+        return self._transaction(run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, count(*) FROM job GROUP BY status").fetchall()
+            completions = self._conn.execute(
+                "SELECT completions, count(*) FROM job GROUP BY completions"
+            ).fetchall()
+        counts = {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)}
+        counts.update(dict(rows))
+        return {"jobs": counts, "completions": {str(k): v for k, v in completions}}
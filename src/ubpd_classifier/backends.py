@@ -0,0 +1,445 @@
+"""
+backends.py
+Backends intercambiables para la llamada al LLM:
+
+- OpenAIBackend: cliente OpenAI (o cualquier servidor compatible vía base_url).
+- RuleBasedBackend: clasificador local determinista basado en reglas, que
+  devuelve JSON válido según la ontología, con latencia configurable.
+  Sirve para pruebas de carga del resto del pipeline sin red.
+
+OpenAIBackend(structured_output=True) pide salida estructurada
+(response_format json_schema generado desde la ontología, ver schema.py).
+
+OpenAIBackend registra el consumo de tokens de cada llamada (incluidos
+los servidos desde la caché de prefijos del proveedor, ver usage.py).
+
+Ambos admiten además el modo streaming (complete_stream): el JSON se lee
+con streaming.StreamingJSONParser según llega y la respuesta se corta en
+cuanto están todos los campos requeridos.
+
+Autor: Manuel Daza Ramirez
+"""
+
+import asyncio
+import functools
+import json
+import random
+import re
+import time
+import unicodedata
+from typing import Dict, List, Optional, Protocol, runtime_checkable
+
+from budget import ACTOR_RULES, HECHO_RULES
+from gazetteer import UNKNOWN_TERRITORIO, get_gazetteer
+from ontology import CompiledOntology, get_ontology
+from prompts import extract_document
+from ratelimit import RateLimiter
+from schema import response_format
+from streaming import REQUIRED_FIELDS, StreamingJSONParser, iter_chunks
+from usage import UsageRecord, UsageStats, get_usage, usage_counts
+
+
+DEFAULT_MODEL_NAME = "gpt-5.1"
+RULES_MODEL_NAME = "ubpd-rules-v1"
+
+
+@runtime_checkable
+class LLMBackend(Protocol):
+    """Interfaz mínima de un backend: completar (system, user) → texto."""
+
+    model_name: str
+
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        ...
+
+    async def acomplete(self, system_prompt: str, user_prompt: str) -> str:
+        ...
+
+
+@runtime_checkable
+class StreamingLLMBackend(Protocol):
+    """Backend que además puede leer la respuesta por streaming."""
+
+    def complete_stream(self, system_prompt: str, user_prompt: str,
+                        required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        ...
+
+    async def acomplete_stream(self, system_prompt: str, user_prompt: str,
+                               required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        ...
+
+
+class StreamStats:
+    """Contadores del modo streaming de un backend."""
+
+    def __init__(self):
+        self.streams = 0
+        self.early_stops = 0
+        self.invalid_fields = 0
+        self.chars_received = 0
+
+    def record(self, parser: StreamingJSONParser) -> None:
+        self.streams += 1
+        self.early_stops += not parser.complete and parser.satisfied
+        self.invalid_fields += len(parser.invalid)
+        self.chars_received += parser.received
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "streams": self.streams,
+            "early_stops": self.early_stops,
+            "invalid_fields": self.invalid_fields,
+            "chars_received": self.chars_received,
+        }
+
+
+def _delta_text(chunk) -> Optional[str]:
+    """Texto de un fragmento de chat.completions en modo stream."""
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+# ---------------------------------------------------------------------
+# OpenAI
+# ---------------------------------------------------------------------
+class OpenAIBackend:
+    """
+    Backend OpenAI. Los clientes se crean al primer uso, de modo que
+    importar el módulo no exige OPENAI_API_KEY.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        limiter: Optional[RateLimiter] = None,
+        expected_output_tokens: int = 300,
+        structured_output: bool = False,
+        usage: Optional[UsageStats] = None,
+    ):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = limiter
+        self.expected_output_tokens = expected_output_tokens
+        self.structured_output = structured_output
+        self._usage = usage
+        self._client = None
+        self._async_client = None
+        self.stream_stats = StreamStats()
+
+    @property
+    def client(self):
+        """Cliente síncrono (también lo usa batch_api)."""
+        if self._client is None:
+            from openai import OpenAI
+            # Los reintentos los gestiona el RateLimiter
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+    def _request_kwargs(self, system_prompt: str, user_prompt: str) -> dict:
+        kwargs = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": 0.0,
+        }
+        if self.structured_output:
+            # Salida restringida al esquema de la ontología vigente
+            kwargs["response_format"] = response_format()
+        return kwargs
+
+    @property
+    def usage(self) -> UsageStats:
+        """Destino del consumo por llamada (por defecto, el del proceso)."""
+        return self._usage if self._usage is not None else get_usage()
+
+    def _record_usage(self, usage, start: float, stream: bool = False) -> None:
+        counts = usage_counts(usage)
+        if counts is None:
+            self.usage.record_missing()
+            return
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self.usage.record(UsageRecord(self.model_name, *counts, latency_ms, stream))
+
+    def _estimate_tokens(self, system_prompt: str, user_prompt: str) -> int:
+        from tokenizer import get_tokenizer
+        tokenizer = get_tokenizer()
+        return tokenizer.count(system_prompt) + tokenizer.count(user_prompt) + self.expected_output_tokens
+
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        kwargs = self._request_kwargs(system_prompt, user_prompt)
+        start = time.perf_counter()
+
+        def request():
+            return self.client.chat.completions.create(**kwargs)
+
+        if self.limiter is not None:
+            response = self.limiter.call(request, tokens=self._estimate_tokens(system_prompt, user_prompt))
+        else:
+            response = request()
+        self._record_usage(response.usage, start)
+        # SDK nuevo: message es un objeto, no un dict
+        return response.choices[0].message.content
+
+    async def acomplete(self, system_prompt: str, user_prompt: str) -> str:
+        kwargs = self._request_kwargs(system_prompt, user_prompt)
+        start = time.perf_counter()
+
+        def request():
+            return self.async_client.chat.completions.create(**kwargs)
+
+        if self.limiter is not None:
+            response = await self.limiter.acall(request, tokens=self._estimate_tokens(system_prompt, user_prompt))
+        else:
+            response = await request()
+        self._record_usage(response.usage, start)
+        return response.choices[0].message.content
+
+    def complete_stream(self, system_prompt: str, user_prompt: str,
+                        required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        """
+        Como complete(), pero leyendo la respuesta por streaming. Al cerrar
+        el stream antes de tiempo se corta la petición HTTP y el proveedor
+        deja de generar tokens. Si el objeto llega completo se sigue leyendo
+        hasta el final para recibir el usage (un corte anticipado no lo trae).
+
+        El stream se lee dentro de la llamada al limiter: ocupa un hueco de
+        concurrencia hasta cerrarse, y un 429 o un corte a mitad de lectura
+        cuentan para el AIMD y se reintentan como cualquier otra llamada.
+        """
+        kwargs = dict(self._request_kwargs(system_prompt, user_prompt), stream=True,
+                      stream_options={"include_usage": True})
+        start = time.perf_counter()
+
+        def request():
+            stream = self.client.chat.completions.create(**kwargs)
+            parser = StreamingJSONParser(required)
+            usage = None
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    text = _delta_text(chunk)
+                    if text and parser.feed(text) and not parser.complete:
+                        break
+            finally:
+                stream.close()
+            return parser, usage
+
+        if self.limiter is not None:
+            parser, usage = self.limiter.call(request, tokens=self._estimate_tokens(system_prompt, user_prompt))
+        else:
+            parser, usage = request()
+        self.stream_stats.record(parser)
+        self._record_usage(usage, start, stream=True)
+        return parser.result_text()
+
+    async def acomplete_stream(self, system_prompt: str, user_prompt: str,
+                               required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        kwargs = dict(self._request_kwargs(system_prompt, user_prompt), stream=True,
+                      stream_options={"include_usage": True})
+        start = time.perf_counter()
+
+        async def request():
+            stream = await self.async_client.chat.completions.create(**kwargs)
+            parser = StreamingJSONParser(required)
+            usage = None
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    text = _delta_text(chunk)
+                    if text and parser.feed(text) and not parser.complete:
+                        break
+            finally:
+                await stream.close()
+            return parser, usage
+
+        if self.limiter is not None:
+            parser, usage = await self.limiter.acall(request, tokens=self._estimate_tokens(system_prompt, user_prompt))
+        else:
+            parser, usage = await request()
+        self.stream_stats.record(parser)
+        self._record_usage(usage, start, stream=True)
+        return parser.result_text()
+
+
+# ---------------------------------------------------------------------
+# Clasificador local por reglas
+# ---------------------------------------------------------------------
+_COMBINING_RE = re.compile(r"[\u0300-\u036f]")
+
+
+def _fold(text: str) -> str:
+    """Minúsculas y sin tildes (para comparar palabras clave)."""
+    return _COMBINING_RE.sub("", unicodedata.normalize("NFD", text.lower()))
+
+
+TD0_CUES = re.compile(r"\boficio\b|\bremito\b|informe tecnico|\bradicado\b|\bresolucion\b|cordial saludo")
+TD3_CUES = re.compile(r"me desmovilice|cuando estaba en (el grupo|la guerrilla|las autodefensas)|yo era (guerrillero|paramilitar|combatiente)")
+TD4_CUES = re.compile(r"fui testigo|presencie|vi como|yo vi")
+TD2_CUES = re.compile(r"\bmi (esposo|esposa|hijo|hija|hermano|hermana|padre|madre|papa|mama|companero|companera)\b")
+FIRST_PERSON = re.compile(r"\b(yo|me|nos|mi)\b")
+
+
+# Una expresión por código: más rápido que una sola alternativa con grupos
+# con nombre, que anula la búsqueda por prefijo literal de `re`
+_COMPILED_HECHOS = [(code, re.compile(p)) for code, p in HECHO_RULES]
+_COMPILED_ACTORES = [(code, re.compile(p)) for code, p in ACTOR_RULES]
+_YEAR_RE = re.compile(r"\b(19[5-9]\d|20[0-4]\d)\b")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@functools.lru_cache(maxsize=4)
+def _period_ranges(ontology: CompiledOntology) -> List[tuple]:
+    """(año inicial, año final, código) a partir de las etiquetas "1991-2000"."""
+    ranges = []
+    for code, label in ontology.labels["periodo"].items():
+        match = re.fullmatch(r"\s*(\d{4})\s*-\s*(\d{4})\s*", label)
+        if match:
+            ranges.append((int(match.group(1)), int(match.group(2)), code))
+    return ranges
+
+
+def rule_based_prediction(text: str) -> Dict:
+    """
+    Predicción determinista por palabras clave. No pretende calidad de
+    modelo: produce salidas plausibles y siempre válidas según la ontología.
+    """
+    folded = _fold(text)
+
+    hechos = [code for code, rx in _COMPILED_HECHOS if rx.search(folded)]
+    actores = [code for code, rx in _COMPILED_ACTORES if rx.search(folded)] or ["ACT0"]
+
+    territorio = get_gazetteer().departments(text) or [UNKNOWN_TERRITORIO]
+
+    periodo = "PER0"
+    year = _YEAR_RE.search(folded)
+    if year:
+        y = int(year.group(1))
+        periodo = next((code for lo, hi, code in _period_ranges(get_ontology()) if lo <= y <= hi), "PER0")
+
+    first_person = FIRST_PERSON.search(folded) is not None
+    if TD3_CUES.search(folded):
+        tipo_documento = "TD3"
+    elif TD0_CUES.search(folded) and not first_person:
+        tipo_documento = "TD0"
+    elif TD2_CUES.search(folded) and "TH1" in hechos:
+        tipo_documento = "TD2"
+    elif TD4_CUES.search(folded):
+        tipo_documento = "TD4"
+    elif first_person:
+        tipo_documento = "TD1"
+    else:
+        tipo_documento = "TD0"
+
+    if tipo_documento == "TD0":
+        ruteo = "RU0"
+    elif "TH1" in hechos:
+        ruteo = "RU1"
+    elif "TH4" in hechos or "TH6" in hechos:
+        ruteo = "RU3"
+    elif hechos:
+        ruteo = "RU2"
+    else:
+        ruteo = "RU4"
+
+    highlights = []
+    if hechos:
+        for sentence in _SENTENCE_RE.split(text.strip()):
+            f = _fold(sentence)
+            if any(rx.search(f) for _, rx in _COMPILED_HECHOS):
+                highlights.append(sentence.strip()[:160])
+            if len(highlights) == 3:
+                break
+
+    return {
+        "tipo_documento": tipo_documento,
+        "tipo_hecho": hechos,
+        "territorio": territorio,
+        "periodo": periodo,
+        "actores": actores,
+        "ruteo": ruteo,
+        "highlights": highlights,
+    }
+
+
+class RuleBasedBackend:
+    """
+    Backend local determinista. `latency_s` (más un jitter uniforme opcional
+    de hasta `jitter_s`) simula el tiempo de respuesta del proveedor; en
+    modo streaming, `latency_s` es el tiempo hasta el primer fragmento y
+    cada fragmento de `stream_chunk_chars` caracteres tarda `chunk_latency_s`.
+    """
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0, seed: int = 0,
+                 model_name: str = RULES_MODEL_NAME, chunk_latency_s: float = 0.0,
+                 stream_chunk_chars: int = 16):
+        self.model_name = model_name
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.chunk_latency_s = chunk_latency_s
+        self.stream_chunk_chars = stream_chunk_chars
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.stream_stats = StreamStats()
+
+    def _delay(self) -> float:
+        if self.jitter_s:
+            return self.latency_s + self._rng.uniform(0, self.jitter_s)
+        return self.latency_s
+
+    def respond(self, user_prompt: str) -> str:
+        self.calls += 1
+        pred = rule_based_prediction(extract_document(user_prompt))
+        return json.dumps(pred, ensure_ascii=False)
+
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        return self.respond(user_prompt)
+
+    async def acomplete(self, system_prompt: str, user_prompt: str) -> str:
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self.respond(user_prompt)
+
+    def complete_stream(self, system_prompt: str, user_prompt: str,
+                        required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        parser = StreamingJSONParser(required)
+        for chunk in iter_chunks(self.respond(user_prompt), self.stream_chunk_chars):
+            if self.chunk_latency_s:
+                time.sleep(self.chunk_latency_s)
+            if parser.feed(chunk):
+                break
+        self.stream_stats.record(parser)
+        return parser.result_text()
+
+    async def acomplete_stream(self, system_prompt: str, user_prompt: str,
+                               required: Optional[tuple] = REQUIRED_FIELDS) -> str:
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        parser = StreamingJSONParser(required)
+        for chunk in iter_chunks(self.respond(user_prompt), self.stream_chunk_chars):
+            if self.chunk_latency_s:
+                await asyncio.sleep(self.chunk_latency_s)
+            if parser.feed(chunk):
+                break
+        self.stream_stats.record(parser)
+        return parser.result_text()
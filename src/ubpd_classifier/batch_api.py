@@ -0,0 +1,331 @@
+"""
+batch_api.py
+Modo por lotes diferido (OpenAI Batch API) para cargas nocturnas:
+serializa las peticiones en un JSONL, lo envía, consulta su estado y
+recoge los resultados hacia la base de datos, con posibilidad de reanudar.
+
+Cada documento pasa por el mismo preprocesado (con su source_system),
+presupuesto de tokens y división en fragmentos que classify_document: un
+documento largo envía una petición por fragmento y sus respuestas se
+fusionan al recoger. El estado guarda las versiones de prompt y ontología
+del envío, que se graban en cada run aunque se recoja horas después.
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import classifier
+from backends import OpenAIBackend
+from chunking import merge_predictions
+from classifier import parse_model_response, validate_and_fix
+from ontology import get_ontology
+from preprocessing import preprocess_text
+from prompts import build_user_prompt, get_system_prompt, prompt_version
+from runner import iter_input_dir, iter_manifest, read_text_from_file
+from schema import response_format
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+DEFAULT_SOURCE_SYSTEM = "BATCH_API"
+
+# custom_id de cada fragmento de un documento largo: "doc-3#0", "doc-3#1"...
+CHUNK_SEP = "#"
+
+# Documentos guardados por transacción al recoger resultados
+DEFAULT_SAVE_CHUNK = 500
+
+
+# ---------------------------------------------------------------------
+# Estado persistente del lote
+# ---------------------------------------------------------------------
+def load_state(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    """Escritura atómica: un corte a mitad nunca deja el estado corrupto."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------
+# Preparación y envío
+# ---------------------------------------------------------------------
+def build_batch_request(custom_id: str, document: str) -> Dict[str, Any]:
+    """Una línea del JSONL para un texto ya preparado: mismo prompt que la ruta síncrona."""
+    request = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": classifier.MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": get_system_prompt()},
+                {"role": "user", "content": build_user_prompt(document)},
+            ],
+            "temperature": 0.0,
+        },
+    }
+    if classifier.STRUCTURED_OUTPUT:
+        request["body"]["response_format"] = response_format()
+    return request
+
+
+def build_batch_requests(doc_key: str, text: str, source_system: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Líneas del JSONL de un documento, preparado como en classify_document
+    (preprocess_text con su fuente y prepare_chunks). Un documento largo da
+    una línea por fragmento, con custom_id doc_key#i.
+    """
+    chunks, _ = classifier.prepare_chunks(preprocess_text(text, source_system))
+    if len(chunks) == 1:
+        return [build_batch_request(doc_key, chunks[0])]
+    return [build_batch_request(f"{doc_key}{CHUNK_SEP}{i}", chunk) for i, chunk in enumerate(chunks)]
+
+
+def write_batch_file(items: Iterable[dict], requests_path: str,
+                     source_system: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Escribe el JSONL de peticiones. Devuelve doc_key → {path, external_id,
+    chunks} para poder asociar después cada respuesta con su archivo.
+    """
+    mapping: Dict[str, dict] = {}
+    with open(requests_path, "w", encoding="utf-8") as f:
+        for index, item in enumerate(items):
+            doc_key = f"doc-{index}"
+            text = read_text_from_file(item["path"])
+            requests = build_batch_requests(doc_key, text, source_system)
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            mapping[doc_key] = {"path": item["path"], "external_id": item.get("external_id"),
+                                "chunks": len(requests)}
+    return mapping
+
+
+def submit_batch(client, items: Iterable[dict], requests_path: str, state_path: str,
+                 source_system: str = DEFAULT_SOURCE_SYSTEM) -> Dict[str, Any]:
+    """
+    Prepara el JSONL, lo sube y crea el lote. Guarda el estado en disco,
+    con las versiones de prompt y ontología con que se construyeron las
+    peticiones.
+    """
+    versions = {"ontology_hash": get_ontology().version, "prompt_hash": prompt_version()}
+    mapping = write_batch_file(items, requests_path, source_system)
+    with open(requests_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+    )
+    state = {
+        "batch_id": batch.id,
+        "input_file_id": uploaded.id,
+        "requests_path": requests_path,
+        "model_name": classifier.MODEL_NAME,
+        "source_system": source_system,
+        **versions,
+        "items": mapping,
+        "collected": [],
+        "failed": {},
+    }
+    save_state(state_path, state)
+    return state
+
+
+def poll_batch(client, batch_id: str, interval: float = 60.0, timeout: Optional[float] = None):
+    """Consulta el lote hasta que llegue a un estado final."""
+    start = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - start >= timeout:
+            return batch
+        time.sleep(interval)
+
+
+# ---------------------------------------------------------------------
+# Recogida de resultados
+# ---------------------------------------------------------------------
+def _read_jsonl_file(client, file_id: Optional[str]) -> List[dict]:
+    if not file_id:
+        return []
+    content = client.files.content(file_id).text
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def _response_text(line: dict) -> str:
+    """Extrae el contenido del mensaje de una línea de salida del lote."""
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code", 200) != 200:
+        raise RuntimeError(json.dumps(line.get("error") or response.get("body"), ensure_ascii=False))
+    return response["body"]["choices"][0]["message"]["content"]
+
+
+def collect_batch(
+    client,
+    state_path: str,
+    save: Optional[Callable[[List[dict]], List[tuple]]] = None,
+    source_system: Optional[str] = None,
+    chunk_size: int = DEFAULT_SAVE_CHUNK,
+) -> Dict[str, int]:
+    """
+    Descarga la salida del lote, la pasa por parse_model_response (y
+    merge_predictions si el documento iba en fragmentos) y validate_and_fix
+    y la guarda con `save` (db.save_many) por bloques. `source_system` es
+    la fuente con que se guardan los documentos (por defecto, la del envío).
+
+    Tras cada bloque guardado se actualiza el estado, de modo que una
+    recogida interrumpida se reanuda sin duplicar documentos.
+    """
+    state = load_state(state_path)
+    batch = client.batches.retrieve(state["batch_id"])
+    state["output_file_id"] = getattr(batch, "output_file_id", None)
+    state["error_file_id"] = getattr(batch, "error_file_id", None)
+
+    collected = set(state["collected"])
+    failed: Dict[str, str] = state.setdefault("failed", {})
+    lines = _read_jsonl_file(client, state["output_file_id"])
+    lines += _read_jsonl_file(client, state["error_file_id"])
+
+    # Respuestas por documento y fragmento
+    parts: Dict[str, Dict[int, dict]] = {}
+    for line in lines:
+        doc_key, _, index = (line.get("custom_id") or "").partition(CHUNK_SEP)
+        if doc_key in collected or doc_key not in state["items"]:
+            continue
+        parts.setdefault(doc_key, {})[int(index or 0)] = line
+
+    submitted_source = state.get("source_system")
+    source_system = source_system or submitted_source or DEFAULT_SOURCE_SYSTEM
+    versions = {key: state[key] for key in ("ontology_hash", "prompt_hash") if state.get(key)}
+    pending: List[tuple] = []
+    saved = 0
+
+    def flush():
+        nonlocal saved
+        if not pending:
+            return
+        if save is not None:
+            save([doc for _, doc in pending])
+        for doc_key, _ in pending:
+            collected.add(doc_key)
+            failed.pop(doc_key, None)
+        saved += len(pending)
+        pending.clear()
+        state["collected"] = sorted(collected)
+        save_state(state_path, state)
+
+    for doc_key, doc_parts in parts.items():
+        item = state["items"][doc_key]
+        expected = item.get("chunks", 1)
+        try:
+            if len(doc_parts) < expected:
+                raise RuntimeError(f"faltan {expected - len(doc_parts)} de {expected} fragmentos")
+            preds = [parse_model_response(_response_text(doc_parts[i])) for i in range(expected)]
+            text = read_text_from_file(item["path"])
+            pred = preds[0] if expected == 1 else merge_predictions(preds)
+            pred = validate_and_fix(pred, preprocess_text(text, submitted_source))
+        except Exception as e:
+            failed[doc_key] = f"{type(e).__name__}: {e}"
+            continue
+        pred.setdefault("model_name", state.get("model_name", classifier.MODEL_NAME))
+        pred.setdefault("model_version", "")
+        for key, version in versions.items():
+            pred.setdefault(key, version)
+        pending.append((doc_key, {
+            "text": text,
+            "classification": pred,
+            "external_id": item.get("external_id"),
+            "source_system": source_system,
+            "filename": item["path"],
+        }))
+        if len(pending) >= chunk_size:
+            flush()
+    flush()
+    save_state(state_path, state)
+
+    return {
+        "status": batch.status,
+        "saved": saved,
+        "collected": len(collected),
+        "failed": len(failed),
+        "total": len(state["items"]),
+    }
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="UBPD – modo Batch API para cargas diferidas")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_submit = sub.add_parser("submit", help="Preparar y enviar un lote.")
+    p_submit.add_argument("--input-dir", type=str)
+    p_submit.add_argument("--manifest", type=str)
+    p_submit.add_argument("--pattern", type=str, default="*.txt")
+    p_submit.add_argument("--requests", type=str, default="ubpd_batch_requests.jsonl")
+    p_submit.add_argument("--state", type=str, required=True)
+    p_submit.add_argument("--source-system", type=str, default=DEFAULT_SOURCE_SYSTEM)
+
+    p_status = sub.add_parser("status", help="Consultar el estado del lote.")
+    p_status.add_argument("--state", type=str, required=True)
+
+    p_collect = sub.add_parser("collect", help="Esperar y recoger resultados (reanudable).")
+    p_collect.add_argument("--state", type=str, required=True)
+    p_collect.add_argument("--no-db", action="store_true")
+    p_collect.add_argument("--no-wait", action="store_true")
+    p_collect.add_argument("--interval", type=float, default=60.0)
+    p_collect.add_argument("--source-system", type=str,
+                           help="Fuente con que se guardan los documentos (default: la del envío).")
+
+    args = parser.parse_args()
+    backend = classifier.get_backend()
+    if not isinstance(backend, OpenAIBackend):
+        print("ERROR: el modo Batch API requiere el backend OpenAI (UBPD_LLM_BACKEND=openai).")
+        return
+    client = backend.client
+
+    if args.command == "submit":
+        if args.manifest:
+            items = iter_manifest(args.manifest)
+        elif args.input_dir:
+            items = iter_input_dir(args.input_dir, args.pattern)
+        else:
+            print("Debe proporcionar --input-dir o --manifest.")
+            return
+        state = submit_batch(client, items, args.requests, args.state, args.source_system)
+        print(f"Lote enviado: {state['batch_id']} ({len(state['items'])} documentos)")
+
+    elif args.command == "status":
+        batch = client.batches.retrieve(load_state(args.state)["batch_id"])
+        print(f"{batch.id}: {batch.status}")
+
+    elif args.command == "collect":
+        state = load_state(args.state)
+        if not args.no_wait:
+            batch = poll_batch(client, state["batch_id"], interval=args.interval)
+            print(f"Lote {batch.id}: {batch.status}")
+        save = None
+        if not args.no_db:
+            from db import save_many
+            save = save_many
+        summary = collect_batch(client, args.state, save=save, source_system=args.source_system)
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
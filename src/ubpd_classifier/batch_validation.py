@@ -0,0 +1,252 @@
+"""
+batch_validation.py
+Validación y arreglo vectorizados (NumPy) de muchas predicciones a la vez.
+
+Pensado para re-procesar millones de raw_json guardados o en caché tras un
+cambio de ontología o de pesos de prioridad. Las etiquetas se codifican
+como enteros según la ontología, las dimensiones multi-etiqueta se
+resumen en máscaras de bits y priority_score se calcula como suma
+ponderada sobre arreglos. El resultado es idéntico al de validate_and_fix.
+Autor: Manuel Daza Ramirez
+"""
+
+import gc
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from classifier import SINGLE_LABEL_DEFAULTS
+from gazetteer import UNKNOWN_TERRITORIO, get_gazetteer
+from ontology import CompiledOntology, get_ontology
+from priority import MULTI_LABEL_FIELDS, PriorityRules, get_priority_rules
+
+
+# Las máscaras de bits son uint64: una dimensión multi-etiqueta puede
+# tener como mucho 64 códigos
+MAX_MULTI_LABEL_CODES = 64
+
+
+# ---------------------------------------------------------------------
+# Codificación de etiquetas
+# ---------------------------------------------------------------------
+class LabelCodec:
+    """
+    Códigos enteros de una dimensión: 0..n-1 en el orden de la ontología
+    y -1 para valores desconocidos. Si `default` no es un código de la
+    ontología se añade al final para poder decodificarlo.
+    """
+
+    def __init__(self, labels: Sequence[str], default: Optional[str] = None):
+        labels = list(labels)
+        if default is not None and default not in labels:
+            labels.append(default)
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.index: Dict[str, int] = {label: i for i, label in enumerate(labels)}
+        self.default = self.index[default] if default is not None else -1
+        self._table = np.array(self.labels, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def encode(self, values) -> np.ndarray:
+        """Código de cada valor (-1 si no es una etiqueta válida)."""
+        get = self.index.get
+        return np.fromiter((get(v, -1) for v in values), dtype=np.int32, count=len(values))
+
+    def decode(self, codes: np.ndarray) -> List[str]:
+        return self._table.take(codes).tolist()
+
+
+@lru_cache(maxsize=4)
+def _codecs(ontology: CompiledOntology) -> Dict[str, LabelCodec]:
+    codecs = {}
+    for field, default in SINGLE_LABEL_DEFAULTS.items():
+        codecs[field] = LabelCodec(ontology.labels[field], default)
+    for field in MULTI_LABEL_FIELDS:
+        codec = LabelCodec(ontology.labels[field])
+        if len(codec) > MAX_MULTI_LABEL_CODES:
+            raise ValueError(
+                f"{field} tiene {len(codec)} códigos; el máximo para máscaras "
+                f"de bits es {MAX_MULTI_LABEL_CODES}."
+            )
+        codecs[field] = codec
+    return codecs
+
+
+# ---------------------------------------------------------------------
+# Dimensiones
+# ---------------------------------------------------------------------
+# Los mismos valores se repiten muchísimo entre predicciones: cada campo se
+# factoriza (valor → id de valor único) y la validación con NumPy se hace
+# sobre los valores únicos; las filas toman su resultado con un take.
+_NOT_A_LIST = object()
+
+
+def _factorize(values) -> Tuple[np.ndarray, list]:
+    """Id de cada valor y lista de valores únicos en orden de aparición."""
+    uniques: Dict[object, int] = {}
+    ids = [uniques.setdefault(v, len(uniques)) for v in values]
+    return np.array(ids, dtype=np.intp), list(uniques)
+
+
+def _fix_single(preds: List[dict], codec: LabelCodec, field: str) -> np.ndarray:
+    ids, uniques = _factorize([p.get(field) for p in preds])
+    codes = codec.encode(uniques)
+    return np.where(codes < 0, codec.default, codes).take(ids)
+
+
+def _fix_multi(preds: List[dict], codec: LabelCodec, field: str) -> Tuple[List[list], np.ndarray]:
+    """Listas filtradas (mismo orden y repeticiones) y máscara de bits por predicción."""
+    ids, uniques = _factorize([
+        tuple(v) if isinstance(v, list) else _NOT_A_LIST
+        for v in (p.get(field, []) for p in preds)
+    ])
+    lists = [() if u is _NOT_A_LIST else u for u in uniques]
+    n = len(lists)
+    lengths = np.fromiter(map(len, lists), dtype=np.intp, count=n)
+
+    flat = list(chain.from_iterable(lists))
+    codes = codec.encode(flat)
+    valid = codes >= 0
+    owners = np.repeat(np.arange(n), lengths)
+
+    masks = np.zeros(n, dtype=np.uint64)
+    np.bitwise_or.at(masks, owners[valid], np.left_shift(np.uint64(1), codes[valid].astype(np.uint64)))
+
+    # Solo los valores con alguna etiqueta inválida se reconstruyen
+    fixed = list(lists)
+    dirty = np.flatnonzero(np.bincount(owners[~valid], minlength=n))
+    if dirty.size:
+        offsets = np.concatenate(([0], np.cumsum(lengths))).tolist()
+        valid_list = valid.tolist()
+        for u in dirty.tolist():
+            start, end = offsets[u], offsets[u + 1]
+            fixed[u] = tuple(v for v, ok in zip(flat[start:end], valid_list[start:end]) if ok)
+    templates = [list(f) for f in fixed]
+    return [templates[u][:] for u in ids.tolist()], masks.take(ids)
+
+
+def _fix_territorio(preds: List[dict], texts: Optional[Sequence[Optional[str]]]) -> List[list]:
+    """fix_territorio resolviendo cada combinación distinta de valores una sola vez."""
+    gazetteer = get_gazetteer()
+    keys = [tuple(v) if isinstance(v, list) else () for v in (p.get("territorio", []) for p in preds)]
+    try:
+        ids, uniques = _factorize(keys)
+    except TypeError:
+        # Elementos no hashables (p. ej. dicts): fix_territorio los ignora
+        ids, uniques = _factorize([tuple(v for v in key if isinstance(v, str)) for key in keys])
+    resolved = []
+    for key in uniques:
+        found: List[str] = []
+        for value in key:
+            if isinstance(value, str):
+                found.extend(gazetteer.resolve(value))
+        resolved.append(list(dict.fromkeys(found)))
+
+    if texts is None:
+        templates = [r or [UNKNOWN_TERRITORIO] for r in resolved]
+        return [templates[u][:] for u in ids.tolist()]
+
+    # Sin valores reconocidos se usan los departamentos del texto
+    result = []
+    for u, text in zip(ids.tolist(), texts):
+        found = resolved[u]
+        if not found and text:
+            found = gazetteer.departments(text)
+        result.append(list(dict.fromkeys(found)) if found else [UNKNOWN_TERRITORIO])
+    return result
+
+
+def compute_priority_batch(codecs: Dict[str, LabelCodec], single: Dict[str, np.ndarray],
+                           masks: Dict[str, np.ndarray], rules: PriorityRules) -> np.ndarray:
+    """
+    priority_score de todas las predicciones ya arregladas: suma de los
+    pesos de las reglas en el mismo orden que compute_priority (mismo
+    redondeo) y tope en rules.max_score.
+    """
+    n = len(next(iter(single.values())))
+    score = np.zeros(n, dtype=np.float64)
+    for field, code, weight in rules:
+        index = codecs[field].index.get(code)
+        if index is None:
+            continue  # un código fuera de la ontología nunca sobrevive al arreglo
+        if field in masks:
+            hit = (masks[field] >> np.uint64(index)) & np.uint64(1) == 1
+        else:
+            hit = single[field] == index
+        score += np.where(hit, weight, 0.0)
+    return np.minimum(score, rules.max_score)
+
+
+# ---------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------
+@contextmanager
+def _gc_paused():
+    """
+    Pausa el recolector cíclico: crear millones de listas pequeñas con
+    millones de dicts vivos dispara recolecciones completas que cuestan
+    más que la propia validación (aquí no se crean ciclos).
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def validate_and_fix_batch(preds: List[dict],
+                           texts: Optional[Sequence[Optional[str]]] = None,
+                           rules: Optional[PriorityRules] = None) -> List[dict]:
+    """
+    validate_and_fix para una lista de predicciones. Igual que la versión
+    escalar, modifica cada diccionario y lo devuelve (en la misma lista);
+    `texts[i]` es el texto preprocesado de preds[i] o None y `rules` las
+    reglas de prioridad (por defecto, las del proceso).
+    """
+    if texts is not None and len(texts) != len(preds):
+        raise ValueError("texts debe tener un elemento por predicción.")
+    if not preds:
+        return preds
+    with _gc_paused():
+        _fix_all(preds, texts, rules or get_priority_rules())
+    return preds
+
+
+def _fix_all(preds: List[dict], texts: Optional[Sequence[Optional[str]]], rules: PriorityRules) -> None:
+    codecs = _codecs(get_ontology())
+    single = {field: _fix_single(preds, codecs[field], field) for field in SINGLE_LABEL_DEFAULTS}
+    multi = {field: _fix_multi(preds, codecs[field], field) for field in MULTI_LABEL_FIELDS}
+
+    # Regla automática: sin tipo de documento no hay ruteo
+    td = codecs["tipo_documento"]
+    ruteo = codecs["ruteo"]
+    single["ruteo"] = np.where(single["tipo_documento"] == td.default, ruteo.default, single["ruteo"])
+
+    scores = compute_priority_batch(
+        codecs, single, {field: masks for field, (_, masks) in multi.items()}, rules
+    ).tolist()
+    territorio = _fix_territorio(preds, texts)
+
+    tipo_documento = td.decode(single["tipo_documento"])
+    periodo = codecs["periodo"].decode(single["periodo"])
+    ruteo_labels = ruteo.decode(single["ruteo"])
+    tipo_hecho, _ = multi["tipo_hecho"]
+    actores, _ = multi["actores"]
+
+    # Mismo orden de asignación que validate_and_fix (orden de claves del dict)
+    for i, p in enumerate(preds):
+        p["tipo_documento"] = tipo_documento[i]
+        p["tipo_hecho"] = tipo_hecho[i]
+        p["periodo"] = periodo[i]
+        p["actores"] = actores[i]
+        p["ruteo"] = ruteo_labels[i]
+        p["territorio"] = territorio[i]
+        if not isinstance(p.get("highlights"), list):
+            p["highlights"] = []
+        p["priority_score"] = scores[i]
@@ -0,0 +1,251 @@
+"""
+budget.py
+Presupuesto de tokens por documento, medido sobre el prompt completo que se
+envía (system prompt + parte fija del mensaje de usuario + documento) con
+el tokenizador local (tokenizer.py).
+
+Si el prompt supera UBPD_MAX_PROMPT_TOKENS, UBPD_BUDGET_POLICY decide qué
+hacer con el documento:
+- chunk (default): no se recorta; chunking lo divide en fragmentos cuyo
+  prompt completo cabe en UBPD_MAX_PROMPT_TOKENS (medido con el
+  tokenizador) y se fusionan las predicciones.
+- head_tail: se conservan frases del principio y del final.
+- cues: se conservan primero las frases con pistas de fecha, lugar o actor
+  armado (las que deciden periodo, territorio y actores) y el resto del
+  presupuesto se llena desde el principio.
+Los huecos que deja el recorte se marcan con OMISSION_MARK.
+Autor: Manuel Daza Ramirez
+"""
+
+import os
+import re
+import threading
+from typing import List, NamedTuple, Optional, Set
+
+from chunking import sentence_units
+from gazetteer import fold, get_gazetteer
+from prompts import USER_PREFIX, get_system_prompt
+from tokenizer import Tokenizer, get_tokenizer
+
+
+POLICIES = ("chunk", "head_tail", "cues")
+DEFAULT_POLICY = "chunk"
+
+OMISSION_MARK = "[...]"
+
+# Parte del presupuesto para el principio del documento en head_tail
+HEAD_FRACTION = 0.6
+
+# Tokens de formato de chat.completions: 3 por mensaje (system y user) y 3
+# de arranque de la respuesta
+CHAT_OVERHEAD_TOKENS = 3 * 2 + 3
+
+# Pistas de texto por código, sobre texto en minúsculas y sin tildes. Las
+# usan la política "cues" y el backend local por reglas (backends.py).
+HECHO_RULES = [
+    ("TH1", r"desapare|se (lo|la|los|las) llevaron|se llevaron a|nunca (mas|volvi)"),
+    ("TH2", r"asesin|mataron|homicidio|masacre"),
+    ("TH3", r"desplaz|(tuvimos|debimos) (que )?(salir|huir)|salimos huyendo"),
+    ("TH4", r"violencia sexual|violaron|abuso sexual"),
+    ("TH5", r"reclut|se llevaron a los ninos|menores de edad al grupo"),
+    ("TH6", r"tortur|golpearon|amarraron"),
+]
+
+ACTOR_RULES = [
+    ("ACT1", r"ejercito|policia|fuerza publica|soldados|militares"),
+    ("ACT2", r"guerrill|farc|eln|epl"),
+    ("ACT3", r"paramilitar|\bauc\b|autodefensas|paras\b"),
+    ("ACT4", r"bacrim|clan del golfo|aguilas negras|disidencia"),
+    ("ACT5", r"hombres armados|encapuchados|grupo armado"),
+]
+
+_DATE_RE = re.compile(
+    r"\b(19[5-9]\d|20[0-4]\d)\b|\b(enero|febrero|marzo|abril|mayo|junio|julio|agosto|"
+    r"septiembre|setiembre|octubre|noviembre|diciembre)\b"
+)
+_ACTOR_RE = re.compile("|".join(f"(?:{pattern})" for _, pattern in ACTOR_RULES))
+
+
+class BudgetResult(NamedTuple):
+    text: str              # documento que se envía
+    original_tokens: int   # prompt completo con el documento original
+    sent_tokens: int       # prompt completo con el documento enviado
+    truncated: bool
+
+
+# ---------------------------------------------------------------------
+# Selección de frases
+# ---------------------------------------------------------------------
+def _assemble(units: List[str], keep: Set[int]) -> str:
+    """Frases conservadas en su orden, con OMISSION_MARK en cada hueco."""
+    parts = []
+    previous = -1
+    for index in sorted(keep):
+        if index != previous + 1:
+            parts.append(OMISSION_MARK + " ")
+        parts.append(units[index] + " ")
+        previous = index
+    if previous != len(units) - 1:
+        parts.append(OMISSION_MARK)
+    return "".join(parts).strip()
+
+
+def _select(units: List[str], order: List[int], available: int,
+            tokenizer: Tokenizer) -> Set[int]:
+    """
+    Añade frases en el orden dado mientras quepan. Cada frase reserva una
+    marca de omisión (cota superior de los huecos que puede abrir).
+    """
+    mark = tokenizer.count(f" {OMISSION_MARK} ")
+    keep: Set[int] = set()
+    used = mark
+    for index in order:
+        cost = tokenizer.count(units[index] + " ") + mark
+        if used + cost <= available:
+            keep.add(index)
+            used += cost
+    return keep
+
+
+def compress_head_tail(text: str, available: int, tokenizer: Tokenizer) -> str:
+    """Frases seguidas del principio (hasta HEAD_FRACTION) y del final."""
+    units = sentence_units(text)
+    costs = [tokenizer.count(sentence + " ") for sentence in units]
+    used = 2 * tokenizer.count(f" {OMISSION_MARK} ")
+    head_cap = int(available * HEAD_FRACTION)
+    end = 0
+    while end < len(units) and used + costs[end] <= head_cap:
+        used += costs[end]
+        end += 1
+    start = len(units)
+    while start > end and used + costs[start - 1] <= available:
+        start -= 1
+        used += costs[start]
+    return _assemble(units, set(range(end)) | set(range(start, len(units))))
+
+
+def cue_flags(sentence: str) -> int:
+    """Número de pistas (fecha, lugar, actor armado) presentes en una frase."""
+    folded = fold(sentence)
+    return (
+        (_DATE_RE.search(folded) is not None)
+        + bool(get_gazetteer().scan(sentence))
+        + (_ACTOR_RE.search(folded) is not None)
+    )
+
+
+def compress_cues(text: str, available: int, tokenizer: Tokenizer) -> str:
+    """Frases con pistas primero; el resto del presupuesto, desde el principio."""
+    units = sentence_units(text)
+    scores = [cue_flags(sentence) for sentence in units]
+    # Primera frase (contexto), después las de más pistas y luego el resto
+    # desde el principio
+    cued = sorted((i for i, s in enumerate(scores) if s), key=lambda i: (-scores[i], i))
+    order = [0] + [i for i in cued if i] + [i for i, s in enumerate(scores) if not s and i]
+    return _assemble(units, _select(units, order, available, tokenizer))
+
+
+_COMPRESSORS = {"head_tail": compress_head_tail, "cues": compress_cues}
+
+
+# ---------------------------------------------------------------------
+# Presupuesto
+# ---------------------------------------------------------------------
+class TokenBudget:
+    """
+    Cuenta los tokens del prompt completo de un documento y, si pasa de
+    `max_prompt_tokens` (None: sin límite), lo recorta según `policy`.
+    """
+
+    def __init__(self, max_prompt_tokens: Optional[int] = None, policy: str = DEFAULT_POLICY,
+                 tokenizer: Optional[Tokenizer] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de presupuesto desconocida: {policy!r} (opciones: {', '.join(POLICIES)})")
+        if max_prompt_tokens is not None and max_prompt_tokens < 1:
+            raise ValueError("max_prompt_tokens debe ser >= 1.")
+        self.max_prompt_tokens = max_prompt_tokens
+        self.policy = policy
+        self._tokenizer = tokenizer
+        self._overhead = (None, 0)   # (clave, tokens)
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        return self._tokenizer if self._tokenizer is not None else get_tokenizer()
+
+    def overhead_tokens(self) -> int:
+        """Tokens fijos de cada llamada (se recalculan si cambia el prompt)."""
+        tokenizer = self.tokenizer
+        system_prompt = get_system_prompt()
+        key = (system_prompt, tokenizer.name)
+        cached_key, tokens = self._overhead
+        if cached_key != key:
+            tokens = tokenizer.count(system_prompt) + tokenizer.count(USER_PREFIX) + CHAT_OVERHEAD_TOKENS
+            self._overhead = (key, tokens)
+        return tokens
+
+    def prompt_tokens(self, document: str) -> int:
+        """Tokens del prompt completo para un documento (o fragmento)."""
+        return self.overhead_tokens() + self.tokenizer.count(document)
+
+    def available_tokens(self) -> int:
+        """Tokens que quedan para el documento dentro de max_prompt_tokens."""
+        available = self.max_prompt_tokens - self.overhead_tokens()
+        if available < 1:
+            raise ValueError(
+                f"El prompt fijo ({self.overhead_tokens()} tokens) no cabe en max_prompt_tokens={self.max_prompt_tokens}."
+            )
+        return available
+
+    def chunk_tokens(self, default: int) -> int:
+        """
+        Tamaño de fragmento en tokens del tokenizador: `default`
+        (UBPD_CHUNK_TOKENS), sin pasar de lo que deja libre max_prompt_tokens.
+        """
+        if self.max_prompt_tokens is None:
+            return default
+        return min(default, self.available_tokens())
+
+    def fit(self, text: str) -> BudgetResult:
+        original = self.prompt_tokens(text)
+        if self.policy == "chunk" or self.max_prompt_tokens is None or original <= self.max_prompt_tokens:
+            return BudgetResult(text, original, original, False)
+
+        available = self.available_tokens()
+        tokenizer = self.tokenizer
+        fitted = _COMPRESSORS[self.policy](text, available, tokenizer)
+        if not fitted.replace(OMISSION_MARK, "").strip():
+            fitted = tokenizer.truncate(text, available)  # una sola frase enorme
+        if tokenizer.count(fitted) > available:
+            fitted = tokenizer.truncate(fitted, available)
+        return BudgetResult(fitted, original, self.prompt_tokens(fitted), True)
+
+
+# ---------------------------------------------------------------------
+# Presupuesto del proceso
+# ---------------------------------------------------------------------
+_budget: Optional[TokenBudget] = None
+_budget_lock = threading.Lock()
+
+
+def budget_from_env() -> TokenBudget:
+    """UBPD_MAX_PROMPT_TOKENS (sin definir: sin límite) y UBPD_BUDGET_POLICY."""
+    max_tokens = os.getenv("UBPD_MAX_PROMPT_TOKENS")
+    return TokenBudget(
+        int(max_tokens) if max_tokens else None,
+        os.getenv("UBPD_BUDGET_POLICY", DEFAULT_POLICY),
+    )
+
+
+def get_token_budget() -> TokenBudget:
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = budget_from_env()
+    return _budget
+
+
+def set_token_budget(budget: Optional[TokenBudget]) -> None:
+    """Sustituye el presupuesto del proceso (None: se vuelve a leer el entorno)."""
+    global _budget
+    _budget = budget
@@ -0,0 +1,196 @@
+"""
+cache.py
+Caché persistente de respuestas del modelo: LRU en memoria delante de SQLite.
+Autor: Manuel Daza Ramirez
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# Valores por defecto (ajustables por instancia)
+DEFAULT_MEMORY_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB en disco
+
+# Al superar max_bytes se libera hasta este porcentaje para no desalojar
+# en cada inserción.
+EVICTION_TARGET = 0.9
+
+# Los aciertos en memoria se anotan y su last_access se escribe en disco en
+# bloque (al llegar a este número, antes de desalojar o al cerrar).
+TOUCH_BATCH = 256
+
+
+CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key          TEXT PRIMARY KEY,
+    value        TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    last_access  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access);
+"""
+
+
+class ClassificationCache:
+    """
+    Caché clave → respuesta cruda del modelo.
+
+    - Nivel 1: LRU en memoria con `memory_entries` elementos.
+    - Nivel 2: SQLite en `path` (usar ":memory:" para pruebas), con
+      desalojo por tamaño total (`max_bytes`) de las entradas menos usadas.
+
+    Es seguro usarla desde varios hilos del mismo proceso.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+    ):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._touched: dict = {}  # clave → último acierto en memoria aún sin escribir
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(CACHE_SCHEMA_SQL)
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        self._total_bytes = total
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evictions = 0
+
+    # -----------------------------------------------------------------
+    # Lectura / escritura
+    # -----------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        """Devuelve el valor guardado o None si no existe."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self._touched[key] = time.time()
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+                return self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+            self.disk_hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Guarda un valor en memoria y en disco."""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (key, value, size, last_access)
+                VALUES (?, ?, ?, ?)
+                """,
+                (key, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(keep=key)
+            self._conn.commit()
+            self.puts += 1
+            self._remember(key, value)
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            old, _ = self._memory.popitem(last=False)
+            if old in self._touched:
+                # Sale de memoria: su último acceso tiene que llegar a disco
+                self._flush_touched()
+
+    def _flush_touched(self) -> None:
+        """Escribe en disco el last_access de los aciertos en memoria."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self, keep: str) -> None:
+        """Borra las entradas menos usadas (salvo `keep`) hasta bajar del objetivo."""
+        self._flush_touched()
+        target = int(self.max_bytes * EVICTION_TARGET)
+        rows = self._conn.execute(
+            "SELECT key, size FROM llm_cache WHERE key <> ? ORDER BY last_access ASC",
+            (keep,),
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+            self._memory.pop(key, None)
+            self._touched.pop(key, None)
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    # -----------------------------------------------------------------
+    # Utilidades
+    # -----------------------------------------------------------------
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos y ocupación."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "puts": self.puts,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._total_bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,160 @@
+"""
+chunking.py
+División de documentos largos en fragmentos y fusión de las predicciones
+por fragmento (map-reduce).
+Autor: Manuel Daza Ramirez
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+
+# Aproximación de tokens por caracteres (español, tokenizadores BPE)
+CHARS_PER_TOKEN = 4
+DEFAULT_CHUNK_TOKENS = 6000
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;…])\s+")
+
+# Campos de lista: se unen conservando el orden de aparición
+MULTI_FIELDS = ("tipo_hecho", "territorio", "actores", "highlights")
+
+# Valores "vacíos" que se descartan si otro fragmento aporta algo concreto
+PLACEHOLDERS = {
+    "territorio": "No identificado",
+    "actores": "ACT0",
+}
+
+# Ruteo: gana el más urgente entre los fragmentos
+RUTEO_ORDER = ("RU1", "RU2", "RU3", "RU4", "RU0")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (sin tokenizador)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# ---------------------------------------------------------------------
+# División
+# ---------------------------------------------------------------------
+def sentence_units(text: str) -> List[str]:
+    """
+    Frases del texto. El texto llega ya normalizado por preprocess_text
+    (espacios simples, sin saltos de línea), así que se corta solo por frase.
+    """
+    return [s for s in _SENTENCE_RE.split(text.strip()) if s]
+
+
+def _split_oversized(sentence: str, limit: int, measure: Callable[[str], int],
+                     cut: Callable[[str, int], str]) -> List[str]:
+    """
+    Parte una frase demasiado larga por palabras (o a la fuerza). `measure`
+    mide un texto y `cut(texto, límite)` devuelve el prefijo que cabe.
+    """
+    pieces, current, used = [], "", 0
+    for word in sentence.split(" "):
+        while measure(word) > limit:
+            if current:
+                pieces.append(current)
+                current, used = "", 0
+            head = cut(word, limit) or word[:1]
+            pieces.append(head)
+            word = word[len(head):]
+        cost = measure(f" {word}") if current else measure(word)
+        if current and used + cost > limit:
+            pieces.append(current)
+            current, used = word, measure(word)
+        else:
+            current = f"{current} {word}" if current else word
+            used += cost
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS,
+                      tokenizer: Optional[object] = None) -> List[str]:
+    """
+    Divide el texto en fragmentos de como máximo `max_tokens`, cortando en
+    límites de frase. Solo se parte una frase cuando ella sola
+    supera el presupuesto. Con `tokenizer` (ver tokenizer.py) se cuentan
+    tokens reales; sin él, se estiman por caracteres.
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens debe ser >= 1.")
+    if tokenizer is not None:
+        measure, limit, cut = tokenizer.count, max_tokens, tokenizer.truncate
+    else:
+        measure, limit = len, max_tokens * CHARS_PER_TOKEN
+        cut = lambda text, n: text[:n]  # noqa: E731
+    if measure(text) <= limit:
+        return [text] if text else []
+
+    chunks: List[str] = []
+    current, used = "", 0
+
+    for sentence in sentence_units(text):
+        parts = [sentence] if measure(sentence) <= limit else _split_oversized(sentence, limit, measure, cut)
+        for part in parts:
+            if current and used + measure(part) > limit:
+                chunks.append(current.strip())
+                current, used = "", 0
+            current += part + " "
+            used += measure(part + " ")
+
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+# ---------------------------------------------------------------------
+# Fusión de predicciones
+# ---------------------------------------------------------------------
+def _majority(values: List[str], fallback_code: str) -> str:
+    """Código más frecuente distinto del de 'no identificado'; empate → el primero."""
+    informative = [v for v in values if isinstance(v, str) and v != fallback_code]
+    if not informative:
+        return fallback_code if fallback_code in values else (values[0] if values else None)
+    counts = Counter(informative)
+    best = max(counts.values())
+    return next(v for v in informative if counts[v] == best)
+
+
+def merge_predictions(preds: List[Dict]) -> Dict:
+    """
+    Fusiona las predicciones (sin validar) de varios fragmentos:
+
+    - tipo_hecho, territorio, actores, highlights: unión en orden de
+      aparición; "No identificado"/"ACT0" solo si ningún fragmento aporta
+      un valor concreto.
+    - tipo_documento: el código testimonial más frecuente (TD0 si todos
+      los fragmentos son TD0).
+    - periodo: el más frecuente distinto de PER0.
+    - ruteo: el más urgente según RUTEO_ORDER.
+
+    El resultado pasa después por validate_and_fix como cualquier otra
+    predicción.
+    """
+    if len(preds) == 1:
+        return dict(preds[0])
+
+    merged: Dict = {}
+    for field in MULTI_FIELDS:
+        values: List = []
+        for pred in preds:
+            field_values = pred.get(field)
+            if isinstance(field_values, list):
+                values.extend(field_values)
+        values = list(dict.fromkeys(v for v in values if isinstance(v, str)))
+        placeholder = PLACEHOLDERS.get(field)
+        if placeholder is not None and any(v != placeholder for v in values):
+            values = [v for v in values if v != placeholder]
+        merged[field] = values
+
+    merged["tipo_documento"] = _majority([p.get("tipo_documento") for p in preds], "TD0")
+    merged["periodo"] = _majority([p.get("periodo") for p in preds], "PER0")
+
+    ruteos = {p.get("ruteo") for p in preds}
+    merged["ruteo"] = next((r for r in RUTEO_ORDER if r in ruteos), None)
+    return merged
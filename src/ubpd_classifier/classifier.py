@@ -4,38 +4,221 @@ Pipeline completo del clasificador UBPD.
 Autor: Manuel Daza Ramirez
 """
 
+import asyncio
+import hashlib
 import json
 import os
-from typing import Dict, Any, List
-from openai import OpenAI
-
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Container, Dict, Any, Iterable, List, Optional, Tuple
+
+from backends import LLMBackend, OpenAIBackend, RuleBasedBackend, StreamingLLMBackend
+from budget import get_token_budget
+from cache import ClassificationCache
+from chunking import DEFAULT_CHUNK_TOKENS, merge_predictions, split_into_chunks
+from gazetteer import UNKNOWN_TERRITORIO, get_gazetteer
+from headers import get_header_engine
 from preprocessing import preprocess_text
-from prompts import SYSTEM_PROMPT, build_user_prompt, ONTOLOGY
-from ontology import load_ontology
+from ratelimit import RateLimiter
+from prompts import USER_TEMPLATE, build_user_prompt, get_system_prompt, get_versioned_system_prompt
+from priority import PriorityRules, get_priority_rules
+from ontology import get_ontology
+from schema import SchemaStats, is_valid_response
+from streaming import REQUIRED_FIELDS, first_json_object
+from usage import get_usage
+
+
+# Modelo por defecto del backend OpenAI
+MODEL_NAME = os.getenv("UBPD_MODEL_NAME", "gpt-5.1")
+
+# Backend del LLM (se crea al primer uso; ver get_backend)
+_backend: Optional[LLMBackend] = None
+
+# Número de peticiones simultáneas por defecto en el modo asíncrono
+DEFAULT_CONCURRENCY = 8
+
+# Hilos compartidos para los fragmentos de documentos largos en
+# classify_document (se crean al primer uso): el límite es del proceso, no
+# de cada documento.
+_chunk_pool: Optional[ThreadPoolExecutor] = None
+_chunk_pool_lock = threading.Lock()
+
+# Caché de respuestas (desactivada salvo que se defina UBPD_CACHE_PATH
+# o se llame a set_cache)
+_cache: Optional[ClassificationCache] = None
+
+# Presupuesto de tokens del documento por llamada; los textos más largos
+# se dividen en fragmentos (ver chunking.py)
+CHUNK_TOKENS = int(os.getenv("UBPD_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
 
+# Ritmo, reintentos y concurrencia adaptativa de las llamadas al modelo
+RATE_LIMITER = RateLimiter.from_env()
 
-# Inicializar cliente OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-MODEL_NAME = "gpt-5.1"
+# Leer la respuesta por streaming (ver streaming.py). Por defecto se lee
+# entera y el resultado es el mismo que sin streaming.
+LLM_STREAM = os.getenv("UBPD_LLM_STREAM", "0") == "1"
+
+# Con streaming, cortar la respuesta en cuanto están los campos de
+# REQUIRED_FIELDS: ahorra los tokens de los highlights, pero la
+# clasificación queda sin highlights (ni sus posiciones en el texto).
+STREAM_EARLY_STOP = os.getenv("UBPD_LLM_STREAM_EARLY_STOP", "0") == "1"
+
+# Salida estructurada: el proveedor restringe la respuesta al JSON Schema
+# de la ontología (ver schema.py)
+STRUCTURED_OUTPUT = os.getenv("UBPD_STRUCTURED_OUTPUT", "0") == "1"
+
+# Respuestas nuevas no parseables o fuera del esquema
+SCHEMA_STATS = SchemaStats()
+
+
+# ---------------------------------------------------------------------
+# Backend del modelo
+# ---------------------------------------------------------------------
+def create_backend_from_env() -> LLMBackend:
+    """
+    Crea el backend según variables de entorno:
+
+    - UBPD_LLM_BACKEND: "openai" (default) o "rules" (local, sin red)
+    - UBPD_LLM_BASE_URL: servidor compatible con OpenAI (p. ej. fake_server.py)
+    - UBPD_FAKE_LATENCY_MS: latencia simulada del backend "rules"
+    - UBPD_FAKE_CHUNK_LATENCY_MS: latencia por fragmento en modo streaming
+    - UBPD_STRUCTURED_OUTPUT=1: response_format con el esquema (backend "openai")
+    """
+    kind = os.getenv("UBPD_LLM_BACKEND", "openai").lower()
+    if kind == "rules":
+        return RuleBasedBackend(
+            latency_s=float(os.getenv("UBPD_FAKE_LATENCY_MS", "0")) / 1000.0,
+            chunk_latency_s=float(os.getenv("UBPD_FAKE_CHUNK_LATENCY_MS", "0")) / 1000.0,
+        )
+    if kind != "openai":
+        raise ValueError(f"UBPD_LLM_BACKEND desconocido: {kind}")
+    return OpenAIBackend(
+        model_name=MODEL_NAME,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("UBPD_LLM_BASE_URL"),
+        limiter=RATE_LIMITER,
+        structured_output=STRUCTURED_OUTPUT,
+    )
+
+
+def get_backend() -> LLMBackend:
+    """Backend activo (creado desde el entorno la primera vez)."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend_from_env()
+    return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Sustituye el backend (None vuelve a leerlo del entorno)."""
+    global _backend
+    _backend = backend
+
+
+def missing_api_key() -> bool:
+    """True si el backend configurado es OpenAI real y falta la clave."""
+    backend = get_backend()
+    return (
+        isinstance(backend, OpenAIBackend)
+        and backend.base_url is None
+        and not backend.api_key
+    )
 
 
 # ---------------------------------------------------------------------
 # Llamada al modelo
 # ---------------------------------------------------------------------
+def _stream_required() -> Optional[tuple]:
+    return REQUIRED_FIELDS if STREAM_EARLY_STOP else None
+
+
 def call_llm(system_prompt: str, user_prompt: str) -> str:
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.0,
-    )
+    backend = get_backend()
+    if LLM_STREAM and isinstance(backend, StreamingLLMBackend):
+        return backend.complete_stream(system_prompt, user_prompt, required=_stream_required())
+    return backend.complete(system_prompt, user_prompt)
+
+
+async def call_llm_async(system_prompt: str, user_prompt: str) -> str:
+    backend = get_backend()
+    if LLM_STREAM and isinstance(backend, StreamingLLMBackend):
+        return await backend.acomplete_stream(system_prompt, user_prompt, required=_stream_required())
+    return await backend.acomplete(system_prompt, user_prompt)
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    """Reintentos, esperas por límite y rendimiento efectivo."""
+    return RATE_LIMITER.stats()
+
 
-    # SDK nuevo: message es un objeto, no un dict
-    return response.choices[0].message.content
+def usage_stats() -> Dict[str, Any]:
+    """Tokens de prompt (y cuántos en caché) y de respuesta de las llamadas."""
+    return get_usage().as_dict()
 
 
+def header_stats() -> Dict[str, Any]:
+    """Líneas, bytes y tokens de encabezados/pies eliminados en preprocesamiento."""
+    return get_header_engine().as_dict()
+
+
+def schema_stats() -> Dict[str, Any]:
+    """Tasa de respuestas no parseables y de respuestas fuera del esquema."""
+    return SCHEMA_STATS.as_dict()
+
+
+# ---------------------------------------------------------------------
+# Caché de respuestas del modelo
+# ---------------------------------------------------------------------
+def _hash_parts(h, parts: Iterable[str]) -> None:
+    for part in parts:
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+
+
+# Estado del hash tras modelo y prompts: solo cambia si cambia uno de ellos
+_key_prefix: Tuple[Optional[tuple], Any] = (None, None)
+
+
+def make_cache_key(clean_text: str, system_prompt: Optional[str] = None) -> str:
+    """
+    Clave de caché: hash del texto ya preprocesado, de los prompts y del
+    modelo. Cualquier cambio en uno de ellos invalida la entrada.
+    """
+    global _key_prefix
+    prefix = (get_backend().model_name, system_prompt or get_system_prompt(), USER_TEMPLATE)
+    cached, state = _key_prefix
+    if cached != prefix:
+        state = hashlib.sha256()
+        _hash_parts(state, prefix)
+        _key_prefix = (prefix, state)
+    h = state.copy()
+    parts = (clean_text,)
+    if LLM_STREAM and STREAM_EARLY_STOP:
+        # Las respuestas cortadas por streaming no traen highlights
+        parts += ("stream",)
+    if STRUCTURED_OUTPUT:
+        parts += ("structured",)
+    _hash_parts(h, parts)
+    return h.hexdigest()
+
+
+def get_cache() -> Optional[ClassificationCache]:
+    """Devuelve la caché activa (o None si está desactivada)."""
+    global _cache
+    if _cache is None and os.getenv("UBPD_CACHE_PATH"):
+        _cache = ClassificationCache(os.environ["UBPD_CACHE_PATH"])
+    return _cache
+
+
+def set_cache(cache: Optional[ClassificationCache]) -> None:
+    """Activa una caché concreta, o la desactiva con None."""
+    global _cache
+    _cache = cache
+
 
 # ---------------------------------------------------------------------
 # Extracción segura de JSON
@@ -49,81 +232,135 @@ def extract_json_block(text: str) -> str:
 
 
 def parse_model_response(raw: str) -> Dict[str, Any]:
-    return json.loads(extract_json_block(raw))
+    """
+    JSON de la respuesta. Si lo que hay entre la primera "{" y la última
+    "}" no es JSON (llaves sueltas antes o después del objeto), se usa el
+    primer objeto JSON balanceado.
+    """
+    try:
+        return json.loads(extract_json_block(raw))
+    except json.JSONDecodeError as e:
+        error = e
+    try:
+        return json.loads(first_json_object(raw))
+    except ValueError:
+        raise error from None
+
+
+def check_response(raw: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    parse_model_response más la comprobación contra el esquema, sin
+    contabilizarla. Devuelve (predicción, conforme al esquema).
+    """
+    pred = parse_model_response(raw)
+    checked = pred
+    if LLM_STREAM and STREAM_EARLY_STOP and isinstance(pred, dict) and "highlights" not in pred:
+        # El streaming corta la respuesta antes de los highlights
+        checked = dict(pred, highlights=[])
+    return pred, is_valid_response(checked)
+
+
+def _parse_new_response(raw: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    parse_model_response de una respuesta recién recibida del modelo,
+    contabilizada en SCHEMA_STATS. Devuelve (predicción, conforme al esquema).
+    """
+    try:
+        pred, valid = check_response(raw)
+    except ValueError:  # incluye JSONDecodeError
+        SCHEMA_STATS.record(parsed=False)
+        raise
+    SCHEMA_STATS.record(parsed=True, valid=valid)
+    return pred, valid
 
 
 # ---------------------------------------------------------------------
 # Validación y arreglos post-modelo
 # ---------------------------------------------------------------------
-def fix_single_label(value: str, allowed: dict, default: str):
+def fix_single_label(value: str, allowed: Container[str], default: str):
     return value if value in allowed else default
 
 
-def fix_multi_labels(values, allowed: dict):
+def fix_multi_labels(values, allowed: Container[str]):
     if not isinstance(values, list):
         return []
     return [v for v in values if v in allowed]
 
 
-def fix_territorio(values):
-    if not isinstance(values, list) or len(values) == 0:
-        return ["No identificado"]
-    return list({v.strip() for v in values})
-
-
-def compute_priority(pred: dict) -> float:
-    score = 0.0
-    hechos = set(pred.get("tipo_hecho", []))
-    ruteo = pred.get("ruteo")
-
-    if "TH1" in hechos:
-        score += 0.4
-    if "TH4" in hechos:
-        score += 0.2
-    if ruteo == "RU1":
-        score += 0.3
-    if ruteo == "RU3":
-        score += 0.1
-
-    return min(score, 1.0)
-
-
-def validate_and_fix(pred: dict) -> dict:
-    ont = ONTOLOGY
+def fix_territorio(values, text: Optional[str] = None):
+    """
+    Normaliza los territorios del modelo a los nombres canónicos de la
+    ontología ("antioquia" → "Antioquia", "Medellín" → "Antioquia") y
+    descarta los que no se reconocen. Si no queda ninguno y se pasa el
+    texto, se usan los departamentos que el índice encuentra en él.
+    """
+    gazetteer = get_gazetteer()
+    found: List[str] = []
+    if isinstance(values, list):
+        for value in values:
+            if isinstance(value, str):
+                found.extend(gazetteer.resolve(value))
+    if not found and text:
+        found = gazetteer.departments(text)
+    return list(dict.fromkeys(found)) or [UNKNOWN_TERRITORIO]
+
+
+# Valor que toman las dimensiones de una sola etiqueta si no es válida
+SINGLE_LABEL_DEFAULTS = {
+    "tipo_documento": "TD0",
+    "periodo": "PER0",
+    "ruteo": "RU0",
+}
+
+
+def compute_priority(pred: dict, rules: Optional[PriorityRules] = None) -> float:
+    """
+    Suma de los pesos de las reglas que cumple la predicción, con tope.
+    Las reglas vienen de priority_rules.yaml (o UBPD_PRIORITY_RULES).
+    """
+    return (rules or get_priority_rules()).score(pred)
+
+
+def validate_and_fix(pred: dict, text: Optional[str] = None) -> dict:
+    """
+    Ajusta la predicción a la ontología. `text` (el documento ya
+    preprocesado) permite completar territorio con el índice local.
+    """
+    ont = get_ontology()
 
     pred["tipo_documento"] = fix_single_label(
         pred.get("tipo_documento"),
-        ont["tipo_documento"],
-        "TD0"
+        ont.tipo_documento,
+        SINGLE_LABEL_DEFAULTS["tipo_documento"]
     )
 
     pred["tipo_hecho"] = fix_multi_labels(
         pred.get("tipo_hecho", []),
-        ont["tipo_hecho"]
+        ont.tipo_hecho
     )
 
     pred["periodo"] = fix_single_label(
         pred.get("periodo"),
-        ont["periodo"],
-        "PER0"
+        ont.periodo,
+        SINGLE_LABEL_DEFAULTS["periodo"]
     )
 
     pred["actores"] = fix_multi_labels(
         pred.get("actores", []),
-        ont["actores"]
+        ont.actores
     )
 
     pred["ruteo"] = fix_single_label(
         pred.get("ruteo"),
-        ont["ruteo"],
-        "RU0"
+        ont.ruteo,
+        SINGLE_LABEL_DEFAULTS["ruteo"]
     )
 
     # Regla automática
-    if pred["tipo_documento"] == "TD0":
-        pred["ruteo"] = "RU0"
+    if pred["tipo_documento"] == SINGLE_LABEL_DEFAULTS["tipo_documento"]:
+        pred["ruteo"] = SINGLE_LABEL_DEFAULTS["ruteo"]
 
-    pred["territorio"] = fix_territorio(pred.get("territorio", []))
+    pred["territorio"] = fix_territorio(pred.get("territorio", []), text)
 
     if not isinstance(pred.get("highlights"), list):
         pred["highlights"] = []
@@ -132,13 +369,232 @@ def validate_and_fix(pred: dict) -> dict:
     return pred
 
 
+# ---------------------------------------------------------------------
+# Respuesta cruda del modelo (con caché)
+# ---------------------------------------------------------------------
+def _predict_clean(clean: str, system_prompt: Optional[str] = None) -> dict:
+    """
+    Predicción sin validar para un texto ya preprocesado. `system_prompt`
+    fija el prompt del documento (por defecto, el vigente).
+    """
+    system_prompt = system_prompt or get_system_prompt()
+    cache = get_cache()
+    key = make_cache_key(clean, system_prompt) if cache is not None else None
+    raw = cache.get(key) if cache is not None else None
+
+    if raw is None:
+        user_prompt = build_user_prompt(clean)
+        raw = call_llm(system_prompt, user_prompt)
+        pred, valid = _parse_new_response(raw)
+        # Con salida estructurada, una respuesta fuera del esquema indica que
+        # el proveedor no la aplicó: no se guarda para no fijarla en la caché
+        if cache is not None and (valid or not STRUCTURED_OUTPUT):
+            cache.put(key, raw)
+        return pred
+    return parse_model_response(raw)
+
+
+async def fetch_raw_async(clean: str, system_prompt: Optional[str] = None) -> Tuple[str, bool, Optional[str]]:
+    """
+    Respuesta cruda (sin parsear) para un texto ya preprocesado: de la
+    caché o del modelo. Devuelve (raw, nueva, clave de caché); una respuesta
+    nueva se guarda con record_new_response una vez parseada.
+    """
+    system_prompt = system_prompt or get_system_prompt()
+    cache = get_cache()
+    key = make_cache_key(clean, system_prompt) if cache is not None else None
+    raw = cache.get(key) if cache is not None else None
+    if raw is not None:
+        return raw, False, key
+    raw = await call_llm_async(system_prompt, build_user_prompt(clean))
+    return raw, True, key
+
+
+def record_new_response(raw: str, key: Optional[str], parsed: bool, valid: bool = True) -> None:
+    """Contabiliza una respuesta nueva en SCHEMA_STATS y la guarda en la caché."""
+    SCHEMA_STATS.record(parsed=parsed, valid=valid)
+    cache = get_cache()
+    # Con salida estructurada, una respuesta fuera del esquema indica que
+    # el proveedor no la aplicó: no se guarda para no fijarla en la caché
+    if parsed and cache is not None and key is not None and (valid or not STRUCTURED_OUTPUT):
+        cache.put(key, raw)
+
+
+async def _predict_clean_async(clean: str, system_prompt: Optional[str] = None) -> dict:
+    raw, new, key = await fetch_raw_async(clean, system_prompt)
+    if not new:
+        return parse_model_response(raw)
+    try:
+        pred, valid = check_response(raw)
+    except ValueError:  # incluye JSONDecodeError
+        record_new_response(raw, key, parsed=False)
+        raise
+    record_new_response(raw, key, parsed=True, valid=valid)
+    return pred
+
+
 # ---------------------------------------------------------------------
 # Función principal
 # ---------------------------------------------------------------------
-def classify_document(text: str) -> dict:
-    clean = preprocess_text(text)
-    user_prompt = build_user_prompt(clean)
-    raw = call_llm(SYSTEM_PROMPT, user_prompt)
-    pred = parse_model_response(raw)
-    fixed = validate_and_fix(pred)
+def prepare_chunks(clean: str) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Aplica el presupuesto de tokens (ver budget.py) y divide el resultado
+    en fragmentos medidos con su tokenizador. Devuelve los fragmentos a
+    enviar y el recuento de tokens del documento: prompt original,
+    prompt(s) enviado(s) y si se recortó.
+    """
+    budget = get_token_budget()
+    fitted = budget.fit(clean)
+    chunk_tokens = budget.chunk_tokens(CHUNK_TOKENS)
+    chunks = split_into_chunks(fitted.text, chunk_tokens, budget.tokenizer) or [fitted.text]
+    sent = fitted.sent_tokens if len(chunks) == 1 else sum(budget.prompt_tokens(c) for c in chunks)
+    tokens = {
+        "original": fitted.original_tokens,
+        "sent": sent,
+        "calls": len(chunks),
+        "truncated": fitted.truncated,
+    }
+    return chunks, tokens
+
+
+def _get_chunk_pool() -> ThreadPoolExecutor:
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            _chunk_pool = ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY, thread_name_prefix="ubpd-chunk")
+        return _chunk_pool
+
+
+def classify_document(text: str, source_system: Optional[str] = None) -> dict:
+    """
+    Clasifica un documento. El resultado lleva ontology_hash y prompt_hash
+    del prompt con que se pidió, que db.py graba en el run.
+    """
+    fixed, _ = classify_document_with_tokens(text, source_system)
     return fixed
+
+
+def classify_document_with_tokens(
+    text: str, source_system: Optional[str] = None
+) -> Tuple[dict, Dict[str, Any]]:
+    """classify_document más el recuento de tokens de prepare_chunks."""
+    clean = preprocess_text(text, source_system)
+    chunks, tokens = prepare_chunks(clean)
+    # Todos los fragmentos con el mismo prompt, aunque la ontología se recargue
+    system_prompt, versions = get_versioned_system_prompt()
+
+    if len(chunks) == 1:
+        pred = _predict_clean(chunks[0], system_prompt)
+    else:
+        # Documento largo: fragmentos en paralelo y fusión (map-reduce). Los
+        # hilos son compartidos: varios documentos a la vez no suman más de
+        # DEFAULT_CONCURRENCY llamadas por fragmentos.
+        predict = partial(_predict_clean, system_prompt=system_prompt)
+        pred = merge_predictions(list(_get_chunk_pool().map(predict, chunks)))
+
+    fixed = validate_and_fix(pred, clean)
+    fixed.update(versions)
+    return fixed, tokens
+
+
+# ---------------------------------------------------------------------
+# Clasificación asíncrona por lotes
+# ---------------------------------------------------------------------
+async def classify_document_async(
+    text: str,
+    source_system: Optional[str] = None,
+    calls: Optional[asyncio.Semaphore] = None,
+) -> dict:
+    """
+    Versión asíncrona de classify_document (misma cadena de pasos). Con
+    `calls`, cada llamada al modelo (una por fragmento) ocupa un hueco de
+    ese semáforo, compartido por el lote; sin él, las llamadas solo las
+    limita la concurrencia del RateLimiter del backend.
+    """
+    fixed, _ = await _classify_document_async(text, source_system, calls)
+    return fixed
+
+
+async def _classify_document_async(
+    text: str,
+    source_system: Optional[str] = None,
+    calls: Optional[asyncio.Semaphore] = None,
+) -> Tuple[dict, Dict[str, Any]]:
+    """classify_document_async más el recuento de tokens de prepare_chunks."""
+    clean = preprocess_text(text, source_system)
+    chunks, tokens = prepare_chunks(clean)
+    system_prompt, versions = get_versioned_system_prompt()
+
+    async def one(chunk: str) -> dict:
+        async with calls if calls is not None else nullcontext():
+            return await _predict_clean_async(chunk, system_prompt)
+
+    if len(chunks) == 1:
+        pred = await one(chunks[0])
+    else:
+        preds = await asyncio.gather(*(one(chunk) for chunk in chunks))
+        pred = merge_predictions(list(preds))
+
+    fixed = validate_and_fix(pred, clean)
+    fixed.update(versions)
+    return fixed, tokens
+
+
+async def classify_documents_async(
+    texts: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    source_system: Optional[str] = None,
+) -> List[dict]:
+    """
+    Clasifica varios documentos manteniendo hasta `concurrency` llamadas
+    al modelo en vuelo (contando cada fragmento de un documento largo).
+    `source_system` selecciona los patrones de encabezados y pies de esa
+    fuente (header_rules.yaml).
+
+    Devuelve una lista en el mismo orden que `texts`. Cada elemento es:
+      - index (int): posición del documento en la entrada
+      - classification (dict | None): resultado de validate_and_fix
+      - error (str | None): descripción del fallo, si lo hubo
+      - elapsed_ms (float): tiempo total del documento
+      - tokens (dict | None): tokens del prompt original y enviado
+        (ver prepare_chunks)
+
+    Un fallo en un documento no interrumpe el resto del lote.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency debe ser >= 1.")
+
+    pending = iter(enumerate(texts))
+    results: Dict[int, dict] = {}
+    calls = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        for index, text in pending:
+            start = time.perf_counter()
+            try:
+                classification, tokens = await _classify_document_async(text, source_system, calls)
+                error = None
+            except Exception as e:  # fallo aislado por documento
+                classification, tokens = None, None
+                error = f"{type(e).__name__}: {e}"
+            results[index] = {
+                "index": index,
+                "classification": classification,
+                "error": error,
+                "elapsed_ms": (time.perf_counter() - start) * 1000.0,
+                "tokens": tokens,
+            }
+
+    # N trabajadores comparten el mismo iterador: nunca hay más de N
+    # documentos en curso, aunque la entrada sea muy grande.
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return [results[i] for i in range(len(results))]
+
+
+def classify_documents(
+    texts: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    source_system: Optional[str] = None,
+) -> List[dict]:
+    """Envoltorio síncrono de classify_documents_async."""
+    return asyncio.run(classify_documents_async(texts, concurrency=concurrency, source_system=source_system))
@@ -6,10 +6,21 @@ Autor: Manuel Daza Ramirez
 
 import os
 import json
-from typing import Tuple, Dict, Any
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Tuple, Dict, Any, Iterable, Iterator, List, Optional
 
 import psycopg2
-from psycopg2.extras import Json
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import Json, execute_values
+
+from highlights import get_highlight_locator
+from ontology import get_ontology
+from prompts import prompt_version
 
 
 # ---------------------------------------------------------------------
@@ -36,6 +47,240 @@ def get_connection():
     )
 
 
+# ---------------------------------------------------------------------
+# Pool de conexiones
+# ---------------------------------------------------------------------
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones con espera acotada y verificación de conexiones.
+
+    - Abre hasta `maxconn` conexiones (mantiene `minconn` abiertas).
+    - Si todas están en uso, getconn espera hasta `timeout` segundos.
+    - Una conexión inactiva más de `healthcheck_after` segundos se
+      comprueba con SELECT 1 antes de entregarla; si falla, se reemplaza.
+    """
+
+    def __init__(
+        self,
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 30.0,
+        healthcheck_after: float = 30.0,
+        connect=None,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Valores de pool inválidos: se requiere 0 <= min <= max, max >= 1.")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        # Se resuelve get_connection en cada llamada (permite sustituirla)
+        self._connect = connect or (lambda: get_connection())
+
+        self._cond = threading.Condition()
+        self._idle: deque = deque()  # (conn, momento en que quedó libre)
+        self._in_use = set()
+        self._opening = 0  # conexiones reservadas que se están abriendo
+        self._closed = False
+
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.healthcheck_failures = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Toma una conexión del pool (o abre una nueva si hay cupo)."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("El pool está cerrado.")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self.size < self.maxconn:
+                    conn, idle_since = None, None
+                    # Reservar el cupo antes de conectar fuera del lock
+                    self._opening += 1
+                    break
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise psycopg2.pool.PoolError(
+                        f"No hay conexiones libres tras {timeout:.1f} s."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            waited_s = time.monotonic() - start
+            if waited:
+                self.waits += 1
+                self.wait_time_total += waited_s
+                self.wait_time_max = max(self.wait_time_max, waited_s)
+
+            if conn is not None:
+                self._in_use.add(conn)
+
+        if conn is not None and not self._is_healthy(conn, idle_since):
+            with self._cond:
+                self.healthcheck_failures += 1
+                self._in_use.discard(conn)
+                self._opening += 1
+            self._close_quietly(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._in_use.add(conn)
+                    else:
+                        self._cond.notify()
+
+        with self._cond:
+            self.acquired += 1
+        return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Devuelve una conexión al pool (o la descarta si está rota)."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Presta una conexión durante el bloque `with` y la devuelve al salir."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas para monitoreo."""
+        with self._cond:
+            return {
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "size": self.size,
+                "max": self.maxconn,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_time_total_s": self.wait_time_total,
+                "wait_time_max_s": self.wait_time_max,
+                "healthcheck_failures": self.healthcheck_failures,
+            }
+
+    def closeall(self) -> None:
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Pool del proceso, configurado con variables de entorno:
+
+    - DB_POOL_MIN (default: 1)
+    - DB_POOL_MAX (default: 10)
+    - DB_POOL_TIMEOUT (default: 30 s de espera máxima por conexión)
+    - DB_POOL_HEALTHCHECK (default: 30 s de inactividad antes de verificar)
+
+    Tras un fork se crea un pool nuevo: las conexiones no se comparten
+    entre procesos.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(
+                minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                healthcheck_after=float(os.getenv("DB_POOL_HEALTHCHECK", "30")),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    """Atajo: `with connection() as conn:` sobre el pool del proceso."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool del proceso."""
+    return get_pool().stats()
+
+
+def close_pool() -> None:
+    """Cierra el pool del proceso (p. ej. al terminar un worker)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
 # ---------------------------------------------------------------------
 # Creación de tablas mínimas
 # ---------------------------------------------------------------------
@@ -66,8 +311,15 @@ CREATE TABLE IF NOT EXISTS doc_classification_run (
     runtime_ms      INTEGER,
     is_active       BOOLEAN NOT NULL DEFAULT TRUE,
     created_by      TEXT,
-    notes           TEXT
+    notes           TEXT,
+    ontology_hash   TEXT,   -- CompiledOntology.version usada en el run
+    prompt_hash     TEXT    -- prompts.prompt_version() usada en el run
 );
+-- Bases creadas antes de ontology_hash / prompt_hash
+ALTER TABLE doc_classification_run ADD COLUMN IF NOT EXISTS ontology_hash TEXT;
+ALTER TABLE doc_classification_run ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+-- Run activo de cada documento (reclassify.py recorre los activos por doc_id)
+CREATE INDEX IF NOT EXISTS idx_run_active_doc ON doc_classification_run(doc_id) WHERE is_active;
 
 CREATE TABLE IF NOT EXISTS doc_classification_labels (
     run_id          UUID PRIMARY KEY REFERENCES doc_classification_run(run_id),
@@ -104,18 +356,50 @@ CREATE TABLE IF NOT EXISTS doc_classification_highlight (
     char_start      INTEGER,
     char_end        INTEGER
 );
+
+-- Copias casi idénticas de un documento ya clasificado (ver dedup.py): se
+-- enlazan al original y a su run en lugar de crear documento y run nuevos
+CREATE TABLE IF NOT EXISTS doc_duplicate (
+    duplicate_id    BIGSERIAL PRIMARY KEY,
+    doc_id          UUID NOT NULL REFERENCES doc_document(doc_id),
+    run_id          UUID REFERENCES doc_classification_run(run_id),
+    external_id     TEXT,
+    source_system   TEXT,
+    filename        TEXT,
+    similarity      NUMERIC(4,3),
+    detected_ts     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_doc_duplicate_doc ON doc_duplicate(doc_id);
+
+-- Cola de trabajo (ver jobs.py): un job por documento pendiente de clasificar
+CREATE TABLE IF NOT EXISTS doc_job (
+    job_id          BIGSERIAL PRIMARY KEY,
+    doc_id          UUID NOT NULL REFERENCES doc_document(doc_id),
+    status          TEXT NOT NULL DEFAULT 'pending',   -- pending | running | done | failed
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    max_attempts    INTEGER NOT NULL DEFAULT 3,
+    run_after       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    leased_by       TEXT,
+    lease_until     TIMESTAMPTZ,
+    run_id          UUID REFERENCES doc_classification_run(run_id),
+    last_error      TEXT,
+    created_ts      TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_ts      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_doc_job_pending ON doc_job(job_id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_doc_job_lease ON doc_job(lease_until) WHERE status = 'running';
+-- Como mucho un job abierto por documento
+CREATE UNIQUE INDEX IF NOT EXISTS idx_doc_job_open ON doc_job(doc_id)
+    WHERE status IN ('pending', 'running');
 """
 
 
 def create_tables():
     """Crea las tablas mínimas si no existen."""
-    conn = get_connection()
-    try:
+    with connection() as conn:
         with conn, conn.cursor() as cur:
             cur.execute(SCHEMA_SQL)
-        print("Tablas creadas o ya existentes.")
-    finally:
-        conn.close()
+    print("Tablas creadas o ya existentes.")
 
 
 # ---------------------------------------------------------------------
@@ -146,10 +430,14 @@ def save_document_and_classification(
       - territorio (list[str])
       - actores (list[str])
       - highlights (list[str])
+
+    Las posiciones de los highlights en `text` se calculan antes de pedir
+    la conexión (ver highlights.py); las que no se encuentran quedan NULL.
     """
+    snippets = classification.get("highlights", [])
+    spans = get_highlight_locator().locate(text, snippets, source_system)
 
-    conn = get_connection()
-    try:
+    with connection() as conn:
         with conn:
             with conn.cursor() as cur:
                 # 1) Insertar documento
@@ -178,9 +466,10 @@ def save_document_and_classification(
                 cur.execute(
                     """
                     INSERT INTO doc_classification_run (
-                        doc_id, model_name, model_version, is_active, created_by
+                        doc_id, model_name, model_version, is_active, created_by,
+                        ontology_hash, prompt_hash
                     )
-                    VALUES (%s, %s, %s, TRUE, %s)
+                    VALUES (%s, %s, %s, TRUE, %s, %s, %s)
                     RETURNING run_id;
                     """,
                     (
@@ -188,6 +477,7 @@ def save_document_and_classification(
                         classification.get("model_name", "gpt-5.1"),
                         classification.get("model_version", ""),
                         created_by,
+                        *run_versions(classification),
                     ),
                 )
                 (run_id,) = cur.fetchone()
@@ -243,21 +533,311 @@ def save_document_and_classification(
                         (run_id, actor),
                     )
 
-                # 7) Highlights (sin posiciones por ahora)
-                for snippet in classification.get("highlights", []):
+                # 7) Highlights con su posición en el texto original
+                for snippet, span in zip(snippets, spans):
                     cur.execute(
                         """
                         INSERT INTO doc_classification_highlight (
                             run_id, field_name, snippet, char_start, char_end
                         )
-                        VALUES (%s, %s, %s, NULL, NULL);
+                        VALUES (%s, %s, %s, %s, %s);
                         """,
-                        (run_id, None, snippet),
+                        (
+                            run_id,
+                            None,
+                            snippet,
+                            span.start if span else None,
+                            span.end if span else None,
+                        ),
                     )
 
         return str(doc_id), str(run_id)
-    finally:
-        conn.close()
+
+
+# ---------------------------------------------------------------------
+# Inserción masiva (varios documentos en una sola transacción)
+# ---------------------------------------------------------------------
+
+
+# Filas por sentencia INSERT ... VALUES generada por execute_values
+BULK_PAGE_SIZE = 1000
+
+_DOCUMENT_DEFAULTS = {
+    "external_id": None,
+    "source_system": "LOCAL_DEMO",
+    "filename": None,
+    "mime_type": "text/plain",
+    "language": "es",
+    "created_by": "UBPD_Demo2",
+}
+
+
+def _normalize_batch_item(item) -> Dict[str, Any]:
+    """Acepta (text, classification) o un dict con los mismos argumentos
+    que save_document_and_classification."""
+    if isinstance(item, dict):
+        doc = dict(_DOCUMENT_DEFAULTS)
+        doc.update(item)
+    else:
+        text, classification = item
+        doc = dict(_DOCUMENT_DEFAULTS, text=text, classification=classification)
+    return doc
+
+
+def _document_row(doc_id: str, doc: Dict[str, Any]) -> tuple:
+    return (
+        doc_id,
+        doc["external_id"],
+        doc["source_system"],
+        doc["filename"],
+        doc["mime_type"],
+        doc["language"],
+        doc["text"],
+        doc["created_by"],
+    )
+
+
+def run_versions(classification: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    (ontology_hash, prompt_hash) con que se marca un run: los de la
+    clasificación (classify_document los fija al construir el prompt; el
+    modo Batch API, al enviar el lote). Solo si no los trae (resultados de
+    otra fuente) se usan los vigentes al guardar.
+    """
+    return (
+        classification.get("ontology_hash") or get_ontology().version,
+        classification.get("prompt_hash") or prompt_version(),
+    )
+
+
+def _add_run_rows(rows: Dict[str, list], doc_id: str, run_id: str, doc: Dict[str, Any]) -> None:
+    """Filas del run `run_id` de `doc_id` (todas las tablas menos doc_document)."""
+    classification = doc["classification"]
+    rows["doc_classification_run"].append((
+        run_id,
+        doc_id,
+        classification.get("model_name", "gpt-5.1"),
+        classification.get("model_version", ""),
+        doc["created_by"],
+        *run_versions(classification),
+    ))
+    rows["doc_classification_labels"].append((
+        run_id,
+        classification.get("tipo_documento"),
+        classification.get("periodo"),
+        classification.get("ruteo"),
+        classification.get("priority_score", 0.0),
+        Json(classification),
+    ))
+    # dict.fromkeys: elimina duplicados conservando el orden
+    rows["doc_classification_hecho"].extend(
+        (run_id, h) for h in dict.fromkeys(classification.get("tipo_hecho", []))
+    )
+    rows["doc_classification_territorio"].extend(
+        (run_id, t) for t in dict.fromkeys(classification.get("territorio", []))
+    )
+    rows["doc_classification_actor"].extend(
+        (run_id, a) for a in dict.fromkeys(classification.get("actores", []))
+    )
+    snippets = classification.get("highlights", [])
+    spans = doc.get("spans")  # ya calculadas, p. ej. en el pool de pipeline.py
+    if spans is None:
+        spans = get_highlight_locator().locate(doc["text"], snippets, doc["source_system"])
+    rows["doc_classification_highlight"].extend(
+        (run_id, None, snippet, span.start if span else None, span.end if span else None)
+        for snippet, span in zip(snippets, spans)
+    )
+
+
+# Un INSERT multi-fila por tabla, en orden de claves foráneas
+_BULK_INSERTS = [
+    (
+        "doc_document",
+        """
+        INSERT INTO doc_document (
+            doc_id, external_id, source_system, filename, mime_type,
+            language, text_content, created_by
+        ) VALUES %s
+        """,
+    ),
+    (
+        "doc_classification_run",
+        """
+        INSERT INTO doc_classification_run (
+            run_id, doc_id, model_name, model_version, created_by,
+            ontology_hash, prompt_hash
+        ) VALUES %s
+        """,
+    ),
+    (
+        "doc_classification_labels",
+        """
+        INSERT INTO doc_classification_labels (
+            run_id, tipo_documento, periodo, ruteo, priority_score, raw_json
+        ) VALUES %s
+        """,
+    ),
+    (
+        "doc_classification_hecho",
+        """
+        INSERT INTO doc_classification_hecho (run_id, hecho_code)
+        VALUES %s ON CONFLICT DO NOTHING
+        """,
+    ),
+    (
+        "doc_classification_territorio",
+        """
+        INSERT INTO doc_classification_territorio (run_id, territorio_name)
+        VALUES %s ON CONFLICT DO NOTHING
+        """,
+    ),
+    (
+        "doc_classification_actor",
+        """
+        INSERT INTO doc_classification_actor (run_id, actor_code)
+        VALUES %s ON CONFLICT DO NOTHING
+        """,
+    ),
+    (
+        "doc_classification_highlight",
+        """
+        INSERT INTO doc_classification_highlight (
+            run_id, field_name, snippet, char_start, char_end
+        ) VALUES %s
+        """,
+    ),
+]
+
+
+def _execute_bulk(cur, rows: Dict[str, list], page_size: int) -> None:
+    for table, sql in _BULK_INSERTS:
+        if rows.get(table):
+            execute_values(cur, sql, rows[table], page_size=page_size)
+
+
+def save_many(
+    documents_and_classifications: Iterable[Any],
+    page_size: int = BULK_PAGE_SIZE,
+) -> List[Tuple[str, str]]:
+    """
+    Guarda un lote de documentos y sus clasificaciones en UNA transacción.
+
+    Cada elemento puede ser una tupla (text, classification) o un dict con
+    las claves text, classification y, opcionalmente, external_id,
+    source_system, filename, mime_type, language, created_by y spans
+    (posiciones de los highlights ya calculadas con HighlightLocator).
+
+    Los UUID se generan en el cliente, de modo que cada tabla se escribe con
+    un único INSERT multi-fila (execute_values) sin RETURNING. Las
+    posiciones de los highlights que no vengan en spans se calculan antes
+    de pedir la conexión.
+    Devuelve la lista de (doc_id, run_id) en el mismo orden de entrada.
+    """
+    docs = [_normalize_batch_item(item) for item in documents_and_classifications]
+    if not docs:
+        return []
+
+    ids: List[Tuple[str, str]] = []
+    rows: Dict[str, list] = {table: [] for table, _ in _BULK_INSERTS}
+    for doc in docs:
+        doc_id, run_id = str(uuid.uuid4()), str(uuid.uuid4())
+        ids.append((doc_id, run_id))
+        rows["doc_document"].append(_document_row(doc_id, doc))
+        _add_run_rows(rows, doc_id, run_id, doc)
+
+    with connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                _execute_bulk(cur, rows, page_size)
+    return ids
+
+
+def insert_documents(cur, documents: Iterable[Dict[str, Any]], page_size: int = BULK_PAGE_SIZE) -> List[str]:
+    """
+    Inserta documentos sin clasificación (p. ej. para encolarlos, ver
+    jobs.py) con el cursor de una transacción abierta. Cada elemento es un
+    dict con text y, opcionalmente, external_id, source_system, filename,
+    mime_type, language y created_by. Devuelve los doc_id en orden.
+    """
+    doc_ids, rows = [], []
+    for item in documents:
+        doc = dict(_DOCUMENT_DEFAULTS)
+        doc.update(item)
+        doc_id = str(uuid.uuid4())
+        doc_ids.append(doc_id)
+        rows.append(_document_row(doc_id, doc))
+    if rows:
+        execute_values(cur, _BULK_INSERTS[0][1], rows, page_size=page_size)
+    return doc_ids
+
+
+def build_run_rows(runs: Iterable[Dict[str, Any]]) -> Tuple[List[str], Dict[str, list]]:
+    """
+    Filas de nuevos runs para documentos que ya existen en doc_document.
+    Cada elemento es un dict con doc_id, text, classification y,
+    opcionalmente, source_system y created_by. Devuelve (run_ids, filas).
+    Se llama fuera de la transacción: calcula también los highlights.
+    """
+    run_ids: List[str] = []
+    rows: Dict[str, list] = {table: [] for table, _ in _BULK_INSERTS}
+    for item in runs:
+        doc = _normalize_batch_item(item)
+        run_id = str(uuid.uuid4())
+        run_ids.append(run_id)
+        _add_run_rows(rows, str(doc["doc_id"]), run_id, doc)
+    return run_ids, rows
+
+
+def insert_runs(cur, doc_ids: List[str], rows: Dict[str, list], page_size: int = BULK_PAGE_SIZE) -> None:
+    """
+    Escribe, con el cursor de una transacción abierta, las filas de
+    build_run_rows. Los runs activos anteriores de esos documentos pasan a
+    is_active = FALSE: cada documento conserva un único run activo.
+    """
+    if doc_ids:
+        cur.execute(
+            "UPDATE doc_classification_run SET is_active = FALSE "
+            "WHERE doc_id = ANY(%s::uuid[]) AND is_active",
+            (list(doc_ids),),
+        )
+    _execute_bulk(cur, rows, page_size)
+
+
+def save_duplicates(duplicates: Iterable[Dict[str, Any]], page_size: int = BULK_PAGE_SIZE) -> int:
+    """
+    Enlaza copias casi idénticas a su documento original en UNA transacción.
+
+    Cada elemento es un dict con doc_id y run_id del original, similarity
+    y, opcionalmente, external_id, source_system y filename de la copia.
+    Devuelve el número de filas escritas.
+    """
+    rows = [
+        (
+            dup["doc_id"],
+            dup.get("run_id"),
+            dup.get("external_id"),
+            dup.get("source_system"),
+            dup.get("filename"),
+            round(float(dup["similarity"]), 3),
+        )
+        for dup in duplicates
+    ]
+    if not rows:
+        return 0
+    with connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO doc_duplicate (
+                        doc_id, run_id, external_id, source_system, filename, similarity
+                    ) VALUES %s
+                    """,
+                    rows,
+                    page_size=page_size,
+                )
+    return len(rows)
 
 
 # ---------------------------------------------------------------------
@@ -270,6 +850,11 @@ if __name__ == "__main__":
 
     if len(sys.argv) > 1 and sys.argv[1] == "create-tables":
         create_tables()
+    elif len(sys.argv) > 1 and sys.argv[1] == "pool-stats":
+        with connection():
+            pass
+        print(json.dumps(pool_stats(), indent=2))
     else:
         print("Uso:")
         print("  python db.py create-tables")
+        print("  python db.py pool-stats")
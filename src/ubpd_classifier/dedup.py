@@ -0,0 +1,304 @@
+"""
+dedup.py
+Detección de documentos casi duplicados antes de clasificar (MinHash + LSH).
+
+El mismo testimonio llega varias veces por distintos sistemas fuente con
+pequeñas diferencias (ruido de OCR, encabezados). Cada documento se resume
+en una firma MinHash de NUM_PERM valores calculada sobre los shingles de
+SHINGLE_WORDS palabras del texto preprocesado; la proporción de valores
+iguales entre dos firmas estima la similitud de Jaccard de sus shingles.
+
+La firma se parte en BANDS bandas de ROWS valores y cada banda se guarda
+como un cubo (hash) en SQLite con índice: dos documentos son candidatos si
+coinciden en algún cubo. Una consulta hace BANDS búsquedas por índice y
+compara solo con los candidatos, así que el coste no crece con el tamaño
+del índice (millones de documentos). Con 20 bandas de 6 filas, un par con
+Jaccard 0,8 es candidato con probabilidad > 0,99 y uno con 0,3 con < 0,02;
+el umbral (UBPD_DEDUP_THRESHOLD) se aplica después sobre la firma completa.
+
+Se usan shingles de palabras y no de caracteres: separan mejor testimonios
+distintos que comparten fórmulas ("llegaron hombres armados a la vereda"),
+a cambio de tolerar menos ruido de OCR (1 % de caracteres cambiados deja
+la similitud en torno a 0,7).
+
+Autor: Manuel Daza Ramirez
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+import zlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gazetteer import fold
+
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+# Con menos shingles la similitud no es fiable (textos de pocas palabras)
+MIN_SHINGLES = 8
+DEFAULT_THRESHOLD = 0.8
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_WORD_RE = re.compile(r"\w+")
+
+
+DEDUP_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS dedup_doc (
+    key             TEXT PRIMARY KEY,
+    input           TEXT,
+    signature       BLOB NOT NULL,
+    doc_id          TEXT,
+    run_id          TEXT,
+    classification  TEXT
+);
+CREATE TABLE IF NOT EXISTS dedup_band (
+    band    INTEGER NOT NULL,
+    bucket  INTEGER NOT NULL,
+    key     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dedup_band ON dedup_band(band, bucket);
+"""
+
+
+class Match(NamedTuple):
+    key: str
+    similarity: float
+    input: Optional[str]
+    doc_id: Optional[str]
+    run_id: Optional[str]
+    classification: Optional[dict]  # None: el original aún no está clasificado
+
+
+# ---------------------------------------------------------------------
+# Firmas
+# ---------------------------------------------------------------------
+def shingles(text: str, words: int = SHINGLE_WORDS) -> np.ndarray:
+    """Hashes (crc32) distintos de los grupos de `words` palabras seguidas."""
+    tokens = _WORD_RE.findall(fold(text))
+    grams = {" ".join(tokens[i:i + words]) for i in range(max(0, len(tokens) - words + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """NUM_PERM permutaciones (a·x + b) mod p con semilla fija."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, 1 << 61, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.randint(0, 1 << 61, size=num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Firma uint32 del texto; None si tiene menos de MIN_SHINGLES shingles."""
+        hashes = shingles(text)
+        if len(hashes) < MIN_SHINGLES:
+            return None
+        # El producto desborda uint64 a propósito: sigue siendo un hash válido
+        with np.errstate(over="ignore"):
+            permuted = ((self._a * hashes[None, :] + self._b) % _MERSENNE) & _MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimación de Jaccard: proporción de valores iguales."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def band_buckets(signature: np.ndarray, bands: int = BANDS) -> List[int]:
+    """Un cubo (entero de 64 bits con signo, para SQLite) por banda."""
+    rows = len(signature) // bands
+    return [
+        int.from_bytes(
+            hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            "big",
+            signed=True,
+        )
+        for band in range(bands)
+    ]
+
+
+# ---------------------------------------------------------------------
+# Índice persistente
+# ---------------------------------------------------------------------
+class DedupIndex:
+    """
+    Índice LSH en SQLite (`path`; ":memory:" para pruebas). Cada entrada
+    guarda la firma y, cuando se conocen, la clasificación y los
+    (doc_id, run_id) del documento original para reutilizarlos.
+
+    Es seguro usarlo desde varios hilos del mismo proceso.
+    """
+
+    def __init__(self, path: str, threshold: float = DEFAULT_THRESHOLD,
+                 hasher: Optional[MinHasher] = None):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold debe estar en (0, 1].")
+        self.path = str(path)
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(DEDUP_SCHEMA_SQL)
+
+        self.lookups = 0
+        self.hits = 0
+        self.candidates = 0
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        return self.hasher.signature(text)
+
+    def query(self, signature: Optional[np.ndarray]) -> Optional[Match]:
+        """Entrada más parecida con similitud >= threshold, o None."""
+        if signature is None:
+            return None
+        buckets = band_buckets(signature)
+        conditions = " OR ".join(["(b.band = ? AND b.bucket = ?)"] * len(buckets))
+        params = [value for pair in enumerate(buckets) for value in pair]
+        with self._lock:
+            self.lookups += 1
+            rows = self._conn.execute(
+                f"""
+                SELECT DISTINCT d.key, d.input, d.signature, d.doc_id, d.run_id, d.classification
+                FROM dedup_band b JOIN dedup_doc d ON d.key = b.key
+                WHERE {conditions}
+                """,
+                params,
+            ).fetchall()
+            self.candidates += len(rows)
+
+            best = None
+            for key, input_, blob, doc_id, run_id, classification in rows:
+                score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+                if score >= self.threshold and (best is None or score > best.similarity):
+                    best = Match(key, score, input_, doc_id, run_id,
+                                 json.loads(classification) if classification else None)
+            if best is not None:
+                self.hits += 1
+            return best
+
+    def add(self, signature: Optional[np.ndarray], input: Optional[str] = None,
+            key: Optional[str] = None, **fields) -> Optional[str]:
+        """Añade una entrada y devuelve su clave (None si no hay firma)."""
+        if signature is None:
+            return None
+        key = key or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dedup_doc (key, input, signature) VALUES (?, ?, ?)",
+                (key, input, signature.astype(np.uint32).tobytes()),
+            )
+            self._conn.executemany(
+                "INSERT INTO dedup_band (band, bucket, key) VALUES (?, ?, ?)",
+                [(band, bucket, key) for band, bucket in enumerate(band_buckets(signature))],
+            )
+            self._conn.commit()
+        if fields:
+            self.update(key, **fields)
+        return key
+
+    def add_many(self, entries: Iterable[Tuple[np.ndarray, Optional[str]]]) -> List[str]:
+        """
+        Carga masiva de (firma, input) en una transacción, p. ej. para
+        indexar documentos ya clasificados. Devuelve las claves en orden.
+        """
+        keys: List[str] = []
+        docs, bands = [], []
+        for signature, input_ in entries:
+            key = uuid.uuid4().hex
+            keys.append(key)
+            docs.append((key, input_, signature.astype(np.uint32).tobytes()))
+            bands.extend((band, bucket, key) for band, bucket in enumerate(band_buckets(signature)))
+        with self._lock:
+            self._conn.executemany("INSERT INTO dedup_doc (key, input, signature) VALUES (?, ?, ?)", docs)
+            self._conn.executemany("INSERT INTO dedup_band (band, bucket, key) VALUES (?, ?, ?)", bands)
+            self._conn.commit()
+        return keys
+
+    def update(self, key: str, doc_id: Optional[str] = None, run_id: Optional[str] = None,
+               classification: Optional[dict] = None) -> None:
+        """Completa una entrada con lo que se sabe del original."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE dedup_doc SET
+                    doc_id = COALESCE(?, doc_id),
+                    run_id = COALESCE(?, run_id),
+                    classification = COALESCE(?, classification)
+                WHERE key = ?
+                """,
+                (doc_id, run_id, json.dumps(classification, ensure_ascii=False) if classification else None, key),
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Match]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT input, doc_id, run_id, classification FROM dedup_doc WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        input_, doc_id, run_id, classification = row
+        return Match(key, 1.0, input_, doc_id, run_id, json.loads(classification) if classification else None)
+
+    def remove(self, key: str) -> None:
+        """Quita una entrada (p. ej. un original cuya clasificación falló)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM dedup_band WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM dedup_doc WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dedup_doc").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "candidates_per_lookup": self.candidates / self.lookups if self.lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------------------------------------------------------------
+# Índice del proceso
+# ---------------------------------------------------------------------
+_index: Optional[DedupIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index() -> Optional[DedupIndex]:
+    """
+    Índice activo (None si está desactivado). UBPD_DEDUP_PATH es el archivo
+    SQLite y UBPD_DEDUP_THRESHOLD la similitud mínima (default: 0.8).
+    """
+    global _index
+    if _index is None and os.getenv("UBPD_DEDUP_PATH"):
+        with _index_lock:
+            if _index is None:
+                _index = DedupIndex(
+                    os.environ["UBPD_DEDUP_PATH"],
+                    threshold=float(os.getenv("UBPD_DEDUP_THRESHOLD", str(DEFAULT_THRESHOLD))),
+                )
+    return _index
+
+
+def set_dedup_index(index: Optional[DedupIndex]) -> None:
+    """Activa un índice concreto, o lo desactiva con None."""
+    global _index
+    _index = index
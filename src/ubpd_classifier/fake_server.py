@@ -0,0 +1,300 @@
+"""
+fake_server.py
+Servidor HTTP local compatible con POST /v1/chat/completions de OpenAI.
+Responde con el clasificador por reglas (backends.RuleBasedBackend), con
+latencia y tasa de errores 429 configurables, para pruebas de carga sin red.
+Con "stream": true responde por SSE, fragmento a fragmento, como la API real.
+Con --malformed-rate, una fracción de las respuestas en texto libre sale
+estropeada (JSON cortado, coma final, texto en lugar de código); las
+peticiones con response_format json_schema siempre reciben JSON conforme,
+como con la salida estructurada del proveedor.
+El usage de cada respuesta incluye prompt_tokens_details.cached_tokens con
+una caché de prefijos simulada (bloques de 128 tokens, mínimo 1.024 como
+en OpenAI) y --prefill-ms-per-1k añade latencia por token de prompt no
+cacheado.
+
+Uso:
+    python fake_server.py --port 8089 --latency-ms 300 --error-rate 0.05
+    python fake_server.py --port 8089 --malformed-rate 0.1
+    UBPD_LLM_BASE_URL=http://127.0.0.1:8089/v1 python runner.py --input-dir ...
+
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+from backends import RuleBasedBackend
+from chunking import CHARS_PER_TOKEN, estimate_tokens
+from ontology import get_ontology
+from streaming import iter_chunks
+
+
+# Caché de prefijos simulada: bloques completos de este tamaño y nada por
+# debajo del mínimo
+PREFIX_BLOCK_TOKENS = 128
+MIN_CACHED_TOKENS = 1024
+
+# Fallos típicos de la salida en texto libre
+MALFORMED_KINDS = ("truncated", "trailing_comma", "label_instead_of_code", "prose")
+
+
+def malform(content: str, kind: str) -> str:
+    """Estropea una respuesta JSON como lo haría un modelo sin esquema."""
+    if kind == "truncated":
+        return content[:len(content) // 2]
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    if kind == "label_instead_of_code":
+        pred = json.loads(content)
+        pred["tipo_documento"] = get_ontology().labels["tipo_documento"][pred["tipo_documento"]]
+        return json.dumps(pred, ensure_ascii=False)
+    if kind == "prose":
+        return f"Claro, esta es la clasificación:\n```json\n{content}\n```"
+    raise ValueError(f"Tipo de fallo desconocido: {kind}")
+
+
+def wants_structured_output(request: dict) -> bool:
+    return (request.get("response_format") or {}).get("type") == "json_schema"
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Servidor con la configuración del comportamiento simulado."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency_s: float = 0.0,
+                 error_rate: float = 0.0, retry_after_s: float = 1.0, seed: int = 0,
+                 chunk_latency_s: float = 0.0, stream_chunk_chars: int = 16,
+                 malformed_rate: float = 0.0, min_cached_tokens: int = MIN_CACHED_TOKENS,
+                 prefill_s_per_1k_tokens: float = 0.0):
+        super().__init__(address, _Handler)
+        self.backend = RuleBasedBackend()
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.retry_after_s = retry_after_s
+        self.chunk_latency_s = chunk_latency_s
+        self.stream_chunk_chars = stream_chunk_chars
+        self.malformed_rate = malformed_rate
+        self.min_cached_tokens = min_cached_tokens
+        self.prefill_s_per_1k_tokens = prefill_s_per_1k_tokens
+        self._prefix_blocks = set()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.streams_cancelled = 0
+        self.chunks_sent = 0
+        self.malformed = 0
+        self.structured_requests = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def should_throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            throttle = self._rng.random() < self.error_rate
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def cached_prefix_tokens(self, prompt: str) -> int:
+        """
+        Tokens del prompt servidos desde la caché: bloques completos cuyo
+        prefijo (hash encadenado desde el inicio) ya se había visto.
+        """
+        block = PREFIX_BLOCK_TOKENS * CHARS_PER_TOKEN
+        h = hashlib.sha256()
+        cached = 0
+        hit = True
+        with self._lock:
+            for end in range(block, len(prompt) + 1, block):
+                h.update(prompt[end - block:end].encode("utf-8"))
+                digest = h.digest()
+                if hit and digest in self._prefix_blocks:
+                    cached = end
+                else:
+                    hit = False
+                    self._prefix_blocks.add(digest)
+        tokens = cached // CHARS_PER_TOKEN
+        return tokens if tokens >= self.min_cached_tokens else 0
+
+    def render(self, request: dict, content: str) -> str:
+        """Respuesta final: conforme si se pidió esquema; si no, a veces estropeada."""
+        with self._lock:
+            if wants_structured_output(request):
+                self.structured_requests += 1
+                return content
+            if not self.malformed_rate or self._rng.random() >= self.malformed_rate:
+                return content
+            self.malformed += 1
+            kind = self._rng.choice(MALFORMED_KINDS)
+        return malform(content, kind)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeLLMServer
+
+    def log_message(self, format, *args):  # silencio en pruebas de carga
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Ruta no soportada: {self.path}"}})
+            return
+
+        if self.server.should_throttle():
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit (simulado)", "type": "rate_limit_error"}},
+                {"Retry-After": f"{self.server.retry_after_s:g}"},
+            )
+            return
+
+        messages = request.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        prompt_tokens = estimate_tokens(system) + estimate_tokens(user)
+        cached_tokens = min(self.server.cached_prefix_tokens(system + user), prompt_tokens)
+
+        delay = self.server.latency_s + self.server.prefill_s_per_1k_tokens * (prompt_tokens - cached_tokens) / 1000.0
+        if delay:
+            time.sleep(delay)
+
+        content = self.server.render(request, self.server.backend.respond(user))
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        if request.get("stream"):
+            self._send_stream(request, content, usage)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+
+    def _send_stream(self, request: dict, content: str, usage: dict) -> None:
+        """Respuesta SSE; si el cliente cierra la conexión se deja de generar."""
+        server = self.server
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def event(delta: dict, finish_reason=None, usage=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage is not None:
+                # Fragmento final de stream_options.include_usage: sin choices
+                payload["choices"] = []
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            self.wfile.write(event({"role": "assistant", "content": ""}))
+            for piece in iter_chunks(content, server.stream_chunk_chars):
+                if server.chunk_latency_s:
+                    time.sleep(server.chunk_latency_s)
+                self.wfile.write(event({"content": piece}))
+                self.wfile.flush()
+                with server._lock:
+                    server.chunks_sent += 1
+            self.wfile.write(event({}, "stop"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self.wfile.write(event({}, usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with server._lock:
+                server.streams_cancelled += 1
+        self.close_connection = True
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0, **kwargs) -> FakeLLMServer:
+    """Arranca el servidor en un hilo (port=0 elige un puerto libre)."""
+    server = FakeLLMServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM local compatible con OpenAI")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fracción de peticiones que reciben 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--chunk-latency-ms", type=float, default=0.0,
+                        help="Latencia por fragmento en respuestas con stream.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fracción de respuestas sin esquema que salen estropeadas.")
+    parser.add_argument("--min-cached-tokens", type=int, default=MIN_CACHED_TOKENS,
+                        help="Prefijo mínimo para servir tokens desde la caché simulada.")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                        help="Latencia por cada 1.000 tokens de prompt no cacheados.")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        (args.host, args.port),
+        latency_s=args.latency_ms / 1000.0,
+        error_rate=args.error_rate,
+        retry_after_s=args.retry_after,
+        chunk_latency_s=args.chunk_latency_ms / 1000.0,
+        malformed_rate=args.malformed_rate,
+        min_cached_tokens=args.min_cached_tokens,
+        prefill_s_per_1k_tokens=args.prefill_ms_per_1k / 1000.0,
+    )
+    print(f"Servidor LLM simulado en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
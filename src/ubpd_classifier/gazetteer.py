@@ -0,0 +1,243 @@
+"""
+gazetteer.py
+Índice territorial local: encuentra departamentos (y municipios o alias que
+los implican) en el texto y normaliza los nombres que devuelve el modelo a
+los nombres canónicos de la ontología.
+
+Los nombres se compilan en una sola expresión regular con forma de trie
+que recorre una vez el texto sin tildes ni mayúsculas. El plegado se hace
+sobre bytes latin-1 (un byte por carácter), así que las posiciones
+encontradas valen también en el texto original.
+Autor: Manuel Daza Ramirez
+"""
+
+import csv
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from ontology import get_ontology
+
+
+DEFAULT_DATA_PATH = Path(__file__).parent / "gazetteer_municipios.tsv"
+UNKNOWN_TERRITORIO = "No identificado"
+
+KIND_DEPARTMENT = "departamento"
+KIND_ALIAS = "alias"
+KIND_MUNICIPALITY = "municipio"
+
+# Máximo de valores distintos del modelo recordados por resolve()
+RESOLVE_CACHE_SIZE = 4096
+
+
+# ---------------------------------------------------------------------
+# Plegado de acentos y mayúsculas (1 carácter → 1 carácter)
+# ---------------------------------------------------------------------
+def _build_fold_table() -> Dict[int, str]:
+    table = {}
+    for cp in range(0x41, 0x250):
+        ch = chr(cp)
+        base = unicodedata.normalize("NFD", ch)[0].lower()
+        if base != ch and len(base) == 1 and "a" <= base <= "z":
+            table[cp] = base
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+# Misma tabla para bytes latin-1: bytes.translate es mucho más rápido que
+# str.translate con un dict en textos de varios MB
+_FOLD_BYTES = bytes(
+    ord(_FOLD_TABLE.get(b, chr(b))) for b in range(256)
+)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes, conservando la longitud del texto."""
+    return text.translate(_FOLD_TABLE)
+
+
+def fold_bytes(text: str) -> bytes:
+    """fold() en bytes: cada carácter fuera de latin-1 pasa a ser '?'."""
+    return text.encode("latin-1", "replace").translate(_FOLD_BYTES)
+
+
+def _key(name: str) -> str:
+    return _SPACES_RE.sub(" ", fold(name).strip())
+
+
+# ---------------------------------------------------------------------
+# Índice
+# ---------------------------------------------------------------------
+class GazetteerMatch(NamedTuple):
+    start: int
+    end: int
+    text: str         # tal como aparece en el documento
+    department: str   # nombre canónico de la ontología
+    kind: str         # departamento | alias | municipio
+
+
+class _Entry(NamedTuple):
+    department: Optional[str]  # None: municipio ambiguo
+    kind: str
+    capitalized: bool
+
+
+def _trie_pattern(keys: Iterable[str]) -> str:
+    """Expresión regular con forma de trie: el nombre más largo gana."""
+    trie: dict = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [
+            (r"\s+" if ch == " " else re.escape(ch)) + build(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class Gazetteer:
+    """
+    Departamentos canónicos más alias y municipios que apuntan a ellos.
+
+    Un municipio que aparece en varios departamentos es ambiguo: se
+    reconoce (para no confundirlo con un nombre más corto) pero no implica
+    ningún departamento.
+    """
+
+    def __init__(self, departments: Iterable[str], entries: Iterable[tuple] = ()):
+        self._entries: Dict[str, _Entry] = {}
+        for name in departments:
+            self._entries[_key(name)] = _Entry(name, KIND_DEPARTMENT, False)
+
+        for name, department, kind, capitalized in entries:
+            key = _key(name)
+            current = self._entries.get(key)
+            if kind == KIND_DEPARTMENT:
+                if current is not None and current.kind == KIND_DEPARTMENT:
+                    self._entries[key] = current._replace(capitalized=capitalized)
+                continue
+            if current is None:
+                self._entries[key] = _Entry(department, kind, capitalized)
+            elif current.kind != KIND_DEPARTMENT and current.department != department:
+                self._entries[key] = current._replace(department=None)
+
+        # Empezar por un carácter no alfanumérico limita los intentos del
+        # motor a los inicios de palabra (el texto se prefija con un espacio)
+        pattern = r"[^a-z0-9](" + _trie_pattern(self._entries) + r")(?![a-z0-9])"
+        self._pattern = re.compile(pattern.encode("latin-1", "replace"))
+        # Forma plegada encontrada en el texto → entrada (evita recalcular la clave)
+        self._surfaces: Dict[bytes, _Entry] = {}
+        # Valores del modelo ya resueltos (se repiten mucho entre documentos)
+        self._resolved: Dict[str, tuple] = {}
+
+    @classmethod
+    def from_files(cls, departments: Optional[Iterable[str]] = None,
+                   data_path: Optional[str] = None) -> "Gazetteer":
+        """Departamentos (por defecto, los de la ontología) + nombres del archivo TSV."""
+        if departments is None:
+            departments = get_ontology().departments
+        return cls(departments, load_entries(data_path or DEFAULT_DATA_PATH))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def scan(self, text: str) -> List[GazetteerMatch]:
+        """Todas las menciones territoriales del texto, con sus posiciones."""
+        matches = []
+        surfaces = self._surfaces
+        for m in self._pattern.finditer(b" " + fold_bytes(text)):
+            surface = m.group(1)
+            entry = surfaces.get(surface)
+            if entry is None:
+                entry = surfaces[surface] = self._entries[_key(surface.decode("latin-1"))]
+            start, end = m.start(1) - 1, m.end(1) - 1
+            if entry.department is None:
+                continue
+            if entry.capitalized and not text[start].isupper():
+                continue
+            matches.append(GazetteerMatch(start, end, text[start:end], entry.department, entry.kind))
+        return matches
+
+    def departments(self, text: str) -> List[str]:
+        """Departamentos mencionados en el texto, en orden de aparición."""
+        return list(dict.fromkeys(m.department for m in self.scan(text)))
+
+    def resolve(self, name: str) -> List[str]:
+        """
+        Nombre(s) canónico(s) para un valor devuelto por el modelo:
+        coincidencia exacta (sin tildes ni mayúsculas) o, si no la hay,
+        los departamentos que aparezcan dentro del valor.
+        """
+        cached = self._resolved.get(name)
+        if cached is not None:
+            return list(cached)
+        entry = self._entries.get(_key(name))
+        if entry is not None:
+            result = [entry.department] if entry.department else []
+        else:
+            result = self.departments(name)
+        if len(self._resolved) < RESOLVE_CACHE_SIZE:
+            self._resolved[name] = tuple(result)
+        return result
+
+
+def load_entries(path) -> List[tuple]:
+    """Lee el TSV: nombre, departamento, tipo y marca opcional de mayúscula."""
+    entries = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            name, department, kind = (value.strip() for value in row[:3])
+            capitalized = len(row) > 3 and row[3].strip() == "1"
+            entries.append((name, department, kind, capitalized))
+    return entries
+
+
+# ---------------------------------------------------------------------
+# Índice del proceso
+# ---------------------------------------------------------------------
+_gazetteer: Optional[Gazetteer] = None
+# Versión de la ontología con la que se construyó (None: fijado a mano)
+_gazetteer_version: Optional[str] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Índice compartido (UBPD_GAZETTEER_PATH permite otro archivo de datos).
+    Se reconstruye si la ontología se recarga con otra versión.
+    """
+    global _gazetteer, _gazetteer_version
+    ontology = get_ontology()
+    stale = _gazetteer is None or (
+        _gazetteer_version is not None and _gazetteer_version != ontology.version
+    )
+    if stale:
+        with _gazetteer_lock:
+            if _gazetteer is None or _gazetteer_version not in (None, ontology.version):
+                _gazetteer = Gazetteer.from_files(
+                    ontology.departments, os.getenv("UBPD_GAZETTEER_PATH")
+                )
+                _gazetteer_version = ontology.version
+    return _gazetteer
+
+
+def set_gazetteer(gazetteer: Optional[Gazetteer]) -> None:
+    """Sustituye el índice del proceso (None: se reconstruye al usarlo)."""
+    global _gazetteer, _gazetteer_version
+    _gazetteer = gazetteer
+    _gazetteer_version = None
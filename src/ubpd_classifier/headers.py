@@ -0,0 +1,333 @@
+"""
+headers.py
+Eliminación de encabezados, pies de página y números de página de los
+documentos escaneados (oficios, actas) antes de enviarlos al LLM.
+
+Dos fuentes de reglas, aplicadas juntas en una sola pasada de regex:
+- Aprendidas por documento: líneas que se repiten de página en página. Se
+  miran las primeras y últimas EDGE_LINES líneas de cada página (\\f, como
+  los deja el OCR) y cuentan las que aparecen en al menos MIN_PAGE_RATIO de
+  las páginas; solo se eliminan en esos mismos bordes. Sin saltos de página
+  no se aprende nada: en una transcripción, una respuesta repetida
+  ("R: No me acuerdo bien.") no se distingue de un encabezado. Las cifras
+  no cuentan para la huella de la línea ("Página 3" y "Página 4" son la
+  misma línea). En archivos grandes se aprende solo de los primeros
+  LEARN_SAMPLE_CHARS caracteres: los encabezados se repiten en todas las
+  páginas.
+- Configuradas: patrones de header_rules.yaml (default y por source_system,
+  sin distinguir mayúsculas), precompilados una vez por fuente. Los de
+  `edges` (números de página sueltos como "3/10", que en medio de una
+  página pueden ser una fecha) solo se eliminan en los bordes, como las
+  líneas aprendidas.
+
+La pasada de eliminación es una sola regex que empieza por "\\n": el motor
+de re salta de salto de línea en salto de línea sin probar el resto de
+posiciones, lo que la mantiene en más de 100 MB/s. Se aplica página a
+página para que la primera línea de cada página también empiece por "\\n".
+
+Autor: Manuel Daza Ramirez
+"""
+
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import yaml
+
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "header_rules.yaml"
+
+PAGE_BREAK = "\f"
+
+# Líneas de cada borde de página que pueden ser encabezado o pie
+EDGE_LINES = 3
+# Fracción de páginas en que debe aparecer una línea para aprenderla
+MIN_PAGE_RATIO = 0.5
+# Caracteres del principio del documento de los que se aprende
+LEARN_SAMPLE_CHARS = 256 * 1024
+# Solo se aprenden líneas cortas de al menos dos palabras: así no se
+# pierden marcas de diálogo ("CONTESTÓ:") ni párrafos repetidos
+MIN_LINE_CHARS = 12
+MAX_LINE_CHARS = 150
+
+_DIGITS = re.compile(r"[0-9]+")
+_BLANKS = re.compile(r"[ \t]+")
+_DIGIT_MARK = "\x00"
+
+
+class StripReport(NamedTuple):
+    lines_removed: int
+    bytes_removed: int
+    tokens_removed: int
+    learned: int  # líneas aprendidas del propio documento
+
+
+# ---------------------------------------------------------------------
+# Líneas repetidas
+# ---------------------------------------------------------------------
+def fingerprint_text(text: str) -> str:
+    """Cifras sustituidas por una marca y espacios simples."""
+    return _BLANKS.sub(" ", _DIGITS.sub(_DIGIT_MARK, text))
+
+
+def _learnable(line: str) -> bool:
+    return (
+        MIN_LINE_CHARS <= len(line) <= MAX_LINE_CHARS
+        and " " in line
+        and any(c.isalpha() for c in line)
+    )
+
+
+def _edge_lines(page: str) -> List[str]:
+    """Primeras y últimas EDGE_LINES líneas no vacías de una página."""
+    lines = [line for line in (raw.strip() for raw in page.splitlines()) if line]
+    if len(lines) <= 2 * EDGE_LINES:
+        return lines
+    return lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+
+
+def learn_repeated_lines(text: str) -> Set[str]:
+    """Huellas de las líneas que se repiten entre páginas del documento."""
+    sample = text[:LEARN_SAMPLE_CHARS]
+    if PAGE_BREAK not in sample:
+        return set()
+    counts: Counter = Counter()
+    pages = sample.split(PAGE_BREAK)
+    if len(text) > LEARN_SAMPLE_CHARS:
+        pages.pop()  # página cortada por la muestra
+    for page in pages:
+        # Una vez por página; solo se toma la huella de los bordes
+        counts.update({fingerprint_text(line) for line in _edge_lines(page)})
+    needed = max(2, round(len(pages) * MIN_PAGE_RATIO))
+    return {line for line, count in counts.items() if count >= needed and _learnable(line)}
+
+
+def _edge_starts(page: str) -> Set[int]:
+    """
+    Posiciones de los "\\n" que abren las primeras y últimas EDGE_LINES
+    líneas no vacías de `page` (que empieza por "\\n").
+    """
+    starts: Set[int] = set()
+    pos, found = 0, 0
+    while found < EDGE_LINES and pos != -1:
+        end = page.find("\n", pos + 1)
+        if page[pos + 1:end if end != -1 else len(page)].strip():
+            starts.add(pos)
+            found += 1
+        pos = end
+    end, found = len(page), 0
+    while found < EDGE_LINES:
+        pos = page.rfind("\n", 0, end)
+        if pos == -1:
+            break
+        if page[pos + 1:end].strip():
+            starts.add(pos)
+            found += 1
+        end = pos
+    return starts
+
+
+def fingerprint_pattern(fingerprint: str) -> str:
+    """Expresión regular que reconoce las líneas con esa huella."""
+    parts = [
+        r"[ \t]+".join(re.escape(word) for word in piece.split(" "))
+        for piece in fingerprint.split(_DIGIT_MARK)
+    ]
+    return r"\d+".join(parts)
+
+
+# ---------------------------------------------------------------------
+# Reglas configuradas
+# ---------------------------------------------------------------------
+class HeaderRules:
+    """Patrones de línea completa: comunes, por source_system y de borde de página."""
+
+    def __init__(self, default: Sequence[str] = (), sources: Optional[Dict[str, Sequence[str]]] = None,
+                 edges: Sequence[str] = ()):
+        self.default = tuple(default)
+        self.sources = {name: tuple(patterns or ()) for name, patterns in (sources or {}).items()}
+        self.edges = tuple(edges)
+        for pattern in self.default + self.edges + tuple(p for ps in self.sources.values() for p in ps):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Patrón de encabezado inválido {pattern!r}: {e}") from e
+
+    def patterns(self, source_system: Optional[str] = None) -> tuple:
+        """Patrones de la fuente, sin distinguir mayúsculas."""
+        return tuple(f"(?i:{p})" for p in self.default + self.sources.get(source_system, ()))
+
+    def edge_patterns(self) -> tuple:
+        """Patrones que solo se aplican en los bordes de página."""
+        return tuple(f"(?i:{p})" for p in self.edges)
+
+
+def load_header_rules(path=None) -> HeaderRules:
+    """Lee las reglas desde YAML (por defecto, header_rules.yaml)."""
+    with open(path or DEFAULT_RULES_PATH, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    return HeaderRules(config.get("default") or (), config.get("sources") or {}, config.get("edges") or ())
+
+
+@lru_cache(maxsize=256)
+def _compile(patterns: tuple, edge_only: tuple = ()) -> Optional[re.Pattern]:
+    """
+    Una sola regex para todas las líneas a eliminar (con su salto de línea).
+    Las líneas aprendidas y los patrones de `edges` van al final, en el
+    grupo "edge", para poder limitarlos a los bordes de página. Se cachea:
+    los patrones configurados se repiten en cada documento de la fuente y
+    las líneas aprendidas, en los documentos de una misma plantilla.
+    """
+    if not patterns and not edge_only:
+        return None
+    alternatives = "|".join(f"(?:{p})" for p in patterns)
+    if edge_only:
+        group = "(?P<edge>" + "|".join(f"(?:{p})" for p in edge_only) + ")"
+        alternatives = f"{alternatives}|{group}" if alternatives else group
+    # Se elimina el salto de línea anterior y la línea; el siguiente se queda
+    return re.compile(rf"\n[ \t]*(?:{alternatives})[ \t]*(?=[\r\n]|\Z)")
+
+
+# ---------------------------------------------------------------------
+# Motor
+# ---------------------------------------------------------------------
+class HeaderFooterEngine:
+    """
+    Elimina encabezados y pies de un documento y acumula lo eliminado
+    (líneas, bytes UTF-8 y tokens) para el resumen del lote.
+    """
+
+    def __init__(self, rules: Optional[HeaderRules] = None, learn: bool = True):
+        self.rules = rules if rules is not None else HeaderRules()
+        self.learn = learn
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.docs = 0
+        self.chars_in = 0
+        self.lines_removed = 0
+        self.chars_removed = 0
+        self.bytes_removed = 0
+        self.tokens_removed = 0
+
+    def strip(self, text: str, source_system: Optional[str] = None, record: bool = True) -> str:
+        return self.strip_with_report(text, source_system, record)[0]
+
+    def strip_with_report(self, text: str, source_system: Optional[str] = None, record: bool = True,
+                          spans: Optional[List[Tuple[int, int]]] = None):
+        """
+        Devuelve (texto limpio, StripReport). Con record=False no se suma a
+        los totales (texto que ya se contó o se contará en otra pasada).
+        Si se pasa `spans`, se le añaden los tramos [inicio, fin) de `text`
+        eliminados (para el mapa de posiciones de preprocessing).
+        """
+        from tokenizer import get_tokenizer
+
+        learned = sorted(learn_repeated_lines(text)) if self.learn else []
+        edge_only = self.rules.edge_patterns() + tuple(fingerprint_pattern(f) for f in learned)
+        pattern = _compile(self.rules.patterns(source_system), edge_only)
+        removed: List[str] = []
+        if pattern is not None:
+            def drop(match):
+                if edge_only and match.group("edge") is not None and match.start() not in edges:
+                    return match.group()  # línea de borde en medio de la página
+                removed.append(match.group())
+                if spans is not None:
+                    start, end = match.span()
+                    if start == 0:
+                        first_line.append(page_start)
+                    spans.append((page_start + max(start - 1, 0), page_start + end - 1))
+                return ""
+            sub = pattern.sub
+            pages = []
+            page_start = 0
+            first_line: List[int] = []
+            for page in text.split(PAGE_BREAK):
+                first = len(spans) if spans is not None else 0
+                page = "\n" + page
+                edges = _edge_starts(page) if edge_only else ()
+                out = sub(drop, page)
+                pages.append(out[1:])
+                if first_line and first_line[-1] == page_start and out:
+                    # Se eliminó la primera línea: el [1:] quitó el primer
+                    # carácter que quedaba de la página (su salto de línea)
+                    kept = page_start
+                    for start, end in spans[first:]:
+                        if start > kept:
+                            break
+                        kept = max(kept, end)
+                    spans.append((kept, kept + 1))
+                page_start += len(page)
+            text_out = PAGE_BREAK.join(pages)
+        else:
+            text_out = text
+
+        joined = "".join(removed)
+        report = StripReport(
+            lines_removed=len(removed),
+            bytes_removed=len(joined.encode("utf-8")),
+            tokens_removed=get_tokenizer().count(joined) if joined else 0,
+            learned=len(learned),
+        )
+        if not record:
+            return text_out, report
+        with self._lock:
+            self.docs += 1
+            self.chars_in += len(text)
+            self.lines_removed += report.lines_removed
+            self.chars_removed += len(joined)
+            self.bytes_removed += report.bytes_removed
+            self.tokens_removed += report.tokens_removed
+        return text_out, report
+
+    _COUNTERS = ("docs", "chars_in", "lines_removed", "chars_removed", "bytes_removed", "tokens_removed")
+
+    def counters(self) -> Dict[str, int]:
+        """Totales acumulados, para sumarlos a otro motor con merge()."""
+        with self._lock:
+            return {name: getattr(self, name) for name in self._COUNTERS}
+
+    def merge(self, counters: Dict[str, int]) -> None:
+        """Suma los totales de otro motor (p. ej. de un proceso del pool, ver pipeline.py)."""
+        with self._lock:
+            for name in self._COUNTERS:
+                setattr(self, name, getattr(self, name) + counters.get(name, 0))
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "docs": self.docs,
+            "chars_in": self.chars_in,
+            "lines_removed": self.lines_removed,
+            "bytes_removed": self.bytes_removed,
+            "tokens_removed": self.tokens_removed,
+            "removed_ratio": self.chars_removed / self.chars_in if self.chars_in else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------
+# Motor del proceso
+# ---------------------------------------------------------------------
+_engine: Optional[HeaderFooterEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_header_engine() -> HeaderFooterEngine:
+    """Motor compartido (UBPD_HEADER_RULES permite otro archivo de reglas)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = HeaderFooterEngine(load_header_rules(os.getenv("UBPD_HEADER_RULES") or None))
+    return _engine
+
+
+def set_header_engine(engine: Optional[HeaderFooterEngine]) -> None:
+    """Sustituye el motor del proceso (None: se recargan las reglas al usarlo)."""
+    global _engine
+    _engine = engine
+
@@ -0,0 +1,167 @@
+"""
+highlights.py
+Posiciones (char_start, char_end) de los highlights del modelo en el texto
+original del documento, para guardarlas en doc_classification_highlight.
+
+El modelo copia los highlights del texto preprocesado (preprocess_text), así
+que cada snippet se busca en ese texto y su posición se traduce al original
+con el mapa de preprocessing.preprocess_with_offsets. Por cada documento:
+- Exacto: str.find de cada snippet (búsqueda en C, del orden de GB/s; una
+  regex con todos los snippets como alternativas es cientos de veces más
+  lenta porque no tiene un literal fijo por el que empezar).
+- Aproximado, solo para los que no aparecen tal cual: el texto se pliega una
+  vez (minúsculas, sin tildes, un byte por carácter) y cada snippet se busca
+  como sus palabras en orden, separadas por a lo sumo MAX_GAP caracteres que
+  no son letras ni cifras. Recoge diferencias de espacios, tildes,
+  mayúsculas, comillas y puntos suspensivos.
+
+Autor: Manuel Daza Ramirez
+"""
+
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from gazetteer import fold_bytes
+from preprocessing import collapse_spaces, normalize_unicode, original_span, preprocess_with_offsets
+
+
+EXACT = "exact"
+FUZZY = "fuzzy"
+
+# Caracteres de separación tolerados entre dos palabras del snippet
+MAX_GAP = 8
+# Con menos palabras la búsqueda aproximada da falsos positivos
+MIN_FUZZY_WORDS = 3
+
+_WORD_BYTES_RE = re.compile(rb"[a-z0-9]+")
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    method: str  # EXACT o FUZZY
+
+
+def _fuzzy_pattern(snippet: str, folded: bytes) -> Optional[re.Pattern]:
+    words = _WORD_BYTES_RE.findall(fold_bytes(snippet))
+    if len(words) < MIN_FUZZY_WORDS:
+        return None
+    # Sin su palabra más larga el snippet no puede estar: no se compila la regex
+    if max(words, key=len) not in folded:
+        return None
+    gap = rb"[^a-z0-9]{1,%d}" % MAX_GAP
+    return re.compile(gap.join(re.escape(word) for word in words))
+
+
+def locate_in_clean(clean: str, snippets: Sequence[str]) -> List[Optional[Span]]:
+    """Tramo de cada snippet dentro del texto preprocesado (None si no está)."""
+    spans: List[Optional[Span]] = []
+    pending = []
+    for n, snippet in enumerate(snippets):
+        needle = collapse_spaces(normalize_unicode(snippet or ""))
+        position = clean.find(needle) if needle else -1
+        if position >= 0:
+            spans.append(Span(position, position + len(needle), EXACT))
+        else:
+            spans.append(None)
+            if needle:
+                pending.append(n)
+
+    if pending:
+        folded = fold_bytes(clean)
+        for n in pending:
+            pattern = _fuzzy_pattern(snippets[n], folded)
+            match = pattern.search(folded) if pattern is not None else None
+            if match is not None:
+                spans[n] = Span(match.start(), match.end(), FUZZY)
+    return spans
+
+
+# ---------------------------------------------------------------------
+# Resolutor con estadísticas
+# ---------------------------------------------------------------------
+class HighlightLocator:
+    """Resuelve los highlights de cada documento y acumula la tasa de acierto."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.docs = 0
+        self.snippets = 0
+        self.exact = 0
+        self.fuzzy = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+    def locate(self, text: str, snippets: Sequence[str],
+               source_system: Optional[str] = None) -> List[Optional[Span]]:
+        """Tramo de cada snippet en el texto original `text` (None si no está)."""
+        start = time.perf_counter()
+        spans: List[Optional[Span]] = [None] * len(snippets)
+        if snippets:
+            clean, offsets = preprocess_with_offsets(text, source_system, record=False)
+            for n, span in enumerate(locate_in_clean(clean, snippets)):
+                if span is not None:
+                    spans[n] = Span(*original_span(text, offsets, span.start, span.end), span.method)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.docs += 1
+            self.snippets += len(snippets)
+            self.exact += sum(span is not None and span.method == EXACT for span in spans)
+            self.fuzzy += sum(span is not None and span.method == FUZZY for span in spans)
+            self.chars += len(text)
+            self.seconds += elapsed
+        return spans
+
+    _COUNTERS = ("docs", "snippets", "exact", "fuzzy", "chars", "seconds")
+
+    def counters(self) -> Dict[str, float]:
+        """Totales acumulados, para sumarlos a otro resolutor con merge()."""
+        with self._lock:
+            return {name: getattr(self, name) for name in self._COUNTERS}
+
+    def merge(self, counters: Dict[str, float]) -> None:
+        """Suma los totales de otro resolutor (p. ej. de un proceso del pool, ver pipeline.py)."""
+        with self._lock:
+            for name in self._COUNTERS:
+                setattr(self, name, getattr(self, name) + counters.get(name, 0))
+
+    def as_dict(self) -> Dict[str, float]:
+        resolved = self.exact + self.fuzzy
+        return {
+            "docs": self.docs,
+            "snippets": self.snippets,
+            "exact": self.exact,
+            "fuzzy": self.fuzzy,
+            "unresolved": self.snippets - resolved,
+            "resolution_rate": resolved / self.snippets if self.snippets else 0.0,
+            "ms_per_mb": 1000 * self.seconds / (self.chars / 1e6) if self.chars else 0.0,
+        }
+
+
+_locator: Optional[HighlightLocator] = None
+_locator_lock = threading.Lock()
+
+
+def get_highlight_locator() -> HighlightLocator:
+    global _locator
+    if _locator is None:
+        with _locator_lock:
+            if _locator is None:
+                _locator = HighlightLocator()
+    return _locator
+
+
+def set_highlight_locator(locator: Optional[HighlightLocator]) -> None:
+    global _locator
+    _locator = locator
+
+
+def highlight_stats() -> Dict[str, float]:
+    """Tasa de resolución de highlights del proceso (para el resumen del lote)."""
+    return get_highlight_locator().as_dict()
@@ -0,0 +1,492 @@
+"""
+jobs.py
+Cola de trabajo persistente en PostgreSQL (tabla doc_job) para clasificar
+con varios workers, en una o varias máquinas.
+
+- enqueue: guarda los documentos en doc_document y crea un job pendiente por
+  documento (o encola documentos que ya existen).
+- work: el worker reclama lotes con SELECT ... FOR UPDATE SKIP LOCKED (dos
+  workers nunca toman el mismo job ni se esperan entre sí), los clasifica con
+  concurrencia acotada y escribe los resultados y el estado de cada job en la
+  misma transacción.
+- Cada job reclamado tiene un lease de UBPD_JOB_LEASE_S segundos que el
+  worker renueva mientras trabaja. Si el worker muere, al vencer el lease otro
+  lo retoma. Un job que falla se reintenta con espera exponencial
+  (UBPD_JOB_RETRY_BASE_S · 2^(intento-1)) hasta UBPD_JOB_MAX_ATTEMPTS
+  intentos; después queda en 'failed'.
+- Un error de base de datos al reclamar o guardar no detiene al worker: se
+  registra, espera (de POLL_S hasta DB_BACKOFF_MAX_S, doblando) y sigue. Los
+  jobs de un lote que no se pudo guardar vuelven a la cola al vencer su
+  lease.
+
+Uso:
+    python jobs.py enqueue --input-dir ./documentos --source-system ARCHIVO
+    python jobs.py work --batch-size 20 --concurrency 8
+    python jobs.py stats
+    python jobs.py retry-failed
+
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import db
+from classifier import classify_document_async, get_backend
+
+
+BATCH_SIZE = int(os.getenv("UBPD_JOB_BATCH_SIZE", "20"))
+LEASE_S = float(os.getenv("UBPD_JOB_LEASE_S", "300"))
+MAX_ATTEMPTS = int(os.getenv("UBPD_JOB_MAX_ATTEMPTS", "3"))
+RETRY_BASE_S = float(os.getenv("UBPD_JOB_RETRY_BASE_S", "30"))
+POLL_S = 2.0
+# Espera máxima tras errores de base de datos seguidos
+DB_BACKOFF_MAX_S = 60.0
+
+# Documentos por transacción al encolar
+ENQUEUE_BATCH_SIZE = 1000
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job(NamedTuple):
+    job_id: int
+    doc_id: str
+    attempts: int  # incluye el intento en curso
+    text: str
+    source_system: Optional[str]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# ---------------------------------------------------------------------
+# SQL
+# ---------------------------------------------------------------------
+# Jobs con el lease vencido y sin intentos restantes: no se vuelven a reclamar
+EXPIRE_SQL = """
+UPDATE doc_job
+SET status = 'failed', last_error = 'lease vencido', leased_by = NULL,
+    lease_until = NULL, updated_ts = now()
+WHERE job_id IN (
+    SELECT job_id FROM doc_job
+    WHERE status = 'running' AND lease_until < now() AND attempts >= max_attempts
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+# Pendientes (ya sin espera de reintento) o con el lease vencido. SKIP LOCKED
+# salta las filas que otro worker está reclamando en ese momento.
+CLAIM_SQL = """
+WITH picked AS (
+    SELECT job_id FROM doc_job
+    WHERE (status = 'pending' AND run_after <= now())
+       OR (status = 'running' AND lease_until < now() AND attempts < max_attempts)
+    ORDER BY job_id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE doc_job AS j
+SET status = 'running', attempts = j.attempts + 1, leased_by = %(worker)s,
+    lease_until = now() + make_interval(secs => %(lease_s)s), updated_ts = now()
+FROM picked, doc_document AS d
+WHERE j.job_id = picked.job_id AND d.doc_id = j.doc_id
+RETURNING j.job_id, j.doc_id, j.attempts, d.text_content, d.source_system
+"""
+
+EXTEND_SQL = """
+UPDATE doc_job
+SET lease_until = now() + make_interval(secs => %s), updated_ts = now()
+WHERE job_id = ANY(%s) AND leased_by = %s AND status = 'running'
+"""
+
+# Bloquea los jobs que siguen siendo de este worker antes de escribir resultados
+OWNED_SQL = """
+SELECT job_id FROM doc_job
+WHERE job_id = ANY(%s) AND leased_by = %s AND status = 'running'
+FOR UPDATE
+"""
+
+COMPLETE_SQL = """
+UPDATE doc_job AS j
+SET status = 'done', run_id = v.run_id, last_error = NULL, leased_by = NULL,
+    lease_until = NULL, updated_ts = now()
+FROM (VALUES %s) AS v(job_id, run_id)
+WHERE j.job_id = v.job_id
+"""
+COMPLETE_TEMPLATE = "(%s::bigint, %s::uuid)"
+
+FAIL_SQL = """
+UPDATE doc_job AS j
+SET status = CASE WHEN j.attempts >= j.max_attempts THEN 'failed' ELSE 'pending' END,
+    run_after = now() + make_interval(secs => v.retry_base_s * power(2, j.attempts - 1)),
+    last_error = v.error, leased_by = NULL, lease_until = NULL, updated_ts = now()
+FROM (VALUES %s) AS v(job_id, error, worker, retry_base_s)
+WHERE j.job_id = v.job_id AND j.leased_by = v.worker AND j.status = 'running'
+RETURNING j.job_id
+"""
+FAIL_TEMPLATE = "(%s::bigint, %s, %s, %s::float8)"
+
+ENQUEUE_SQL = """
+INSERT INTO doc_job (doc_id, max_attempts)
+SELECT unnest(%s::uuid[]), %s
+ON CONFLICT (doc_id) WHERE status IN ('pending', 'running') DO NOTHING
+"""
+
+# Un documento que falló varias veces tiene varios jobs en 'failed': solo se
+# reabre el último de cada uno (el índice único de jobs abiertos no admite dos)
+RETRY_FAILED_SQL = """
+UPDATE doc_job AS j
+SET status = 'pending', attempts = 0, run_after = now(), last_error = NULL, updated_ts = now()
+FROM (
+    SELECT DISTINCT ON (doc_id) job_id FROM doc_job
+    WHERE status = 'failed'
+    ORDER BY doc_id, job_id DESC
+) AS latest
+WHERE j.job_id = latest.job_id
+  AND NOT EXISTS (
+      SELECT 1 FROM doc_job o WHERE o.doc_id = j.doc_id AND o.status IN ('pending', 'running')
+  )
+"""
+
+STATS_SQL = """
+SELECT status, count(*), EXTRACT(EPOCH FROM now() - min(created_ts))
+FROM doc_job GROUP BY status
+"""
+
+
+# ---------------------------------------------------------------------
+# Cola
+# ---------------------------------------------------------------------
+class PostgresJobQueue:
+    """Operaciones de la cola sobre el pool de db.py; cada una es una transacción."""
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_s: float = LEASE_S,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_base_s: float = RETRY_BASE_S,
+        page_size: int = db.BULK_PAGE_SIZE,
+    ):
+        if lease_s <= 0 or max_attempts < 1:
+            raise ValueError("lease_s debe ser > 0 y max_attempts >= 1.")
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self.page_size = page_size
+
+    def enqueue_texts(self, docs: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Guarda documentos nuevos (dicts con text y, opcionalmente,
+        external_id, source_system, filename, mime_type, language y
+        created_by) y crea su job en la misma transacción. Devuelve doc_ids.
+        """
+        docs = list(docs)
+        if not docs:
+            return []
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    doc_ids = db.insert_documents(cur, docs, self.page_size)
+                    cur.execute(ENQUEUE_SQL, (doc_ids, self.max_attempts))
+        return doc_ids
+
+    def enqueue_documents(self, doc_ids: Sequence[str]) -> int:
+        """Encola documentos ya guardados; omite los que ya tienen un job abierto."""
+        if not doc_ids:
+            return 0
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(ENQUEUE_SQL, (list(doc_ids), self.max_attempts))
+                    return max(cur.rowcount, 0)
+
+    def claim(self, limit: int) -> List[Job]:
+        """Reclama hasta `limit` jobs para este worker (lease de lease_s)."""
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(EXPIRE_SQL)
+                    cur.execute(CLAIM_SQL, {"limit": limit, "worker": self.worker_id, "lease_s": self.lease_s})
+                    rows = cur.fetchall()
+        jobs = [Job(job_id, str(doc_id), attempts, text, source) for job_id, doc_id, attempts, text, source in rows]
+        return sorted(jobs, key=lambda job: job.job_id)
+
+    def extend(self, jobs: Sequence[Job]) -> int:
+        """Renueva el lease; devuelve cuántos jobs siguen siendo de este worker."""
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(EXTEND_SQL, (self.lease_s, [job.job_id for job in jobs], self.worker_id))
+                    return max(cur.rowcount, 0)
+
+    def complete(self, results: Sequence[Tuple[Job, Dict[str, Any]]]) -> Dict[int, str]:
+        """
+        Escribe run + etiquetas de cada (job, clasificación) y marca el job
+        como 'done', en una transacción. Los jobs que ya no son de este
+        worker (lease vencido y retomado por otro) se descartan sin escribir.
+        Devuelve {job_id: run_id} de los escritos.
+        """
+        if not results:
+            return {}
+
+        def rows_for(subset):
+            return db.build_run_rows(
+                {"doc_id": job.doc_id, "text": job.text, "classification": classification,
+                 "source_system": job.source_system or "LOCAL_DEMO"}
+                for job, classification in subset
+            )
+
+        # Highlights y filas fuera de la transacción
+        run_ids, rows = rows_for(results)
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(OWNED_SQL, ([job.job_id for job, _ in results], self.worker_id))
+                    owned = {job_id for (job_id,) in cur.fetchall()}
+                    if len(owned) < len(results):
+                        results = [r for r in results if r[0].job_id in owned]
+                        run_ids, rows = rows_for(results)
+                    if not results:
+                        return {}
+                    db.insert_runs(cur, [job.doc_id for job, _ in results], rows, self.page_size)
+                    done = [(job.job_id, run_id) for (job, _), run_id in zip(results, run_ids)]
+                    execute_values(cur, COMPLETE_SQL, done, template=COMPLETE_TEMPLATE, page_size=self.page_size)
+        return dict(done)
+
+    def fail(self, failures: Sequence[Tuple[Job, str]]) -> int:
+        """Devuelve los jobs a 'pending' con espera exponencial, o a 'failed' sin intentos."""
+        if not failures:
+            return 0
+        rows = [(job.job_id, error, self.worker_id, self.retry_base_s) for job, error in failures]
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    # rowcount solo cubriría la última página: se cuentan las filas devueltas
+                    released = execute_values(cur, FAIL_SQL, rows, template=FAIL_TEMPLATE,
+                                              page_size=self.page_size, fetch=True)
+        return len(released)
+
+    def retry_failed(self) -> int:
+        """Vuelve a encolar el último job en 'failed' de cada documento, con los intentos a cero."""
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(RETRY_FAILED_SQL)
+                    return max(cur.rowcount, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Jobs por estado y antigüedad (s) del más viejo de cada estado."""
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(STATS_SQL)
+                    rows = cur.fetchall()
+        counts = {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)}
+        oldest = {}
+        for status, count, age_s in rows:
+            counts[status] = count
+            oldest[status] = float(age_s or 0.0)
+        return {"jobs": counts, "oldest_s": oldest}
+
+
+# ---------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------
+async def _keep_leases(queue, jobs: Sequence[Job]) -> None:
+    """Renueva el lease del lote cada lease_s / 3 mientras se clasifica."""
+    while True:
+        await asyncio.sleep(queue.lease_s / 3)
+        try:
+            await asyncio.to_thread(queue.extend, jobs)
+        except Exception as e:  # el siguiente intento puede funcionar
+            print(f"ADVERTENCIA: no se pudo renovar el lease: {e}")
+
+
+async def work(
+    queue,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = 8,
+    until_empty: bool = False,
+    max_batches: Optional[int] = None,
+    poll_s: float = POLL_S,
+    classify: Callable[[str, Optional[str]], Awaitable[dict]] = classify_document_async,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Bucle del worker: reclama un lote, lo clasifica con hasta `concurrency`
+    llamadas al modelo en vuelo, y guarda aciertos y fallos. Con
+    `until_empty` termina cuando no queda nada que reclamar; si no, espera
+    `poll_s` y vuelve a mirar. `queue` es un PostgresJobQueue (o un objeto
+    con la misma interfaz).
+    """
+    if batch_size < 1 or concurrency < 1:
+        raise ValueError("batch_size y concurrency deben ser >= 1.")
+    model_name = get_backend().model_name
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"worker": queue.worker_id, "batches": 0, "claimed": 0, "done": 0,
+             "failed": 0, "lost": 0, "retried_claims": 0, "db_errors": 0}
+    start = time.monotonic()
+    streak = 0  # errores de base de datos seguidos
+
+    async def one(job: Job) -> dict:
+        async with semaphore:
+            return await classify(job.text, job.source_system)
+
+    async def db_call(fn, arg, default):
+        """Operación de la cola; si la base de datos falla, espera y devuelve `default`."""
+        nonlocal streak
+        try:
+            result = await asyncio.to_thread(fn, arg)
+        except psycopg2.Error as e:
+            streak += 1
+            stats["db_errors"] += 1
+            wait_s = min(poll_s * 2 ** (streak - 1), DB_BACKOFF_MAX_S)
+            print(f"ADVERTENCIA: error de base de datos en {fn.__name__}: {e}; se reintenta en {wait_s:.0f} s")
+            await asyncio.sleep(wait_s)
+            return default
+        streak = 0
+        return result
+
+    while max_batches is None or stats["batches"] < max_batches:
+        jobs = await db_call(queue.claim, batch_size, None)
+        if jobs is None:
+            continue
+        if not jobs:
+            if until_empty:
+                break
+            await asyncio.sleep(poll_s)
+            continue
+
+        heartbeat = asyncio.ensure_future(_keep_leases(queue, jobs))
+        try:
+            outcomes = await asyncio.gather(*(one(job) for job in jobs), return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+
+        succeeded, failures = [], []
+        for job, outcome in zip(jobs, outcomes):
+            if isinstance(outcome, BaseException):
+                failures.append((job, f"{type(outcome).__name__}: {outcome}"))
+            else:
+                outcome.setdefault("model_name", model_name)
+                outcome.setdefault("model_version", "")
+                succeeded.append((job, outcome))
+
+        # Si no se pueden guardar, los jobs siguen en 'running' y vuelven a la
+        # cola al vencer el lease
+        written = await db_call(queue.complete, succeeded, {})
+        await db_call(queue.fail, failures, 0)
+
+        stats["batches"] += 1
+        stats["claimed"] += len(jobs)
+        stats["retried_claims"] += sum(job.attempts > 1 for job in jobs)
+        stats["done"] += len(written)
+        stats["lost"] += len(succeeded) - len(written)
+        stats["failed"] += len(failures)
+        if progress is not None:
+            progress(dict(stats, elapsed_s=time.monotonic() - start))
+
+    stats["elapsed_s"] = time.monotonic() - start
+    return stats
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def _iter_documents(items: Iterable[dict], source_system: str) -> Iterable[Dict[str, Any]]:
+    from runner import read_text_from_file
+
+    for item in items:
+        yield {
+            "text": read_text_from_file(item["path"]),
+            "external_id": item.get("external_id"),
+            "source_system": source_system,
+            "filename": item["path"],
+        }
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UBPD – cola de clasificación en PostgreSQL")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="Guardar documentos y crear sus jobs.")
+    enqueue.add_argument("--input-dir", type=str)
+    enqueue.add_argument("--manifest", type=str)
+    enqueue.add_argument("--pattern", type=str, default="*.txt")
+    enqueue.add_argument("--source-system", type=str, default="LOCAL_DEMO")
+
+    worker = sub.add_parser("work", help="Reclamar y clasificar lotes.")
+    worker.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    worker.add_argument("--concurrency", type=int, default=8,
+                        help="Llamadas simultáneas al modelo por worker (default: 8).")
+    worker.add_argument("--until-empty", action="store_true", help="Terminar cuando la cola esté vacía.")
+    worker.add_argument("--max-batches", type=int)
+
+    sub.add_parser("stats", help="Jobs por estado.")
+    sub.add_parser("retry-failed", help="Volver a encolar los jobs fallidos.")
+    args = parser.parse_args()
+
+    queue = PostgresJobQueue()
+    if args.command == "enqueue":
+        from runner import iter_input_dir, iter_manifest
+
+        if args.manifest:
+            items = iter_manifest(args.manifest)
+        elif args.input_dir:
+            items = iter_input_dir(args.input_dir, args.pattern)
+        else:
+            parser.error("enqueue necesita --input-dir o --manifest")
+        total = 0
+        for chunk in _chunks(_iter_documents(items, args.source_system), ENQUEUE_BATCH_SIZE):
+            total += len(queue.enqueue_texts(chunk))
+            print(f"  {total} documentos encolados")
+    elif args.command == "work":
+        from classifier import missing_api_key
+
+        if missing_api_key():
+            print("ERROR: OPENAI_API_KEY no está definida en las variables de entorno.")
+            return
+
+        def report(stats):
+            print(f"  lote {stats['batches']}: {stats['done']} clasificados, "
+                  f"{stats['failed']} fallidos ({stats['elapsed_s']:.1f} s)")
+
+        summary = asyncio.run(work(queue, args.batch_size, args.concurrency,
+                                   until_empty=args.until_empty, max_batches=args.max_batches,
+                                   progress=report))
+        print(json.dumps(summary, indent=2))
+    elif args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+    else:
+        print(f"{queue.retry_failed()} jobs vueltos a encolar")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,44 @@
 """
 ontology.py
 Carga y manejo de la ontología UBPD (YAML → diccionario → texto para prompt).
+
+También ofrece la forma compilada (CompiledOntology): inmutable, con los
+códigos de cada dimensión en frozensets, el texto para el prompt ya
+construido y un hash de versión. Se guarda ya compilada en una caché
+binaria del usuario (indexada por el hash del YAML) y se recarga sola
+cuando el archivo cambia.
 Autor: Manuel Daza Ramirez
 """
 
-import yaml
+import copy
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
 from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, List, Optional
+
+import yaml
+
+
+DEFAULT_ONTOLOGY_PATH = Path(__file__).parent / "ontology_ubpd.yaml"
+DIMENSIONS = ("tipo_documento", "tipo_hecho", "periodo", "actores", "ruteo")
+
+# Cambiar si cambia la estructura de CompiledOntology (invalida las cachés)
+CACHE_FORMAT = 2
+DEFAULT_RELOAD_INTERVAL = 2.0  # segundos entre comprobaciones del archivo
 
 
 def load_ontology(path: str = None) -> dict:
     """Carga la ontología UBPD desde YAML."""
     if path is None:
         # Resolve path relative to this module's directory
-        module_dir = Path(__file__).parent
-        path = module_dir / "ontology_ubpd.yaml"
-    
+        path = DEFAULT_ONTOLOGY_PATH
+
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
@@ -47,3 +71,284 @@ def ontology_to_prompt_text(ontology: dict) -> str:
         lines.append(f"  - {code}")
 
     return "\n".join(lines)
+
+
+def ontology_version(ontology: dict) -> str:
+    """Hash sha256 del contenido (independiente del formato del YAML)."""
+    canonical = json.dumps(ontology, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------
+# Ontología compilada
+# ---------------------------------------------------------------------
+class CompiledOntology:
+    """
+    Vista inmutable de la ontología preparada para el camino caliente:
+
+    - tipo_documento, tipo_hecho, periodo, actores, ruteo: frozenset de
+      códigos (cadenas internadas), para comprobar pertenencia en O(1).
+    - labels[dimensión][código]: descripción del código (solo lectura).
+    - departments, unknown_territorio: datos de territorio.
+    - prompt_text: resultado de ontology_to_prompt_text.
+    - version: ontology_version del contenido.
+    """
+
+    __slots__ = (
+        "tipo_documento", "tipo_hecho", "periodo", "actores", "ruteo",
+        "labels", "departments", "unknown_territorio",
+        "prompt_text", "version", "_raw",
+    )
+
+    def __init__(self, ontology: dict):
+        init = object.__setattr__
+        labels = {}
+        for dimension in DIMENSIONS:
+            codes = {sys.intern(str(code)): str(label) for code, label in ontology[dimension].items()}
+            labels[dimension] = MappingProxyType(codes)
+            init(self, dimension, frozenset(codes))
+        territorio = ontology.get("territorio") or {}
+        init(self, "labels", MappingProxyType(labels))
+        init(self, "departments", tuple(sys.intern(d) for d in territorio.get("departments", [])))
+        init(self, "unknown_territorio", territorio.get("unknown", "No identificado"))
+        init(self, "prompt_text", ontology_to_prompt_text(ontology))
+        init(self, "version", ontology_version(ontology))
+        init(self, "_raw", copy.deepcopy(ontology))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledOntology es inmutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledOntology es inmutable.")
+
+    def __reduce__(self):
+        # Estado ya compilado; los MappingProxyType no se serializan y los
+        # frozensets salen de las claves de labels
+        state = {name: getattr(self, name) for name in self.__slots__ if name not in DIMENSIONS}
+        state["labels"] = {dimension: dict(codes) for dimension, codes in self.labels.items()}
+        return (_restore_compiled, (state,))
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledOntology) and other.version == self.version
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def __repr__(self):
+        return f"CompiledOntology(version={self.version[:12]})"
+
+    def codes(self, dimension: str) -> frozenset:
+        """Códigos válidos de una dimensión."""
+        if dimension not in DIMENSIONS:
+            raise KeyError(dimension)
+        return getattr(self, dimension)
+
+    def as_dict(self) -> dict:
+        """Copia del diccionario original (formato de load_ontology)."""
+        return copy.deepcopy(self._raw)
+
+
+def _restore_compiled(state: dict) -> CompiledOntology:
+    """Reconstruye una CompiledOntology serializada sin volver a compilarla."""
+    compiled = object.__new__(CompiledOntology)
+    init = object.__setattr__
+    labels = {}
+    for dimension in DIMENSIONS:
+        codes = {sys.intern(code): label for code, label in state["labels"][dimension].items()}
+        labels[dimension] = MappingProxyType(codes)
+        init(compiled, dimension, frozenset(codes))
+    init(compiled, "labels", MappingProxyType(labels))
+    init(compiled, "departments", tuple(sys.intern(d) for d in state["departments"]))
+    for name in ("unknown_territorio", "prompt_text", "version", "_raw"):
+        init(compiled, name, state[name])
+    return compiled
+
+
+# ---------------------------------------------------------------------
+# Caché binaria (directorio de caché del usuario)
+# ---------------------------------------------------------------------
+def cache_dir() -> Path:
+    """
+    Directorio de la caché binaria: UBPD_ONTOLOGY_CACHE_DIR, o
+    $XDG_CACHE_HOME/ubpd_classifier (por defecto ~/.cache/ubpd_classifier).
+    El directorio del paquete puede ser de solo lectura o compartido.
+    """
+    configured = os.getenv("UBPD_ONTOLOGY_CACHE_DIR")
+    if configured:
+        return Path(configured)
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "ubpd_classifier"
+
+
+def _cache_file(path: Path, digest: str) -> Path:
+    return cache_dir() / f"{path.stem}-{digest[:32]}.v{CACHE_FORMAT}.pkl"
+
+
+def cache_path_for(path) -> Path:
+    """Archivo de caché para el contenido actual de `path` (sha256 del YAML)."""
+    path = Path(path)
+    return _cache_file(path, hashlib.sha256(path.read_bytes()).hexdigest())
+
+
+def load_compiled_ontology(path=None, use_cache: bool = True) -> CompiledOntology:
+    """
+    Ontología compilada. La caché se indexa por el hash sha256 del YAML
+    (no por fecha ni tamaño) y guarda el estado ya compilado: si existe,
+    no se parsea el YAML ni se recompila. Si no, se compila y se escribe
+    (si el directorio de caché lo permite).
+    """
+    path = Path(path or DEFAULT_ONTOLOGY_PATH)
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    cache = _cache_file(path, digest)
+
+    if use_cache:
+        try:
+            with open(cache, "rb") as f:
+                payload = pickle.load(f)
+            if payload.get("format") == CACHE_FORMAT and payload.get("sha256") == digest:
+                return payload["ontology"]
+        except Exception:
+            pass  # caché ausente, corrupta o de otro formato: se regenera
+
+    # Se compila a partir de los mismos bytes que se han hasheado
+    compiled = CompiledOntology(yaml.safe_load(data.decode("utf-8")))
+    if use_cache:
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickle.dump({"format": CACHE_FORMAT, "sha256": digest, "ontology": compiled}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    return compiled
+
+
+# ---------------------------------------------------------------------
+# Recarga en caliente
+# ---------------------------------------------------------------------
+def _file_stamp(path: Path) -> tuple:
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+class OntologyReloader:
+    """
+    Mantiene la ontología compilada vigente.
+
+    get() comprueba la fecha de modificación del YAML como mucho una vez
+    cada `check_interval` segundos (None desactiva la comprobación) y
+    recompila si cambió; entre comprobaciones solo cuesta una lectura del
+    reloj. start() lanza además un hilo que comprueba en segundo plano.
+    Si el YAML editado no es válido se conserva la versión anterior y el
+    error queda en `last_error`.
+    """
+
+    def __init__(self, path=None, check_interval: Optional[float] = DEFAULT_RELOAD_INTERVAL,
+                 use_cache: bool = True):
+        self.path = Path(path or DEFAULT_ONTOLOGY_PATH)
+        self.check_interval = check_interval
+        self.use_cache = use_cache
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[CompiledOntology], None]] = []
+        self._stamp = _file_stamp(self.path)
+        self._ontology = load_compiled_ontology(self.path, use_cache)
+        self._next_check = time.monotonic() + (check_interval or 0)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> CompiledOntology:
+        if self.check_interval is not None and time.monotonic() >= self._next_check:
+            self.check()
+        return self._ontology
+
+    def check(self) -> bool:
+        """Recompila si el archivo cambió. Devuelve True si hubo recarga."""
+        with self._lock:
+            self._next_check = time.monotonic() + (self.check_interval or 0)
+            try:
+                stamp = _file_stamp(self.path)
+                if stamp == self._stamp:
+                    return False
+                compiled = load_compiled_ontology(self.path, self.use_cache)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                return False
+            self._stamp = stamp
+            self.last_error = None
+            changed = compiled.version != self._ontology.version
+            self._ontology = compiled
+            if changed:
+                self.reloads += 1
+            listeners = list(self._listeners) if changed else []
+        for listener in listeners:
+            listener(compiled)
+        return changed
+
+    def add_listener(self, listener: Callable[[CompiledOntology], None]) -> None:
+        """`listener(ontología)` se llama tras cada recarga con cambios."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Comprobación periódica en un hilo (útil en workers de larga vida)."""
+        if self._thread is not None:
+            return
+        interval = self.check_interval or DEFAULT_RELOAD_INTERVAL
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="ontology-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_reloader: Optional[OntologyReloader] = None
+_reloader_lock = threading.Lock()
+
+
+def get_reloader() -> OntologyReloader:
+    """
+    Recargador del proceso, configurado con variables de entorno:
+
+    - UBPD_ONTOLOGY_PATH (default: ontology_ubpd.yaml junto a este módulo)
+    - UBPD_ONTOLOGY_RELOAD_S (default: 2; 0 desactiva la recarga)
+    - UBPD_ONTOLOGY_CACHE (default: 1; 0 no usa la caché binaria)
+    - UBPD_ONTOLOGY_CACHE_DIR (default: ~/.cache/ubpd_classifier)
+    """
+    global _reloader
+    if _reloader is None:
+        with _reloader_lock:
+            if _reloader is None:
+                interval = float(os.getenv("UBPD_ONTOLOGY_RELOAD_S", DEFAULT_RELOAD_INTERVAL))
+                _reloader = OntologyReloader(
+                    os.getenv("UBPD_ONTOLOGY_PATH") or None,
+                    check_interval=interval if interval > 0 else None,
+                    use_cache=os.getenv("UBPD_ONTOLOGY_CACHE", "1") != "0",
+                )
+    return _reloader
+
+
+def set_reloader(reloader: Optional[OntologyReloader]) -> None:
+    """Sustituye el recargador del proceso (None: se recrea al usarlo)."""
+    global _reloader
+    _reloader = reloader
+
+
+def get_ontology() -> CompiledOntology:
+    """Ontología compilada vigente."""
+    return get_reloader().get()
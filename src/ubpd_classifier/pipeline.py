@@ -0,0 +1,348 @@
+"""
+pipeline.py
+Clasificación por lotes con las etapas de CPU en un pool de procesos.
+
+Con el modelo en caché o sustituido, el lote deja de esperar la red y pasa
+a estar limitado por la CPU de un solo núcleo (GIL): preprocess_text,
+extract_json_block/json.loads, validate_and_fix y las posiciones de los
+highlights que calcula el guardado. Aquí esas etapas corren en un
+ProcessPoolExecutor, por bloques de documentos (un viaje de ida y vuelta
+por bloque, no por documento). La caché y el modelo siguen en el bucle
+asyncio del proceso principal:
+
+    textos → [CPU] preparar → cola → [E/S] caché/modelo → cola → [CPU] validar → resultados
+
+Las colas son acotadas: si una etapa se atrasa, las anteriores esperan en
+lugar de acumular documentos en memoria. Los resultados salen en orden de
+llegada, cada uno con su índice de entrada.
+
+Con fork (Linux), los procesos del pool heredan ya cargados la ontología,
+las reglas de prioridad, el índice territorial y el motor de encabezados,
+compartidos y de solo lectura. Con spawn, el initializer los carga una vez
+por proceso. Los contadores de encabezados y highlights de los procesos se
+suman a los del proceso principal (header_stats y highlight_stats siguen
+valiendo para el resumen del lote).
+
+Autor: Manuel Daza Ramirez
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chunking import merge_predictions
+from classifier import (
+    DEFAULT_CONCURRENCY,
+    check_response,
+    fetch_raw_async,
+    parse_model_response,
+    prepare_chunks,
+    record_new_response,
+    validate_and_fix,
+)
+from gazetteer import get_gazetteer
+from headers import get_header_engine
+from highlights import get_highlight_locator
+from ontology import get_ontology
+from preprocessing import preprocess_text
+from prompts import get_versioned_system_prompt
+from priority import get_priority_rules
+from tokenizer import get_tokenizer
+
+
+# Documentos por envío al pool
+CPU_BATCH_SIZE = int(os.getenv("UBPD_PIPELINE_BATCH", "64"))
+
+
+# ---------------------------------------------------------------------
+# Trabajo de los procesos del pool (funciones de módulo: se serializan por nombre)
+# ---------------------------------------------------------------------
+def _warm() -> None:
+    """Carga lo que comparten todos los documentos (una vez por proceso)."""
+    get_ontology()
+    get_priority_rules()
+    get_gazetteer()
+    get_header_engine()
+    get_highlight_locator()
+    get_tokenizer()
+
+
+def _delta(after: Dict[str, float], before: Dict[str, float]) -> Dict[str, float]:
+    return {name: after[name] - before[name] for name in after}
+
+
+def prepare_batch(batch: Sequence[Tuple[int, str]], source_system: Optional[str]) -> Tuple[list, dict]:
+    """
+    Preprocesa y divide en fragmentos un bloque de (índice, texto).
+    Devuelve ([(índice, limpio, fragmentos, tokens, error)], totales de
+    encabezados eliminados en el bloque).
+    """
+    engine = get_header_engine()
+    before = engine.counters()
+    out = []
+    for index, text in batch:
+        try:
+            clean = preprocess_text(text, source_system)
+            chunks, tokens = prepare_chunks(clean)
+            out.append((index, clean, chunks, tokens, None))
+        except Exception as e:  # fallo aislado por documento
+            out.append((index, None, None, None, f"{type(e).__name__}: {e}"))
+    return out, _delta(engine.counters(), before)
+
+
+def finish_batch(batch: Sequence[tuple], source_system: Optional[str], locate: bool) -> Tuple[list, dict]:
+    """
+    Parsea y valida un bloque de (índice, texto, limpio, [(raw, nueva)]).
+    Devuelve ([(índice, clasificación, error, comprobaciones, spans)],
+    totales de highlights). `comprobaciones` trae (parseada, conforme) de
+    cada respuesta nueva, para contabilizarla y guardarla en la caché en el
+    proceso principal. Con `locate` se calculan también las posiciones de
+    los highlights en el texto original (las que usa db.save_many).
+    """
+    locator = get_highlight_locator()
+    before = locator.counters()
+    out = []
+    for index, text, clean, raws in batch:
+        checks: List[Tuple[bool, bool]] = []
+        try:
+            preds = []
+            for raw, new in raws:
+                if not new:
+                    preds.append(parse_model_response(raw))
+                    continue
+                try:
+                    pred, valid = check_response(raw)
+                except ValueError:
+                    checks.append((False, False))
+                    raise
+                checks.append((True, valid))
+                preds.append(pred)
+            pred = preds[0] if len(preds) == 1 else merge_predictions(preds)
+            fixed = validate_and_fix(pred, clean)
+            spans = locator.locate(text, fixed["highlights"], source_system) if locate else None
+            out.append((index, fixed, None, checks, spans))
+        except Exception as e:  # fallo aislado por documento
+            out.append((index, None, f"{type(e).__name__}: {e}", checks, None))
+    return out, _delta(locator.counters(), before)
+
+
+# ---------------------------------------------------------------------
+# Pool
+# ---------------------------------------------------------------------
+class CPUPool:
+    """
+    ProcessPoolExecutor para las etapas de CPU. Se crea una vez por
+    trabajo (arrancar procesos cuesta) y se cierra con close() o `with`.
+    """
+
+    def __init__(self, processes: Optional[int] = None, batch_size: int = CPU_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("batch_size debe ser >= 1.")
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        # Cargado antes del fork: los procesos lo heredan sin volver a leerlo
+        _warm()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self._executor = ProcessPoolExecutor(self.processes, mp_context=context, initializer=_warm)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# ---------------------------------------------------------------------
+# Etapas conectadas por colas acotadas
+# ---------------------------------------------------------------------
+_END = None
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def classify_stream(
+    texts: Iterable[str],
+    pool: CPUPool,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    source_system: Optional[str] = None,
+    locate: bool = False,
+) -> AsyncIterator[dict]:
+    """
+    Clasifica `texts` con las etapas de CPU en `pool` y hasta `concurrency`
+    llamadas al modelo en vuelo. Produce, en orden de llegada, dicts con el
+    formato de classify_documents_async (index, classification, error,
+    elapsed_ms, tokens) más spans (posiciones de los highlights si
+    `locate`, si no None).
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency debe ser >= 1.")
+    in_flight = pool.processes * 2  # bloques en el pool por etapa
+    prepared: asyncio.Queue = asyncio.Queue(maxsize=in_flight * pool.batch_size)
+    answered: asyncio.Queue = asyncio.Queue(maxsize=in_flight * pool.batch_size)
+    results: asyncio.Queue = asyncio.Queue(maxsize=in_flight)  # un bloque por elemento
+    calls = asyncio.Semaphore(concurrency)  # llamadas al modelo en vuelo, fragmentos incluidos
+    texts_by_index: Dict[int, str] = {}
+    started: Dict[int, float] = {}
+
+    async def bounded(stage_slots: asyncio.Semaphore, work, batches: Iterable[list]) -> None:
+        # Se libera el hueco cuando el bloque ya pasó a la siguiente cola
+        async def one(batch):
+            try:
+                await work(batch)
+            finally:
+                stage_slots.release()
+
+        tasks = []
+        for batch in batches:
+            await stage_slots.acquire()
+            tasks.append(asyncio.ensure_future(one(batch)))
+        await asyncio.gather(*tasks)
+
+    async def prepare_stage() -> None:
+        async def work(batch):
+            now = time.perf_counter()
+            for index, text in batch:
+                texts_by_index[index] = text
+                started[index] = now
+            out, counters = await pool.run(prepare_batch, batch, source_system)
+            get_header_engine().merge(counters)
+            for doc in out:
+                await prepared.put(doc)
+
+        await bounded(asyncio.Semaphore(in_flight), work, _batches(enumerate(texts), pool.batch_size))
+        for _ in range(concurrency):
+            await prepared.put(_END)
+
+    async def fetch_chunk(chunk: str, system_prompt: str):
+        async with calls:
+            return await fetch_raw_async(chunk, system_prompt)
+
+    async def llm_worker() -> None:
+        while True:
+            doc = await prepared.get()
+            if doc is _END:
+                return
+            index, clean, chunks, tokens, error = doc
+            fetched = []
+            # Versiones del prompt con que se pide el documento (ver classify_document)
+            system_prompt, versions = get_versioned_system_prompt()
+            if error is None:
+                try:
+                    if len(chunks) == 1:
+                        fetched = [await fetch_chunk(chunks[0], system_prompt)]
+                    else:
+                        fetched = await asyncio.gather(*(fetch_chunk(chunk, system_prompt) for chunk in chunks))
+                except Exception as e:  # fallo aislado por documento
+                    error = f"{type(e).__name__}: {e}"
+            await answered.put((index, clean, tokens, fetched, versions, error))
+
+    async def llm_stage() -> None:
+        await asyncio.gather(*(llm_worker() for _ in range(concurrency)))
+        await answered.put(_END)
+
+    async def finish_stage() -> None:
+        slots = asyncio.Semaphore(in_flight)
+        tasks = []
+        done = False
+        while not done:
+            first = await answered.get()
+            if first is _END:
+                break
+            # Bloque: lo que ya esté esperando, hasta batch_size (sin esperar a llenarlo)
+            batch = [first]
+            while len(batch) < pool.batch_size and not answered.empty():
+                doc = answered.get_nowait()
+                if doc is _END:
+                    done = True
+                    break
+                batch.append(doc)
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(_finish(batch, slots)))
+        await asyncio.gather(*tasks)
+        await results.put(_END)
+
+    async def _finish(batch: list, slots: asyncio.Semaphore) -> None:
+        try:
+            ready, failed = [], []
+            for index, clean, tokens, fetched, _, error in batch:
+                if error is None:
+                    ready.append((index, texts_by_index[index], clean, [(raw, new) for raw, new, _ in fetched]))
+                else:
+                    failed.append((index, None, error, [], None))
+            out, counters = await pool.run(finish_batch, ready, source_system, locate) if ready else ([], {})
+            if counters:
+                get_highlight_locator().merge(counters)
+            meta = {index: (tokens, fetched, versions) for index, _, tokens, fetched, versions, _ in batch}
+            finished = []
+            now = time.perf_counter()
+            for index, classification, error, checks, spans in out + failed:
+                tokens, fetched, versions = meta[index]
+                if classification is not None:
+                    classification.update(versions)
+                new = [(raw, key) for raw, is_new, key in fetched if is_new]
+                for (raw, key), (parsed, valid) in zip(new, checks):
+                    record_new_response(raw, key, parsed, valid)
+                texts_by_index.pop(index, None)
+                finished.append({
+                    "index": index,
+                    "classification": classification,
+                    "error": error,
+                    "elapsed_ms": (now - started.pop(index)) * 1000.0,
+                    "tokens": tokens if error is None else None,
+                    "spans": spans,
+                })
+            await results.put(finished)
+        finally:
+            slots.release()
+
+    stages = asyncio.ensure_future(asyncio.gather(prepare_stage(), llm_stage(), finish_stage()))
+    try:
+        while True:
+            getter = asyncio.ensure_future(results.get())
+            await asyncio.wait({getter, stages}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                stages.result()  # error de una etapa (p. ej. el pool se rompió)
+                continue
+            finished = getter.result()
+            if finished is _END:
+                break
+            for result in finished:
+                yield result
+        await stages
+    finally:
+        if not stages.done():
+            stages.cancel()
+            await asyncio.gather(stages, return_exceptions=True)
+
+
+async def classify_documents_pipelined(
+    texts: Iterable[str],
+    pool: CPUPool,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    source_system: Optional[str] = None,
+    locate: bool = False,
+) -> List[dict]:
+    """classify_stream con los resultados en el orden de `texts` (como classify_documents_async)."""
+    results = [result async for result in classify_stream(texts, pool, concurrency, source_system, locate)]
+    return sorted(results, key=lambda result: result["index"])
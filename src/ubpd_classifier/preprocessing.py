@@ -6,6 +6,11 @@ Autor: Manuel Daza Ramirez
 
 import re
 import unicodedata
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from headers import get_header_engine
 
 
 def normalize_unicode(text: str) -> str:
@@ -18,18 +23,107 @@ def collapse_spaces(text: str) -> str:
     return re.sub(r"\s+", " ", text).strip()
 
 
-def remove_headers_and_footers(text: str) -> str:
+def remove_headers_and_footers(text: str, source_system: Optional[str] = None, record: bool = True) -> str:
     """
-    Elimina encabezados/pies de página comunes en documentos UBPD.
-    Puedes ajustar expresiones regulares según nuevas fuentes de datos.
+    Elimina encabezados/pies de página comunes en documentos UBPD: líneas
+    repetidas entre páginas y patrones de header_rules.yaml (ver headers.py).
+    Los patrones de nuevas fuentes de datos se añaden en ese archivo.
     """
-    # TODO: añadir patrones UBPD si aparecen en producción.
-    return text
+    return get_header_engine().strip(text, source_system, record)
 
 
-def preprocess_text(text: str) -> str:
-    """Pipeline completo de preprocesamiento."""
+def preprocess_text(text: str, source_system: Optional[str] = None, record: bool = True) -> str:
+    """
+    Pipeline completo de preprocesamiento. record=False no suma lo
+    eliminado a header_stats() (pasadas auxiliares, como la de dedup).
+    """
     text = normalize_unicode(text)
-    text = remove_headers_and_footers(text)
+    text = remove_headers_and_footers(text, source_system, record)
     text = collapse_spaces(text)
     return text
+
+
+# ---------------------------------------------------------------------
+# Mapa de posiciones (texto preprocesado → texto original)
+# ---------------------------------------------------------------------
+# Tabla: ¿es espacio para \s y str.strip? Ninguno pasa de U+3000, así que
+# los códigos mayores se llevan a la última posición (False)
+_LAST_SPACE = 0x3000
+_IS_SPACE = np.array([chr(cp).isspace() for cp in range(_LAST_SPACE + 1)] + [False])
+
+
+def _nfc_with_offsets(text: str) -> Tuple[str, Optional[np.ndarray]]:
+    """NFC por grupos (carácter base + marcas combinantes); None si no cambia."""
+    if unicodedata.is_normalized("NFC", text):
+        return text, None
+    pieces: List[str] = []
+    offsets: List[int] = []
+    start = 0
+    for i in range(1, len(text) + 1):
+        if i == len(text) or not unicodedata.combining(text[i]):
+            piece = unicodedata.normalize("NFC", text[start:i])
+            pieces.append(piece)
+            offsets.extend([start] * len(piece))
+            start = i
+    return "".join(pieces), np.array(offsets, dtype=np.int64)
+
+
+def _kept_positions(length: int, removed: List[Tuple[int, int]]) -> np.ndarray:
+    keep = np.ones(length, dtype=bool)
+    for start, end in removed:
+        keep[start:end] = False
+    return np.flatnonzero(keep)
+
+
+def _collapse_with_offsets(text: str) -> Tuple[str, np.ndarray]:
+    """
+    collapse_spaces y, para cada carácter del resultado, su posición en
+    `text`. Se hace con NumPy sobre los códigos de carácter: más rápido que
+    la regex de collapse_spaces y sin una segunda pasada.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    space = _IS_SPACE[np.minimum(codes, _LAST_SPACE + 1)]
+    # Cada tramo de espacios queda en su primer carácter
+    keep = ~space
+    keep[1:] |= space[1:] & ~space[:-1]
+    if len(keep):
+        keep[0] |= space[0]
+    positions = np.flatnonzero(keep)
+    if len(positions) and space[positions[0]]:
+        positions = positions[1:]
+    if len(positions) and space[positions[-1]]:
+        positions = positions[:-1]
+    kept = codes[positions]
+    kept[space[positions]] = ord(" ")
+    return kept.tobytes().decode("utf-32-le"), positions
+
+
+def preprocess_with_offsets(
+    text: str, source_system: Optional[str] = None, record: bool = True
+) -> Tuple[str, np.ndarray]:
+    """
+    Igual que preprocess_text, pero devuelve también `offsets`: offsets[i]
+    es la posición en `text` del carácter i del texto limpio, y
+    offsets[len(limpio)] = len(text). original_span() traduce tramos.
+    """
+    normalized, nfc_map = _nfc_with_offsets(text)
+    removed: List[Tuple[int, int]] = []
+    stripped = get_header_engine().strip_with_report(normalized, source_system, record, spans=removed)[0]
+    clean, collapse_map = _collapse_with_offsets(stripped)
+
+    offsets = _kept_positions(len(normalized), removed)[collapse_map]
+    if nfc_map is not None:
+        offsets = nfc_map[offsets]
+    return clean, np.append(offsets, len(text))
+
+
+def original_span(text: str, offsets: np.ndarray, start: int, end: int) -> Tuple[int, int]:
+    """Tramo [start, end) del texto limpio → tramo del original `text`."""
+    if end <= start:
+        position = int(offsets[start])
+        return position, position
+    last = int(offsets[end - 1]) + 1
+    # Si el original no estaba en NFC, el último carácter puede llevar marcas
+    while last < len(text) and unicodedata.combining(text[last]):
+        last += 1
+    return int(offsets[start]), last
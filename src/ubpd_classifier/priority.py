@@ -0,0 +1,104 @@
+"""
+priority.py
+Reglas de priority_score cargadas de configuración (priority_rules.yaml)
+en lugar de estar fijas en el código.
+Autor: Manuel Daza Ramirez
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+import yaml
+
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "priority_rules.yaml"
+
+SINGLE_LABEL_FIELDS = ("tipo_documento", "periodo", "ruteo")
+MULTI_LABEL_FIELDS = ("tipo_hecho", "actores")
+
+
+class PriorityRule(NamedTuple):
+    field: str
+    code: str
+    weight: float
+
+
+class PriorityRules:
+    """
+    Reglas en el orden en que se suman, tope del total y hash de versión
+    (cambia con cualquier peso, código u orden).
+    """
+
+    __slots__ = ("rules", "max_score", "version")
+
+    def __init__(self, rules: Iterable[Tuple[str, str, float]], max_score: float = 1.0):
+        parsed = []
+        for field, code, weight in rules:
+            if field not in SINGLE_LABEL_FIELDS + MULTI_LABEL_FIELDS:
+                raise ValueError(f"Campo de prioridad desconocido: {field!r}")
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+                raise ValueError(f"Peso inválido para {field}={code}: {weight!r}")
+            parsed.append(PriorityRule(field, str(code), float(weight)))
+        self.rules: Tuple[PriorityRule, ...] = tuple(parsed)
+        self.max_score = float(max_score)
+        canonical = json.dumps([self.rules, self.max_score], separators=(",", ":"))
+        self.version = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __repr__(self):
+        return f"PriorityRules({len(self.rules)} reglas, version={self.version[:12]})"
+
+    def score(self, pred: dict) -> float:
+        """priority_score de una predicción (ver compute_priority)."""
+        score = 0.0
+        sets = {}
+        for field, code, weight in self.rules:
+            if field in MULTI_LABEL_FIELDS:
+                values = sets.get(field)
+                if values is None:
+                    values = sets[field] = set(pred.get(field, []))
+                if code in values:
+                    score += weight
+            elif pred.get(field) == code:
+                score += weight
+        return min(score, self.max_score)
+
+
+def load_priority_rules(path=None) -> PriorityRules:
+    """Lee las reglas desde YAML (por defecto, priority_rules.yaml)."""
+    with open(path or DEFAULT_RULES_PATH, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    rules = [(r["field"], r["code"], r["weight"]) for r in config.get("rules", [])]
+    return PriorityRules(rules, config.get("max_score", 1.0))
+
+
+# ---------------------------------------------------------------------
+# Reglas del proceso
+# ---------------------------------------------------------------------
+_rules: Optional[PriorityRules] = None
+_rules_lock = threading.Lock()
+
+
+def get_priority_rules() -> PriorityRules:
+    """Reglas compartidas (UBPD_PRIORITY_RULES permite otro archivo)."""
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = load_priority_rules(os.getenv("UBPD_PRIORITY_RULES") or None)
+    return _rules
+
+
+def set_priority_rules(rules: Optional[PriorityRules]) -> None:
+    """Sustituye las reglas del proceso (None: se recargan al usarlas)."""
+    global _rules
+    _rules = rules
@@ -4,22 +4,21 @@ Prompts estructurados y auto-verificables para el clasificador UBPD.
 Autor: Manuel Daza Ramirez
 """
 
-from ontology import ontology_to_prompt_text, load_ontology
+import functools
+import hashlib
+from typing import Dict, Tuple
 
-
-# Cargar ontología al inicio
-ONTOLOGY = load_ontology()
-ONTOLOGY_PROMPT = ontology_to_prompt_text(ONTOLOGY)
+from ontology import CompiledOntology, get_ontology
 
 
 # ---------------------------------------------------------------------
 # SYSTEM PROMPT (auto-verificable + comprimido)
 # ---------------------------------------------------------------------
-SYSTEM_PROMPT = f"""
+_SYSTEM_TEMPLATE = """
 Eres un clasificador para la UBPD. Devuelves SOLO un JSON válido usando únicamente los códigos permitidos.
 
 CÓDIGOS VÁLIDOS:
-{ONTOLOGY_PROMPT}
+{ontology_prompt}
 
 REGLAS:
 - No inventes códigos.
@@ -52,9 +51,42 @@ VALIDACIÓN INTERNA (antes de responder):
 """.strip()
 
 
+def build_system_prompt(ontology_prompt: str) -> str:
+    """System prompt con la lista de códigos válidos de la ontología."""
+    return _SYSTEM_TEMPLATE.format(ontology_prompt=ontology_prompt)
+
+
+# (versión de la ontología, prompt): se reconstruye solo si la ontología cambia
+_system_prompt_cache = (None, None)
+
+
+def _system_prompt_for(ontology: CompiledOntology) -> str:
+    global _system_prompt_cache
+    version, prompt = _system_prompt_cache
+    if version != ontology.version:
+        prompt = build_system_prompt(ontology.prompt_text)
+        _system_prompt_cache = (ontology.version, prompt)
+    return prompt
+
+
+def get_system_prompt() -> str:
+    """System prompt de la ontología vigente (sigue las recargas en caliente)."""
+    return _system_prompt_for(get_ontology())
+
+
+# Valores al importar (compatibilidad); el código que debe seguir las
+# recargas usa get_ontology() / get_system_prompt()
+ONTOLOGY = get_ontology().as_dict()
+ONTOLOGY_PROMPT = get_ontology().prompt_text
+SYSTEM_PROMPT = get_system_prompt()
+
+
 # ---------------------------------------------------------------------
 # USER TEMPLATE (few-shot comprimido)
 # ---------------------------------------------------------------------
+# El documento va al final: system prompt, ontología, ejemplos e
+# instrucciones forman un prefijo idéntico byte a byte en todas las
+# llamadas, que el proveedor puede reutilizar (caché de prefijos)
 USER_TEMPLATE = """
 Ejemplo 1 (entrada):
 "Yo, María, cuento que en 1997, en San Carlos, Antioquia, hombres armados de la guerrilla se llevaron a mi esposo. Debimos salir hacia Medellín."
@@ -87,15 +119,52 @@ Ejemplo 2 (salida):
   "highlights": []
 }
 
-Ahora clasifica este documento siguiendo exactamente el formato:
+Ahora clasifica el siguiente documento siguiendo exactamente el formato.
+Devuelve SOLO el JSON.
 
 DOCUMENTO:
 {{DOCUMENTO}}
-
-Devuelve SOLO el JSON.
 """.strip()
 
+# Parte fija del mensaje de usuario (todo lo anterior al documento)
+USER_PREFIX, _TEMPLATE_SUFFIX = USER_TEMPLATE.split("{{DOCUMENTO}}")
+if _TEMPLATE_SUFFIX:
+    raise ValueError("El documento debe ir al final de USER_TEMPLATE.")
+
 
 def build_user_prompt(text: str) -> str:
-    """Inserta documento en la plantilla few-shot."""
-    return USER_TEMPLATE.replace("{{DOCUMENTO}}", text.strip())
+    """Añade el documento tras la parte fija de la plantilla few-shot."""
+    return USER_PREFIX + text.strip()
+
+
+@functools.lru_cache(maxsize=1)
+def prompt_version() -> str:
+    """
+    Hash sha256 de las plantillas de prompt. No incluye la ontología, que
+    tiene su propia versión (CompiledOntology.version): así un run se puede
+    marcar como obsoleto por uno u otro motivo.
+    """
+    h = hashlib.sha256()
+    for part in (_SYSTEM_TEMPLATE, USER_TEMPLATE):
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def get_versioned_system_prompt() -> Tuple[str, Dict[str, str]]:
+    """
+    System prompt vigente y las versiones con que se construyó
+    ({"ontology_hash", "prompt_hash"}), tomados de la misma ontología. La
+    clasificación lleva esas versiones hasta el run que se guarda, aunque
+    la ontología se recargue antes de guardarlo.
+    """
+    ontology = get_ontology()
+    return _system_prompt_for(ontology), {"ontology_hash": ontology.version, "prompt_hash": prompt_version()}
+
+
+def extract_document(user_prompt: str) -> str:
+    """Inversa de build_user_prompt: recupera el documento del prompt."""
+    if user_prompt.startswith(USER_PREFIX):
+        return user_prompt[len(USER_PREFIX):]
+    return user_prompt
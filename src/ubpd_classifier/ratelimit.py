@@ -0,0 +1,337 @@
+"""
+ratelimit.py
+Control de ritmo y reintentos para las llamadas al LLM: cubetas de
+peticiones/min y tokens/min, backoff exponencial con jitter, respeto de
+Retry-After y concurrencia adaptativa.
+Autor: Manuel Daza Ramirez
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+
+
+# Códigos HTTP que se reintentan
+RETRYABLE_STATUS = {408, 409, 429}
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5   # segundos
+DEFAULT_BACKOFF_CAP = 60.0   # segundos
+
+
+# ---------------------------------------------------------------------
+# Clasificación de errores
+# ---------------------------------------------------------------------
+def is_throttle(exc: BaseException) -> bool:
+    """True si el proveedor pidió bajar el ritmo (HTTP 429)."""
+    return isinstance(exc, openai.RateLimitError) or getattr(exc, "status_code", None) == 429
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True para errores que merece la pena reintentar."""
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Segundos indicados por Retry-After / retry-after-ms, si vienen."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+# ---------------------------------------------------------------------
+# Cubeta de tokens
+# ---------------------------------------------------------------------
+class TokenBucket:
+    """
+    Cubeta que se rellena a `per_minute` unidades por minuto.
+
+    reserve() descuenta siempre (la cubeta puede quedar en negativo) y
+    devuelve cuánto hay que esperar antes de usar lo reservado; así una
+    petición más grande que la capacidad no se bloquea para siempre.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate
+
+
+# ---------------------------------------------------------------------
+# Planificador
+# ---------------------------------------------------------------------
+class RateLimiter:
+    """
+    Planificador de llamadas al LLM.
+
+    - Respeta peticiones/min y tokens/min (tokens estimados por llamada).
+    - Limita las llamadas en vuelo a `limit`, que se reduce a la mitad
+      con cada 429 y crece de uno en uno tras `limit` éxitos seguidos
+      (AIMD), entre `min_concurrency` y `max_concurrency`.
+    - Reintenta errores transitorios con backoff exponencial y jitter;
+      si el proveedor envía Retry-After, se espera al menos ese tiempo.
+    """
+
+    def __init__(
+        self,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        min_concurrency: int = 1,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP,
+    ):
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._success_streak = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters: deque = deque()
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_wait_s = 0.0
+        self.backoff_wait_s = 0.0
+        self.tokens = 0
+        self._started: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """
+        Configuración por variables de entorno:
+
+        - UBPD_RPM, UBPD_TPM: límites del proveedor
+        - UBPD_MAX_CONCURRENCY: techo de llamadas simultáneas
+        - UBPD_MAX_RETRIES: reintentos por llamada
+        """
+        return cls(
+            rpm=float(os.getenv("UBPD_RPM", DEFAULT_RPM)),
+            tpm=float(os.getenv("UBPD_TPM", DEFAULT_TPM)),
+            max_concurrency=int(os.getenv("UBPD_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            max_retries=int(os.getenv("UBPD_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+        )
+
+    # -----------------------------------------------------------------
+    # Concurrencia adaptativa
+    # -----------------------------------------------------------------
+    def _try_take_slot(self) -> bool:
+        if self._in_flight < self.limit:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # Se despierta a todos: cada uno vuelve a comprobar el límite
+        self._cond.notify_all()
+        while self._async_waiters:
+            fut = self._async_waiters.popleft()
+            fut.get_loop().call_soon_threadsafe(_resolve, fut)
+
+    def _on_success(self, tokens: int) -> None:
+        with self._lock:
+            self.successes += 1
+            self.tokens += tokens
+            self._success_streak += 1
+            if self._success_streak >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._success_streak = 0
+                self._wake_waiters()
+
+    def _on_throttle(self) -> None:
+        with self._lock:
+            self.throttled += 1
+            self._success_streak = 0
+            self.limit = max(self.min_concurrency, self.limit // 2)
+
+    # -----------------------------------------------------------------
+    # Esperas
+    # -----------------------------------------------------------------
+    def _bucket_wait(self, tokens: int) -> float:
+        return max(self.requests_bucket.reserve(1), self.tokens_bucket.reserve(tokens))
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        hinted = retry_after(exc)
+        if hinted is not None:
+            delay = max(delay, hinted)
+        return delay
+
+    def _record_start(self) -> None:
+        with self._lock:
+            self.requests += 1
+            if self._started is None:
+                self._started = time.monotonic()
+
+    def _give_up(self, exc: BaseException, attempt: int) -> bool:
+        return not is_transient(exc) or attempt >= self.max_retries
+
+    # -----------------------------------------------------------------
+    # API pública
+    # -----------------------------------------------------------------
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """
+        Ejecuta `fn` (síncrona) respetando límites y reintentos. El hueco de
+        concurrencia se ocupa mientras dura `fn`: si lee un stream, debe
+        consumirlo dentro de `fn`.
+        """
+        attempt = 0
+        while True:
+            with self._cond:
+                while not self._try_take_slot():
+                    self._cond.wait()
+            try:
+                wait = self._bucket_wait(tokens)
+                if wait > 0:
+                    self._add_throttle_wait(wait)
+                    time.sleep(wait)
+                self._record_start()
+                result = fn()
+            except Exception as exc:
+                error = exc
+            else:
+                error = None
+            finally:
+                # También con KeyboardInterrupt y similares
+                self._release_slot()
+            if error is None:
+                self._on_success(tokens)
+                return result
+            delay = self._after_error(error, attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """Versión asíncrona de call: `fn` devuelve un awaitable."""
+        attempt = 0
+        while True:
+            while True:
+                with self._lock:
+                    if self._try_take_slot():
+                        break
+                    fut = asyncio.get_running_loop().create_future()
+                    self._async_waiters.append(fut)
+                await fut
+            try:
+                wait = self._bucket_wait(tokens)
+                if wait > 0:
+                    self._add_throttle_wait(wait)
+                    await asyncio.sleep(wait)
+                self._record_start()
+                result = await fn()
+            except Exception as exc:
+                error = exc
+            else:
+                error = None
+            finally:
+                # También con CancelledError (timeouts, gather cancelado, cierre)
+                self._release_slot()
+            if error is None:
+                self._on_success(tokens)
+                return result
+            delay = self._after_error(error, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _after_error(self, exc: Exception, attempt: int) -> float:
+        """Ajusta el límite y los contadores; devuelve la espera o relanza `exc`."""
+        if is_throttle(exc):
+            self._on_throttle()
+        if self._give_up(exc, attempt):
+            with self._lock:
+                self.failures += 1
+            raise exc
+        delay = self._retry_delay(exc, attempt)
+        self._count_retry(exc, delay)
+        return delay
+
+    def _add_throttle_wait(self, wait: float) -> None:
+        with self._lock:
+            self.throttle_wait_s += wait
+
+    def _count_retry(self, exc: BaseException, delay: float) -> None:
+        with self._lock:
+            self.retries += 1
+            if is_throttle(exc):
+                self.throttle_wait_s += delay
+            else:
+                self.backoff_wait_s += delay
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores para monitoreo."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started if self._started else 0.0
+            return {
+                "requests": self.requests,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "throttle_wait_s": self.throttle_wait_s,
+                "backoff_wait_s": self.backoff_wait_s,
+                "concurrency_limit": self.limit,
+                "in_flight": self._in_flight,
+                "requests_per_min": self.successes / elapsed * 60 if elapsed else 0.0,
+                "tokens_per_min": self.tokens / elapsed * 60 if elapsed else 0.0,
+            }
+
+
+def _resolve(fut: "asyncio.Future") -> None:
+    if not fut.done():
+        fut.set_result(None)
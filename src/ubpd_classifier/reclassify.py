@@ -0,0 +1,330 @@
+"""
+reclassify.py
+Reclasificación incremental: solo los documentos cuyo run activo quedó
+obsoleto tras un cambio de modelo, de prompts o de ontología.
+
+Cada run guarda model_name/model_version, ontology_hash
+(CompiledOntology.version) y prompt_hash (prompts.prompt_version()). Un run
+activo está obsoleto por:
+
+- model: otro model_name o model_version que el backend vigente.
+- prompt: otro prompt_hash (o ninguno: runs anteriores a esta columna).
+- ontology: otro ontology_hash (o ninguno).
+- codes: alguna etiqueta (tipo_documento, periodo, ruteo, tipo_hecho,
+  actores) usa un código que ya no existe en la ontología vigente.
+
+--reasons limita los motivos: p. ej. tras cambiar solo descripciones de la
+ontología, `--reasons codes` reclasifica únicamente los runs con códigos
+eliminados. Los documentos se recorren por doc_id en lotes y se clasifican
+con el bucle de jobs.work(). Cada lote se escribe en una transacción: los
+runs nuevos y el paso a is_active = FALSE de los anteriores (db.insert_runs)
+se confirman juntos. Un documento cuyo run activo cambió mientras tanto (p.
+ej. lo reclasificó otro proceso) no se escribe. Con --enqueue, los
+documentos se encolan en doc_job para los workers de jobs.py.
+
+Uso:
+    python reclassify.py --stale --dry-run
+    python reclassify.py --stale --batch-size 50 --concurrency 16
+    python reclassify.py --stale --reasons codes
+    python reclassify.py --stale --enqueue
+
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import db
+from classifier import get_backend
+from jobs import BATCH_SIZE, LEASE_S, Job, PostgresJobQueue, work
+from ontology import get_ontology
+from prompts import prompt_version
+
+
+STALE_REASONS = ("model", "prompt", "ontology", "codes")
+
+# Documentos por página al encolar con --enqueue
+ENQUEUE_PAGE_SIZE = 1000
+
+
+# ---------------------------------------------------------------------
+# SQL
+# ---------------------------------------------------------------------
+# Condición de cada motivo sobre el run activo r y sus etiquetas l
+_CONDITIONS = {
+    "model": "(r.model_name <> %(model_name)s OR COALESCE(r.model_version, '') <> %(model_version)s)",
+    "prompt": "r.prompt_hash IS DISTINCT FROM %(prompt_hash)s",
+    "ontology": "r.ontology_hash IS DISTINCT FROM %(ontology_hash)s",
+    "codes": """(
+        l.tipo_documento <> ALL(%(tipo_documento)s)
+        OR l.periodo <> ALL(%(periodo)s)
+        OR l.ruteo <> ALL(%(ruteo)s)
+        OR EXISTS (SELECT 1 FROM doc_classification_hecho h
+                   WHERE h.run_id = r.run_id AND h.hecho_code <> ALL(%(tipo_hecho)s))
+        OR EXISTS (SELECT 1 FROM doc_classification_actor a
+                   WHERE a.run_id = r.run_id AND a.actor_code <> ALL(%(actores)s))
+    )""",
+}
+
+_ACTIVE_RUNS = """
+FROM doc_classification_run r
+JOIN doc_classification_labels l ON l.run_id = r.run_id
+JOIN doc_document d ON d.doc_id = r.doc_id
+WHERE r.is_active
+"""
+
+
+def stale_select_sql(reasons: Sequence[str]) -> str:
+    """Siguiente página de runs activos obsoletos (por doc_id, desde %(after)s)."""
+    where = " OR ".join(_CONDITIONS[reason] for reason in reasons)
+    return f"""
+SELECT r.doc_id, r.run_id, d.text_content, d.source_system
+{_ACTIVE_RUNS}
+  AND r.doc_id > %(after)s::uuid
+  AND ({where})
+ORDER BY r.doc_id
+LIMIT %(limit)s
+"""
+
+
+def stale_count_sql(reasons: Sequence[str]) -> str:
+    """Runs activos, obsoletos por cada motivo y obsoletos por alguno."""
+    counts = ",\n       ".join(
+        f"count(*) FILTER (WHERE {_CONDITIONS[reason]}) AS {reason}" for reason in reasons
+    )
+    where = " OR ".join(_CONDITIONS[reason] for reason in reasons)
+    return f"""
+SELECT count(*) AS active,
+       {counts},
+       count(*) FILTER (WHERE {where}) AS stale
+{_ACTIVE_RUNS}
+"""
+
+
+# Runs seleccionados que siguen activos, bloqueados hasta el commit
+STILL_ACTIVE_SQL = """
+SELECT run_id FROM doc_classification_run
+WHERE run_id = ANY(%s::uuid[]) AND is_active
+FOR UPDATE
+"""
+
+# Menor que cualquier UUID: punto de partida del recorrido por doc_id
+_FIRST_DOC = "00000000-0000-0000-0000-000000000000"
+
+
+def current_versions() -> Dict[str, Any]:
+    """Parámetros de las consultas: modelo, hashes y códigos vigentes."""
+    backend = get_backend()
+    ontology = get_ontology()
+    params: Dict[str, Any] = {
+        "model_name": backend.model_name,
+        "model_version": getattr(backend, "model_version", "") or "",
+        "prompt_hash": prompt_version(),
+        "ontology_hash": ontology.version,
+    }
+    for dimension in ("tipo_documento", "periodo", "ruteo", "tipo_hecho", "actores"):
+        params[dimension] = sorted(ontology.codes(dimension))
+    return params
+
+
+def _check_reasons(reasons: Sequence[str]) -> Tuple[str, ...]:
+    unknown = set(reasons) - set(STALE_REASONS)
+    if unknown or not reasons:
+        raise ValueError(f"Motivos válidos: {', '.join(STALE_REASONS)} (recibido: {', '.join(reasons)}).")
+    return tuple(reasons)
+
+
+# ---------------------------------------------------------------------
+# Cola sobre los runs obsoletos (interfaz de PostgresJobQueue para work())
+# ---------------------------------------------------------------------
+class StaleRunQueue:
+    """
+    Entrega los documentos con run activo obsoleto, en orden de doc_id y sin
+    repetir ninguno, como si fueran jobs. complete() escribe el nuevo run de
+    los que siguen teniendo activo el run seleccionado.
+    """
+
+    worker_id = "reclassify"
+    lease_s = LEASE_S  # no hay lease: extend() no hace nada
+
+    def __init__(
+        self,
+        reasons: Sequence[str] = STALE_REASONS,
+        limit: Optional[int] = None,
+        page_size: int = db.BULK_PAGE_SIZE,
+    ):
+        self.reasons = _check_reasons(reasons)
+        self.limit = limit
+        self.page_size = page_size
+        self.params = current_versions()
+        self._sql = stale_select_sql(self.reasons)
+        self._after = _FIRST_DOC
+        self._next_id = 0
+        self._runs: Dict[int, str] = {}  # job_id → run obsoleto seleccionado
+        self.selected = self.replaced = self.skipped = 0
+        self.errors: List[Tuple[str, str]] = []
+
+    def claim(self, limit: int) -> List[Job]:
+        if self.limit is not None:
+            limit = min(limit, self.limit - self.selected)
+            if limit <= 0:
+                return []
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(self._sql, dict(self.params, after=self._after, limit=limit))
+                    rows = cur.fetchall()
+        jobs = []
+        for doc_id, run_id, text, source_system in rows:
+            self._next_id += 1
+            self._runs[self._next_id] = str(run_id)
+            jobs.append(Job(self._next_id, str(doc_id), 1, text, source_system))
+        if rows:
+            self._after = str(rows[-1][0])
+        self.selected += len(jobs)
+        return jobs
+
+    def extend(self, jobs: Sequence[Job]) -> int:
+        return len(jobs)
+
+    def complete(self, results: Sequence[Tuple[Job, Dict[str, Any]]]) -> Dict[int, str]:
+        """Nuevos runs y desactivación de los anteriores, en una transacción."""
+        if not results:
+            return {}
+        runs = {job.job_id: self._runs.pop(job.job_id) for job, _ in results}
+
+        def rows_for(subset):
+            return db.build_run_rows(
+                {"doc_id": job.doc_id, "text": job.text, "classification": classification,
+                 "source_system": job.source_system or "LOCAL_DEMO"}
+                for job, classification in subset
+            )
+
+        # Highlights y filas fuera de la transacción
+        run_ids, rows = rows_for(results)
+        with db.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(STILL_ACTIVE_SQL, (list(runs.values()),))
+                    active = {str(run_id) for (run_id,) in cur.fetchall()}
+                    if len(active) < len(results):
+                        results = [r for r in results if runs[r[0].job_id] in active]
+                        run_ids, rows = rows_for(results)
+                    if results:
+                        db.insert_runs(cur, [job.doc_id for job, _ in results], rows, self.page_size)
+        self.replaced += len(results)
+        self.skipped += len(runs) - len(results)
+        return {job.job_id: run_id for (job, _), run_id in zip(results, run_ids)}
+
+    def fail(self, failures: Sequence[Tuple[Job, str]]) -> int:
+        # El run anterior sigue activo; se vuelve a seleccionar en otra pasada
+        for job, error in failures:
+            self._runs.pop(job.job_id, None)
+            self.errors.append((job.doc_id, error))
+        return len(failures)
+
+
+# ---------------------------------------------------------------------
+# Operaciones
+# ---------------------------------------------------------------------
+def stale_counts(reasons: Sequence[str] = STALE_REASONS) -> Dict[str, int]:
+    """Runs activos y cuántos están obsoletos (por motivo y en total)."""
+    reasons = _check_reasons(reasons)
+    with db.connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(stale_count_sql(reasons), current_versions())
+                row = cur.fetchone()
+    return dict(zip(("active", *reasons, "stale"), row))
+
+
+def enqueue_stale(
+    reasons: Sequence[str] = STALE_REASONS,
+    limit: Optional[int] = None,
+    queue: Optional[PostgresJobQueue] = None,
+) -> int:
+    """Encola en doc_job los documentos con run obsoleto; devuelve cuántos jobs se crearon."""
+    stale = StaleRunQueue(reasons, limit)
+    queue = queue or PostgresJobQueue()
+    total = 0
+    while True:
+        jobs = stale.claim(ENQUEUE_PAGE_SIZE)
+        if not jobs:
+            return total
+        total += queue.enqueue_documents([job.doc_id for job in jobs])
+
+
+async def reclassify_stale(
+    reasons: Sequence[str] = STALE_REASONS,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = 8,
+    limit: Optional[int] = None,
+    progress=None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """
+    Reclasifica los documentos con run obsoleto en lotes de `batch_size`.
+    `kwargs` se pasa a jobs.work() (p. ej. classify). Devuelve el resumen
+    de work() más seleccionados, reemplazados, omitidos y errores.
+    """
+    queue = StaleRunQueue(reasons, limit)
+    stats = await work(queue, batch_size, concurrency, until_empty=True, progress=progress, **kwargs)
+    stats.update(selected=queue.selected, replaced=queue.replaced, skipped=queue.skipped,
+                 errors=queue.errors[:20])
+    return stats
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="UBPD – reclasificación de los runs obsoletos (modelo, prompts u ontología)"
+    )
+    parser.add_argument("--stale", action="store_true",
+                        help="Seleccionar los documentos cuyo run activo está obsoleto.")
+    parser.add_argument("--reasons", type=str, default=",".join(STALE_REASONS),
+                        help=f"Motivos a considerar (default: {','.join(STALE_REASONS)}).")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Llamadas simultáneas al modelo (default: 8).")
+    parser.add_argument("--limit", type=int, help="Como mucho N documentos.")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar los runs obsoletos.")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="Encolar en doc_job para los workers de jobs.py en lugar de clasificar aquí.")
+    args = parser.parse_args()
+
+    if not args.stale:
+        parser.error("indica qué reclasificar: --stale")
+    reasons = [reason.strip() for reason in args.reasons.split(",") if reason.strip()]
+    try:
+        reasons = _check_reasons(reasons)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.dry_run:
+        print(json.dumps(stale_counts(reasons), indent=2))
+        return
+    if args.enqueue:
+        print(f"{enqueue_stale(reasons, args.limit)} documentos encolados")
+        return
+
+    from classifier import missing_api_key
+
+    if missing_api_key():
+        print("ERROR: OPENAI_API_KEY no está definida en las variables de entorno.")
+        return
+
+    def report(stats):
+        print(f"  lote {stats['batches']}: {stats['done']} reclasificados, "
+              f"{stats['failed']} fallidos ({stats['elapsed_s']:.1f} s)")
+
+    summary = asyncio.run(reclassify_stale(reasons, args.batch_size, args.concurrency, args.limit,
+                                           progress=report))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+rescore.py
+Recalcula priority_score de las clasificaciones ya guardadas con las reglas
+actuales (priority_rules.yaml o UBPD_PRIORITY_RULES), sin llamar al modelo.
+
+Las etiquetas se leen con un cursor del lado del servidor (memoria acotada
+por el tamaño de lote), las puntuaciones se recalculan por lote y solo las
+filas cuya puntuación cambia se actualizan, con un UPDATE ... FROM (VALUES)
+por lote en una segunda conexión que confirma cada lote.
+
+raw_json conserva la puntuación calculada al clasificar.
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import json
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Dict, Optional
+
+from psycopg2.extras import execute_values
+
+import db
+from priority import MULTI_LABEL_FIELDS, PriorityRules, get_priority_rules, load_priority_rules
+
+
+# Filas leídas (y como mucho actualizadas) por lote
+RESCORE_BATCH_SIZE = 5000
+
+# priority_score es NUMERIC(5,4)
+SCORE_QUANTUM = Decimal("0.0001")
+
+CURSOR_NAME = "ubpd_rescore"
+
+# Tabla de cada dimensión multi-etiqueta que pueden usar las reglas
+_MULTI_LABEL_TABLES = {
+    "tipo_hecho": ("doc_classification_hecho", "hecho_code"),
+    "actores": ("doc_classification_actor", "actor_code"),
+}
+
+UPDATE_SQL = """
+UPDATE doc_classification_labels AS l
+SET priority_score = v.priority_score
+FROM (VALUES %s) AS v(run_id, priority_score)
+WHERE l.run_id = v.run_id
+  AND l.priority_score IS DISTINCT FROM v.priority_score
+"""
+UPDATE_TEMPLATE = "(%s::uuid, %s::numeric)"
+
+
+def quantize_score(score: float) -> Decimal:
+    """La puntuación tal como la guarda PostgreSQL (4 decimales, mitad hacia arriba)."""
+    return Decimal(repr(score)).quantize(SCORE_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+def build_select_sql(rules: PriorityRules, active_only: bool = True) -> str:
+    """
+    Etiquetas simples y, solo para las dimensiones que usan las reglas,
+    los códigos multi-etiqueta agregados por run (LATERAL sobre la clave
+    primaria: se recorre sin agrupar toda la tabla).
+    """
+    used = {rule.field for rule in rules}
+    columns = ["l.run_id", "l.tipo_documento", "l.periodo", "l.ruteo", "l.priority_score"]
+    joins = []
+    for field in MULTI_LABEL_FIELDS:
+        if field not in used:
+            continue
+        table, column = _MULTI_LABEL_TABLES[field]
+        columns.append(f"COALESCE({field}.codes, '{{}}') AS {field}")
+        joins.append(
+            f"LEFT JOIN LATERAL (SELECT array_agg(x.{column}) AS codes FROM {table} x "
+            f"WHERE x.run_id = l.run_id) AS {field} ON TRUE"
+        )
+    if active_only:
+        joins.insert(0, "JOIN doc_classification_run r ON r.run_id = l.run_id AND r.is_active")
+    return "SELECT {} FROM doc_classification_labels l {}".format(", ".join(columns), " ".join(joins))
+
+
+class _Scorer:
+    """Puntuación por combinación de etiquetas (se repiten mucho entre runs)."""
+
+    def __init__(self, rules: PriorityRules):
+        self.rules = rules
+        used = {rule.field for rule in rules}
+        self.multi = [f for f in MULTI_LABEL_FIELDS if f in used]
+        self._memo: Dict[tuple, Decimal] = {}
+
+    def __call__(self, row: tuple) -> Decimal:
+        _, tipo_documento, periodo, ruteo, _, *multi = row
+        key = (tipo_documento, periodo, ruteo, *(frozenset(codes) for codes in multi))
+        score = self._memo.get(key)
+        if score is None:
+            pred = {"tipo_documento": tipo_documento, "periodo": periodo, "ruteo": ruteo}
+            pred.update(zip(self.multi, key[3:]))
+            score = self._memo[key] = quantize_score(self.rules.score(pred))
+        return score
+
+
+def rescore(
+    rules: Optional[PriorityRules] = None,
+    batch_size: int = RESCORE_BATCH_SIZE,
+    active_only: bool = True,
+    dry_run: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Recalcula y guarda priority_score. Con `dry_run` solo cuenta cuántas
+    filas cambiarían. `progress(stats)` se llama tras cada lote.
+    """
+    rules = rules or get_priority_rules()
+    scorer = _Scorer(rules)
+    stats = {"scanned": 0, "changed": 0, "updated": 0, "batches": 0, "rules_version": rules.version}
+    start = time.monotonic()
+
+    with db.connection() as read_conn, db.connection() as write_conn:
+        # El cursor con nombre vive dentro de la transacción de lectura;
+        # las escrituras van por otra conexión para poder confirmar cada lote
+        with read_conn:
+            with read_conn.cursor(name=CURSOR_NAME) as cur:
+                cur.itersize = batch_size
+                cur.execute(build_select_sql(rules, active_only))
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    updates = []
+                    for row in rows:
+                        score = scorer(row)
+                        if row[4] is None or row[4] != score:
+                            updates.append((row[0], score))
+
+                    stats["scanned"] += len(rows)
+                    stats["changed"] += len(updates)
+                    stats["batches"] += 1
+                    if updates and not dry_run:
+                        with write_conn:
+                            with write_conn.cursor() as wcur:
+                                execute_values(wcur, UPDATE_SQL, updates,
+                                               template=UPDATE_TEMPLATE, page_size=len(updates))
+                                stats["updated"] += max(wcur.rowcount, 0)
+                    if progress is not None:
+                        progress(dict(stats, elapsed_s=time.monotonic() - start))
+
+    stats["elapsed_s"] = time.monotonic() - start
+    return stats
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="UBPD – recalcular priority_score con las reglas actuales (sin LLM)"
+    )
+    parser.add_argument("--rules", type=str, help="Archivo de reglas (default: priority_rules.yaml)")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    parser.add_argument("--all-runs", action="store_true", help="Incluir runs inactivos.")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar las filas que cambiarían.")
+    args = parser.parse_args()
+
+    rules = load_priority_rules(args.rules) if args.rules else get_priority_rules()
+
+    def report(stats):
+        print(f"  {stats['scanned']} leídas, {stats['changed']} con cambios "
+              f"({stats['elapsed_s']:.1f} s)")
+
+    summary = rescore(rules, args.batch_size, active_only=not args.all_runs,
+                      dry_run=args.dry_run, progress=report)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,33 @@ Autor: Manuel Daza Ramirez
 """
 
 import argparse
+import asyncio
 import json
+import math
 import os
-from typing import Optional
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from classifier import classify_document
+from classifier import (
+    DEFAULT_CONCURRENCY,
+    classify_document_with_tokens,
+    classify_documents_async,
+    get_backend,
+    header_stats,
+    missing_api_key,
+    rate_limit_stats,
+    usage_stats,
+)
+from dedup import DedupIndex, Match, get_dedup_index
+from highlights import highlight_stats
+from ontology import get_ontology
+from pipeline import CPUPool, classify_documents_pipelined
+from preprocessing import preprocess_text
+from prompts import prompt_version
+
+
+DEFAULT_CHECKPOINT = "ubpd_batch_checkpoint.jsonl"
 
 
 def read_text_from_file(path: str) -> str:
@@ -17,12 +39,355 @@ def read_text_from_file(path: str) -> str:
         return f.read()
 
 
+# ---------------------------------------------------------------------
+# Modo por lotes: entradas
+# ---------------------------------------------------------------------
+def iter_input_dir(directory: str, pattern: str = "*.txt") -> Iterator[dict]:
+    """Recorre (recursivamente y en orden) los archivos de un directorio."""
+    for path in sorted(Path(directory).rglob(pattern)):
+        if path.is_file():
+            yield {"path": str(path), "external_id": None}
+
+
+def iter_manifest(manifest: str) -> Iterator[dict]:
+    """
+    Lee un manifiesto con una entrada por línea:
+
+    - una ruta de archivo, o
+    - un objeto JSON {"path": ..., "external_id": ...}
+
+    Las rutas relativas se resuelven respecto a la carpeta del manifiesto.
+    Las líneas vacías o que empiezan por '#' se ignoran.
+    """
+    base = Path(manifest).parent
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+            else:
+                entry = {"path": line}
+            path = Path(entry["path"])
+            if not path.is_absolute():
+                path = base / path
+            yield {"path": str(path), "external_id": entry.get("external_id")}
+
+
+# ---------------------------------------------------------------------
+# Modo por lotes: checkpoint
+# ---------------------------------------------------------------------
+def load_checkpoint(path: str) -> Set[str]:
+    """Devuelve las entradas ya completadas según el archivo de checkpoint."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                done.add(json.loads(line)["input"])
+            except (ValueError, KeyError):
+                # Última línea truncada por una caída: se reprocesa
+                continue
+    return done
+
+
+def append_checkpoint(fh, entry: dict) -> None:
+    """Añade una entrada completada y la fuerza a disco."""
+    fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+# ---------------------------------------------------------------------
+# Modo por lotes: ejecución y resumen
+# ---------------------------------------------------------------------
+def percentile(values: List[float], q: float) -> float:
+    """Percentil por vecino más cercano (q entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _same_versions(classification: Optional[dict], current: Dict[str, str]) -> bool:
+    """La clasificación existe y se hizo con el modelo, la ontología y el prompt vigentes."""
+    return classification is not None and all(classification.get(k) == v for k, v in current.items())
+
+
+def split_duplicates(
+    pending: List[dict], dedup: DedupIndex, source_system: Optional[str] = None
+) -> Tuple[List[dict], List[Tuple[dict, Match]]]:
+    """
+    Separa los documentos que son casi duplicados de otro ya indexado.
+
+    Los que no lo son se añaden al índice (item["dedup_key"]) antes de
+    clasificarlos, así las copias dentro del mismo bloque también se
+    detectan. Una entrada antigua sin clasificación (un original que falló
+    en una ejecución anterior) no cuenta como original. Tampoco una
+    clasificada con otro modelo, otra ontología u otro prompt (model_name /
+    model_version, ontology_hash / prompt_hash distintos de los vigentes):
+    la copia se clasifica y sustituye a esa entrada en el índice.
+    """
+    current = {
+        "model_name": get_backend().model_name,
+        "model_version": "",  # el que graba _run_batch_async
+        "ontology_hash": get_ontology().version,
+        "prompt_hash": prompt_version(),
+    }
+    fresh: List[dict] = []
+    duplicates: List[Tuple[dict, Match]] = []
+    added: Set[str] = set()
+    for item in pending:
+        signature = dedup.signature(preprocess_text(item["text"], source_system, record=False))
+        match = dedup.query(signature)
+        if match is not None:
+            if match.key in added or _same_versions(match.classification, current):
+                duplicates.append((item, match))
+                continue
+            if match.classification is not None:
+                dedup.remove(match.key)  # clasificado con versiones anteriores
+        item["dedup_key"] = dedup.add(signature, input=item["path"])
+        if item["dedup_key"] is not None:
+            added.add(item["dedup_key"])
+        fresh.append(item)
+    return fresh, duplicates
+
+
+async def _run_batch_async(
+    items: Iterable[dict],
+    checkpoint_path: str,
+    concurrency: int,
+    save: Optional[Callable[[List[dict]], List[tuple]]],
+    source_system: str,
+    dedup: Optional[DedupIndex] = None,
+    link: Optional[Callable[[List[dict]], Any]] = None,
+    pool: Optional[CPUPool] = None,
+) -> Dict[str, object]:
+    done = load_checkpoint(checkpoint_path)
+    model_name = get_backend().model_name
+    latencies: List[float] = []
+    processed = skipped = failures = duplicates_found = 0
+    original_tokens = sent_tokens = truncated = 0
+    chunk_size = max(1, concurrency * 4)
+    if pool is not None:
+        # Bloques grandes: el pool se vacía entre un bloque y el siguiente
+        chunk_size = max(chunk_size, pool.processes * pool.batch_size * 4)
+    start = time.perf_counter()
+
+    def chunks() -> Iterator[List[dict]]:
+        chunk: List[dict] = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    with open(checkpoint_path, "a", encoding="utf-8") as ckpt:
+        for chunk in chunks():
+            pending = []
+            for item in chunk:
+                if item["path"] in done:
+                    skipped += 1
+                    continue
+                try:
+                    item["text"] = read_text_from_file(item["path"])
+                except OSError as e:
+                    failures += 1
+                    print(f"[error] {item['path']}: {e}")
+                    continue
+                pending.append(item)
+
+            duplicates: List[Tuple[dict, Match]] = []
+            if dedup is not None:
+                pending, duplicates = split_duplicates(pending, dedup, source_system)
+
+            texts = [item["text"] for item in pending]
+            if pool is None:
+                results = await classify_documents_async(texts, concurrency=concurrency, source_system=source_system)
+            else:
+                # Las posiciones de los highlights se calculan en el pool si hay que guardar
+                results = await classify_documents_pipelined(
+                    texts, pool, concurrency=concurrency, source_system=source_system, locate=save is not None
+                )
+
+            completed = []
+            for item, result in zip(pending, results):
+                processed += 1
+                latencies.append(result["elapsed_ms"])
+                tokens = result.get("tokens")
+                if tokens:
+                    original_tokens += tokens["original"]
+                    sent_tokens += tokens["sent"]
+                    truncated += tokens["truncated"]
+                if result["error"] is not None:
+                    failures += 1
+                    print(f"[error] {item['path']}: {result['error']}")
+                    if item.get("dedup_key"):
+                        dedup.remove(item["dedup_key"])
+                    continue
+
+                classification = result["classification"]
+                classification.setdefault("model_name", model_name)
+                classification.setdefault("model_version", "")
+                if result.get("spans") is not None:
+                    item["spans"] = result["spans"]
+                completed.append((item, classification, tokens))
+
+            # Un solo guardado (una transacción) por bloque
+            entries = [
+                {"input": item["path"], "tokens": tokens} if tokens else {"input": item["path"]}
+                for item, _, tokens in completed
+            ]
+            if save is not None and completed:
+                try:
+                    ids = save([
+                        {
+                            "text": item["text"],
+                            "classification": classification,
+                            "external_id": item.get("external_id"),
+                            "source_system": source_system,
+                            "filename": item["path"],
+                            "spans": item.get("spans"),
+                        }
+                        for item, classification, _ in completed
+                    ])
+                except Exception as e:
+                    failures += len(completed) + len(duplicates)
+                    print(f"[error] no se pudo guardar el bloque en BD: {e}")
+                    for item, _, _ in completed:
+                        if item.get("dedup_key"):
+                            dedup.remove(item["dedup_key"])
+                    continue
+                for entry, (doc_id, run_id) in zip(entries, ids):
+                    entry.update(doc_id=doc_id, run_id=run_id)
+
+            if dedup is not None:
+                for entry, (item, classification, _) in zip(entries, completed):
+                    if item.get("dedup_key"):
+                        dedup.update(item["dedup_key"], entry.get("doc_id"), entry.get("run_id"), classification)
+
+            # Las copias reutilizan la clasificación del original sin llamar al modelo
+            links = []
+            for item, match in duplicates:
+                original = match if match.classification is not None else dedup.get(match.key)
+                if original is None or original.classification is None:
+                    failures += 1
+                    print(f"[error] {item['path']}: el original {match.input} no se clasificó")
+                    continue
+                processed += 1
+                duplicates_found += 1
+                entry = {
+                    "input": item["path"],
+                    "duplicate_of": original.input,
+                    "similarity": round(match.similarity, 3),
+                }
+                if original.doc_id is not None:
+                    entry.update(doc_id=original.doc_id, run_id=original.run_id)
+                    links.append({
+                        "doc_id": original.doc_id,
+                        "run_id": original.run_id,
+                        "external_id": item.get("external_id"),
+                        "source_system": source_system,
+                        "filename": item["path"],
+                        "similarity": match.similarity,
+                    })
+                entries.append(entry)
+            if link is not None and links:
+                try:
+                    link(links)
+                except Exception as e:
+                    print(f"[error] no se pudieron enlazar los duplicados en BD: {e}")
+
+            for entry in entries:
+                append_checkpoint(ckpt, entry)
+                done.add(entry["input"])
+
+    elapsed = time.perf_counter() - start
+    return {
+        "processed": processed,
+        "skipped": skipped,
+        "failures": failures,
+        "elapsed_s": elapsed,
+        "docs_per_s": processed / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "original_tokens": original_tokens,
+        "sent_tokens": sent_tokens,
+        "truncated_docs": truncated,
+        "duplicates": duplicates_found,
+    }
+
+
+def run_batch(
+    items: Iterable[dict],
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    save: Optional[Callable[[List[dict]], List[tuple]]] = None,
+    source_system: str = "LOCAL_DEMO",
+    dedup: Optional[DedupIndex] = None,
+    link: Optional[Callable[[List[dict]], Any]] = None,
+    processes: int = 0,
+) -> Dict[str, object]:
+    """
+    Clasifica un flujo de archivos en un único proceso.
+
+    `save` recibe una lista de documentos con el formato de db.save_many y
+    devuelve sus (doc_id, run_id); se invoca una vez por bloque.
+
+    Con un índice `dedup` (por defecto, get_dedup_index()) los casi
+    duplicados no se envían al modelo: reutilizan la clasificación del
+    original y, si se conoce su doc_id, `link` (db.save_duplicates) los
+    enlaza a él.
+
+    Con `processes` > 0, el preprocesado, la validación y las posiciones de
+    los highlights corren en ese número de procesos (ver pipeline.py); las
+    llamadas al modelo y el guardado siguen en el bucle asyncio.
+
+    Las entradas ya presentes en el checkpoint se saltan, de modo que un
+    trabajo interrumpido se reanuda donde quedó. Devuelve el resumen de
+    rendimiento (docs/s, latencias p50/p95, fallos).
+    """
+    if dedup is None:
+        dedup = get_dedup_index()
+    if processes <= 0:
+        return asyncio.run(
+            _run_batch_async(items, checkpoint_path, concurrency, save, source_system, dedup, link)
+        )
+    with CPUPool(processes) as pool:
+        return asyncio.run(
+            _run_batch_async(items, checkpoint_path, concurrency, save, source_system, dedup, link, pool)
+        )
+
+
+def format_summary(summary: Dict[str, object]) -> str:
+    return (
+        f"Procesados: {summary['processed']}  "
+        f"Saltados (checkpoint): {summary['skipped']}  "
+        f"Fallos: {summary['failures']}\n"
+        f"Tiempo: {summary['elapsed_s']:.1f} s  "
+        f"Rendimiento: {summary['docs_per_s']:.2f} docs/s  "
+        f"p50: {summary['p50_ms']:.0f} ms  p95: {summary['p95_ms']:.0f} ms\n"
+        f"Tokens del prompt (estimados): originales {summary['original_tokens']}  "
+        f"enviados {summary['sent_tokens']}  "
+        f"Documentos recortados: {summary['truncated_docs']}  "
+        f"Duplicados reutilizados: {summary.get('duplicates', 0)}"
+    )
+
+
 def main():
     # Import db only when needed (lazy import for optional database functionality)
     try:
-        from db import save_document_and_classification
+        from db import save_document_and_classification, save_duplicates, save_many
     except ImportError:
-        save_document_and_classification = None
+        save_document_and_classification = save_duplicates = save_many = None
     
     parser = argparse.ArgumentParser(
         description="Demo 2 – UBPD: Clasificador de documentos testimoniales"
@@ -53,9 +418,92 @@ def main():
         default="LOCAL_DEMO",
         help="Nombre del sistema de origen (default: LOCAL_DEMO).",
     )
+    parser.add_argument(
+        "--input-dir",
+        type=str,
+        help="Modo por lotes: clasificar todos los archivos de un directorio.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Modo por lotes: archivo con una ruta (o JSON) por línea.",
+    )
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        default="*.txt",
+        help="Patrón de archivos para --input-dir (default: *.txt).",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=DEFAULT_CHECKPOINT,
+        help=f"Archivo de checkpoint del modo por lotes (default: {DEFAULT_CHECKPOINT}).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Llamadas simultáneas al modelo en modo por lotes (default: {DEFAULT_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="Modo por lotes: procesos para preprocesado y validación (default: 0, en el proceso principal).",
+    )
 
     args = parser.parse_args()
 
+    # Modo por lotes
+    if args.input_dir or args.manifest:
+        if missing_api_key():
+            print("ERROR: OPENAI_API_KEY no está definida en las variables de entorno.")
+            return
+        if args.manifest:
+            items = iter_manifest(args.manifest)
+        else:
+            items = iter_input_dir(args.input_dir, args.pattern)
+        summary = run_batch(
+            items,
+            checkpoint_path=args.checkpoint,
+            concurrency=args.concurrency,
+            save=None if args.no_db else save_many,
+            source_system=args.source_system,
+            link=None if args.no_db else save_duplicates,
+            processes=args.processes,
+        )
+        limits = rate_limit_stats()
+        print("\nResumen del lote:")
+        print(format_summary(summary))
+        print(
+            f"Reintentos: {limits['retries']}  429 recibidos: {limits['throttled']}  "
+            f"Espera por límites: {limits['throttle_wait_s']:.1f} s  "
+            f"Concurrencia final: {limits['concurrency_limit']}"
+        )
+        headers = header_stats()
+        if headers["lines_removed"]:
+            print(
+                f"Encabezados/pies eliminados: {headers['lines_removed']} líneas, "
+                f"{headers['bytes_removed']} bytes ({headers['removed_ratio']:.1%}), "
+                f"~{headers['tokens_removed']} tokens"
+            )
+        located = highlight_stats()
+        if located["snippets"]:
+            print(
+                f"Highlights ubicados: {located['resolution_rate']:.1%} de {located['snippets']} "
+                f"(exactos {located['exact']}, aproximados {located['fuzzy']})  "
+                f"{located['ms_per_mb']:.1f} ms/MB"
+            )
+        usage = usage_stats()
+        if usage["calls"]:
+            print(
+                f"Tokens de prompt: {usage['prompt_tokens']} "
+                f"(en caché: {usage['cached_ratio']:.1%})  "
+                f"Tokens de respuesta: {usage['completion_tokens']}"
+            )
+        return
+
     # Obtener texto
     if args.text:
         text = args.text
@@ -65,17 +513,22 @@ def main():
         print("Debe proporcionar --text o --file.")
         return
 
-    # Verificar API key
-    if not os.getenv("OPENAI_API_KEY"):
+    # Verificar API key (no hace falta con el backend local o un servidor propio)
+    if missing_api_key():
         print("ERROR: OPENAI_API_KEY no está definida en las variables de entorno.")
         return
 
     # Clasificar
     print("Clasificando documento...")
-    classification = classify_document(text)
+    classification, tokens = classify_document_with_tokens(text, args.source_system)
+    print(
+        f"Tokens del prompt (estimados): originales {tokens['original']}  "
+        f"enviados {tokens['sent']}  Llamadas: {tokens['calls']}"
+        + ("  (recortado)" if tokens["truncated"] else "")
+    )
 
     # Añadir metadatos de modelo si quieres guardarlos en BD
-    classification.setdefault("model_name", "gpt-5.1")
+    classification.setdefault("model_name", get_backend().model_name)
     classification.setdefault("model_version", "")
 
     # Mostrar resultado en pantalla
@@ -0,0 +1,142 @@
+"""
+schema.py
+JSON Schema de la respuesta del modelo generado desde la ontología cargada:
+enums para tipo_documento, periodo y ruteo; listas de enums para tipo_hecho,
+actores y territorio; highlights como lista de cadenas.
+
+Se usa de dos formas:
+- response_format(): salida estructurada del proveedor (json_schema,
+  strict), de modo que el modelo solo puede devolver JSON conforme.
+- schema_errors(): validador local (jsonschema) compilado una vez por
+  versión de la ontología y reutilizado en todas las llamadas.
+Autor: Manuel Daza Ramirez
+"""
+
+import functools
+import threading
+from typing import Any, Dict, List, Optional
+
+from jsonschema import Draft202012Validator
+
+from ontology import CompiledOntology, get_ontology
+
+
+SCHEMA_NAME = "ubpd_clasificacion"
+
+SINGLE_LABEL_FIELDS = ("tipo_documento", "periodo", "ruteo")
+MULTI_LABEL_FIELDS = ("tipo_hecho", "actores")
+
+# Orden de las propiedades = orden del formato pedido en el prompt
+FIELDS = ("tipo_documento", "tipo_hecho", "territorio", "periodo", "actores", "ruteo", "highlights")
+
+
+# ---------------------------------------------------------------------
+# Construcción del esquema
+# ---------------------------------------------------------------------
+def _enum(values) -> Dict[str, Any]:
+    return {"type": "string", "enum": sorted(values)}
+
+
+@functools.lru_cache(maxsize=8)
+def _build(ontology: CompiledOntology) -> Dict[str, Any]:
+    properties = {}
+    for field in FIELDS:
+        if field in SINGLE_LABEL_FIELDS:
+            properties[field] = _enum(ontology.codes(field))
+        elif field in MULTI_LABEL_FIELDS:
+            properties[field] = {"type": "array", "items": _enum(ontology.codes(field))}
+        elif field == "territorio":
+            territorios = list(ontology.departments) + [ontology.unknown_territorio]
+            properties[field] = {"type": "array", "items": {"type": "string", "enum": territorios}}
+        else:
+            properties[field] = {"type": "array", "items": {"type": "string"}}
+    # strict exige todas las propiedades en required y additionalProperties false
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(FIELDS),
+        "additionalProperties": False,
+    }
+
+
+def build_response_schema(ontology: Optional[CompiledOntology] = None) -> Dict[str, Any]:
+    """
+    Esquema de la respuesta para una ontología (por defecto, la vigente).
+    Se construye una vez por versión; el dict es compartido: no modificarlo.
+    """
+    return _build(ontology or get_ontology())
+
+
+def response_format(ontology: Optional[CompiledOntology] = None) -> Dict[str, Any]:
+    """Parámetro response_format de chat.completions (salida estructurada)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": SCHEMA_NAME,
+            "strict": True,
+            "schema": build_response_schema(ontology),
+        },
+    }
+
+
+# ---------------------------------------------------------------------
+# Validador local
+# ---------------------------------------------------------------------
+@functools.lru_cache(maxsize=8)
+def _validator(ontology: CompiledOntology) -> Draft202012Validator:
+    schema = _build(ontology)
+    Draft202012Validator.check_schema(schema)
+    return Draft202012Validator(schema)
+
+
+def get_validator(ontology: Optional[CompiledOntology] = None) -> Draft202012Validator:
+    """Validador compilado de la ontología (por defecto, la vigente)."""
+    return _validator(ontology or get_ontology())
+
+
+def schema_errors(pred: Any, ontology: Optional[CompiledOntology] = None) -> List[str]:
+    """
+    Errores de la predicción frente al esquema, como "campo: mensaje"
+    (lista vacía si es conforme).
+    """
+    errors = []
+    for error in get_validator(ontology).iter_errors(pred):
+        path = "/".join(str(p) for p in error.absolute_path) or "$"
+        errors.append(f"{path}: {error.message}")
+    return sorted(errors)
+
+
+def is_valid_response(pred: Any, ontology: Optional[CompiledOntology] = None) -> bool:
+    return get_validator(ontology).is_valid(pred)
+
+
+# ---------------------------------------------------------------------
+# Estadísticas de respuestas
+# ---------------------------------------------------------------------
+class SchemaStats:
+    """Respuestas nuevas del modelo: total, no parseables y no conformes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.responses = 0
+        self.parse_failures = 0
+        self.schema_violations = 0
+
+    def record(self, parsed: bool, valid: bool = True) -> None:
+        with self._lock:
+            self.responses += 1
+            self.parse_failures += not parsed
+            self.schema_violations += parsed and not valid
+
+    def as_dict(self) -> Dict[str, Any]:
+        n = self.responses or 1
+        return {
+            "responses": self.responses,
+            "parse_failures": self.parse_failures,
+            "schema_violations": self.schema_violations,
+            "parse_failure_rate": self.parse_failures / n,
+            "schema_violation_rate": self.schema_violations / n,
+        }
@@ -0,0 +1,298 @@
+"""
+service.py
+Servicio HTTP (FastAPI) de clasificación con el proceso ya caliente:
+ontología, prompt de sistema, cliente del modelo y reglas de encabezados se
+cargan una vez al arrancar, no en cada clasificación.
+
+- POST /classify: un documento.
+- POST /classify/batch: hasta MAX_BATCH documentos.
+- GET /health: contadores del servicio y de las llamadas al modelo.
+
+Peticiones concurrentes con el mismo documento (mismo texto y
+source_system) comparten una sola clasificación en curso. Como mucho
+UBPD_SERVICE_MAX_IN_FLIGHT documentos se clasifican a la vez y
+UBPD_SERVICE_MAX_QUEUE esperan turno; por encima, el servicio responde 429
+con Retry-After en lugar de acumular peticiones sin límite. El guardado en
+PostgreSQL corre en un hilo (asyncio.to_thread) para no bloquear el bucle.
+
+Uso (desde src/ubpd_classifier):
+    uvicorn service:app --host 0.0.0.0 --port 8000
+    UBPD_LLM_BASE_URL=http://127.0.0.1:8089/v1 uvicorn service:app   # con fake_server.py
+
+Autor: Manuel Daza Ramirez
+"""
+
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+
+from classifier import classify_document_async, get_backend, rate_limit_stats, usage_stats
+from headers import get_header_engine
+from ontology import get_ontology
+from tokenizer import get_tokenizer
+
+
+MAX_IN_FLIGHT = int(os.getenv("UBPD_SERVICE_MAX_IN_FLIGHT", "32"))
+MAX_QUEUE = int(os.getenv("UBPD_SERVICE_MAX_QUEUE", "256"))
+MAX_BATCH = 100
+RETRY_AFTER_S = 1
+SAVE_TO_DB = os.getenv("UBPD_SERVICE_SAVE", "1") == "1"
+
+
+class Overloaded(Exception):
+    """No caben más documentos en curso ni en espera (HTTP 429)."""
+
+
+# ---------------------------------------------------------------------
+# Núcleo del servicio (independiente de HTTP)
+# ---------------------------------------------------------------------
+def document_key(text: str, source_system: Optional[str]) -> str:
+    return hashlib.sha256(f"{source_system or ''}\0{text}".encode("utf-8")).hexdigest()
+
+
+class ClassificationService:
+    """
+    Clasifica documentos con deduplicación de los que ya están en curso y
+    admisión acotada. `save` y `save_batch` (db.save_document_and_classification
+    y db.save_many) se ejecutan en un hilo; None desactiva el guardado.
+    """
+
+    def __init__(
+        self,
+        classify: Callable[[str, Optional[str]], Awaitable[dict]] = classify_document_async,
+        save: Optional[Callable[..., tuple]] = None,
+        save_batch: Optional[Callable[[List[dict]], List[tuple]]] = None,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+    ):
+        if max_in_flight < 1 or max_queue < 0:
+            raise ValueError("max_in_flight debe ser >= 1 y max_queue >= 0.")
+        self.classify_fn = classify
+        self.save = save
+        self.save_batch = save_batch
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_in_flight + max_queue
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        self.requests = 0
+        self.documents = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+        self.db_errors = 0
+        self.llm_calls = 0
+
+    @property
+    def pending(self) -> int:
+        """Documentos distintos en clasificación o esperando turno."""
+        return len(self._inflight)
+
+    async def _run(self, text: str, source_system: Optional[str]) -> dict:
+        async with self._semaphore:
+            self.llm_calls += 1
+            return await self.classify_fn(text, source_system)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # recuperada aunque todos los clientes se hayan ido
+
+    def _admit(self, docs: List[dict]) -> List[asyncio.Task]:
+        """
+        Una tarea por documento: la que ya está en curso o una nueva. Si las
+        nuevas no caben, no se admite ninguna (Overloaded).
+        """
+        keys = [document_key(doc["text"], doc.get("source_system")) for doc in docs]
+        new = {key for key in keys if key not in self._inflight}
+        if self.pending + len(new) > self.max_pending:
+            self.rejected += len(docs)
+            raise Overloaded(f"{self.pending} documentos en curso o en espera")
+
+        tasks = []
+        for key, doc in zip(keys, docs):
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._run(doc["text"], doc.get("source_system")))
+                task.add_done_callback(lambda done, key=key: self._finish(key, done))
+                self._inflight[key] = task
+            else:
+                self.coalesced += 1
+            tasks.append(task)
+        self.documents += len(docs)
+        return tasks
+
+    async def classify(self, doc: dict) -> Dict[str, Any]:
+        """
+        Clasifica (y guarda, si doc["save"]) un documento: dict con text y,
+        opcionalmente, source_system, external_id, filename y save.
+        """
+        self.requests += 1
+        start = time.perf_counter()
+        [task] = self._admit([doc])
+        try:
+            # shield: si el cliente se desconecta, el resto sigue esperando
+            classification = copy.deepcopy(await asyncio.shield(task))
+        except Exception:
+            self.errors += 1
+            raise
+
+        result = {"classification": classification, "doc_id": None, "run_id": None}
+        if self.save is not None and doc.get("save", True):
+            try:
+                result["doc_id"], result["run_id"] = await asyncio.to_thread(
+                    self.save,
+                    text=doc["text"],
+                    classification=classification,
+                    external_id=doc.get("external_id"),
+                    source_system=doc.get("source_system") or "LOCAL_DEMO",
+                    filename=doc.get("filename"),
+                )
+            except Exception as e:
+                # La clasificación ya está pagada: se devuelve igualmente
+                self.db_errors += 1
+                result["db_error"] = f"{type(e).__name__}: {e}"
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+        return result
+
+    async def classify_batch(self, docs: List[dict]) -> Dict[str, Any]:
+        """
+        Clasifica un lote (todo o nada en la admisión). Un fallo en un
+        documento no interrumpe el resto; los correctos se guardan en una
+        sola transacción.
+        """
+        self.requests += 1
+        start = time.perf_counter()
+        tasks = self._admit(docs)
+        outcomes = await asyncio.gather(*(asyncio.shield(task) for task in tasks), return_exceptions=True)
+
+        results = []
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, BaseException):
+                self.errors += 1
+                results.append({"index": index, "classification": None, "doc_id": None, "run_id": None,
+                                "error": f"{type(outcome).__name__}: {outcome}"})
+            else:
+                results.append({"index": index, "classification": copy.deepcopy(outcome),
+                                "doc_id": None, "run_id": None, "error": None})
+
+        to_save = [r for r in results if r["error"] is None and docs[r["index"]].get("save", True)]
+        response: Dict[str, Any] = {"results": results}
+        if self.save_batch is not None and to_save:
+            try:
+                ids = await asyncio.to_thread(self.save_batch, [
+                    {
+                        "text": docs[r["index"]]["text"],
+                        "classification": r["classification"],
+                        "external_id": docs[r["index"]].get("external_id"),
+                        "source_system": docs[r["index"]].get("source_system") or "LOCAL_DEMO",
+                        "filename": docs[r["index"]].get("filename"),
+                    }
+                    for r in to_save
+                ])
+                for r, (doc_id, run_id) in zip(to_save, ids):
+                    r["doc_id"], r["run_id"] = doc_id, run_id
+            except Exception as e:
+                self.db_errors += 1
+                response["db_error"] = f"{type(e).__name__}: {e}"
+        response["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "documents": self.documents,
+            "llm_calls": self.llm_calls,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "db_errors": self.db_errors,
+            "pending": self.pending,
+            "max_in_flight": self.max_in_flight,
+            "max_pending": self.max_pending,
+        }
+
+
+def warm_up() -> None:
+    """Carga lo que la primera petición pagaría: ontología, prompt, backend..."""
+    import prompts  # noqa: F401  (construye el prompt de sistema)
+    get_ontology()
+    get_backend()
+    get_header_engine()
+    get_tokenizer()
+
+
+def default_service() -> ClassificationService:
+    save = save_batch = None
+    if SAVE_TO_DB:
+        from db import save_document_and_classification, save_many
+        save, save_batch = save_document_and_classification, save_many
+    return ClassificationService(save=save, save_batch=save_batch)
+
+
+# ---------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------
+class ClassifyRequest(BaseModel):
+    text: str = Field(min_length=1)
+    source_system: str = "LOCAL_DEMO"
+    external_id: Optional[str] = None
+    filename: Optional[str] = None
+    save: bool = True
+
+
+class BatchRequest(BaseModel):
+    documents: List[ClassifyRequest] = Field(min_length=1, max_length=MAX_BATCH)
+
+
+def _too_many(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_S)})
+
+
+def create_app(service: Optional[ClassificationService] = None, warm: bool = True) -> FastAPI:
+    """Aplicación FastAPI sobre `service` (por defecto, default_service())."""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if warm:
+            await asyncio.to_thread(warm_up)
+        yield
+
+    app = FastAPI(title="UBPD – Clasificador de documentos", lifespan=lifespan)
+    app.state.service = service or default_service()
+
+    @app.post("/classify")
+    async def classify(request: ClassifyRequest) -> Dict[str, Any]:
+        try:
+            return await app.state.service.classify(request.model_dump())
+        except Overloaded as e:
+            raise _too_many(e)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"{type(e).__name__}: {e}")
+
+    @app.post("/classify/batch")
+    async def classify_batch(request: BatchRequest) -> Dict[str, Any]:
+        try:
+            return await app.state.service.classify_batch([doc.model_dump() for doc in request.documents])
+        except Overloaded as e:
+            raise _too_many(e)
+
+    @app.get("/health")
+    async def health() -> Dict[str, Any]:
+        return {
+            "service": app.state.service.stats(),
+            "rate_limit": rate_limit_stats(),
+            "usage": usage_stats(),
+        }
+
+    return app
+
+
+app = create_app()
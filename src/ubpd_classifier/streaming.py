@@ -0,0 +1,257 @@
+"""
+streaming.py
+Lectura incremental del JSON que devuelve el modelo mientras llega por
+streaming.
+
+StreamingJSONParser consume los fragmentos de texto según llegan, ignora
+lo que haya antes del primer objeto, detecta cada campo de primer nivel en
+cuanto se cierra (y lo valida contra la ontología) y avisa cuando ya están
+todos los campos requeridos, para poder cortar la respuesta sin esperar a
+los highlights. Cortar es opcional (UBPD_LLM_STREAM_EARLY_STOP en
+classifier.py): la respuesta cortada no trae highlights, así que por
+defecto el clasificador lee el objeto entero. Si el objeto termina, el
+resultado es el primer objeto JSON balanceado, aunque después vengan
+llaves sueltas.
+Autor: Manuel Daza Ramirez
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ontology import get_ontology
+
+
+# Campos que bastan para clasificar; highlights (el más largo) va al final
+# del formato pedido. Cortar al tenerlos ahorra esos tokens a cambio de
+# perder los highlights
+REQUIRED_FIELDS = ("tipo_documento", "tipo_hecho", "territorio", "periodo", "actores", "ruteo")
+
+_SINGLE_LABEL_FIELDS = ("tipo_documento", "periodo", "ruteo")
+_MULTI_LABEL_FIELDS = ("tipo_hecho", "actores")
+
+_WHITESPACE = " \t\r\n"
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+def validate_field(key: str, value: Any) -> bool:
+    """¿El valor de un campo es válido según la ontología vigente?"""
+    ontology = get_ontology()
+    if key in _SINGLE_LABEL_FIELDS:
+        return isinstance(value, str) and value in ontology.codes(key)
+    if key in _MULTI_LABEL_FIELDS:
+        codes = ontology.codes(key)
+        return isinstance(value, list) and all(isinstance(v, str) and v in codes for v in value)
+    if key in ("territorio", "highlights"):
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+    return False  # campo no pedido
+
+
+class StreamingJSONParser:
+    """
+    Parser incremental del primer objeto JSON de un texto.
+
+    - feed(fragmento) devuelve True cuando ya no hace falta leer más: el
+      objeto se cerró o (con `required`) ya están todos esos campos.
+    - fields: campos de primer nivel completos, en orden de llegada.
+    - invalid: campos que no pasaron `validator(clave, valor)`.
+    - result_text(): el objeto tal cual si se cerró; si se cortó antes,
+      un JSON con los campos completos; si no, todo el texto recibido.
+
+    `required=None` espera siempre a que el objeto se cierre.
+    """
+
+    def __init__(
+        self,
+        required: Optional[Iterable[str]] = REQUIRED_FIELDS,
+        validator: Optional[Callable[[str, Any], bool]] = validate_field,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self.required = frozenset(required) if required is not None else None
+        self.validator = validator
+        self.on_field = on_field
+        self.fields: Dict[str, Any] = {}
+        self.invalid: List[str] = []
+        self.errors: List[str] = []
+        self.complete = False
+        self._buf = ""
+        self._pos = 0
+        self._start: Optional[int] = None   # inicio del objeto en _buf
+        self._end: Optional[int] = None
+        self._reset_object()
+
+    def _reset_object(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._phase = "key"        # key | colon | value | after (en el primer nivel)
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    # -----------------------------------------------------------------
+    @property
+    def satisfied(self) -> bool:
+        """Todos los campos requeridos ya llegaron completos."""
+        return self.required is not None and self.required.issubset(self.fields)
+
+    @property
+    def done(self) -> bool:
+        return self.complete or self.satisfied
+
+    @property
+    def received(self) -> int:
+        """Caracteres recibidos hasta ahora."""
+        return len(self._buf)
+
+    def feed(self, chunk: str) -> bool:
+        if self.done or not chunk:
+            return self.done
+        self._buf += chunk
+        self._scan()
+        return self.done
+
+    def result_text(self) -> str:
+        if self.complete:
+            return self._buf[self._start:self._end]
+        if self.satisfied:
+            return json.dumps(self.fields, ensure_ascii=False)
+        return self._buf
+
+    # -----------------------------------------------------------------
+    def _scan(self) -> None:
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            if self._start is None:
+                i = buf.find("{", i)
+                if i == -1:
+                    i = n
+                    break
+                self._start = i
+                self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                # Saltar de golpe el contenido de la cadena (highlights largos)
+                m = _STRING_SPECIAL.search(buf, i)
+                if m is None:
+                    i = n
+                    break
+                i = m.start()
+                if buf[i] == "\\":
+                    self._escape = True
+                    i += 1
+                    continue
+                self._in_string = False
+                if self._depth == 1:
+                    if self._phase == "key":
+                        self._key = self._loads(buf[self._key_start:i + 1])
+                        self._phase = "colon"
+                    elif self._phase == "value":
+                        self._finish_value(i + 1)
+                i += 1
+                if self.satisfied:
+                    break
+                continue
+
+            c = buf[i]
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._phase == "key":
+                        self._key_start = i
+                    elif self._phase == "value" and self._value_start is None:
+                        self._value_start = i
+            elif c == "{" or c == "[":
+                if self._depth == 1 and self._phase == "value" and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif c == "}" or c == "]":
+                self._depth -= 1
+                if self._depth == 1 and self._phase == "value" and self._value_start is not None:
+                    self._finish_value(i + 1)
+                elif self._depth == 0:
+                    if self._phase == "value" and self._value_start is not None:
+                        self._finish_value(i)
+                    if self._close_object(i + 1):
+                        i += 1
+                        break
+                    # No era un objeto JSON: se busca el siguiente
+                    i = self._start + 1
+                    self._start = None
+                    self._reset_object()
+                    continue
+            elif self._depth == 1:
+                if c == ":" and self._phase == "colon":
+                    self._phase = "value"
+                    self._value_start = None
+                elif c == ",":
+                    if self._phase == "value" and self._value_start is not None:
+                        self._finish_value(i)
+                    self._phase = "key"
+                elif self._phase == "value" and self._value_start is None and c not in _WHITESPACE:
+                    self._value_start = i  # número, true, false o null
+            i += 1
+            if self.satisfied:
+                break
+        self._pos = i
+
+    def _loads(self, text: str):
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+            return None
+
+    def _finish_value(self, end: int) -> None:
+        key = self._key
+        text = self._buf[self._value_start:end]
+        self._phase = "after"
+        self._value_start = None
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            self.errors.append(f"{key}: {type(e).__name__}: {e}")
+            return
+        if not isinstance(key, str):
+            return
+        self.fields[key] = value
+        if self.validator is not None and not self.validator(key, value):
+            self.invalid.append(key)
+        if self.on_field is not None:
+            self.on_field(key, value)
+
+    def _close_object(self, end: int) -> bool:
+        """Cierra el objeto; False si el texto entre llaves no es JSON."""
+        try:
+            obj = json.loads(self._buf[self._start:end])
+        except ValueError:
+            self.fields.clear()
+            self.invalid.clear()
+            return False
+        self.fields = obj
+        self._end = end
+        self.complete = True
+        return True
+
+
+def first_json_object(text: str) -> str:
+    """Primer objeto JSON balanceado y válido dentro de un texto."""
+    parser = StreamingJSONParser(required=None, validator=None)
+    parser.feed(text)
+    if not parser.complete:
+        raise ValueError("No se encontró un objeto JSON completo en la salida del modelo.")
+    return parser.result_text()
+
+
+def iter_chunks(text: str, size: int) -> Iterable[str]:
+    """Trocea un texto como lo haría un stream (para el backend local)."""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
@@ -0,0 +1,133 @@
+"""
+tokenizer.py
+Conteo de tokens local, sin red.
+
+- BPETokenizer: tokens exactos del modelo a partir de un archivo BPE en el
+  formato de tiktoken (p. ej. o200k_base.tiktoken, descargado una vez y
+  guardado junto al proyecto). Usa el paquete tiktoken (requirements.txt),
+  pero no descarga nada: el archivo se lee del disco.
+- HeuristicTokenizer: la aproximación por caracteres de chunking. Es el
+  tokenizador por defecto: se usa siempre que no se configure
+  UBPD_TOKENIZER_PATH, esté o no instalado tiktoken.
+Autor: Manuel Daza Ramirez
+"""
+
+import base64
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Protocol, runtime_checkable
+
+from chunking import CHARS_PER_TOKEN, estimate_tokens
+
+
+# Expresiones de pre-tokenización de las codificaciones de OpenAI
+O200K_PATTERN = "|".join([
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""\p{N}{1,3}""",
+    r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+    r"""\s*[\r\n]+""",
+    r"""\s+(?!\S)""",
+    r"""\s+""",
+])
+CL100K_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+
+
+@runtime_checkable
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int:
+        ...
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Prefijo del texto de como máximo `max_tokens` tokens."""
+        ...
+
+
+class HeuristicTokenizer:
+    """Aproximación de CHARS_PER_TOKEN caracteres por token."""
+
+    name = f"heuristic-{CHARS_PER_TOKEN}cpt"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+
+
+def load_bpe_ranks(path) -> Dict[bytes, int]:
+    """Lee un archivo .tiktoken: una línea "<token en base64> <rango>" por token."""
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+class BPETokenizer:
+    """Tokenizador BPE de tiktoken construido desde un archivo local."""
+
+    def __init__(self, path, pattern: Optional[str] = None):
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError(
+                "El tokenizador BPE necesita el paquete tiktoken (pip install tiktoken)."
+            ) from e
+        path = Path(path)
+        if pattern is None:
+            pattern = CL100K_PATTERN if "cl100k" in path.name else O200K_PATTERN
+        self.name = path.stem
+        self._encoding = tiktoken.Encoding(
+            name=self.name,
+            pat_str=pattern,
+            mergeable_ranks=load_bpe_ranks(path),
+            special_tokens={},
+        )
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # Un corte a mitad de un carácter multibyte se descarta
+        return self._encoding.decode_bytes(tokens[:max(0, max_tokens)]).decode("utf-8", errors="ignore")
+
+
+def load_tokenizer(path=None) -> Tokenizer:
+    """BPETokenizer si se da un archivo; si no, la aproximación por caracteres."""
+    if path:
+        return BPETokenizer(path)
+    return HeuristicTokenizer()
+
+
+# ---------------------------------------------------------------------
+# Tokenizador del proceso
+# ---------------------------------------------------------------------
+_tokenizer: Optional[Tokenizer] = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> Tokenizer:
+    """Tokenizador compartido (UBPD_TOKENIZER_PATH: archivo .tiktoken local)."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = load_tokenizer(os.getenv("UBPD_TOKENIZER_PATH") or None)
+    return _tokenizer
+
+
+def set_tokenizer(tokenizer: Optional[Tokenizer]) -> None:
+    """Sustituye el tokenizador del proceso (None: se vuelve a leer el entorno)."""
+    global _tokenizer
+    _tokenizer = tokenizer
@@ -0,0 +1,215 @@
+"""
+usage.py
+Registro del consumo de tokens por llamada al modelo, a partir del objeto
+usage de la API: tokens de prompt, tokens de prompt servidos desde la caché
+de prefijos del proveedor (prompt_tokens_details.cached_tokens) y tokens de
+respuesta, junto con la latencia de la llamada.
+
+Los totales del proceso están en get_usage(); con UBPD_USAGE_LOG cada
+llamada se añade además como una línea JSON a ese archivo, que el informe
+resume (proporción de tokens en caché, coste y latencia por 1.000 docs):
+
+    python usage.py report --log usage.jsonl --input-price 1.25 \\
+        --cached-input-price 0.125 --output-price 10
+
+Autor: Manuel Daza Ramirez
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+
+class UsageRecord(NamedTuple):
+    """Consumo de una llamada (latencia en ms, incluye esperas del limitador)."""
+    model: str
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    latency_ms: float
+    stream: bool = False
+
+
+class Prices(NamedTuple):
+    """Precios en USD por millón de tokens."""
+    input: float
+    cached_input: float
+    output: float
+
+
+def _field(obj: Any, name: str) -> Any:
+    """Atributo del SDK o clave de dict (respuestas de la Batch API)."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def usage_counts(usage: Any) -> Optional[tuple]:
+    """(prompt, cached, completion) de un objeto usage; None si no lo hay."""
+    if usage is None:
+        return None
+    details = _field(usage, "prompt_tokens_details")
+    return (
+        int(_field(usage, "prompt_tokens") or 0),
+        int(_field(details, "cached_tokens") or 0),
+        int(_field(usage, "completion_tokens") or 0),
+    )
+
+
+def cost_usd(prompt_tokens: int, cached_tokens: int, completion_tokens: int, prices: Prices) -> float:
+    """Coste de unos tokens: los de prompt en caché se cobran a su precio."""
+    return (
+        (prompt_tokens - cached_tokens) * prices.input
+        + cached_tokens * prices.cached_input
+        + completion_tokens * prices.output
+    ) / 1_000_000
+
+
+# ---------------------------------------------------------------------
+# Acumulado del proceso
+# ---------------------------------------------------------------------
+class UsageStats:
+    """Totales de consumo y, si hay `log_path`, una línea JSON por llamada."""
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.calls_without_usage = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms = 0.0
+
+    def record(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += record.prompt_tokens
+            self.cached_tokens += record.cached_tokens
+            self.completion_tokens += record.completion_tokens
+            self.latency_ms += record.latency_ms
+            if self.log_path:
+                line = dict(record._asdict(), ts=time.time())
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line) + "\n")
+
+    def record_missing(self) -> None:
+        """Llamada sin objeto usage (p. ej. stream cortado antes del final)."""
+        with self._lock:
+            self.calls_without_usage += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "calls_without_usage": self.calls_without_usage,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "mean_latency_ms": self.latency_ms / self.calls if self.calls else 0.0,
+        }
+
+
+_usage: Optional[UsageStats] = None
+_usage_lock = threading.Lock()
+
+
+def get_usage() -> UsageStats:
+    """Consumo del proceso (UBPD_USAGE_LOG: archivo JSONL por llamada)."""
+    global _usage
+    if _usage is None:
+        with _usage_lock:
+            if _usage is None:
+                _usage = UsageStats(os.getenv("UBPD_USAGE_LOG") or None)
+    return _usage
+
+
+def set_usage(usage: Optional[UsageStats]) -> None:
+    """Sustituye el acumulado del proceso (None: se vuelve a leer el entorno)."""
+    global _usage
+    _usage = usage
+
+
+# ---------------------------------------------------------------------
+# Informe
+# ---------------------------------------------------------------------
+def read_log(path: str) -> List[UsageRecord]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [
+            UsageRecord(**{k: v for k, v in json.loads(line).items() if k in UsageRecord._fields})
+            for line in f if line.strip()
+        ]
+
+
+def usage_report(records: Iterable[UsageRecord], docs: Optional[int] = None,
+                 prices: Optional[Prices] = None) -> Dict[str, Any]:
+    """
+    Resumen de un conjunto de llamadas. Sin `docs` se cuenta un documento
+    por llamada (documentos que no se dividen en fragmentos).
+    """
+    from runner import percentile
+
+    records = list(records)
+    calls = len(records)
+    docs = docs or calls
+    prompt = sum(r.prompt_tokens for r in records)
+    cached = sum(r.cached_tokens for r in records)
+    completion = sum(r.completion_tokens for r in records)
+    latencies = [r.latency_ms for r in records]
+    per_1k = 1000.0 / docs if docs else 0.0
+
+    report = {
+        "calls": calls,
+        "docs": docs,
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "completion_tokens": completion,
+        "cached_ratio": round(cached / prompt, 4) if prompt else 0.0,
+        "per_1k_docs": {
+            "prompt_tokens": round(prompt * per_1k),
+            "cached_tokens": round(cached * per_1k),
+            "completion_tokens": round(completion * per_1k),
+            "model_time_s": round(sum(latencies) / 1000.0 * per_1k, 2),
+        },
+        "latency_ms": {
+            "mean": round(sum(latencies) / calls, 2) if calls else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+        },
+    }
+    if prices is not None:
+        cost = cost_usd(prompt, cached, completion, prices)
+        report["per_1k_docs"]["cost_usd"] = round(cost * per_1k, 4)
+        # Lo mismo sin caché de prefijos, para ver el ahorro
+        report["per_1k_docs"]["cost_usd_without_cache"] = round(cost_usd(prompt, 0, completion, prices) * per_1k, 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UBPD – informe de consumo de tokens (UBPD_USAGE_LOG)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Resumir un registro JSONL de llamadas")
+    report.add_argument("--log", type=str, default=os.getenv("UBPD_USAGE_LOG"), required=not os.getenv("UBPD_USAGE_LOG"))
+    report.add_argument("--docs", type=int, default=None, help="Documentos procesados (default: uno por llamada)")
+    report.add_argument("--input-price", type=float, help="USD por millón de tokens de prompt")
+    report.add_argument("--cached-input-price", type=float, help="USD por millón de tokens de prompt en caché")
+    report.add_argument("--output-price", type=float, help="USD por millón de tokens de respuesta")
+    args = parser.parse_args()
+
+    prices = None
+    if args.input_price is not None and args.output_price is not None:
+        cached_price = args.cached_input_price if args.cached_input_price is not None else args.input_price
+        prices = Prices(args.input_price, cached_price, args.output_price)
+    print(json.dumps(usage_report(read_log(args.log), args.docs, prices), indent=2))
+
+
+if __name__ == "__main__":
+    main()
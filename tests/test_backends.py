@@ -0,0 +1,164 @@
+"""
+test_backends.py
+Unit tests for backends.py and fake_server.py modules.
+Tests the rule-based deterministic backend, backend selection in
+classifier.py and the OpenAI-compatible local server.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier
+from backends import LLMBackend, OpenAIBackend, RuleBasedBackend, rule_based_prediction
+from classifier import validate_and_fix
+from prompts import ONTOLOGY, SYSTEM_PROMPT, build_user_prompt, extract_document
+
+
+@pytest.fixture
+def rules_backend():
+    backend = RuleBasedBackend()
+    classifier.set_backend(backend)
+    yield backend
+    classifier.set_backend(None)
+
+
+class TestExtractDocument:
+    """Test suite for prompts.extract_document."""
+
+    def test_roundtrip(self):
+        assert extract_document(build_user_prompt("Texto del documento")) == "Texto del documento"
+
+    def test_plain_text_passthrough(self):
+        assert extract_document("solo texto") == "solo texto"
+
+
+class TestRuleBasedPrediction:
+    """Test suite for rule_based_prediction."""
+
+    def test_output_is_valid_for_ontology(self, sample_victim_testimony):
+        """Test that validate_and_fix does not need to change anything."""
+        pred = rule_based_prediction(sample_victim_testimony)
+        fixed = validate_and_fix(dict(pred))
+        for field in ("tipo_documento", "tipo_hecho", "periodo", "actores", "ruteo"):
+            assert fixed[field] == pred[field]
+
+    def test_victim_testimony(self, sample_victim_testimony):
+        pred = rule_based_prediction(sample_victim_testimony)
+        assert "TH1" in pred["tipo_hecho"]
+        assert "TH3" in pred["tipo_hecho"]
+        assert "ACT2" in pred["actores"]
+        assert pred["territorio"] == ["Antioquia"]
+        assert pred["periodo"] == "PER2"
+        assert pred["ruteo"] == "RU1"
+        assert pred["highlights"]
+
+    def test_non_testimonial(self, sample_non_testimonial):
+        pred = rule_based_prediction(sample_non_testimonial)
+        assert pred["tipo_documento"] == "TD0"
+        assert pred["ruteo"] == "RU0"
+        assert pred["territorio"] == ["No identificado"]
+        assert pred["actores"] == ["ACT0"]
+
+    def test_sexual_violence(self, sample_sexual_violence_testimony):
+        pred = rule_based_prediction(sample_sexual_violence_testimony)
+        assert "TH4" in pred["tipo_hecho"]
+        assert "ACT3" in pred["actores"]
+        assert "Bolívar" in pred["territorio"]
+
+    def test_deterministic(self, sample_displacement_testimony):
+        assert rule_based_prediction(sample_displacement_testimony) == \
+            rule_based_prediction(sample_displacement_testimony)
+
+
+class TestRuleBasedBackend:
+    """Test suite for RuleBasedBackend."""
+
+    def test_implements_protocol(self):
+        assert isinstance(RuleBasedBackend(), LLMBackend)
+        assert isinstance(OpenAIBackend(), LLMBackend)
+
+    def test_complete_returns_json(self, sample_victim_testimony):
+        backend = RuleBasedBackend()
+        raw = backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_victim_testimony))
+        assert json.loads(raw)["tipo_hecho"]
+        assert backend.calls == 1
+
+    def test_latency_is_applied(self):
+        backend = RuleBasedBackend(latency_s=0.05)
+        start = time.monotonic()
+        asyncio.run(backend.acomplete(SYSTEM_PROMPT, build_user_prompt("texto")))
+        assert time.monotonic() - start >= 0.05
+
+
+class TestBackendSelection:
+    """Test suite for backend selection in classifier.py."""
+
+    def test_import_does_not_need_api_key(self):
+        """Test that the OpenAI client is not created until first use."""
+        backend = OpenAIBackend(api_key=None)
+        assert backend._client is None
+
+    def test_env_selects_rules_backend(self, monkeypatch):
+        monkeypatch.setenv("UBPD_LLM_BACKEND", "rules")
+        monkeypatch.setenv("UBPD_FAKE_LATENCY_MS", "20")
+        backend = classifier.create_backend_from_env()
+        assert isinstance(backend, RuleBasedBackend)
+        assert backend.latency_s == pytest.approx(0.02)
+
+    def test_unknown_backend_rejected(self, monkeypatch):
+        monkeypatch.setenv("UBPD_LLM_BACKEND", "nope")
+        with pytest.raises(ValueError):
+            classifier.create_backend_from_env()
+
+    def test_missing_api_key_only_for_real_openai(self, rules_backend, monkeypatch):
+        assert not classifier.missing_api_key()
+        classifier.set_backend(OpenAIBackend(api_key=None))
+        assert classifier.missing_api_key()
+        classifier.set_backend(OpenAIBackend(api_key=None, base_url="http://127.0.0.1:1/v1"))
+        assert not classifier.missing_api_key()
+
+    def test_classify_document_offline(self, rules_backend, sample_victim_testimony):
+        result = classifier.classify_document(sample_victim_testimony)
+        assert result["tipo_hecho"]
+        assert "priority_score" in result
+
+    def test_async_batch_offline(self, rules_backend, sample_non_testimonial):
+        results = asyncio.run(classifier.classify_documents_async([sample_non_testimonial] * 50))
+        assert all(r["classification"]["tipo_documento"] == "TD0" for r in results)
+
+
+class TestFakeServer:
+    """Test suite for the OpenAI-compatible local server."""
+
+    @pytest.fixture
+    def server(self):
+        from fake_server import start_in_thread
+        server = start_in_thread()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def test_openai_backend_against_fake_server(self, server, sample_victim_testimony):
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url)
+        raw = backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_victim_testimony))
+        assert "TH1" in json.loads(raw)["tipo_hecho"]
+        assert server.requests == 1
+
+    def test_throttling_is_retried_by_limiter(self, server, sample_non_testimonial):
+        from ratelimit import RateLimiter
+        server.error_rate = 0.5
+        server.retry_after_s = 0.01
+        limiter = RateLimiter(rpm=10 ** 6, tpm=10 ** 9, max_retries=20,
+                              backoff_base=0.001, backoff_cap=0.01)
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url, limiter=limiter)
+        for _ in range(5):
+            raw = backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_non_testimonial))
+            assert json.loads(raw)["tipo_documento"] == "TD0"
+        assert limiter.stats()["retries"] == server.throttled
@@ -0,0 +1,310 @@
+"""
+test_batch_api.py
+Unit tests for batch_api.py module.
+Tests request serialization (shared preprocessing, token budget and
+chunking), submission, polling and resumable collection against an
+in-process fake of the files/batches endpoints.
+"""
+
+import sys
+import json
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import budget
+import headers
+from batch_api import (
+    build_batch_requests,
+    collect_batch,
+    load_state,
+    poll_batch,
+    submit_batch,
+)
+from budget import CHAT_OVERHEAD_TOKENS, TokenBudget
+from headers import HeaderFooterEngine, HeaderRules
+from ontology import get_ontology
+from prompts import SYSTEM_PROMPT, prompt_version
+from reclassify import current_versions
+from tokenizer import HeuristicTokenizer
+
+
+class FakeBatchClient:
+    """Fake of client.files / client.batches that answers every request."""
+
+    def __init__(self, respond):
+        self.respond = respond  # custom_id, body -> content string or exception
+        self.files_store = {}
+        self.batch_store = {}
+        self.polls = 0
+        self.files = SimpleNamespace(create=self._file_create, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._batch_create, retrieve=self._batch_retrieve)
+
+    def _file_create(self, file, purpose):
+        file_id = f"file-{len(self.files_store)}"
+        self.files_store[file_id] = file.read().decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self.files_store[file_id])
+
+    def _batch_create(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.batch_store)}"
+        self.batch_store[batch_id] = {"input": input_file_id, "status": "in_progress"}
+        return SimpleNamespace(id=batch_id, status="in_progress")
+
+    def complete(self, batch_id):
+        """Run every request and publish output/error files."""
+        batch = self.batch_store[batch_id]
+        out, err = [], []
+        for line in self.files_store[batch["input"]].splitlines():
+            request = json.loads(line)
+            try:
+                content = self.respond(request["custom_id"], request["body"])
+                out.append({"custom_id": request["custom_id"], "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"content": content}}]},
+                }})
+            except Exception as e:
+                err.append({"custom_id": request["custom_id"], "response": None,
+                            "error": {"message": str(e)}})
+        batch["output"] = self._store("\n".join(json.dumps(x) for x in out))
+        batch["error"] = self._store("\n".join(json.dumps(x) for x in err)) if err else None
+        batch["status"] = "completed"
+
+    def _store(self, text):
+        file_id = f"file-{len(self.files_store)}"
+        self.files_store[file_id] = text
+        return file_id
+
+    def _batch_retrieve(self, batch_id):
+        self.polls += 1
+        batch = self.batch_store[batch_id]
+        return SimpleNamespace(id=batch_id, status=batch["status"],
+                               output_file_id=batch.get("output"),
+                               error_file_id=batch.get("error"))
+
+
+def _ok_response(custom_id, body):
+    return json.dumps({
+        "tipo_documento": "TD1", "tipo_hecho": ["TH1", "XX"], "territorio": ["Cauca"],
+        "periodo": "PER3", "actores": ["ACT3"], "ruteo": "RU1", "highlights": [],
+    })
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    items = []
+    for i in range(5):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(f"Testimonio   número {i}.", encoding="utf-8")
+        items.append({"path": str(path), "external_id": f"EXT{i}"})
+    return items
+
+
+@pytest.fixture
+def small_budget():
+    """Token budget that splits long documents into several chunks."""
+    tb = TokenBudget(None, "chunk", HeuristicTokenizer())
+    tb.max_prompt_tokens = tb.overhead_tokens() + 40
+    budget.set_token_budget(tb)
+    yield tb
+    budget.set_token_budget(None)
+
+
+LONG_TEXT = " ".join(f"En {1990 + i} pasó algo en la vereda número {i}." for i in range(12))
+
+
+class TestBuildBatchRequest:
+    """Test suite for build_batch_request."""
+
+    def test_request_shape(self):
+        """Test the JSONL line uses the sync prompts and preprocessing."""
+        [request] = build_batch_requests("doc-0", "  Texto   con espacios ")
+        assert request["custom_id"] == "doc-0"
+        assert request["url"] == "/v1/chat/completions"
+        messages = request["body"]["messages"]
+        assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+        assert "Texto con espacios" in messages[1]["content"]
+        assert request["body"]["temperature"] == 0.0
+
+    def test_source_system_header_rules(self):
+        """Test headers are stripped with the patterns of the document's source."""
+        rules = HeaderRules(sources={"ORFEO": [r"al contestar cite este n[úu]mero"]})
+        headers.set_header_engine(HeaderFooterEngine(rules, learn=False))
+        try:
+            text = "Al contestar cite este número\nCuerpo del oficio."
+            [request] = build_batch_requests("doc-0", text, "ORFEO")
+            assert "contestar" not in request["body"]["messages"][1]["content"]
+            [request] = build_batch_requests("doc-0", text)
+            assert "contestar" in request["body"]["messages"][1]["content"]
+        finally:
+            headers.set_header_engine(None)
+
+    def test_long_document_one_request_per_chunk(self, small_budget):
+        """Test the token budget and chunking of classify_document apply."""
+        requests = build_batch_requests("doc-0", LONG_TEXT)
+        assert len(requests) > 1
+        assert [r["custom_id"] for r in requests] == [f"doc-0#{i}" for i in range(len(requests))]
+        count = small_budget.tokenizer.count
+        for request in requests:
+            system, user = (m["content"] for m in request["body"]["messages"])
+            # +1: redondeo de la heurística al contar el prefijo y el fragmento por separado
+            assert count(system) + count(user) + CHAT_OVERHEAD_TOKENS <= small_budget.max_prompt_tokens + 1
+
+
+class TestSubmitAndPoll:
+    """Test suite for submit_batch and poll_batch."""
+
+    def test_submit_writes_state(self, tmp_path, corpus):
+        client = FakeBatchClient(_ok_response)
+        state = submit_batch(client, corpus, str(tmp_path / "req.jsonl"), str(tmp_path / "state.json"))
+        assert state["batch_id"] == "batch-0"
+        assert len(state["items"]) == 5
+        assert load_state(str(tmp_path / "state.json"))["items"]["doc-2"]["external_id"] == "EXT2"
+        assert len((tmp_path / "req.jsonl").read_text(encoding="utf-8").splitlines()) == 5
+        assert state["source_system"] == "BATCH_API"
+        assert state["prompt_hash"] == prompt_version()
+        assert state["ontology_hash"] == get_ontology().version
+
+    def test_poll_until_terminal(self, tmp_path, corpus):
+        client = FakeBatchClient(_ok_response)
+        state = submit_batch(client, corpus, str(tmp_path / "req.jsonl"), str(tmp_path / "state.json"))
+        original = client.batches.retrieve
+
+        def retrieve(batch_id):
+            if client.polls == 2:
+                client.complete(batch_id)
+            return original(batch_id)
+
+        client.batches.retrieve = retrieve
+        batch = poll_batch(client, state["batch_id"], interval=0)
+        assert batch.status == "completed"
+
+    def test_poll_timeout_returns_current_status(self, tmp_path, corpus):
+        client = FakeBatchClient(_ok_response)
+        state = submit_batch(client, corpus, str(tmp_path / "req.jsonl"), str(tmp_path / "state.json"))
+        batch = poll_batch(client, state["batch_id"], interval=0, timeout=0)
+        assert batch.status == "in_progress"
+
+
+class TestCollectBatch:
+    """Test suite for collect_batch."""
+
+    def _submitted(self, tmp_path, corpus, respond=_ok_response):
+        client = FakeBatchClient(respond)
+        state_path = str(tmp_path / "state.json")
+        state = submit_batch(client, corpus, str(tmp_path / "req.jsonl"), state_path)
+        client.complete(state["batch_id"])
+        return client, state_path
+
+    def test_collect_validates_and_saves(self, tmp_path, corpus):
+        """Test that outputs are validated and saved in chunks."""
+        client, state_path = self._submitted(tmp_path, corpus)
+        saved = []
+        summary = collect_batch(client, state_path, save=lambda docs: saved.append(docs), chunk_size=2)
+        assert summary["saved"] == 5
+        assert [len(chunk) for chunk in saved] == [2, 2, 1]
+        doc = saved[0][0]
+        assert doc["classification"]["tipo_hecho"] == ["TH1"]
+        assert "priority_score" in doc["classification"]
+        assert doc["external_id"] == "EXT0"
+        assert doc["text"] == "Testimonio   número 0."
+
+    def test_failures_are_recorded(self, tmp_path, corpus):
+        """Test that error lines and unparseable outputs are tracked."""
+        def respond(custom_id, body):
+            if custom_id == "doc-1":
+                raise RuntimeError("rate limited")
+            if custom_id == "doc-3":
+                return "sin json"
+            return _ok_response(custom_id, body)
+
+        client, state_path = self._submitted(tmp_path, corpus, respond)
+        summary = collect_batch(client, state_path)
+        assert summary["saved"] == 3
+        assert summary["failed"] == 2
+        assert set(load_state(state_path)["failed"]) == {"doc-1", "doc-3"}
+
+    def test_resume_half_collected(self, tmp_path, corpus):
+        """Test that a crash mid-collection resumes without duplicates."""
+        client, state_path = self._submitted(tmp_path, corpus)
+        saved = []
+
+        def crashing_save(docs):
+            if saved:
+                raise RuntimeError("crash")
+            saved.append(docs)
+
+        with pytest.raises(RuntimeError):
+            collect_batch(client, state_path, save=crashing_save, chunk_size=2)
+        assert len(load_state(state_path)["collected"]) == 2
+
+        resumed = []
+        summary = collect_batch(client, state_path, save=lambda docs: resumed.append(docs), chunk_size=2)
+        assert summary["saved"] == 3
+        assert summary["collected"] == 5
+        filenames = {d["filename"] for chunk in saved + resumed for d in chunk}
+        assert len(filenames) == 5
+
+    def test_collect_is_idempotent(self, tmp_path, corpus):
+        client, state_path = self._submitted(tmp_path, corpus)
+        collect_batch(client, state_path)
+        assert collect_batch(client, state_path)["saved"] == 0
+
+    def test_chunked_document_merged(self, tmp_path, small_budget):
+        """Test the chunk responses of a long document are merged into one result."""
+        path = tmp_path / "largo.txt"
+        path.write_text(LONG_TEXT, encoding="utf-8")
+
+        def respond(custom_id, body):
+            pred = json.loads(_ok_response(custom_id, body))
+            pred["actores"] = ["ACT1"] if custom_id.endswith("#0") else ["ACT3"]
+            return json.dumps(pred)
+
+        client, state_path = self._submitted(tmp_path, [{"path": str(path)}], respond)
+        assert load_state(state_path)["items"]["doc-0"]["chunks"] > 1
+        saved = []
+        summary = collect_batch(client, state_path, save=saved.extend)
+        assert (summary["saved"], summary["failed"]) == (1, 0)
+        assert sorted(saved[0]["classification"]["actores"]) == ["ACT1", "ACT3"]
+
+    def test_missing_chunk_fails_document(self, tmp_path, small_budget):
+        """Test a document is not saved when one of its chunks failed."""
+        path = tmp_path / "largo.txt"
+        path.write_text(LONG_TEXT, encoding="utf-8")
+
+        def respond(custom_id, body):
+            if custom_id.endswith("#1"):
+                raise RuntimeError("rate limited")
+            return _ok_response(custom_id, body)
+
+        client, state_path = self._submitted(tmp_path, [{"path": str(path)}], respond)
+        summary = collect_batch(client, state_path)
+        assert (summary["saved"], summary["failed"]) == (0, 1)
+        assert list(load_state(state_path)["failed"]) == ["doc-0"]
+
+    def test_runs_carry_submit_versions(self, tmp_path, corpus):
+        """Test collected results keep the prompt/ontology versions of the submit."""
+        client, state_path = self._submitted(tmp_path, corpus)
+        state = load_state(state_path)
+        state.update(ontology_hash="ontologia-anterior", prompt_hash="prompt-anterior")
+        (tmp_path / "state.json").write_text(json.dumps(state), encoding="utf-8")
+        saved = []
+        collect_batch(client, state_path, save=saved.extend)
+        assert {(d["classification"]["ontology_hash"], d["classification"]["prompt_hash"]) for d in saved} == {
+            ("ontologia-anterior", "prompt-anterior")
+        }
+        assert {d["source_system"] for d in saved} == {"BATCH_API"}
+
+    def test_runs_match_current_model(self, tmp_path, corpus):
+        """Test collected runs are not stale by model for the same backend."""
+        client, state_path = self._submitted(tmp_path, corpus)
+        saved = []
+        collect_batch(client, state_path, save=saved.extend)
+        current = current_versions()
+        assert {d["classification"]["model_version"] for d in saved} == {current["model_version"]}
+        assert {d["classification"]["model_name"] for d in saved} == {load_state(state_path)["model_name"]}
@@ -0,0 +1,175 @@
+"""
+test_batch_validation.py
+Unit tests for batch_validation.py module.
+Tests that validate_and_fix_batch gives exactly the same results as the
+scalar validate_and_fix path, including priority scores and edge cases.
+"""
+
+import copy
+import random
+import sys
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from batch_validation import LabelCodec, MAX_MULTI_LABEL_CODES, compute_priority_batch, validate_and_fix_batch
+from classifier import compute_priority, validate_and_fix
+from ontology import get_ontology
+from priority import PriorityRules
+
+
+EDGE_CASES = [
+    {},
+    {"tipo_documento": "TD0", "ruteo": "RU1", "tipo_hecho": ["TH1"]},
+    {"tipo_documento": "TD9", "tipo_hecho": "TH1", "actores": None, "periodo": 3},
+    {"tipo_documento": "TD2", "tipo_hecho": ["TH1", "TH1", "TH4", "XX"], "ruteo": "RU1"},
+    {"tipo_documento": "TD1", "tipo_hecho": ["TH4", "TH1"], "ruteo": "RU3", "actores": ["ACT5", "ACT0", "ACT9"]},
+    {"territorio": ["antioquia", "Medellín", "Venezuela", 7, {"x": 1}], "highlights": "texto"},
+    {"territorio": "Cauca", "highlights": ["frase"], "extra": True},
+]
+
+
+def scalar(preds, texts=None):
+    """Run the scalar path over deep copies."""
+    preds = copy.deepcopy(preds)
+    texts = texts or [None] * len(preds)
+    return [validate_and_fix(p, t) for p, t in zip(preds, texts)]
+
+
+def random_predictions(n, seed=7):
+    """Mostly valid predictions with some invalid values and missing fields."""
+    rng = random.Random(seed)
+    ont = get_ontology()
+    codes = {dim: sorted(ont.codes(dim)) + ["XX"] for dim in ("tipo_documento", "tipo_hecho", "periodo", "actores", "ruteo")}
+    preds = []
+    for _ in range(n):
+        pred = {
+            "tipo_documento": rng.choice(codes["tipo_documento"]),
+            "tipo_hecho": rng.choices(codes["tipo_hecho"], k=rng.randint(0, 4)),
+            "periodo": rng.choice(codes["periodo"]),
+            "actores": rng.choices(codes["actores"], k=rng.randint(0, 3)),
+            "ruteo": rng.choice(codes["ruteo"]),
+            "territorio": rng.sample(["Cauca", "bogota", "Quibdó", "Marte"], rng.randint(0, 2)),
+            "highlights": [],
+        }
+        if rng.random() < 0.2:
+            del pred[rng.choice(list(pred))]
+        preds.append(pred)
+    return preds
+
+
+class TestValidateAndFixBatch:
+    """Test suite for validate_and_fix_batch."""
+
+    def test_edge_cases_match_scalar(self):
+        """Test malformed predictions are fixed exactly like the scalar path."""
+        expected = scalar(EDGE_CASES)
+        result = validate_and_fix_batch(copy.deepcopy(EDGE_CASES))
+        assert result == expected
+        assert [list(r) for r in result] == [list(e) for e in expected]  # same key order
+
+    def test_random_predictions_match_scalar(self):
+        """Test thousands of random predictions give identical results."""
+        preds = random_predictions(5000)
+        expected = scalar(preds)
+        assert validate_and_fix_batch(preds) == expected
+
+    def test_priority_scores_bitwise_identical(self):
+        """Test priority scores are the same floats (same summation order)."""
+        preds = random_predictions(2000, seed=3)
+        expected = [p["priority_score"] for p in scalar(preds)]
+        result = [p["priority_score"] for p in validate_and_fix_batch(preds)]
+        assert result == expected
+        assert all(type(score) is float for score in result)
+
+    def test_texts_fill_territorio(self):
+        """Test document texts are used when no model value resolves."""
+        preds = [{"territorio": []}, {"territorio": ["Marte"]}, {"territorio": ["Cauca"]}]
+        texts = ["Llegaron a Quibdó.", None, "Salimos de Tumaco."]
+        expected = scalar(preds, texts)
+        result = validate_and_fix_batch(copy.deepcopy(preds), texts)
+        assert result == expected
+        assert [p["territorio"] for p in result] == [["Chocó"], ["No identificado"], ["Cauca"]]
+
+    def test_texts_length_mismatch(self):
+        """Test texts must align with predictions."""
+        with pytest.raises(ValueError):
+            validate_and_fix_batch([{}, {}], ["uno"])
+
+    def test_empty_batch(self):
+        """Test an empty list is returned unchanged."""
+        assert validate_and_fix_batch([]) == []
+
+    def test_updates_dicts_in_place(self):
+        """Test the same dict objects are fixed and returned."""
+        preds = [{"tipo_documento": "TD1"}, {}]
+        originals = list(preds)
+        result = validate_and_fix_batch(preds)
+        assert all(a is b for a, b in zip(result, originals))
+
+    def test_rows_do_not_share_lists(self):
+        """Test identical inputs still get independent output lists."""
+        preds = [{"tipo_hecho": ["TH1"], "territorio": ["Cauca"]} for _ in range(3)]
+        result = validate_and_fix_batch(preds)
+        result[0]["tipo_hecho"].append("TH2")
+        result[0]["territorio"].append("Meta")
+        assert result[1]["tipo_hecho"] == ["TH1"]
+        assert result[1]["territorio"] == ["Cauca"]
+
+    def test_custom_rules_match_scalar(self):
+        """Test rules on any field (including actores) match compute_priority."""
+        rules = PriorityRules([("actores", "ACT1", 0.25), ("periodo", "PER2", 0.5),
+                               ("tipo_hecho", "TH2", 0.35)], max_score=0.9)
+        preds = random_predictions(2000, seed=11)
+        expected = [compute_priority(p, rules) for p in scalar(preds)]
+        result = [p["priority_score"] for p in validate_and_fix_batch(preds, rules=rules)]
+        assert result == expected
+
+    def test_unhashable_label_raises_like_scalar(self):
+        """Test an unhashable single label fails the same way as the scalar path."""
+        with pytest.raises(TypeError):
+            validate_and_fix({"tipo_documento": ["TD1"]})
+        with pytest.raises(TypeError):
+            validate_and_fix_batch([{"tipo_documento": ["TD1"]}])
+
+
+class TestLabelCodec:
+    """Test suite for LabelCodec."""
+
+    def test_encode_decode(self):
+        """Test labels round-trip and unknown values encode to -1."""
+        codec = LabelCodec(["A", "B"])
+        codes = codec.encode(["B", "X", "A"])
+        assert codes.tolist() == [1, -1, 0]
+        assert codec.decode(codes[codes >= 0]) == ["B", "A"]
+
+    def test_default_outside_labels_is_appended(self):
+        """Test a default that is not an ontology code can still be decoded."""
+        codec = LabelCodec(["A"], default="Z")
+        assert codec.decode([codec.default]) == ["Z"]
+        assert len(codec) == 2
+
+    def test_priority_batch_caps_at_one(self):
+        """Test the vectorized weighted sum is capped at max_score."""
+        import numpy as np
+        codecs = {
+            "tipo_hecho": LabelCodec(["TH1", "TH4"]),
+            "ruteo": LabelCodec(["RU1", "RU3"], default="RU0"),
+        }
+        masks = {"tipo_hecho": np.array([0b11, 0b00], dtype=np.uint64)}
+        single = {"ruteo": np.array([0, 1])}
+        rules = PriorityRules([("tipo_hecho", "TH1", 0.4), ("tipo_hecho", "TH4", 0.2),
+                               ("ruteo", "RU1", 0.3), ("ruteo", "RU3", 0.1)], max_score=0.8)
+        scores = compute_priority_batch(codecs, single, masks, rules)
+        assert scores.tolist() == [0.8, 0.0 + 0.1]
+
+    def test_too_many_multi_label_codes(self):
+        """Test a multi-label dimension larger than a uint64 mask is rejected."""
+        from batch_validation import _codecs
+        from ontology import CompiledOntology
+        raw = get_ontology().as_dict()
+        raw["tipo_hecho"] = {f"TH{i}": f"Hecho {i}" for i in range(MAX_MULTI_LABEL_CODES + 1)}
+        with pytest.raises(ValueError):
+            _codecs(CompiledOntology(raw))
@@ -0,0 +1,217 @@
+"""
+test_budget.py
+Unit tests for tokenizer.py and budget.py modules.
+Tests local token counting (character heuristic and BPE from a .tiktoken
+file), full-prompt token counts, the head_tail and cues compression
+policies and the per-document token counts of classify_documents.
+"""
+
+import sys
+import base64
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import budget
+import classifier
+import tokenizer
+from backends import RuleBasedBackend
+from budget import OMISSION_MARK, TokenBudget, compress_cues, compress_head_tail, cue_flags
+from prompts import USER_PREFIX, get_system_prompt
+from tokenizer import HeuristicTokenizer, load_bpe_ranks, load_tokenizer
+
+
+HEURISTIC = HeuristicTokenizer()
+
+FILLER = "El comité revisó el acta de la reunión anterior sin observaciones."
+CUE = "En marzo de 1998 los paramilitares entraron a Caldas y se llevaron a mi hermano."
+
+
+def _document(filler_before: int = 20, filler_after: int = 20) -> str:
+    return " ".join([FILLER] * filler_before + [CUE] + [FILLER] * filler_after)
+
+
+@pytest.fixture
+def bpe_file(tmp_path):
+    """A tiny .tiktoken file: the 256 single bytes plus a few merges."""
+    tokens = [bytes([i]) for i in range(256)] + [b"de", b" de", b"la", b" la"]
+    path = tmp_path / "tiny.tiktoken"
+    path.write_bytes(b"\n".join(base64.b64encode(t) + b" " + str(rank).encode() for rank, t in enumerate(tokens)))
+    return path
+
+
+@pytest.fixture
+def rules_backend():
+    classifier.set_backend(RuleBasedBackend())
+    yield
+    classifier.set_backend(None)
+    budget.set_token_budget(None)
+
+
+class TestTokenizers:
+    """Test suite for the local tokenizers."""
+
+    def test_heuristic_matches_chunking_estimate(self):
+        """Test the default tokenizer is the character heuristic."""
+        assert HEURISTIC.count("a" * 40) == 10
+        assert HEURISTIC.truncate("a" * 40, 3) == "a" * 12
+        assert isinstance(load_tokenizer(None), HeuristicTokenizer)
+
+    def test_load_bpe_ranks(self, bpe_file):
+        """Test ranks are read as base64 token and integer rank."""
+        ranks = load_bpe_ranks(bpe_file)
+        assert len(ranks) == 260
+        assert ranks[b" la"] == 259
+
+    def test_bpe_counts_and_truncates(self, bpe_file):
+        """Test the BPE tokenizer applies merges and cuts on token boundaries."""
+        pytest.importorskip("tiktoken")
+        bpe = load_tokenizer(str(bpe_file))
+        assert bpe.name == "tiny"
+        assert bpe.count("de la") == 2
+        assert bpe.count("ñ") == 2  # dos bytes UTF-8 sin fusión
+        assert bpe.truncate("de la casa", 4) == "de la c"
+        assert bpe.truncate("de", 10) == "de"
+
+    def test_env_var_selects_tokenizer(self, bpe_file, monkeypatch):
+        """Test UBPD_TOKENIZER_PATH loads the local file."""
+        pytest.importorskip("tiktoken")
+        monkeypatch.setenv("UBPD_TOKENIZER_PATH", str(bpe_file))
+        tokenizer.set_tokenizer(None)
+        try:
+            assert tokenizer.get_tokenizer().name == "tiny"
+        finally:
+            tokenizer.set_tokenizer(None)
+
+
+class TestPromptTokens:
+    """Test suite for full-prompt token counts."""
+
+    def test_counts_system_prompt_prefix_and_document(self):
+        """Test the count covers every part of the assembled prompt."""
+        tb = TokenBudget(tokenizer=HEURISTIC)
+        expected = HEURISTIC.count(get_system_prompt()) + HEURISTIC.count(USER_PREFIX) + budget.CHAT_OVERHEAD_TOKENS
+        assert tb.overhead_tokens() == expected
+        assert tb.prompt_tokens("a" * 400) == expected + 100
+
+    def test_chunk_policy_and_no_limit_send_everything(self):
+        """Test the default policy and a missing limit never cut the text."""
+        text = _document()
+        for tb in (TokenBudget(10, "chunk", HEURISTIC), TokenBudget(None, "cues", HEURISTIC)):
+            result = tb.fit(text)
+            assert result.text == text and not result.truncated
+            assert result.original_tokens == result.sent_tokens
+
+    def test_invalid_configuration(self):
+        """Test unknown policies and prompts that cannot fit are rejected."""
+        with pytest.raises(ValueError):
+            TokenBudget(100, "middle")
+        with pytest.raises(ValueError):
+            TokenBudget(10, "head_tail", HEURISTIC).fit(_document())
+
+
+class TestPolicies:
+    """Test suite for the head_tail and cues policies."""
+
+    def test_head_tail_keeps_both_ends(self):
+        """Test head_tail keeps the opening and closing sentences."""
+        text = " ".join(f"Frase número {i} del documento." for i in range(100))
+        out = compress_head_tail(text, 120, HEURISTIC)
+        assert out.startswith("Frase número 0 ")
+        assert out.endswith("Frase número 99 del documento.")
+        assert OMISSION_MARK in out
+        assert HEURISTIC.count(out) <= 120
+
+    def test_cue_flags(self):
+        """Test date, place and actor cues are detected."""
+        assert cue_flags(CUE) == 3
+        assert cue_flags(FILLER) == 0
+
+    def test_cues_keeps_cue_sentence_from_the_middle(self):
+        """Test the cue sentence survives where head_tail drops it."""
+        text = _document()
+        assert CUE in compress_cues(text, 120, HEURISTIC)
+        assert CUE not in compress_head_tail(text, 120, HEURISTIC)
+
+    @pytest.mark.parametrize("policy", ["head_tail", "cues"])
+    def test_fit_respects_max_prompt_tokens(self, policy):
+        """Test the whole prompt fits and both counts are reported."""
+        tb = TokenBudget(None, policy, HEURISTIC)
+        tb.max_prompt_tokens = tb.overhead_tokens() + 150
+        result = tb.fit(_document())
+        assert result.truncated
+        assert result.original_tokens == tb.prompt_tokens(_document())
+        assert result.sent_tokens == tb.prompt_tokens(result.text) <= tb.max_prompt_tokens
+
+    def test_single_huge_sentence_is_truncated(self):
+        """Test text without sentence breaks falls back to a token cut."""
+        tb = TokenBudget(None, "cues", HEURISTIC)
+        tb.max_prompt_tokens = tb.overhead_tokens() + 50
+        result = tb.fit("x" * 4000)
+        assert result.text == "x" * 200
+
+    def test_env_configuration(self, monkeypatch):
+        """Test UBPD_MAX_PROMPT_TOKENS and UBPD_BUDGET_POLICY."""
+        monkeypatch.setenv("UBPD_MAX_PROMPT_TOKENS", "3000")
+        monkeypatch.setenv("UBPD_BUDGET_POLICY", "cues")
+        tb = budget.budget_from_env()
+        assert (tb.max_prompt_tokens, tb.policy) == (3000, "cues")
+
+
+class TestClassifierTokens:
+    """Test suite for per-document token counts in classify_documents."""
+
+    def test_results_report_original_and_sent_tokens(self, rules_backend):
+        """Test each result records the tokens before and after the budget."""
+        tb = TokenBudget(None, "cues", HEURISTIC)
+        tb.max_prompt_tokens = tb.overhead_tokens() + 150
+        budget.set_token_budget(tb)
+        short, long_text = "Me llamo Ana.", _document(60, 60)
+        results = classifier.classify_documents([short, long_text])
+
+        assert results[0]["tokens"]["truncated"] is False
+        assert results[0]["tokens"]["original"] == results[0]["tokens"]["sent"]
+        tokens = results[1]["tokens"]
+        assert tokens["truncated"] is True
+        assert tokens["sent"] <= tb.max_prompt_tokens < tokens["original"]
+        assert tokens["calls"] == 1
+        # La frase con las pistas llega al modelo aunque esté en medio
+        assert results[1]["classification"]["territorio"] == ["Caldas"]
+
+    def test_chunk_policy_fits_each_prompt(self, rules_backend):
+        """Test the chunk policy splits so every prompt fits max_prompt_tokens."""
+        tb = TokenBudget(None, "chunk", HEURISTIC)
+        tb.max_prompt_tokens = tb.overhead_tokens() + 150
+        budget.set_token_budget(tb)
+        [result] = classifier.classify_documents([_document(60, 60)])
+
+        tokens = result["tokens"]
+        assert tokens["truncated"] is False
+        assert tokens["calls"] > 1
+        chunks, _ = classifier.prepare_chunks(_document(60, 60))
+        assert all(tb.prompt_tokens(chunk) <= tb.max_prompt_tokens for chunk in chunks)
+        assert result["classification"]["territorio"] == ["Caldas"]
+
+    def test_chunks_measured_with_tokenizer(self, rules_backend, bpe_file):
+        """Test chunk sizes come from the budget tokenizer, not the char estimate."""
+        bpe = load_tokenizer(bpe_file)
+        tb = TokenBudget(None, "chunk", bpe)
+        tb.max_prompt_tokens = tb.overhead_tokens() + 120
+        budget.set_token_budget(tb)
+        chunks, tokens = classifier.prepare_chunks(_document(30, 30))
+        assert len(chunks) > 1
+        assert all(bpe.count(chunk) <= 120 for chunk in chunks)
+        assert tokens["sent"] == sum(tb.prompt_tokens(chunk) for chunk in chunks)
+
+    def test_chunk_tokens(self):
+        """Test the chunk size is capped by the tokens left for the document."""
+        tb = TokenBudget(None, "chunk", HEURISTIC)
+        assert tb.chunk_tokens(500) == 500
+        tb.max_prompt_tokens = tb.overhead_tokens() + 150
+        assert tb.chunk_tokens(500) == 150
+        assert tb.chunk_tokens(100) == 100
+        tb.max_prompt_tokens = tb.overhead_tokens()
+        with pytest.raises(ValueError):
+            tb.chunk_tokens(500)
@@ -0,0 +1,179 @@
+"""
+test_cache.py
+Unit tests for cache.py module and the cache integration in classifier.py.
+Tests LRU/SQLite lookups, size-based eviction, counters and cache keys.
+"""
+
+import sys
+import json
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier
+from cache import ClassificationCache
+from classifier import classify_document, make_cache_key, set_backend, set_cache
+
+
+RAW_RESPONSE = json.dumps({
+    "tipo_documento": "TD1",
+    "tipo_hecho": ["TH1", "BAD"],
+    "territorio": ["Antioquia"],
+    "periodo": "PER2",
+    "actores": ["ACT2"],
+    "ruteo": "RU1",
+    "highlights": [],
+})
+
+
+@pytest.fixture
+def memory_cache():
+    cache = ClassificationCache(":memory:")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def active_cache(memory_cache):
+    set_cache(memory_cache)
+    yield memory_cache
+    set_cache(None)
+
+
+class TestClassificationCache:
+    """Test suite for ClassificationCache."""
+
+    def test_miss_returns_none(self, memory_cache):
+        """Test that an unknown key is a miss."""
+        assert memory_cache.get("nope") is None
+        assert memory_cache.stats()["misses"] == 1
+
+    def test_put_then_get_hits_memory(self, memory_cache):
+        """Test that a stored value is served from memory."""
+        memory_cache.put("k", "v")
+        assert memory_cache.get("k") == "v"
+        stats = memory_cache.stats()
+        assert stats["memory_hits"] == 1
+        assert stats["hit_rate"] == 1.0
+
+    def test_persists_across_instances(self, tmp_path):
+        """Test that values survive reopening the SQLite file."""
+        path = tmp_path / "cache.sqlite"
+        first = ClassificationCache(path)
+        first.put("k", "valor")
+        first.close()
+
+        second = ClassificationCache(path)
+        assert second.get("k") == "valor"
+        assert second.stats()["disk_hits"] == 1
+        assert second.stats()["disk_bytes"] == len("valor")
+        second.close()
+
+    def test_memory_lru_is_bounded(self, memory_cache):
+        """Test that the in-process LRU keeps at most memory_entries items."""
+        cache = ClassificationCache(":memory:", memory_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        assert cache.stats()["memory_entries"] == 2
+        # "a" fell out of memory but is still on disk
+        assert cache.get("a") == "a"
+        assert cache.stats()["disk_hits"] == 1
+
+    def test_size_based_eviction(self):
+        """Test that least recently used entries are evicted by size."""
+        cache = ClassificationCache(":memory:", max_bytes=30, memory_entries=1)
+        cache.put("a", "x" * 10)
+        cache.put("b", "x" * 10)
+        cache.get("a")  # "a" becomes more recent than "b"
+        cache.put("c", "x" * 15)
+        stats = cache.stats()
+        assert stats["evictions"] >= 1
+        assert stats["disk_bytes"] <= 30
+        assert cache.get("b") is None
+
+    def test_memory_hits_refresh_disk_recency(self):
+        """Test keys served from memory are not evicted as least recently used."""
+        cache = ClassificationCache(":memory:", max_bytes=30, memory_entries=4)
+        cache.put("a", "x" * 10)
+        cache.put("b", "x" * 10)
+        cache.get("a")  # acierto en memoria: "a" pasa a ser la más reciente
+        cache.put("c", "x" * 15)
+        assert cache.get("a") == "x" * 10
+        assert cache.get("b") is None
+
+    def test_eviction_keeps_new_entry(self):
+        """Test the entry just written is never evicted by its own put."""
+        cache = ClassificationCache(":memory:", max_bytes=30, memory_entries=1)
+        cache.put("a", "x" * 10)
+        cache.put("big", "x" * 28)
+        assert cache.stats()["disk_bytes"] == 28
+        assert cache.get("a") is None
+
+    def test_overwrite_updates_size(self, memory_cache):
+        """Test that replacing a key does not double count its size."""
+        memory_cache.put("k", "12345")
+        memory_cache.put("k", "12")
+        assert memory_cache.stats()["disk_bytes"] == 2
+
+    def test_clear(self, memory_cache):
+        """Test that clear empties both levels."""
+        memory_cache.put("k", "v")
+        memory_cache.clear()
+        assert memory_cache.get("k") is None
+        assert memory_cache.stats()["disk_bytes"] == 0
+
+
+class TestMakeCacheKey:
+    """Test suite for make_cache_key."""
+
+    def test_key_is_deterministic(self):
+        """Test that the same text yields the same key."""
+        assert make_cache_key("texto") == make_cache_key("texto")
+
+    def test_key_depends_on_text(self):
+        """Test that different texts yield different keys."""
+        assert make_cache_key("texto a") != make_cache_key("texto b")
+
+    def test_key_depends_on_model(self):
+        """Test that changing the backend model changes the key."""
+        from backends import OpenAIBackend
+        set_backend(OpenAIBackend(model_name="modelo-a"))
+        try:
+            before = make_cache_key("texto")
+            set_backend(OpenAIBackend(model_name="modelo-b"))
+            assert make_cache_key("texto") != before
+        finally:
+            set_backend(None)
+
+
+class TestClassifyDocumentWithCache:
+    """Test suite for the cache path in classify_document."""
+
+    @patch("classifier.call_llm")
+    def test_hit_skips_llm(self, mock_llm, active_cache):
+        """Test that the second identical call does not reach the model."""
+        mock_llm.return_value = RAW_RESPONSE
+        first = classify_document("Texto  de prueba")
+        second = classify_document("Texto de prueba")
+        assert mock_llm.call_count == 1
+        assert first == second
+
+    @patch("classifier.call_llm")
+    def test_hit_still_validated(self, mock_llm, active_cache):
+        """Test that cached responses still go through validate_and_fix."""
+        mock_llm.return_value = RAW_RESPONSE
+        classify_document("Texto")
+        result = classify_document("Texto")
+        assert result["tipo_hecho"] == ["TH1"]
+        assert "priority_score" in result
+
+    @patch("classifier.call_llm")
+    def test_unparseable_response_not_cached(self, mock_llm, active_cache):
+        """Test that responses that fail to parse are not stored."""
+        mock_llm.return_value = "sin json"
+        with pytest.raises(ValueError):
+            classify_document("Texto")
+        assert active_cache.stats()["puts"] == 0
@@ -0,0 +1,215 @@
+"""
+test_chunking.py
+Unit tests for chunking.py module and the long-document path in classifier.py.
+Tests chunk splitting on sentence boundaries and merging of predictions.
+"""
+
+import sys
+import json
+import asyncio
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from chunking import (
+    CHARS_PER_TOKEN,
+    estimate_tokens,
+    merge_predictions,
+    split_into_chunks,
+)
+
+
+class TestEstimateTokens:
+    """Test suite for estimate_tokens."""
+
+    def test_empty(self):
+        assert estimate_tokens("") == 0
+
+    def test_rounds_up(self):
+        assert estimate_tokens("abcde") == 2
+
+
+class TestSplitIntoChunks:
+    """Test suite for split_into_chunks."""
+
+    def test_short_text_is_single_chunk(self):
+        """Test that text within budget is not split."""
+        assert split_into_chunks("Texto corto.", max_tokens=100) == ["Texto corto."]
+
+    def test_empty_text(self):
+        """Test that empty text yields no chunks."""
+        assert split_into_chunks("", max_tokens=10) == []
+
+    def test_chunks_respect_budget(self):
+        """Test that every chunk fits in the token budget."""
+        text = " ".join(f"Frase número {i} del testimonio." for i in range(200))
+        chunks = split_into_chunks(text, max_tokens=50)
+        assert len(chunks) > 1
+        assert all(len(c) <= 50 * CHARS_PER_TOKEN for c in chunks)
+
+    def test_splits_on_sentence_boundaries(self):
+        """Test that chunks end at a sentence boundary."""
+        text = " ".join(f"Frase número {i} del testimonio." for i in range(200))
+        chunks = split_into_chunks(text, max_tokens=50)
+        assert all(c.endswith(".") for c in chunks)
+
+    def test_no_text_lost(self):
+        """Test that joining chunks restores all words."""
+        text = " ".join(f"Frase {i}." for i in range(300))
+        chunks = split_into_chunks(text, max_tokens=20)
+        assert " ".join(chunks).split() == text.split()
+
+    def test_oversized_sentence_is_split(self):
+        """Test that a sentence larger than the budget is split by words."""
+        text = "palabra " * 500
+        chunks = split_into_chunks(text.strip(), max_tokens=10)
+        assert all(len(c) <= 10 * CHARS_PER_TOKEN for c in chunks)
+        assert " ".join(chunks).split() == text.split()
+
+    def test_invalid_budget(self):
+        with pytest.raises(ValueError):
+            split_into_chunks("texto", max_tokens=0)
+
+
+class TestMergePredictions:
+    """Test suite for merge_predictions."""
+
+    def test_single_prediction_unchanged(self, valid_classification_response):
+        assert merge_predictions([valid_classification_response]) == valid_classification_response
+
+    def test_union_of_list_fields(self):
+        """Test ordered union of multi-valued fields."""
+        merged = merge_predictions([
+            {"tipo_hecho": ["TH1"], "highlights": ["a"]},
+            {"tipo_hecho": ["TH3", "TH1"], "highlights": ["b"]},
+        ])
+        assert merged["tipo_hecho"] == ["TH1", "TH3"]
+        assert merged["highlights"] == ["a", "b"]
+
+    def test_placeholders_dropped_when_concrete_values(self):
+        """Test that 'No identificado' and ACT0 yield to concrete values."""
+        merged = merge_predictions([
+            {"territorio": ["No identificado"], "actores": ["ACT0"]},
+            {"territorio": ["Cauca"], "actores": ["ACT3"]},
+        ])
+        assert merged["territorio"] == ["Cauca"]
+        assert merged["actores"] == ["ACT3"]
+
+    def test_placeholders_kept_when_only_value(self):
+        merged = merge_predictions([
+            {"territorio": ["No identificado"]},
+            {"territorio": ["No identificado"]},
+        ])
+        assert merged["territorio"] == ["No identificado"]
+
+    def test_tipo_documento_prefers_testimonial_majority(self):
+        """Test that TD0 chunks do not override a testimonial majority."""
+        merged = merge_predictions([
+            {"tipo_documento": "TD0"},
+            {"tipo_documento": "TD2"},
+            {"tipo_documento": "TD1"},
+            {"tipo_documento": "TD2"},
+        ])
+        assert merged["tipo_documento"] == "TD2"
+
+    def test_all_td0_stays_td0(self):
+        merged = merge_predictions([{"tipo_documento": "TD0"}, {"tipo_documento": "TD0"}])
+        assert merged["tipo_documento"] == "TD0"
+
+    def test_periodo_ignores_unknown(self):
+        merged = merge_predictions([{"periodo": "PER0"}, {"periodo": "PER3"}])
+        assert merged["periodo"] == "PER3"
+
+    def test_ruteo_most_urgent(self):
+        merged = merge_predictions([{"ruteo": "RU4"}, {"ruteo": "RU1"}, {"ruteo": "RU3"}])
+        assert merged["ruteo"] == "RU1"
+
+
+class TestClassifyLongDocument:
+    """Test suite for the chunked path of classify_document."""
+
+    @staticmethod
+    def _response(doc):
+        hecho = "TH1" if "desaparecieron" in doc else "TH3"
+        return json.dumps({
+            "tipo_documento": "TD1", "tipo_hecho": [hecho],
+            "territorio": ["Antioquia"], "periodo": "PER2",
+            "actores": ["ACT2"], "ruteo": "RU2", "highlights": [],
+        })
+
+    def _long_text(self):
+        return ("Nos desplazaron del pueblo. " * 40) + ("Luego desaparecieron a mi hermano. " * 40)
+
+    def test_sync_long_document_is_chunked_and_merged(self):
+        """Test that an oversize document triggers one call per chunk."""
+        import classifier
+        calls = []
+
+        def fake_llm(system_prompt, user_prompt):
+            calls.append(user_prompt)
+            return self._response(user_prompt.split("DOCUMENTO:")[1])
+
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch("classifier.call_llm", side_effect=fake_llm):
+            result = classifier.classify_document(self._long_text())
+        assert len(calls) > 1
+        assert set(result["tipo_hecho"]) == {"TH1", "TH3"}
+        assert result["priority_score"] == pytest.approx(0.4)
+
+    def test_sync_path_reports_tokens(self):
+        """Test the sync path returns the same token counts as the async one."""
+        import classifier
+
+        def fake_llm(system_prompt, user_prompt):
+            return self._response(user_prompt.split("DOCUMENTO:")[1])
+
+        async def fake_llm_async(system_prompt, user_prompt):
+            return fake_llm(system_prompt, user_prompt)
+
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch("classifier.call_llm", side_effect=fake_llm), \
+             patch("classifier.call_llm_async", new=fake_llm_async):
+            result, tokens = classifier.classify_document_with_tokens(self._long_text())
+            _, async_tokens = asyncio.run(classifier._classify_document_async(self._long_text()))
+        assert tokens == async_tokens
+        assert tokens["calls"] > 1 and tokens["sent"] > 0
+        assert set(result["tipo_hecho"]) == {"TH1", "TH3"}
+
+    def test_sync_chunk_threads_are_shared(self):
+        """Test concurrent documents reuse one chunk thread pool."""
+        import classifier
+        import threading
+        threads = set()
+
+        def fake_llm(system_prompt, user_prompt):
+            threads.add(threading.current_thread().name)
+            return self._response(user_prompt.split("DOCUMENTO:")[1])
+
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch("classifier.call_llm", side_effect=fake_llm):
+            workers = [threading.Thread(target=classifier.classify_document, args=(self._long_text(),))
+                       for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        assert all(name.startswith("ubpd-chunk") for name in threads)
+        assert len(threads) <= classifier.DEFAULT_CONCURRENCY
+
+    def test_async_long_document_is_chunked_and_merged(self):
+        """Test the async path merges chunk predictions the same way."""
+        import classifier
+        calls = []
+
+        async def fake_llm(system_prompt, user_prompt):
+            calls.append(user_prompt)
+            return self._response(user_prompt.split("DOCUMENTO:")[1])
+
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch("classifier.call_llm_async", new=fake_llm):
+            result = asyncio.run(classifier.classify_document_async(self._long_text()))
+        assert len(calls) > 1
+        assert set(result["tipo_hecho"]) == {"TH1", "TH3"}
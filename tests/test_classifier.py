@@ -6,6 +6,7 @@ Tests JSON extraction, parsing, validation, and fixing of classifications.
 
 import sys
 import json
+import asyncio
 import pytest
 from pathlib import Path
 from unittest.mock import patch
@@ -21,6 +22,7 @@ from classifier import (
     fix_territorio,
     compute_priority,
     validate_and_fix,
+    classify_documents_async,
 )
 
 
@@ -516,3 +518,127 @@ class TestClassifyDocumentWithMocks:
         # We would import and call classify_document here
         # but it requires call_llm to be patched
         assert mock_llm is not None
+
+
+class TestClassifyDocumentsAsync:
+    """Test suite for classify_documents_async with a mocked async LLM."""
+
+    @staticmethod
+    def _fake_llm(delays=None, fail_on=None, tracker=None):
+        """Build a fake call_llm_async that echoes the document as highlight."""
+        async def fake(system_prompt, user_prompt):
+            doc = user_prompt.rsplit("DOCUMENTO:", 1)[1].strip()
+            if tracker is not None:
+                tracker["in_flight"] += 1
+                tracker["max"] = max(tracker["max"], tracker["in_flight"])
+            try:
+                await asyncio.sleep((delays or {}).get(doc, 0.001))
+                if fail_on and doc in fail_on:
+                    raise RuntimeError("boom")
+                return json.dumps({
+                    "tipo_documento": "TD1",
+                    "tipo_hecho": ["TH1"],
+                    "territorio": ["Antioquia"],
+                    "periodo": "PER2",
+                    "actores": ["ACT2"],
+                    "ruteo": "RU1",
+                    "highlights": [doc],
+                })
+            finally:
+                if tracker is not None:
+                    tracker["in_flight"] -= 1
+        return fake
+
+    def test_results_preserve_input_order(self):
+        """Test that results follow input order even if calls finish out of order."""
+        texts = ["doc a", "doc b", "doc c"]
+        fake = self._fake_llm(delays={"doc a": 0.03, "doc b": 0.01, "doc c": 0.0})
+        with patch("classifier.call_llm_async", new=fake):
+            results = asyncio.run(classify_documents_async(texts, concurrency=3))
+        assert [r["index"] for r in results] == [0, 1, 2]
+        assert [r["classification"]["highlights"] for r in results] == [
+            ["doc a"], ["doc b"], ["doc c"]
+        ]
+
+    def test_concurrency_is_bounded(self):
+        """Test that no more than `concurrency` calls are in flight."""
+        tracker = {"in_flight": 0, "max": 0}
+        texts = [f"doc {i}" for i in range(20)]
+        with patch("classifier.call_llm_async", new=self._fake_llm(tracker=tracker)):
+            results = asyncio.run(classify_documents_async(texts, concurrency=4))
+        assert len(results) == 20
+        assert tracker["max"] == 4
+
+    def test_chunk_calls_share_the_batch_limit(self):
+        """Test that chunks of long documents count against the batch concurrency."""
+        import classifier
+        tracker = {"in_flight": 0, "max": 0}
+        texts = [("Nos desplazaron del pueblo numero %d. " % i) * 60 for i in range(6)]
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch("classifier.call_llm_async", new=self._fake_llm(tracker=tracker)):
+            results = asyncio.run(classify_documents_async(texts, concurrency=3))
+        assert all(r["tokens"]["calls"] > 1 for r in results)
+        assert tracker["max"] == 3
+
+    def test_failure_does_not_abort_batch(self):
+        """Test that a failing document is reported and others succeed."""
+        texts = ["ok 1", "bad", "ok 2"]
+        with patch("classifier.call_llm_async", new=self._fake_llm(fail_on={"bad"})):
+            results = asyncio.run(classify_documents_async(texts, concurrency=2))
+        assert results[1]["classification"] is None
+        assert "boom" in results[1]["error"]
+        assert results[0]["error"] is None
+        assert results[2]["classification"]["tipo_documento"] == "TD1"
+
+    def test_results_carry_prompt_versions(self):
+        """Test results record the ontology and prompt versions of their prompt."""
+        from ontology import get_ontology
+        from prompts import prompt_version
+        with patch("classifier.call_llm_async", new=self._fake_llm()):
+            [result] = asyncio.run(classify_documents_async(["texto"]))
+        assert result["classification"]["ontology_hash"] == get_ontology().version
+        assert result["classification"]["prompt_hash"] == prompt_version()
+
+    def test_versions_survive_ontology_reload(self):
+        """Test a reload during the model call does not restamp the result."""
+        import ontology
+        from classifier import classify_document
+
+        before = ontology.get_ontology()
+        raw = before.as_dict()
+        raw["ruteo"] = dict(raw["ruteo"], RU0="No aplica (editado)")
+        after = ontology.CompiledOntology(raw)
+
+        class Reloaded:
+            def get(self):
+                return after
+
+        fake = self._fake_llm()
+
+        def reload_then_answer(system_prompt, user_prompt):
+            ontology.set_reloader(Reloaded())
+            return asyncio.run(fake(system_prompt, user_prompt))
+
+        try:
+            with patch("classifier.call_llm", new=reload_then_answer):
+                result = classify_document("texto")
+            assert ontology.get_ontology().version == after.version != before.version
+            assert result["ontology_hash"] == before.version
+        finally:
+            ontology.set_reloader(None)
+
+    def test_results_are_validated(self):
+        """Test that results go through validate_and_fix."""
+        with patch("classifier.call_llm_async", new=self._fake_llm()):
+            results = asyncio.run(classify_documents_async(["texto"]))
+        assert "priority_score" in results[0]["classification"]
+        assert results[0]["elapsed_ms"] >= 0
+
+    def test_empty_input(self):
+        """Test that an empty batch returns an empty list."""
+        assert asyncio.run(classify_documents_async([])) == []
+
+    def test_invalid_concurrency_raises(self):
+        """Test that concurrency below 1 is rejected."""
+        with pytest.raises(ValueError):
+            asyncio.run(classify_documents_async(["x"], concurrency=0))
@@ -0,0 +1,347 @@
+"""
+test_db.py
+Unit tests for db.py module.
+Tests the bulk persistence path with a fake connection (no PostgreSQL needed).
+"""
+
+import sys
+import threading
+import time
+import uuid
+import psycopg2
+import pytest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import db
+from db import ConnectionPool, build_run_rows, insert_runs, save_duplicates, save_many
+from highlights import Span
+from ontology import get_ontology
+from prompts import prompt_version
+
+
+class FakeConnection:
+    """Minimal psycopg2-like connection recording transactions."""
+
+    def __init__(self, healthy=True):
+        self.transactions = 0
+        self.closed = 0
+        self.healthy = healthy
+        self.rollbacks = 0
+        self.in_transaction = False
+        self.cursor_obj = MagicMock()
+        if not healthy:
+            self.cursor_obj.execute.side_effect = psycopg2.OperationalError("gone")
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        cur = MagicMock()
+        cur.__enter__.return_value = self.cursor_obj
+        return cur
+
+    def close(self):
+        self.closed = 1
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def get_transaction_status(self):
+        return 2 if self.in_transaction else 0
+
+
+@pytest.fixture(autouse=True)
+def reset_pool():
+    """Each test gets a fresh process-wide pool."""
+    db.close_pool()
+    yield
+    db.close_pool()
+
+
+@pytest.fixture
+def fake_db():
+    """Patch the connection factory and execute_values; yield recorded calls."""
+    conn = FakeConnection()
+    calls = []
+
+    def fake_execute_values(cur, sql, rows, page_size=None):
+        calls.append((" ".join(sql.split()), list(rows)))
+
+    with patch.object(db, "get_connection", return_value=conn), \
+         patch.object(db, "execute_values", side_effect=fake_execute_values):
+        yield conn, calls
+
+
+def _table_rows(calls, table):
+    return [rows for sql, rows in calls if f"INSERT INTO {table} " in sql][0]
+
+
+class TestSaveMany:
+    """Test suite for save_many."""
+
+    def test_empty_batch(self, fake_db):
+        """Test that an empty batch writes nothing."""
+        conn, calls = fake_db
+        assert save_many([]) == []
+        assert calls == []
+
+    def test_returns_ids_in_order(self, fake_db, valid_classification_response):
+        """Test that one (doc_id, run_id) pair is returned per input."""
+        conn, calls = fake_db
+        ids = save_many([("texto 1", valid_classification_response),
+                         ("texto 2", valid_classification_response)])
+        assert len(ids) == 2
+        for doc_id, run_id in ids:
+            uuid.UUID(doc_id)
+            uuid.UUID(run_id)
+        docs = _table_rows(calls, "doc_document")
+        assert [row[0] for row in docs] == [doc_id for doc_id, _ in ids]
+        assert [row[6] for row in docs] == ["texto 1", "texto 2"]
+
+    def test_single_transaction_one_statement_per_table(self, fake_db,
+                                                       valid_classification_response):
+        """Test that the batch uses one transaction and one INSERT per table."""
+        conn, calls = fake_db
+        save_many([("t", valid_classification_response)] * 50)
+        assert conn.transactions == 1
+        assert len(calls) == 7
+
+    def test_child_rows(self, fake_db, valid_classification_response):
+        """Test multi-label and highlight rows reference the run."""
+        conn, calls = fake_db
+        [(doc_id, run_id)] = save_many([("t", valid_classification_response)])
+        assert _table_rows(calls, "doc_classification_hecho") == [
+            (run_id, "TH1"), (run_id, "TH3")
+        ]
+        assert _table_rows(calls, "doc_classification_actor") == [(run_id, "ACT2")]
+        highlights = _table_rows(calls, "doc_classification_highlight")
+        assert len(highlights) == 2
+        assert _table_rows(calls, "doc_classification_run")[0][:2] == (run_id, doc_id)
+
+    def test_highlight_offsets(self, fake_db, valid_classification_response):
+        """Test highlights carry their offsets in the original text."""
+        conn, calls = fake_db
+        text = "En 1997, en San Carlos,\n  Antioquia, llegaron y se llevaron a mi esposo."
+        save_many([(text, valid_classification_response)])
+        rows = _table_rows(calls, "doc_classification_highlight")
+        (_, _, snippet, start, end), (_, _, _, start2, end2) = rows
+        assert text[start:end] == "1997, en San Carlos,\n  Antioquia"
+        assert text[start2:end2] == "se llevaron a mi esposo"
+
+    def test_precomputed_spans_are_used(self, fake_db, valid_classification_response):
+        """Test spans passed with the document skip the locator."""
+        conn, calls = fake_db
+        spans = [Span(0, 4, "exact"), None]
+        with patch.object(db, "get_highlight_locator") as locator:
+            save_many([{"text": "texto", "classification": valid_classification_response, "spans": spans}])
+        locator.assert_not_called()
+        rows = _table_rows(calls, "doc_classification_highlight")
+        assert [row[3:] for row in rows] == [(0, 4), (None, None)]
+
+    def test_unresolved_highlight_offsets_are_null(self, fake_db, valid_classification_response):
+        """Test snippets not found in the text are stored without offsets."""
+        conn, calls = fake_db
+        save_many([("t", valid_classification_response)])
+        rows = _table_rows(calls, "doc_classification_highlight")
+        assert [row[3:] for row in rows] == [(None, None), (None, None)]
+
+    def test_duplicate_codes_are_deduplicated(self, fake_db):
+        """Test that repeated codes do not produce duplicate primary keys."""
+        conn, calls = fake_db
+        save_many([("t", {"tipo_hecho": ["TH1", "TH1"], "territorio": [],
+                          "actores": [], "highlights": []})])
+        assert len(_table_rows(calls, "doc_classification_hecho")) == 1
+
+    def test_dict_items_with_metadata(self, fake_db, valid_classification_response):
+        """Test dict items carry document metadata with defaults."""
+        conn, calls = fake_db
+        save_many([{
+            "text": "t",
+            "classification": valid_classification_response,
+            "external_id": "EXT1",
+            "filename": "a.txt",
+        }])
+        row = _table_rows(calls, "doc_document")[0]
+        assert row[1:6] == ("EXT1", "LOCAL_DEMO", "a.txt", "text/plain", "es")
+
+    def test_connection_returned_on_error(self, fake_db, valid_classification_response):
+        """Test that the connection goes back to the pool when an insert fails."""
+        conn, calls = fake_db
+        with patch.object(db, "execute_values", side_effect=RuntimeError("fail")):
+            with pytest.raises(RuntimeError):
+                save_many([("t", valid_classification_response)])
+        assert db.pool_stats()["in_use"] == 0
+
+    def test_batches_reuse_pooled_connection(self, fake_db, valid_classification_response):
+        """Test that consecutive batches borrow the same connection."""
+        conn, calls = fake_db
+        save_many([("t", valid_classification_response)])
+        save_many([("t", valid_classification_response)])
+        stats = db.pool_stats()
+        assert stats["size"] == 1
+        assert stats["acquired"] == 2
+        assert not conn.closed
+
+
+class TestRunsForExistingDocuments:
+    """Test suite for build_run_rows and insert_runs."""
+
+    def test_rows_reference_existing_documents(self, valid_classification_response):
+        """Test new runs point at the given doc_id and no document row is built."""
+        run_ids, rows = build_run_rows([
+            {"doc_id": "d1", "text": "t", "classification": valid_classification_response},
+        ])
+        assert rows["doc_document"] == []
+        assert rows["doc_classification_run"][0][:2] == (run_ids[0], "d1")
+        assert rows["doc_classification_labels"][0][0] == run_ids[0]
+
+    def test_previous_runs_deactivated(self, valid_classification_response):
+        """Test insert_runs leaves one active run per document."""
+        cur = MagicMock()
+        run_ids, rows = build_run_rows([
+            {"doc_id": "d1", "text": "t", "classification": valid_classification_response},
+        ])
+        with patch.object(db, "execute_values") as bulk:
+            insert_runs(cur, ["d1"], rows)
+        sql, params = cur.execute.call_args[0]
+        assert "SET is_active = FALSE" in sql
+        assert params == (["d1"],)
+        assert bulk.call_count == 6  # todas las tablas menos doc_document
+
+    def test_runs_stamped_with_versions(self, valid_classification_response):
+        """Test runs carry the current ontology and prompt hashes unless given."""
+        pinned = dict(valid_classification_response, ontology_hash="o1", prompt_hash="p1")
+        _, rows = build_run_rows([
+            {"doc_id": "d1", "text": "t", "classification": valid_classification_response},
+            {"doc_id": "d2", "text": "t", "classification": pinned},
+        ])
+        current, given = rows["doc_classification_run"]
+        assert current[5:] == (get_ontology().version, prompt_version())
+        assert given[5:] == ("o1", "p1")
+
+
+class TestSaveDuplicates:
+    """Test suite for save_duplicates."""
+
+    def test_empty_links_write_nothing(self, fake_db):
+        """Test that no statement is run without duplicates."""
+        conn, calls = fake_db
+        assert save_duplicates([]) == 0
+        assert calls == []
+
+    def test_links_in_one_statement(self, fake_db):
+        """Test duplicates are linked to the original in a single insert."""
+        conn, calls = fake_db
+        written = save_duplicates([
+            {"doc_id": "d1", "run_id": "r1", "filename": "a.txt", "similarity": 0.91666},
+            {"doc_id": "d1", "run_id": "r1", "external_id": "EXT2", "similarity": 1.0},
+        ])
+        assert written == 2
+        assert conn.transactions == 1
+        rows = _table_rows(calls, "doc_duplicate")
+        assert rows[0] == ("d1", "r1", None, None, "a.txt", 0.917)
+        assert rows[1][2] == "EXT2"
+
+
+class TestConnectionPool:
+    """Test suite for ConnectionPool."""
+
+    def _pool(self, **kwargs):
+        opened = []
+
+        def connect():
+            conn = FakeConnection()
+            opened.append(conn)
+            return conn
+
+        kwargs.setdefault("minconn", 0)
+        return ConnectionPool(connect=connect, **kwargs), opened
+
+    def test_invalid_bounds(self):
+        """Test that min greater than max is rejected."""
+        with pytest.raises(ValueError):
+            ConnectionPool(minconn=3, maxconn=2, connect=FakeConnection)
+
+    def test_min_connections_opened_eagerly(self):
+        """Test that minconn connections exist from the start."""
+        pool, opened = self._pool(minconn=2, maxconn=4)
+        assert len(opened) == 2
+        assert pool.stats()["idle"] == 2
+
+    def test_context_manager_returns_connection(self):
+        """Test borrowing and returning through the context manager."""
+        pool, opened = self._pool(maxconn=2)
+        with pool.connection() as conn:
+            assert pool.stats()["in_use"] == 1
+        assert pool.stats()["in_use"] == 0
+        assert pool.stats()["idle"] == 1
+        with pool.connection() as again:
+            assert again is conn
+
+    def test_exhausted_pool_times_out(self):
+        """Test that waiting for a connection is bounded."""
+        pool, _ = self._pool(maxconn=1)
+        conn = pool.getconn()
+        with pytest.raises(psycopg2.pool.PoolError):
+            pool.getconn(timeout=0.05)
+        pool.putconn(conn)
+
+    def test_waiter_gets_released_connection(self):
+        """Test that a waiting caller is woken up and wait time is recorded."""
+        pool, _ = self._pool(maxconn=1)
+        conn = pool.getconn()
+
+        def release():
+            time.sleep(0.05)
+            pool.putconn(conn)
+
+        threading.Thread(target=release).start()
+        assert pool.getconn(timeout=2) is conn
+        stats = pool.stats()
+        assert stats["waits"] == 1
+        assert stats["wait_time_max_s"] > 0
+
+    def test_stale_connection_replaced(self):
+        """Test that a connection failing the health check is replaced."""
+        pool, opened = self._pool(maxconn=2, healthcheck_after=0)
+        conn = pool.getconn()
+        conn.cursor_obj.execute.side_effect = psycopg2.OperationalError("gone")
+        pool.putconn(conn)
+        fresh = pool.getconn()
+        assert fresh is not conn
+        assert conn.closed
+        assert pool.stats()["healthcheck_failures"] == 1
+
+    def test_open_transaction_rolled_back(self):
+        """Test that a connection returned mid-transaction is rolled back."""
+        pool, _ = self._pool()
+        conn = pool.getconn()
+        conn.in_transaction = True
+        pool.putconn(conn)
+        assert conn.rollbacks == 1
+
+    def test_operational_error_discards_connection(self):
+        """Test that a broken connection is not returned to the idle set."""
+        pool, _ = self._pool()
+        with pytest.raises(psycopg2.OperationalError):
+            with pool.connection() as conn:
+                raise psycopg2.OperationalError("server closed")
+        assert conn.closed
+        assert pool.stats()["size"] == 0
+
+    def test_env_configuration(self, monkeypatch):
+        """Test that the process pool reads its bounds from the environment."""
+        monkeypatch.setenv("DB_POOL_MIN", "0")
+        monkeypatch.setenv("DB_POOL_MAX", "3")
+        pool = db.get_pool()
+        assert pool.maxconn == 3
+        assert pool.minconn == 0
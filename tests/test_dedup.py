@@ -0,0 +1,254 @@
+"""
+test_dedup.py
+Unit tests for dedup.py module.
+Tests MinHash signatures, the persistent LSH index (query, update, removal,
+reopening) and the near-duplicate path of runner.run_batch, including
+originals classified under an older ontology or prompt.
+"""
+
+import sys
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import dedup
+from dedup import DedupIndex, MinHasher, band_buckets, similarity
+from ontology import get_ontology
+from prompts import prompt_version
+from runner import iter_input_dir, load_checkpoint, run_batch
+
+
+TESTIMONY = (
+    "En el año 1998 llegaron hombres armados a la vereda La Esperanza y se llevaron "
+    "a mi hermano Pedro. Lo buscamos en hospitales y en la Personería de Granada, "
+    "pusimos la denuncia pero nadie nos dio razón. Mi mamá murió esperando noticias "
+    "y nosotros seguimos buscándolo todos estos años."
+)
+NOISY = TESTIMONY.replace("Personería", "Personeria").replace("1998", "1998,")
+OTHER = (
+    "Soy funcionaria de la alcaldía de Cocorná y remito el listado de expedientes "
+    "solicitado mediante oficio, con las fechas de radicación, los nombres de los "
+    "despachos responsables y el estado actual de cada trámite administrativo."
+)
+
+
+@pytest.fixture
+def index():
+    idx = DedupIndex(":memory:")
+    yield idx
+    idx.close()
+
+
+class TestSignatures:
+    """Test suite for MinHash signatures."""
+
+    def test_same_text_same_signature(self):
+        """Test signatures are deterministic for a fixed seed."""
+        a = MinHasher().signature(TESTIMONY)
+        b = MinHasher().signature(TESTIMONY)
+        assert len(a) == dedup.NUM_PERM
+        assert similarity(a, b) == 1.0
+
+    def test_near_duplicate_is_similar(self):
+        """Test a lightly edited copy keeps a high estimated Jaccard."""
+        hasher = MinHasher()
+        assert similarity(hasher.signature(TESTIMONY), hasher.signature(NOISY)) >= 0.8
+
+    def test_case_and_accents_ignored(self):
+        """Test shingles are built on folded text."""
+        hasher = MinHasher()
+        assert similarity(hasher.signature(TESTIMONY), hasher.signature(TESTIMONY.upper())) == 1.0
+
+    def test_different_text_is_dissimilar(self):
+        """Test unrelated documents score low."""
+        hasher = MinHasher()
+        assert similarity(hasher.signature(TESTIMONY), hasher.signature(OTHER)) < 0.2
+
+    def test_short_text_has_no_signature(self):
+        """Test texts with too few shingles are not indexed."""
+        assert MinHasher().signature("Sin información.") is None
+
+    def test_one_bucket_per_band(self):
+        """Test band buckets fit SQLite signed 64-bit integers."""
+        buckets = band_buckets(MinHasher().signature(TESTIMONY))
+        assert len(buckets) == dedup.BANDS
+        assert all(-(1 << 63) <= b < (1 << 63) for b in buckets)
+
+
+class TestIndex:
+    """Test suite for DedupIndex."""
+
+    def test_query_finds_near_duplicate(self, index):
+        """Test a noisy copy matches the indexed original."""
+        key = index.add(index.signature(TESTIMONY), input="a.txt")
+        match = index.query(index.signature(NOISY))
+        assert match.key == key
+        assert match.input == "a.txt"
+        assert match.similarity >= index.threshold
+        assert match.classification is None
+
+    def test_query_misses_other_documents(self, index):
+        """Test unrelated documents are not returned."""
+        index.add(index.signature(TESTIMONY))
+        assert index.query(index.signature(OTHER)) is None
+        assert index.query(None) is None
+        assert index.stats()["lookups"] == 1  # sin firma no se consulta
+
+    def test_update_get_and_remove(self, index):
+        """Test an entry is completed with ids and classification, then removed."""
+        key = index.add(index.signature(TESTIMONY))
+        index.update(key, "doc-1", "run-1", {"tipo_documento": "TD1"})
+        index.update(key, classification=None)  # no borra lo ya guardado
+        entry = index.get(key)
+        assert (entry.doc_id, entry.run_id) == ("doc-1", "run-1")
+        assert entry.classification == {"tipo_documento": "TD1"}
+        index.remove(key)
+        assert index.get(key) is None
+        assert len(index) == 0
+        assert index.query(index.signature(TESTIMONY)) is None
+
+    def test_persists_across_reopen(self, tmp_path):
+        """Test the SQLite file keeps entries between processes."""
+        path = str(tmp_path / "dedup.sqlite")
+        first = DedupIndex(path)
+        first.add(first.signature(TESTIMONY), input="a.txt", doc_id="doc-1")
+        first.close()
+        second = DedupIndex(path)
+        try:
+            match = second.query(second.signature(NOISY))
+            assert match.doc_id == "doc-1"
+        finally:
+            second.close()
+
+    def test_invalid_threshold(self):
+        """Test the threshold must be a similarity in (0, 1]."""
+        with pytest.raises(ValueError):
+            DedupIndex(":memory:", threshold=0)
+
+    def test_env_configuration(self, tmp_path, monkeypatch):
+        """Test UBPD_DEDUP_PATH enables the process index."""
+        dedup.set_dedup_index(None)
+        monkeypatch.delenv("UBPD_DEDUP_PATH", raising=False)
+        assert dedup.get_dedup_index() is None
+        monkeypatch.setenv("UBPD_DEDUP_PATH", str(tmp_path / "d.sqlite"))
+        monkeypatch.setenv("UBPD_DEDUP_THRESHOLD", "0.9")
+        try:
+            assert dedup.get_dedup_index().threshold == 0.9
+        finally:
+            dedup.get_dedup_index().close()
+            dedup.set_dedup_index(None)
+
+
+def _counting_engine(seen, ontology_hash=None, prompt_hash=None, model_name=None):
+    """Fake classify_documents_async recording the texts it receives."""
+    async def fake(texts, concurrency=1, source_system=None):
+        seen.extend(texts)
+        classification = {"tipo_documento": "TD1",
+                          "ontology_hash": ontology_hash or get_ontology().version,
+                          "prompt_hash": prompt_hash or prompt_version()}
+        if model_name:
+            classification["model_name"] = model_name
+        return [{"index": i, "classification": dict(classification),
+                 "error": None, "elapsed_ms": 10.0} for i in range(len(texts))]
+    return fake
+
+
+class TestRunBatchDedup:
+    """Test suite for near-duplicate handling in run_batch."""
+
+    def _write(self, tmp_path, docs):
+        for name, text in docs.items():
+            (tmp_path / name).write_text(text, encoding="utf-8")
+        return list(iter_input_dir(str(tmp_path)))
+
+    def test_duplicates_skip_the_model(self, tmp_path, index):
+        """Test copies in the same chunk reuse the original's result and ids."""
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        items = self._write(docs, {"a.txt": TESTIMONY, "b.txt": NOISY, "c.txt": OTHER})
+        seen, links = [], []
+
+        def fake_save(batch):
+            return [(f"doc-{i}", f"run-{i}") for i in range(len(batch))]
+
+        ckpt = tmp_path / "ckpt.jsonl"
+        with patch("runner.classify_documents_async", new=_counting_engine(seen)):
+            summary = run_batch(items, checkpoint_path=str(ckpt), save=fake_save,
+                                dedup=index, link=links.extend)
+        assert seen == [TESTIMONY, OTHER]
+        assert summary["processed"] == 3
+        assert summary["duplicates"] == 1
+        assert load_checkpoint(str(ckpt)) == {item["path"] for item in items}
+        assert links[0]["doc_id"] == "doc-0"
+        assert links[0]["filename"] == str(docs / "b.txt")
+        assert '"duplicate_of"' in ckpt.read_text(encoding="utf-8")
+
+    def test_later_run_reuses_index(self, tmp_path, index):
+        """Test a copy arriving in a later batch is not classified again."""
+        first = tmp_path / "first"
+        second = tmp_path / "second"
+        first.mkdir()
+        second.mkdir()
+        seen = []
+        with patch("runner.classify_documents_async", new=_counting_engine(seen)):
+            run_batch(self._write(first, {"a.txt": TESTIMONY}),
+                      checkpoint_path=str(tmp_path / "c1.jsonl"), dedup=index)
+            summary = run_batch(self._write(second, {"a.txt": NOISY}),
+                                checkpoint_path=str(tmp_path / "c2.jsonl"), dedup=index)
+        assert seen == [TESTIMONY]
+        assert summary["duplicates"] == 1
+
+    def test_stale_original_is_classified_again(self, tmp_path, index):
+        """Test a copy of a document classified under another ontology/prompt is not reused."""
+        first = tmp_path / "first"
+        second = tmp_path / "second"
+        third = tmp_path / "third"
+        for folder in (first, second, third):
+            folder.mkdir()
+        seen = []
+        with patch("runner.classify_documents_async", new=_counting_engine(seen, ontology_hash="anterior")):
+            run_batch(self._write(first, {"a.txt": TESTIMONY}),
+                      checkpoint_path=str(tmp_path / "c1.jsonl"), dedup=index)
+        with patch("runner.classify_documents_async", new=_counting_engine(seen)):
+            summary = run_batch(self._write(second, {"a.txt": NOISY}),
+                                checkpoint_path=str(tmp_path / "c2.jsonl"), dedup=index)
+            assert seen == [TESTIMONY, NOISY]
+            assert summary["duplicates"] == 0
+            # La nueva clasificación sustituye a la anterior en el índice
+            assert len(index) == 1
+            summary = run_batch(self._write(third, {"a.txt": TESTIMONY}),
+                                checkpoint_path=str(tmp_path / "c3.jsonl"), dedup=index)
+        assert seen == [TESTIMONY, NOISY]
+        assert summary["duplicates"] == 1
+
+    def test_original_from_another_model_is_classified_again(self, tmp_path, index):
+        """Test a copy is not reused after switching models."""
+        first = tmp_path / "first"
+        second = tmp_path / "second"
+        first.mkdir()
+        second.mkdir()
+        seen = []
+        with patch("runner.classify_documents_async", new=_counting_engine(seen, model_name="modelo-anterior")):
+            run_batch(self._write(first, {"a.txt": TESTIMONY}),
+                      checkpoint_path=str(tmp_path / "c1.jsonl"), dedup=index)
+        with patch("runner.classify_documents_async", new=_counting_engine(seen)):
+            summary = run_batch(self._write(second, {"a.txt": NOISY}),
+                                checkpoint_path=str(tmp_path / "c2.jsonl"), dedup=index)
+        assert seen == [TESTIMONY, NOISY]
+        assert summary["duplicates"] == 0
+
+    def test_failed_original_is_removed(self, tmp_path, index):
+        """Test a failed classification leaves no entry to match later."""
+        items = self._write(tmp_path, {"a.txt": TESTIMONY})
+
+        async def failing(texts, concurrency=1, source_system=None):
+            return [{"index": 0, "classification": None,
+                     "error": "RuntimeError: boom", "elapsed_ms": 5.0}]
+
+        with patch("runner.classify_documents_async", new=failing):
+            summary = run_batch(items, checkpoint_path=str(tmp_path / "ckpt.jsonl"), dedup=index)
+        assert summary["failures"] == 1
+        assert len(index) == 0
@@ -0,0 +1,163 @@
+"""
+test_gazetteer.py
+Unit tests for gazetteer.py module.
+Tests accent/case folding, territorial mention scanning with offsets,
+normalization of model output and integration with fix_territorio.
+"""
+
+import sys
+import time
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from gazetteer import Gazetteer, fold, get_gazetteer, load_entries
+from classifier import fix_territorio, validate_and_fix
+
+
+@pytest.fixture
+def small_gazetteer():
+    """Gazetteer with a handful of departments and municipalities."""
+    return Gazetteer(
+        ["Antioquia", "Cauca", "Valle del Cauca", "Meta", "Bogotá", "Córdoba"],
+        [
+            ("Meta", "Meta", "departamento", True),
+            ("Medellín", "Antioquia", "municipio", False),
+            ("Bogotá D.C.", "Bogotá", "alias", False),
+            ("Valle", "Valle del Cauca", "alias", True),
+            ("San Carlos", "Antioquia", "municipio", False),
+            ("San Carlos", "Córdoba", "municipio", False),
+        ],
+    )
+
+
+class TestFold:
+    """Test suite for fold."""
+
+    def test_removes_accents_and_case(self):
+        """Test accents and uppercase are folded."""
+        assert fold("BOGOTÁ Nariño Quindío") == "bogota narino quindio"
+
+    def test_preserves_length(self):
+        """Test folding never changes string length (offsets stay valid)."""
+        text = "Ñuñoa, İstanbul, Chocó 😀 ÀÉÎÕÜ"
+        assert len(fold(text)) == len(text)
+
+
+class TestScan:
+    """Test suite for Gazetteer.scan and departments."""
+
+    def test_offsets_point_into_original_text(self, small_gazetteer):
+        """Test returned offsets slice the original (unfolded) text."""
+        text = "Vivíamos en Medellín, ANTIOQUIA, y luego en Bogotá D.C."
+        matches = small_gazetteer.scan(text)
+        assert [text[m.start:m.end] for m in matches] == ["Medellín", "ANTIOQUIA", "Bogotá D.C."]
+        assert [m.text for m in matches] == ["Medellín", "ANTIOQUIA", "Bogotá D.C."]
+
+    def test_longest_name_wins(self, small_gazetteer):
+        """Test 'Valle del Cauca' is not reported as 'Cauca'."""
+        assert small_gazetteer.departments("en el Valle del Cauca") == ["Valle del Cauca"]
+
+    def test_municipality_implies_department(self, small_gazetteer):
+        """Test municipalities map to their department."""
+        [match] = small_gazetteer.scan("Salimos hacia Medellin")
+        assert match.department == "Antioquia"
+        assert match.kind == "municipio"
+
+    def test_ambiguous_municipality_ignored(self, small_gazetteer):
+        """Test a municipality in several departments implies none."""
+        assert small_gazetteer.departments("Vivía en San Carlos") == []
+
+    def test_capitalized_only_names(self, small_gazetteer):
+        """Test names that are common words need an uppercase initial."""
+        assert small_gazetteer.departments("la meta era llegar al valle") == []
+        assert small_gazetteer.departments("llegamos al Meta y luego al Valle") == ["Meta", "Valle del Cauca"]
+
+    def test_word_boundaries(self, small_gazetteer):
+        """Test names inside longer words are not matched."""
+        assert small_gazetteer.departments("metabolismo caucano") == []
+
+    def test_adjacent_punctuation(self, small_gazetteer):
+        """Test consecutive names separated only by punctuation."""
+        assert small_gazetteer.departments("Cauca,Antioquia;Meta") == ["Cauca", "Antioquia", "Meta"]
+
+    def test_departments_deduplicated_in_order(self, small_gazetteer):
+        """Test each department is reported once, by first mention."""
+        text = "Cauca. Medellín. Antioquia. Cauca."
+        assert small_gazetteer.departments(text) == ["Cauca", "Antioquia"]
+
+    def test_multi_megabyte_document(self):
+        """Test a ~4 MB document is scanned in a single fast pass."""
+        gazetteer = get_gazetteer()
+        text = ("Relato sin lugares concretos durante varios años. " * 80_000) + "Fin en Tumaco."
+        start = time.perf_counter()
+        departments = gazetteer.departments(text)
+        assert departments == ["Nariño"]
+        assert time.perf_counter() - start < 2.0
+
+
+class TestResolve:
+    """Test suite for Gazetteer.resolve (model output normalization)."""
+
+    def test_case_and_accents(self, small_gazetteer):
+        """Test unnormalized names resolve to the canonical form."""
+        assert small_gazetteer.resolve(" antioquia ") == ["Antioquia"]
+        assert small_gazetteer.resolve("BOGOTA") == ["Bogotá"]
+
+    def test_alias_ignores_capitalization_rule(self, small_gazetteer):
+        """Test exact lookups of aliases are case-insensitive."""
+        assert small_gazetteer.resolve("valle") == ["Valle del Cauca"]
+
+    def test_embedded_names(self, small_gazetteer):
+        """Test values like 'Medellín, Antioquia' resolve to departments."""
+        assert small_gazetteer.resolve("Medellín, Antioquia") == ["Antioquia"]
+
+    def test_unknown(self, small_gazetteer):
+        """Test unknown names resolve to nothing."""
+        assert small_gazetteer.resolve("Venezuela") == []
+
+
+class TestDataFile:
+    """Test suite for the bundled municipalities file."""
+
+    def test_entries_reference_ontology_departments(self):
+        """Test every row points to a department of the real ontology."""
+        from ontology import load_ontology
+        departments = set(load_ontology()["territorio"]["departments"])
+        entries = load_entries(Path(__file__).parent.parent / "src" / "ubpd_classifier" / "gazetteer_municipios.tsv")
+        assert entries
+        assert {department for _, department, _, _ in entries} <= departments
+
+    def test_default_gazetteer(self):
+        """Test the shared gazetteer knows departments and municipalities."""
+        gazetteer = get_gazetteer()
+        assert gazetteer.resolve("Quibdó") == ["Chocó"]
+        assert gazetteer.resolve("norte de santander") == ["Norte de Santander"]
+
+
+class TestFixTerritorioNormalization:
+    """Test suite for gazetteer-backed fix_territorio."""
+
+    def test_normalizes_model_output(self):
+        """Test lowercase/unaccented/alias names become canonical."""
+        assert fix_territorio(["antioquia", "Valle", "bogota"]) == ["Antioquia", "Valle del Cauca", "Bogotá"]
+
+    def test_drops_unknown_values(self):
+        """Test names outside the gazetteer are dropped."""
+        assert fix_territorio(["Venezuela", "Cauca"]) == ["Cauca"]
+        assert fix_territorio(["Venezuela"]) == ["No identificado"]
+
+    def test_prefill_from_text(self):
+        """Test territorio is filled from the document when the model gave none."""
+        assert fix_territorio([], "Nos desplazaron de Tumaco en 2004.") == ["Nariño"]
+
+    def test_model_values_take_precedence_over_text(self):
+        """Test the text is only used when no model value resolves."""
+        assert fix_territorio(["Cauca"], "Salimos de Tumaco.") == ["Cauca"]
+
+    def test_validate_and_fix_uses_text(self):
+        """Test validate_and_fix passes the document text through."""
+        result = validate_and_fix({"territorio": []}, "Llegaron a Quibdó.")
+        assert result["territorio"] == ["Chocó"]
@@ -0,0 +1,197 @@
+"""
+test_headers.py
+Unit tests for headers.py module.
+Tests learning of repeated header/footer lines across pages, configured
+patterns per source_system, the removal report and the integration with
+preprocess_text.
+"""
+
+import sys
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import headers
+from headers import (
+    HeaderFooterEngine,
+    HeaderRules,
+    fingerprint_pattern,
+    fingerprint_text,
+    learn_repeated_lines,
+    load_header_rules,
+)
+from preprocessing import preprocess_text
+
+
+HEADER = "UNIDAD DE BÚSQUEDA DE PERSONAS DADAS POR DESAPARECIDAS"
+FOOTER = "Av. Calle 40A No. 13-09, Bogotá D.C. - Tel. 3770607"
+
+BODIES = [
+    "En 1998 llegaron hombres armados a la vereda.\nSe llevaron a mi hermano.",
+    "Pusimos la denuncia en la Personería.\nNadie nos dio razón.",
+    "Lo seguimos buscando en hospitales.\nMi mamá murió esperando noticias.",
+    "Volvimos años después.\nLa casa estaba destruida.",
+]
+
+
+def _paged_document() -> str:
+    pages = [
+        f"{HEADER}\nRadicado 2023-{1000 + n}\n\n{body}\n\n{FOOTER}\nPágina {n + 1} de {len(BODIES)}\n"
+        for n, body in enumerate(BODIES)
+    ]
+    return "\f".join(pages)
+
+
+@pytest.fixture
+def engine():
+    return HeaderFooterEngine(load_header_rules())
+
+
+class TestLearning:
+    """Test suite for repeated-line learning."""
+
+    def test_fingerprint_ignores_numbers_and_spacing(self):
+        """Test page numbers and spacing do not change the fingerprint."""
+        assert fingerprint_text("Página 3  de 10") == fingerprint_text("Página 12 de 10")
+
+    def test_fingerprint_pattern_matches_other_numbers(self):
+        """Test the learned pattern matches the line with any numbers."""
+        import re
+        pattern = re.compile(fingerprint_pattern(fingerprint_text("Radicado 2023-1001")))
+        assert pattern.fullmatch("Radicado 2024-77")
+        assert not pattern.fullmatch("Radicado sin número")
+
+    def test_learns_page_edges(self):
+        """Test header, footer and numbered lines are learned, not the body."""
+        learned = learn_repeated_lines(_paged_document())
+        assert fingerprint_text(HEADER) in learned
+        assert fingerprint_text(FOOTER) in learned
+        assert fingerprint_text("Radicado 2023-1001") in learned
+        assert not any("hermano" in line for line in learned)
+
+    def test_unpaged_learns_nothing(self):
+        """Test without page breaks repeated lines are not learned."""
+        text = "\n".join([f"{HEADER}\nTexto {i} distinto del resto." for i in range(5)])
+        assert learn_repeated_lines(text) == set()
+
+    def test_dialogue_markers_are_not_learned(self):
+        """Test short single-word lines like CONTESTÓ: are kept."""
+        answers = ["En la finca.", "Con mi mamá.", "Un martes.", "No sé.", "Nunca más volvió."]
+        text = "\n".join(f"PREGUNTADO:\n¿Pregunta?\nCONTESTÓ:\n{answer}" for answer in answers)
+        assert learn_repeated_lines(text) == set()
+
+
+class TestEngine:
+    """Test suite for HeaderFooterEngine."""
+
+    def test_strips_headers_and_footers(self, engine):
+        """Test every page keeps its body and loses header and footer."""
+        out = engine.strip(_paged_document())
+        for body in BODIES:
+            assert body in out
+        assert HEADER not in out and FOOTER not in out
+        assert "Página" not in out and "Radicado" not in out
+        assert out.count("\f") == len(BODIES) - 1
+
+    def test_report_counts_removed_text(self, engine):
+        """Test the report counts lines, UTF-8 bytes and tokens removed."""
+        doc = _paged_document()
+        out, report = engine.strip_with_report(doc)
+        assert report.lines_removed == 4 * len(BODIES)
+        assert report.bytes_removed == len(doc.encode("utf-8")) - len(out.encode("utf-8"))
+        assert report.tokens_removed > 0
+        assert engine.as_dict()["bytes_removed"] == report.bytes_removed
+        assert 0 < engine.as_dict()["removed_ratio"] < 1
+
+    def test_merge_counters(self, engine):
+        """Test totals from another engine (a pool worker) are added."""
+        other = HeaderFooterEngine(load_header_rules())
+        other.strip_with_report(_paged_document())
+        engine.merge(other.counters())
+        engine.merge(other.counters())
+        assert engine.counters() == {name: 2 * value for name, value in other.counters().items()}
+
+    def test_default_page_number_patterns(self, engine):
+        """Test bare page numbers are removed even without repetition."""
+        assert engine.strip("Primera frase.\n- 3 -\nSegunda frase.\n4/10") == "Primera frase.\nSegunda frase."
+
+    def test_bare_page_numbers_only_at_page_edges(self, engine):
+        """Test a "12/05" line in the middle of a testimony is a date, not a page number."""
+        middle = "\n".join(f"Frase {i}." for i in range(4))
+        text = f"Encabezado.\nPrimera frase.\n{middle}\n12/05\n{middle}\nÚltima frase.\n3/10"
+        out = engine.strip(text)
+        assert "\n12/05\n" in out
+        assert not out.endswith("3/10")
+
+    def test_page_patterns_stay_on_one_line(self, engine):
+        """Test configured patterns do not join a number with the next line."""
+        text = "Primera frase.\nPágina\n3\nSegunda frase."
+        assert engine.strip(text) == text
+
+    def test_transcript_answers_kept(self, engine):
+        """Test repeated answers and standalone years in a Q/A transcript survive."""
+        text = (
+            "P: ¿En qué año se lo llevaron?\n1997\n"
+            "P: ¿Quién se lo llevó?\nR: No me acuerdo bien.\n"
+            "P: ¿A qué hora?\nR: No me acuerdo bien.\n"
+            "P: ¿Denunció?\nR: No me acuerdo bien.\n"
+            "- 2 -"
+        )
+        out = preprocess_text(text)
+        assert "1997" in out
+        assert out.count("R: No me acuerdo bien.") == 3
+        assert "- 2 -" not in out
+        assert engine.strip(text) == text[:-len("\n- 2 -")]
+
+    def test_learned_lines_only_removed_at_page_edges(self, engine):
+        """Test a learned line repeated in the middle of a page is kept there."""
+        answer = "R: No me acuerdo bien."
+        body = "\n".join(f"P: Pregunta {i}.\n{answer}" for i in range(4))
+        pages = [
+            f"{answer}\nActa de entrevista {n}\n\n{body}\nSe lee el acta.\nSe firma.\n\nFin de la página {n}"
+            for n in range(3)
+        ]
+        out = engine.strip("\f".join(pages))
+        assert out.count(answer) == 3 * 4
+        assert "Acta de entrevista" not in out and "Fin de la página" not in out
+
+    def test_plain_text_unchanged(self, engine):
+        """Test text without boilerplate passes through unchanged."""
+        text = "Mi nombre es Rosa.\nEn 1998 se llevaron a mi esposo."
+        assert engine.strip(text) == text
+
+    def test_source_specific_patterns(self):
+        """Test per-source patterns only apply to that source_system."""
+        rules = HeaderRules(sources={"ORFEO": [r"al contestar cite este n[úu]mero"]})
+        engine = HeaderFooterEngine(rules, learn=False)
+        text = "Al contestar cite este número\nCuerpo del oficio."
+        assert engine.strip(text, "ORFEO") == "Cuerpo del oficio."
+        assert engine.strip(text, "OTRA") == text
+
+    def test_invalid_pattern(self):
+        """Test invalid configured regexes are rejected when loading."""
+        with pytest.raises(ValueError):
+            HeaderRules(default=["(sin cerrar"])
+
+
+class TestPreprocessing:
+    """Test suite for the preprocess_text integration."""
+
+    def test_preprocess_removes_boilerplate(self):
+        """Test preprocess_text strips headers before collapsing spaces."""
+        clean = preprocess_text(_paged_document())
+        assert HEADER not in clean
+        assert "Se llevaron a mi hermano." in clean
+
+    def test_env_rules_file(self, tmp_path, monkeypatch):
+        """Test UBPD_HEADER_RULES loads another rules file."""
+        path = tmp_path / "rules.yaml"
+        path.write_text("default:\n  - 'confidencial'\n", encoding="utf-8")
+        monkeypatch.setenv("UBPD_HEADER_RULES", str(path))
+        headers.set_header_engine(None)
+        try:
+            assert preprocess_text("CONFIDENCIAL\nTexto") == "Texto"
+        finally:
+            headers.set_header_engine(None)
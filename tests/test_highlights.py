@@ -0,0 +1,100 @@
+"""
+test_highlights.py
+Unit tests for highlights.py module.
+Tests exact and fuzzy location of model highlights, the mapping back to the
+original (pre-preprocessing) text and the resolution statistics.
+"""
+
+import sys
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from highlights import EXACT, FUZZY, HighlightLocator, locate_in_clean
+
+
+HEADER = "UNIDAD DE BÚSQUEDA DE PERSONAS DADAS POR DESAPARECIDAS"
+DOC = (
+    f"{HEADER}\nEn 1997, en San Carlos,   Antioquia,\nllegaron hombres armados.\nPágina 1\f"
+    f"{HEADER}\nSe llevaron a mi esposo y nunca volvió.\nPágina 2\f"
+    f"{HEADER}\nPusimos la denuncia en la Personería.\nPágina 3"
+)
+
+
+@pytest.fixture
+def locator():
+    return HighlightLocator()
+
+
+class TestLocateInClean:
+    """Test suite for locating snippets in preprocessed text."""
+
+    def test_exact_match(self):
+        """Test a verbatim snippet is found with str.find."""
+        clean = "Se llevaron a mi esposo y nunca volvió."
+        [span] = locate_in_clean(clean, ["mi esposo"])
+        assert clean[span.start:span.end] == "mi esposo"
+        assert span.method == EXACT
+
+    def test_fuzzy_accent_case_and_spacing(self):
+        """Test accent, case, quote and spacing drift is found approximately."""
+        clean = "Se llevaron a mi esposo y nunca volvió."
+        [span] = locate_in_clean(clean, ['"Y NUNCA  VOLVIO..."'])
+        assert span.method == FUZZY
+        assert clean[span.start:span.end] == "y nunca volvió"
+
+    def test_missing_and_short_snippets(self):
+        """Test absent snippets and short non-verbatim ones stay unresolved."""
+        clean = "Se llevaron a mi esposo y nunca volvió."
+        assert locate_in_clean(clean, ["otra cosa distinta del texto", "ESPOSO", ""]) == [None, None, None]
+
+    def test_fuzzy_gap_is_bounded(self):
+        """Test words far apart in the text do not match."""
+        clean = "llegaron " + "x" * 50 + " hombres armados"
+        assert locate_in_clean(clean, ["llegaron hombres armados"]) == [None]
+
+
+class TestHighlightLocator:
+    """Test suite for offsets in the original document."""
+
+    def test_offsets_in_original_text(self, locator):
+        """Test snippets map to spans of the raw text across removed headers."""
+        spans = locator.locate(DOC, ["San Carlos, Antioquia, llegaron", "mi esposo", "la personeria"])
+        assert DOC[spans[0].start:spans[0].end] == "San Carlos,   Antioquia,\nllegaron"
+        assert DOC[spans[1].start:spans[1].end] == "mi esposo"
+        assert spans[2] is None
+
+    def test_fuzzy_offsets_in_original_text(self, locator):
+        """Test a fuzzy match maps back to the original characters."""
+        [span] = locator.locate(DOC, ["pusimos la denuncia en la personeria"])
+        assert span.method == FUZZY
+        assert DOC[span.start:span.end] == "Pusimos la denuncia en la Personería"
+
+    def test_stats(self, locator):
+        """Test resolution rate and time per MB are accumulated."""
+        locator.locate(DOC, ["mi esposo", "Nunca volvio a la casa", "no existe en el documento"])
+        locator.locate(DOC, [])
+        stats = locator.as_dict()
+        assert stats["docs"] == 2
+        assert (stats["exact"], stats["fuzzy"], stats["unresolved"]) == (1, 0, 2)
+        assert stats["resolution_rate"] == pytest.approx(1 / 3)
+        assert stats["ms_per_mb"] > 0
+
+    def test_merge_counters(self, locator):
+        """Test totals from another locator (a pool worker) are added."""
+        other = HighlightLocator()
+        other.locate(DOC, ["mi esposo", "no existe en el documento"])
+        locator.locate(DOC, ["la denuncia"])
+        locator.merge(other.counters())
+        stats = locator.as_dict()
+        assert (stats["docs"], stats["snippets"], stats["exact"], stats["unresolved"]) == (2, 3, 2, 1)
+
+    def test_headers_not_counted(self, locator):
+        """Test locating does not add to the header removal totals."""
+        import headers
+        engine = headers.get_header_engine()
+        before = engine.as_dict()["docs"]
+        locator.locate(DOC, ["mi esposo"])
+        assert engine.as_dict()["docs"] == before
@@ -0,0 +1,304 @@
+"""
+test_jobs.py
+Unit tests for jobs.py module.
+Tests the PostgreSQL work queue statements with a fake connection (no
+PostgreSQL needed) and the worker loop with an in-memory queue: batches,
+retries, lost leases, lease renewal and database errors.
+"""
+
+import asyncio
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import db
+import jobs
+import psycopg2
+from jobs import CLAIM_SQL, RETRY_FAILED_SQL, Job, PostgresJobQueue, work
+
+
+class FakeCursor:
+    """Cursor recording statements and serving queued fetchall results."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((" ".join(sql.split()), params))
+        self.rowcount = self.conn.rowcount
+
+    def fetchall(self):
+        return self.conn.results.pop(0) if self.conn.results else []
+
+
+class FakeConnection:
+    def __init__(self, results=(), rowcount=0):
+        self.statements = []
+        self.bulk = []
+        self.results = list(results)
+        self.rowcount = rowcount
+        self.transactions = 0
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def fake_conn():
+    conn = FakeConnection()
+
+    @contextmanager
+    def connection():
+        yield conn
+
+    def fake_execute_values(cur, sql, rows, template=None, page_size=None, fetch=False):
+        conn.bulk.append((" ".join(sql.split()), list(rows)))
+        return [row[:1] for row in rows] if fetch else None
+
+    with patch.object(db, "connection", connection), \
+         patch.object(db, "execute_values", side_effect=fake_execute_values), \
+         patch.object(jobs, "execute_values", side_effect=fake_execute_values):
+        yield conn
+
+
+def _job(job_id, attempts=1, text="texto del documento"):
+    return Job(job_id, f"00000000-0000-0000-0000-{job_id:012d}", attempts, text, "SRC")
+
+
+class TestPostgresJobQueue:
+    """Test suite for the queue statements."""
+
+    def test_claim_skips_locked_rows(self, fake_conn):
+        """Test claim expires exhausted leases, then claims with SKIP LOCKED."""
+        fake_conn.results = [[(2, "doc-2", 1, "b", "SRC"), (1, "doc-1", 2, "a", None)]]
+        queue = PostgresJobQueue(worker_id="w1", lease_s=60)
+        claimed = queue.claim(10)
+        assert [job.job_id for job in claimed] == [1, 2]
+        assert claimed[0].attempts == 2
+        expire, claim = fake_conn.statements
+        assert expire[0].startswith("UPDATE doc_job SET status = 'failed'")
+        assert claim[1] == {"limit": 10, "worker": "w1", "lease_s": 60}
+        assert fake_conn.transactions == 1
+        assert "FOR UPDATE SKIP LOCKED" in CLAIM_SQL
+
+    def test_enqueue_texts_one_transaction(self, fake_conn):
+        """Test documents and their jobs are written together."""
+        queue = PostgresJobQueue(max_attempts=5)
+        doc_ids = queue.enqueue_texts([{"text": "uno"}, {"text": "dos", "source_system": "A"}])
+        assert len(doc_ids) == 2
+        [(sql, rows)] = fake_conn.bulk
+        assert sql.startswith("INSERT INTO doc_document")
+        assert [row[0] for row in rows] == doc_ids
+        assert rows[1][2] == "A"
+        enqueue = fake_conn.statements[-1]
+        assert "INSERT INTO doc_job" in enqueue[0]
+        assert enqueue[1] == (doc_ids, 5)
+        assert fake_conn.transactions == 1
+
+    def test_complete_writes_runs_and_marks_done(self, fake_conn, valid_classification_response):
+        """Test results and job status are written in one transaction."""
+        fake_conn.results = [[(1,), (2,)]]
+        queue = PostgresJobQueue(worker_id="w1")
+        done = queue.complete([(_job(1), valid_classification_response), (_job(2), valid_classification_response)])
+        assert sorted(done) == [1, 2]
+        statements = [sql for sql, _ in fake_conn.statements]
+        assert "FOR UPDATE" in statements[0]
+        assert statements[1].startswith("UPDATE doc_classification_run SET is_active = FALSE")
+        runs = [rows for sql, rows in fake_conn.bulk if sql.startswith("INSERT INTO doc_classification_run ")][0]
+        assert [row[0] for row in runs] == [done[1], done[2]]
+        complete = [rows for sql, rows in fake_conn.bulk if "SET status = 'done'" in sql][0]
+        assert complete == [(1, done[1]), (2, done[2])]
+        assert fake_conn.transactions == 1
+
+    def test_complete_drops_lost_jobs(self, fake_conn, valid_classification_response):
+        """Test a job retaken by another worker is not written."""
+        fake_conn.results = [[(2,)]]
+        queue = PostgresJobQueue(worker_id="w1")
+        done = queue.complete([(_job(1), valid_classification_response), (_job(2), valid_classification_response)])
+        assert list(done) == [2]
+        runs = [rows for sql, rows in fake_conn.bulk if sql.startswith("INSERT INTO doc_classification_run ")][0]
+        assert [row[1] for row in runs] == [_job(2).doc_id]
+
+    def test_complete_nothing_owned(self, fake_conn, valid_classification_response):
+        """Test nothing is written when every lease was lost."""
+        fake_conn.results = [[]]
+        assert PostgresJobQueue().complete([(_job(1), valid_classification_response)]) == {}
+        assert fake_conn.bulk == []
+
+    def test_fail_rows_carry_worker_and_backoff(self, fake_conn):
+        """Test failures are released only for this worker's leases."""
+        queue = PostgresJobQueue(worker_id="w1", retry_base_s=10)
+        assert queue.fail([(_job(1), "RuntimeError: x")]) == 1
+        [(sql, rows)] = fake_conn.bulk
+        assert "power(2, j.attempts - 1)" in sql
+        assert rows == [(1, "RuntimeError: x", "w1", 10)]
+
+    def test_empty_inputs_skip_the_database(self, fake_conn):
+        """Test empty batches do not open a transaction."""
+        queue = PostgresJobQueue()
+        assert queue.enqueue_texts([]) == []
+        assert queue.enqueue_documents([]) == 0
+        assert queue.complete([]) == {}
+        assert queue.fail([]) == 0
+        assert fake_conn.transactions == 0
+
+    def test_retry_failed_reopens_latest_job_per_document(self, fake_conn):
+        """Test only the newest failed job of each document is reopened."""
+        fake_conn.rowcount = 2
+        assert PostgresJobQueue().retry_failed() == 2
+        [(sql, _)] = fake_conn.statements
+        assert sql == " ".join(RETRY_FAILED_SQL.split())
+        assert "SELECT DISTINCT ON (doc_id) job_id FROM doc_job WHERE status = 'failed'" in sql
+        assert "ORDER BY doc_id, job_id DESC" in sql
+        assert "WHERE j.job_id = latest.job_id" in sql
+
+    def test_invalid_settings(self):
+        """Test lease and attempts are validated."""
+        with pytest.raises(ValueError):
+            PostgresJobQueue(lease_s=0)
+        with pytest.raises(ValueError):
+            PostgresJobQueue(max_attempts=0)
+
+
+class MemoryQueue:
+    """In-memory queue with the PostgresJobQueue interface."""
+
+    def __init__(self, texts, lease_s=300.0, lose=()):
+        self.worker_id = "mem"
+        self.lease_s = lease_s
+        self.pending = [_job(n + 1, text=text) for n, text in enumerate(texts)]
+        self.lose = set(lose)
+        self.completed, self.failed, self.extended = [], [], 0
+
+    def claim(self, limit):
+        batch, self.pending = self.pending[:limit], self.pending[limit:]
+        return batch
+
+    def extend(self, jobs):
+        self.extended += 1
+        return len(jobs)
+
+    def complete(self, results):
+        self.completed.extend(results)
+        return {job.job_id: f"run-{job.job_id}" for job, _ in results if job.job_id not in self.lose}
+
+    def fail(self, failures):
+        self.failed.extend(failures)
+        return len(failures)
+
+
+class FlakyQueue(MemoryQueue):
+    """MemoryQueue whose operations raise a database error the first times."""
+
+    def __init__(self, texts, errors):
+        super().__init__(texts)
+        self.errors = dict(errors)  # operación -> veces que falla
+
+    def _maybe_fail(self, name):
+        if self.errors.get(name, 0):
+            self.errors[name] -= 1
+            raise psycopg2.OperationalError(f"{name}: server closed the connection")
+
+    def claim(self, limit):
+        self._maybe_fail("claim")
+        return super().claim(limit)
+
+    def complete(self, results):
+        self._maybe_fail("complete")
+        return super().complete(results)
+
+
+class TestWorker:
+    """Test suite for the worker loop."""
+
+    def test_processes_until_empty(self):
+        """Test every job is classified, completed or failed."""
+        async def classify(text, source_system=None):
+            if text == "malo":
+                raise RuntimeError("boom")
+            return {"tipo_documento": "TD1"}
+
+        queue = MemoryQueue(["a", "malo", "b", "c", "d"])
+        stats = asyncio.run(work(queue, batch_size=2, concurrency=2, until_empty=True, classify=classify))
+        assert stats["batches"] == 3
+        assert stats["done"] == 4
+        assert stats["failed"] == 1
+        assert queue.failed[0][1] == "RuntimeError: boom"
+        assert all(c["model_name"] for _, c in queue.completed)
+
+    def test_counts_lost_leases(self):
+        """Test results discarded by complete() are reported as lost."""
+        async def classify(text, source_system=None):
+            return {}
+
+        queue = MemoryQueue(["a", "b"], lose={2})
+        stats = asyncio.run(work(queue, batch_size=5, until_empty=True, classify=classify))
+        assert (stats["done"], stats["lost"]) == (1, 1)
+
+    def test_concurrency_bound(self):
+        """Test no more than `concurrency` classifications run at once."""
+        active, peak = 0, 0
+
+        async def classify(text, source_system=None):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return {}
+
+        queue = MemoryQueue([str(n) for n in range(12)])
+        asyncio.run(work(queue, batch_size=12, concurrency=3, until_empty=True, classify=classify))
+        assert peak == 3
+
+    def test_renews_lease_while_classifying(self):
+        """Test the lease is extended during a slow batch."""
+        async def classify(text, source_system=None):
+            await asyncio.sleep(0.1)
+            return {}
+
+        queue = MemoryQueue(["a"], lease_s=0.06)
+        asyncio.run(work(queue, until_empty=True, classify=classify))
+        assert queue.extended >= 2
+
+    def test_max_batches(self):
+        """Test the worker stops after max_batches."""
+        async def classify(text, source_system=None):
+            return {}
+
+        queue = MemoryQueue(["a", "b", "c"])
+        stats = asyncio.run(work(queue, batch_size=1, max_batches=2, classify=classify))
+        assert stats["batches"] == 2
+        assert len(queue.pending) == 1
+
+    def test_database_errors_do_not_stop_the_worker(self):
+        """Test claim/complete errors are logged, backed off and the loop goes on."""
+        async def classify(text, source_system=None):
+            return {}
+
+        queue = FlakyQueue(["a", "b", "c"], {"claim": 2, "complete": 1})
+        stats = asyncio.run(work(queue, batch_size=1, until_empty=True, poll_s=0, classify=classify))
+        assert stats["db_errors"] == 3
+        assert stats["batches"] == 3
+        # El lote que no se pudo guardar se retoma cuando vence su lease
+        assert (stats["done"], stats["lost"]) == (2, 1)
@@ -1,17 +1,55 @@
 """
 test_ontology.py
 Unit tests for ontology.py module.
-Tests ontology loading and conversion to prompt text.
+Tests ontology loading, conversion to prompt text, the compiled ontology,
+its binary cache and hot reload.
 """
 
+import os
+import pickle
+import shutil
 import sys
+import time
 from pathlib import Path
 import pytest
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
 
-from ontology import load_ontology, ontology_to_prompt_text
+from ontology import (
+    CompiledOntology,
+    OntologyReloader,
+    cache_path_for,
+    load_compiled_ontology,
+    load_ontology,
+    ontology_to_prompt_text,
+    ontology_version,
+)
+
+ONTOLOGY_YAML = Path(__file__).parent.parent / "src" / "ubpd_classifier" / "ontology_ubpd.yaml"
+
+
+@pytest.fixture
+def ontology_file(tmp_path):
+    """Private copy of the real ontology YAML."""
+    path = tmp_path / "ontology.yaml"
+    shutil.copy(ONTOLOGY_YAML, path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def private_cache_dir(tmp_path, monkeypatch):
+    """Binary caches go to a per-test directory."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("UBPD_ONTOLOGY_CACHE_DIR", str(path))
+    return path
+
+
+def _touch_with(path, text):
+    """Rewrite a file and push its mtime forward so the change is visible."""
+    stat = path.stat()
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
 
 
 class TestLoadOntology:
@@ -177,3 +215,188 @@ class TestOntologyToPromptText:
         assert "'" not in result or result.count("'") == 0
         # Should be clean and simple
         assert len(result) > 50  # Not empty or trivial
+
+
+class TestCompiledOntology:
+    """Test suite for CompiledOntology."""
+
+    def test_frozensets_per_dimension(self, sample_ontology):
+        """Test each dimension is a frozenset of its codes."""
+        compiled = CompiledOntology(sample_ontology)
+        assert compiled.tipo_documento == frozenset(sample_ontology["tipo_documento"])
+        assert isinstance(compiled.ruteo, frozenset)
+        assert compiled.codes("actores") == frozenset(sample_ontology["actores"])
+
+    def test_unknown_dimension(self, sample_ontology):
+        """Test codes() rejects unknown dimensions."""
+        with pytest.raises(KeyError):
+            CompiledOntology(sample_ontology).codes("territorio")
+
+    def test_codes_are_interned(self, sample_ontology):
+        """Test code strings are interned."""
+        compiled = CompiledOntology(sample_ontology)
+        code = next(iter(compiled.tipo_hecho))
+        assert sys.intern("".join(code)) is code
+
+    def test_immutable(self, sample_ontology):
+        """Test attributes cannot be set or deleted and labels are read-only."""
+        compiled = CompiledOntology(sample_ontology)
+        with pytest.raises(AttributeError):
+            compiled.ruteo = frozenset()
+        with pytest.raises(AttributeError):
+            del compiled.ruteo
+        with pytest.raises(TypeError):
+            compiled.labels["ruteo"]["RU9"] = "x"
+
+    def test_prompt_text_cached(self, sample_ontology):
+        """Test prompt text matches ontology_to_prompt_text."""
+        compiled = CompiledOntology(sample_ontology)
+        assert compiled.prompt_text == ontology_to_prompt_text(sample_ontology)
+
+    def test_version_hash(self, sample_ontology):
+        """Test version depends on content, not on key order."""
+        reordered = dict(reversed(list(sample_ontology.items())))
+        assert CompiledOntology(reordered).version == CompiledOntology(sample_ontology).version
+        changed = dict(sample_ontology, ruteo={"RU0": "No aplica"})
+        assert ontology_version(changed) != ontology_version(sample_ontology)
+
+    def test_as_dict_is_a_copy(self, sample_ontology):
+        """Test as_dict returns an independent copy."""
+        compiled = CompiledOntology(sample_ontology)
+        data = compiled.as_dict()
+        data["ruteo"]["RU9"] = "x"
+        assert "RU9" not in compiled.as_dict()["ruteo"]
+
+    def test_pickle_roundtrip(self, sample_ontology):
+        """Test compiled ontologies survive pickling."""
+        compiled = CompiledOntology(sample_ontology)
+        restored = pickle.loads(pickle.dumps(compiled))
+        assert restored == compiled
+        assert restored.periodo == compiled.periodo
+        assert restored.labels["ruteo"] == compiled.labels["ruteo"]
+        code = next(iter(restored.tipo_hecho))
+        assert sys.intern("".join(code)) is code
+        with pytest.raises(AttributeError):
+            restored.ruteo = frozenset()
+
+
+class TestOntologyCache:
+    """Test suite for the binary cache in the user cache directory."""
+
+    def test_cache_written_and_reused(self, ontology_file, private_cache_dir, monkeypatch):
+        """Test the second load neither parses the YAML nor recompiles."""
+        first = load_compiled_ontology(ontology_file)
+        assert cache_path_for(ontology_file).parent == private_cache_dir
+        assert cache_path_for(ontology_file).exists()
+        assert not list(ontology_file.parent.glob("*.pkl"))
+
+        import ontology
+        monkeypatch.setattr(ontology.yaml, "safe_load", lambda data: pytest.fail("YAML parsed"))
+        monkeypatch.setattr(ontology, "ontology_version", lambda data: pytest.fail("recompiled"))
+        cached = load_compiled_ontology(ontology_file)
+        assert cached == first
+        assert cached.labels["ruteo"] == first.labels["ruteo"]
+        assert cached.prompt_text == first.prompt_text
+
+    def test_cache_keyed_on_content(self, ontology_file):
+        """Test a rewrite with the same size and mtime still invalidates the cache."""
+        load_compiled_ontology(ontology_file)
+        stat = ontology_file.stat()
+        text = ontology_file.read_text(encoding="utf-8").replace('RU0: "No aplica"', 'RU0: "No aplicX"')
+        ontology_file.write_text(text, encoding="utf-8")
+        os.utime(ontology_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert ontology_file.stat().st_size == stat.st_size
+        assert load_compiled_ontology(ontology_file).labels["ruteo"]["RU0"] == "No aplicX"
+
+    def test_unwritable_cache_dir(self, ontology_file, tmp_path, monkeypatch):
+        """Test a read-only cache location only disables the cache."""
+        blocker = tmp_path / "not-a-dir"
+        blocker.write_text("x")
+        monkeypatch.setenv("UBPD_ONTOLOGY_CACHE_DIR", str(blocker / "cache"))
+        assert "TD0" in load_compiled_ontology(ontology_file).tipo_documento
+
+    def test_stale_cache_ignored(self, ontology_file):
+        """Test a modified YAML invalidates the cache."""
+        load_compiled_ontology(ontology_file)
+        text = ontology_file.read_text(encoding="utf-8").replace('RU0: "No aplica"', 'RU0: "No aplica (editado)"')
+        _touch_with(ontology_file, text)
+        assert load_compiled_ontology(ontology_file).labels["ruteo"]["RU0"] == "No aplica (editado)"
+
+    def test_corrupt_cache_regenerated(self, ontology_file):
+        """Test an unreadable cache file is replaced."""
+        cache = cache_path_for(ontology_file)
+        cache.parent.mkdir(parents=True)
+        cache.write_bytes(b"not a pickle")
+        compiled = load_compiled_ontology(ontology_file)
+        assert "TD0" in compiled.tipo_documento
+
+    def test_cache_disabled(self, ontology_file):
+        """Test use_cache=False neither reads nor writes the cache."""
+        load_compiled_ontology(ontology_file, use_cache=False)
+        assert not cache_path_for(ontology_file).exists()
+
+
+class TestOntologyReloader:
+    """Test suite for OntologyReloader hot reload."""
+
+    def test_reload_on_change(self, ontology_file):
+        """Test an edited file is picked up and listeners are notified."""
+        reloader = OntologyReloader(ontology_file, check_interval=0)
+        seen = []
+        reloader.add_listener(seen.append)
+        before = reloader.get()
+
+        text = ontology_file.read_text(encoding="utf-8").replace('RU4: "No prioritario"', 'RU4: "Baja"')
+        _touch_with(ontology_file, text)
+        after = reloader.get()
+
+        assert after.version != before.version
+        assert after.labels["ruteo"]["RU4"] == "Baja"
+        assert seen == [after]
+        assert reloader.reloads == 1
+
+    def test_no_check_between_intervals(self, ontology_file):
+        """Test the file is not re-read before the interval elapses."""
+        reloader = OntologyReloader(ontology_file, check_interval=3600)
+        before = reloader.get()
+        _touch_with(ontology_file, ontology_file.read_text(encoding="utf-8") + "\n")
+        assert reloader.get() is before
+
+    def test_invalid_yaml_keeps_previous(self, ontology_file):
+        """Test a broken edit keeps the last good ontology."""
+        reloader = OntologyReloader(ontology_file, check_interval=0)
+        before = reloader.get()
+        _touch_with(ontology_file, "tipo_documento: [unclosed")
+        assert reloader.get() is before
+        assert reloader.last_error is not None
+
+    def test_background_thread(self, ontology_file):
+        """Test start()/stop() run periodic checks."""
+        reloader = OntologyReloader(ontology_file, check_interval=0.01)
+        reloader.start()
+        try:
+            text = ontology_file.read_text(encoding="utf-8").replace('RU4: "No prioritario"', 'RU4: "Baja"')
+            _touch_with(ontology_file, text)
+            deadline = time.monotonic() + 2
+            while reloader.reloads == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            reloader.stop()
+        assert reloader.reloads == 1
+
+    def test_system_prompt_follows_reload(self, ontology_file):
+        """Test get_system_prompt rebuilds after an ontology change."""
+        import ontology
+        from prompts import get_system_prompt
+
+        reloader = OntologyReloader(ontology_file, check_interval=0)
+        ontology.set_reloader(reloader)
+        try:
+            assert "TH7" in get_system_prompt()
+            text = ontology_file.read_text(encoding="utf-8").replace(
+                'TH7: "Otros hechos relevantes"', 'TH7: "Otros hechos relevantes"\n    TH8: "Nuevo"'
+            )
+            _touch_with(ontology_file, text)
+            assert "TH8" in get_system_prompt()
+        finally:
+            ontology.set_reloader(None)
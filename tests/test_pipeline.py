@@ -0,0 +1,257 @@
+"""
+test_pipeline.py
+Unit tests for pipeline.py module.
+Tests the pool-side batch functions, the staged stream (same results as
+classify_documents_async, per-document failures, bounded intake, stage
+errors) and the merge of header/highlight counters from worker processes.
+"""
+
+import asyncio
+import json
+import sys
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import pipeline
+from backends import RuleBasedBackend
+from cache import ClassificationCache
+from classifier import classify_documents_async, schema_stats, set_backend, set_cache
+from headers import get_header_engine
+from highlights import HighlightLocator, set_highlight_locator
+from pipeline import CPUPool, classify_documents_pipelined, classify_stream, finish_batch, prepare_batch
+
+
+TEXTS = [
+    "Yo, María García, cuento que en 1997, en San Carlos, Antioquia, hombres armados "
+    "de la guerrilla se llevaron a mi esposo Juan. Debimos salir hacia Medellín.",
+    "Oficio 123 de 2020. Remito informe técnico.",
+    "En 2004, fuimos desplazados de nuestro municipio en el Cauca por grupos armados.",
+    "Los paramilitares asesinaron a mi hermano en 1999 en Barrancabermeja, Santander.",
+    "Mi hijo fue reclutado por la guerrilla en 2008 en el Caquetá y no volvió.",
+]
+
+RAW = json.dumps({
+    "tipo_documento": "TD1",
+    "tipo_hecho": ["TH1"],
+    "territorio": ["Antioquia"],
+    "periodo": "PER2",
+    "actores": ["ACT2"],
+    "ruteo": "RU1",
+    "highlights": ["se llevaron a mi esposo Juan"],
+})
+
+
+class InlinePool:
+    """CPUPool stand-in running the batch functions in this process."""
+
+    processes = 1
+
+    def __init__(self, batch_size=2, fail=None):
+        self.batch_size = batch_size
+        self.fail = fail
+        self.calls = []
+
+    async def run(self, fn, *args):
+        self.calls.append(fn.__name__)
+        if fn is self.fail:
+            raise RuntimeError("pool roto")
+        return fn(*args)
+
+
+@pytest.fixture
+def rules_backend():
+    backend = RuleBasedBackend()
+    set_backend(backend)
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def fresh_locator():
+    locator = HighlightLocator()
+    set_highlight_locator(locator)
+    yield locator
+    set_highlight_locator(None)
+
+
+def _stream(texts, pool, **kwargs):
+    return asyncio.run(classify_documents_pipelined(texts, pool, **kwargs))
+
+
+class TestBatchFunctions:
+    """Test suite for the functions run in the pool."""
+
+    def test_prepare_batch_isolates_failures(self):
+        """Test one failing document does not discard the rest of the batch."""
+        real = pipeline.preprocess_text
+
+        def preprocess(text, source_system=None):
+            if text == "malo":
+                raise RuntimeError("boom")
+            return real(text, source_system)
+
+        with patch.object(pipeline, "preprocess_text", side_effect=preprocess):
+            out, counters = prepare_batch([(0, TEXTS[0]), (1, "malo")], None)
+        assert out[0][0] == 0 and out[0][4] is None
+        assert out[0][3]["calls"] == len(out[0][2])
+        assert out[1] == (1, None, None, None, "RuntimeError: boom")
+        assert counters["docs"] == 1  # solo el documento que llegó al motor
+
+    def test_finish_batch_reports_checks_for_new_responses(self, fresh_locator):
+        """Test new responses return (parsed, valid); cached ones are not counted."""
+        text = TEXTS[0]
+        out, counters = finish_batch(
+            [(0, text, text, [(RAW, True)]), (1, text, text, [(RAW, False)])], None, True
+        )
+        (_, fixed, error, checks, spans), (_, _, _, cached_checks, _) = out
+        assert error is None
+        assert fixed["tipo_documento"] == "TD1"
+        assert checks == [(True, True)]
+        assert cached_checks == []
+        assert spans[0].method == "exact"
+        assert text[spans[0].start:spans[0].end] == "se llevaron a mi esposo Juan"
+        assert counters["docs"] == 2
+        # Los totales son del bloque: el resolutor local también los lleva
+        assert fresh_locator.docs == 2
+
+    def test_finish_batch_unparseable_response(self):
+        """Test a response that is not JSON fails the document and is flagged unparsed."""
+        out, _ = finish_batch([(3, "x", "x", [("sin json", True)])], None, False)
+        index, fixed, error, checks, spans = out[0]
+        assert (index, fixed, spans) == (3, None, None)
+        assert error.startswith("ValueError")
+        assert checks == [(False, False)]
+
+    def test_finish_batch_merges_chunks(self):
+        """Test multi-chunk documents are merged before validation."""
+        other = json.dumps(dict(json.loads(RAW), tipo_hecho=["TH3"], territorio=["Cauca"]))
+        out, _ = finish_batch([(0, "t", "t", [(RAW, False), (other, False)])], None, False)
+        fixed = out[0][1]
+        assert set(fixed["tipo_hecho"]) == {"TH1", "TH3"}
+        assert set(fixed["territorio"]) == {"Antioquia", "Cauca"}
+
+
+class TestClassifyStream:
+    """Test suite for the staged stream."""
+
+    def test_matches_in_process_results(self, rules_backend):
+        """Test the pipeline classifies exactly like classify_documents_async."""
+        expected = asyncio.run(classify_documents_async(TEXTS))
+        results = _stream(TEXTS, InlinePool(batch_size=2), concurrency=3)
+        assert [r["index"] for r in results] == list(range(len(TEXTS)))
+        assert [r["classification"] for r in results] == [r["classification"] for r in expected]
+        assert [r["tokens"] for r in results] == [r["tokens"] for r in expected]
+        assert all(r["spans"] is None and r["elapsed_ms"] >= 0 for r in results)
+        assert all(r["classification"]["prompt_hash"] and r["classification"]["ontology_hash"] for r in results)
+
+    def test_new_responses_cached_in_parent(self, rules_backend):
+        """Test responses are stored in the parent cache and counted once."""
+        cache = ClassificationCache(":memory:")
+        set_cache(cache)
+        try:
+            before = schema_stats()["responses"]
+            _stream(TEXTS, InlinePool())
+            calls = rules_backend.calls
+            assert schema_stats()["responses"] - before == calls
+            _stream(TEXTS, InlinePool())
+            assert rules_backend.calls == calls
+        finally:
+            set_cache(None)
+            cache.close()
+
+    def test_llm_failure_isolated(self, rules_backend):
+        """Test a failed model call only fails its own document."""
+        real = pipeline.fetch_raw_async
+
+        async def fetch(clean, system_prompt=None):
+            if "Oficio" in clean:
+                raise RuntimeError("503")
+            return await real(clean, system_prompt)
+
+        with patch.object(pipeline, "fetch_raw_async", side_effect=fetch):
+            results = _stream(TEXTS, InlinePool())
+        assert results[1]["error"] == "RuntimeError: 503"
+        assert results[1]["classification"] is None and results[1]["tokens"] is None
+        assert all(r["error"] is None for n, r in enumerate(results) if n != 1)
+
+    def test_chunk_calls_share_the_concurrency_limit(self):
+        """Test chunks of long documents count against `concurrency`."""
+        import classifier
+        tracker = {"in_flight": 0, "max": 0}
+
+        async def fetch(clean, system_prompt=None):
+            tracker["in_flight"] += 1
+            tracker["max"] = max(tracker["max"], tracker["in_flight"])
+            await asyncio.sleep(0.001)
+            tracker["in_flight"] -= 1
+            return RAW, False, None
+
+        texts = [("Nos desplazaron del pueblo numero %d. " % i) * 60 for i in range(6)]
+        with patch.object(classifier, "CHUNK_TOKENS", 100), \
+             patch.object(pipeline, "fetch_raw_async", side_effect=fetch):
+            results = _stream(texts, InlinePool(batch_size=2), concurrency=3)
+        assert all(r["tokens"]["calls"] > 1 for r in results)
+        assert tracker["max"] == 3
+
+    def test_stage_error_propagates(self, rules_backend):
+        """Test an error outside a document (e.g. a broken pool) ends the stream."""
+        with pytest.raises(RuntimeError, match="pool roto"):
+            _stream(TEXTS, InlinePool(fail=prepare_batch))
+
+    def test_intake_is_bounded(self):
+        """Test a stalled model stage stops reading the input."""
+        consumed = 0
+        release = asyncio.Event()
+
+        def texts():
+            nonlocal consumed
+            for n in range(100_000):
+                consumed += 1
+                yield f"documento {n}"
+
+        async def fetch(clean, system_prompt=None):
+            await release.wait()
+            return RAW, False, None
+
+        async def scenario():
+            stream = classify_stream(texts(), InlinePool(batch_size=4), concurrency=2)
+            first = asyncio.ensure_future(stream.__anext__())
+            for _ in range(50):
+                await asyncio.sleep(0)
+            stalled = consumed
+            release.set()
+            await first
+            await stream.aclose()
+            return stalled
+
+        with patch.object(pipeline, "fetch_raw_async", side_effect=fetch):
+            assert asyncio.run(scenario()) < 50
+
+    def test_invalid_concurrency(self):
+        """Test concurrency must be positive."""
+        with pytest.raises(ValueError):
+            _stream(TEXTS, InlinePool(), concurrency=0)
+
+
+class TestCPUPool:
+    """Test suite with real worker processes."""
+
+    def test_process_pool_results_and_counters(self, rules_backend, fresh_locator):
+        """Test worker results match and their counters reach the parent."""
+        expected = asyncio.run(classify_documents_async(TEXTS))
+        headers_before = get_header_engine().counters()["docs"]
+        with CPUPool(2, batch_size=2) as pool:
+            results = _stream(TEXTS, pool, locate=True)
+        assert [r["classification"] for r in results] == [r["classification"] for r in expected]
+        assert get_header_engine().counters()["docs"] - headers_before == len(TEXTS)
+        assert fresh_locator.docs == len(TEXTS)
+        assert all(isinstance(r["spans"], list) for r in results)
+
+    def test_invalid_batch_size(self):
+        """Test batch_size must be positive."""
+        with pytest.raises(ValueError):
+            CPUPool(1, batch_size=0)
@@ -16,6 +16,8 @@ from preprocessing import (
     collapse_spaces,
     remove_headers_and_footers,
     preprocess_text,
+    preprocess_with_offsets,
+    original_span,
 )
 
 
@@ -225,3 +227,46 @@ class TestPreprocessText:
         assert result == "hello world"
         assert not result.startswith(" ")
         assert not result.endswith(" ")
+
+
+class TestPreprocessWithOffsets:
+    """Test suite for the cleaned-to-original offset map."""
+
+    DOC = (
+        "UNIDAD DE BÚSQUEDA DE PERSONAS DADAS POR DESAPARECIDAS\n"
+        "Mi hermano   salió de la casa.\nPágina 1\f"
+        "UNIDAD DE BÚSQUEDA DE PERSONAS DADAS POR DESAPARECIDAS\n"
+        "Nunca\tvolvió.\nPágina 2\f"
+        "UNIDAD DE BÚSQUEDA DE PERSONAS DADAS POR DESAPARECIDAS\n"
+        "Lo seguimos buscando.\nPágina 3"
+    )
+
+    def test_same_text_as_preprocess(self):
+        """Test the cleaned text equals preprocess_text output."""
+        clean, offsets = preprocess_with_offsets(self.DOC)
+        assert clean == preprocess_text(self.DOC)
+        assert len(offsets) == len(clean) + 1
+        assert offsets[-1] == len(self.DOC)
+
+    def test_offsets_point_to_original_chars(self):
+        """Test every kept character maps to itself (spaces to a space)."""
+        clean, offsets = preprocess_with_offsets(self.DOC)
+        for i, char in enumerate(clean):
+            original = self.DOC[offsets[i]]
+            assert original == char or (char == " " and original.isspace())
+        assert list(offsets) == sorted(offsets)
+
+    def test_span_across_collapsed_space(self):
+        """Test a cleaned span maps back over the original whitespace."""
+        clean, offsets = preprocess_with_offsets(self.DOC)
+        start = clean.index("Nunca volvió")
+        a, b = original_span(self.DOC, offsets, start, start + len("Nunca volvió"))
+        assert self.DOC[a:b] == "Nunca\tvolvió"
+
+    def test_decomposed_accents(self):
+        """Test NFD input maps whole characters including combining marks."""
+        text = "Se llevaron a Jose\u0301 en 1998."
+        clean, offsets = preprocess_with_offsets(text)
+        start = clean.index("José")
+        a, b = original_span(text, offsets, start, start + 4)
+        assert text[a:b] == "Jose\u0301"
@@ -6,6 +6,7 @@ Tests prompt building and system prompt structure.
 
 import sys
 from pathlib import Path
+from unittest.mock import patch
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
@@ -16,6 +17,7 @@ from prompts import (
     ONTOLOGY,
     ONTOLOGY_PROMPT,
     build_user_prompt,
+    prompt_version,
 )
 
 
@@ -229,3 +231,27 @@ class TestPromptConsistency:
         # Full prompt should have rules, examples, and document
         assert "VALIDACIÓN" in full_prompt or "validación" in full_prompt.lower()
         assert "Ejemplo" in full_prompt or "ejemplo" in full_prompt.lower()
+
+
+class TestPromptVersion:
+    """Test suite for prompt_version."""
+
+    def test_stable_hex_digest(self):
+        """Test the version is a sha256 hex digest and stable across calls."""
+        version = prompt_version()
+        assert len(version) == 64
+        int(version, 16)
+        assert prompt_version() == version
+
+    def test_changes_with_template(self):
+        """Test editing a template changes the version."""
+        import prompts
+
+        before = prompt_version()
+        prompt_version.cache_clear()
+        try:
+            with patch.object(prompts, "USER_TEMPLATE", prompts.USER_TEMPLATE + " "):
+                assert prompt_version() != before
+        finally:
+            prompt_version.cache_clear()
+        assert prompt_version() == before
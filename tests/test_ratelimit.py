@@ -0,0 +1,259 @@
+"""
+test_ratelimit.py
+Unit tests for ratelimit.py module.
+Tests error classification, token buckets, retries with backoff and
+adaptive concurrency.
+"""
+
+import sys
+import time
+import asyncio
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    is_throttle,
+    is_transient,
+    retry_after,
+)
+
+
+class FakeAPIError(Exception):
+    """Stand-in for an SDK status error carrying status code and headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def fast_limiter(**kwargs):
+    kwargs.setdefault("rpm", 1_000_000)
+    kwargs.setdefault("tpm", 1_000_000_000)
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_cap", 0.01)
+    return RateLimiter(**kwargs)
+
+
+class TestErrorClassification:
+    """Test suite for is_throttle, is_transient and retry_after."""
+
+    def test_429_is_throttle_and_transient(self):
+        exc = FakeAPIError(429)
+        assert is_throttle(exc)
+        assert is_transient(exc)
+
+    def test_5xx_is_transient(self):
+        assert is_transient(FakeAPIError(503))
+        assert not is_throttle(FakeAPIError(503))
+
+    def test_4xx_is_not_transient(self):
+        assert not is_transient(FakeAPIError(400))
+        assert not is_transient(ValueError("bad json"))
+
+    def test_timeout_is_transient(self):
+        assert is_transient(TimeoutError())
+
+    def test_retry_after_seconds(self):
+        assert retry_after(FakeAPIError(429, {"retry-after": "2"})) == 2.0
+
+    def test_retry_after_ms_preferred(self):
+        exc = FakeAPIError(429, {"retry-after-ms": "250", "retry-after": "2"})
+        assert retry_after(exc) == 0.25
+
+    def test_retry_after_missing(self):
+        assert retry_after(FakeAPIError(429)) is None
+        assert retry_after(ValueError()) is None
+
+
+class TestTokenBucket:
+    """Test suite for TokenBucket."""
+
+    def test_within_capacity_no_wait(self):
+        bucket = TokenBucket(per_minute=60)
+        assert bucket.reserve(10) == 0.0
+
+    def test_over_capacity_requires_wait(self):
+        """Test that exhausting the bucket yields the refill time."""
+        bucket = TokenBucket(per_minute=60)  # 1 unit/s
+        bucket.reserve(60)
+        assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+
+    def test_oversized_request_does_not_block_forever(self):
+        bucket = TokenBucket(per_minute=60)
+        wait = bucket.reserve(120)
+        assert 0 < wait < 120
+
+
+class TestRateLimiterSync:
+    """Test suite for RateLimiter.call."""
+
+    def test_success_passthrough(self):
+        limiter = fast_limiter()
+        assert limiter.call(lambda: "ok", tokens=10) == "ok"
+        stats = limiter.stats()
+        assert stats["successes"] == 1
+        assert stats["retries"] == 0
+
+    def test_transient_errors_are_retried(self):
+        limiter = fast_limiter()
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise FakeAPIError(503)
+            return "ok"
+
+        assert limiter.call(flaky) == "ok"
+        assert limiter.stats()["retries"] == 2
+
+    def test_non_transient_error_raises_immediately(self):
+        limiter = fast_limiter()
+        attempts = []
+
+        def broken():
+            attempts.append(1)
+            raise FakeAPIError(400)
+
+        with pytest.raises(FakeAPIError):
+            limiter.call(broken)
+        assert len(attempts) == 1
+
+    def test_gives_up_after_max_retries(self):
+        limiter = fast_limiter(max_retries=2)
+        attempts = []
+
+        def always_503():
+            attempts.append(1)
+            raise FakeAPIError(503)
+
+        with pytest.raises(FakeAPIError):
+            limiter.call(always_503)
+        assert len(attempts) == 3
+        assert limiter.stats()["failures"] == 1
+
+    def test_retry_after_is_honoured(self):
+        """Test that the wait is at least the provider's Retry-After."""
+        limiter = fast_limiter()
+        attempts = []
+
+        def throttled_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise FakeAPIError(429, {"retry-after-ms": "100"})
+            return "ok"
+
+        start = time.monotonic()
+        limiter.call(throttled_once)
+        assert time.monotonic() - start >= 0.1
+        assert limiter.stats()["throttle_wait_s"] >= 0.1
+
+    def test_request_rate_is_enforced(self):
+        """Test that the requests bucket spaces out calls."""
+        limiter = RateLimiter(rpm=600, tpm=10 ** 9)  # 10 req/s, burst 600
+        limiter.requests_bucket = TokenBucket(per_minute=600, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.call(lambda: None)
+        assert time.monotonic() - start >= 0.15
+
+
+class TestAdaptiveConcurrency:
+    """Test suite for the AIMD concurrency limit."""
+
+    def test_throttle_halves_limit(self):
+        limiter = fast_limiter(max_concurrency=16)
+        attempts = []
+
+        def throttled_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise FakeAPIError(429)
+            return "ok"
+
+        limiter.call(throttled_once)
+        assert limiter.limit == 8
+        assert limiter.stats()["throttled"] == 1
+
+    def test_limit_recovers_after_successes(self):
+        limiter = fast_limiter(max_concurrency=4)
+        limiter.limit = 2
+        for _ in range(10):
+            limiter.call(lambda: None)
+        assert limiter.limit == 4
+
+    def test_limit_never_below_minimum(self):
+        limiter = fast_limiter(max_concurrency=2, min_concurrency=1)
+        for _ in range(3):
+            limiter._on_throttle()
+        assert limiter.limit == 1
+
+    def test_async_in_flight_bounded_by_limit(self):
+        """Test that acall never exceeds the current concurrency limit."""
+        limiter = fast_limiter(max_concurrency=3)
+        state = {"now": 0, "max": 0}
+
+        async def work():
+            state["now"] += 1
+            state["max"] = max(state["max"], state["now"])
+            await asyncio.sleep(0.005)
+            state["now"] -= 1
+            return "ok"
+
+        async def main():
+            return await asyncio.gather(*(limiter.acall(work) for _ in range(12)))
+
+        assert asyncio.run(main()) == ["ok"] * 12
+        assert state["max"] == 3
+
+    def test_async_retries(self):
+        limiter = fast_limiter()
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise TimeoutError()
+            return "ok"
+
+        assert asyncio.run(limiter.acall(flaky)) == "ok"
+        assert limiter.stats()["retries"] == 1
+
+    def test_cancellation_releases_slot(self):
+        """Test a cancelled acall (timeout, gather cancel) gives its slot back."""
+        limiter = fast_limiter(max_concurrency=2)
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        async def ok():
+            return "ok"
+
+        async def main():
+            for _ in range(3):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(limiter.acall(slow), 0.01)
+            return await asyncio.wait_for(limiter.acall(ok), 1)
+
+        assert asyncio.run(main()) == "ok"
+        assert limiter.stats()["in_flight"] == 0
+
+    def test_base_exception_releases_slot(self):
+        """Test errors outside Exception do not leak the slot in call."""
+        limiter = fast_limiter(max_concurrency=1)
+
+        def interrupted():
+            raise KeyboardInterrupt()
+
+        with pytest.raises(KeyboardInterrupt):
+            limiter.call(interrupted)
+        assert limiter.stats()["in_flight"] == 0
+        assert limiter.call(lambda: "ok") == "ok"
+
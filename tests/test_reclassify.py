@@ -0,0 +1,256 @@
+"""
+test_reclassify.py
+Unit tests for reclassify.py module.
+Tests the stale-run queries per reason, the keyset walk over stale runs,
+the atomic replacement of still-active runs (with a fake connection, no
+PostgreSQL needed), enqueueing for jobs.py workers and the end-to-end
+reclassification loop.
+"""
+
+import asyncio
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import db
+from ontology import get_ontology
+from prompts import prompt_version
+from reclassify import (
+    STALE_REASONS,
+    STILL_ACTIVE_SQL,
+    StaleRunQueue,
+    current_versions,
+    enqueue_stale,
+    reclassify_stale,
+    stale_count_sql,
+    stale_counts,
+    stale_select_sql,
+)
+
+
+def _doc(n):
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+def _row(n):
+    """(doc_id, run_id, text, source_system) as returned by the stale query."""
+    return (_doc(n), f"run-{n}", f"texto {n}", "SRC")
+
+
+class FakeCursor:
+    """Cursor recording statements and serving queued results."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        return self.conn.results.pop(0) if self.conn.results else []
+
+    def fetchone(self):
+        return self.fetchall()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.bulk = []
+        self.results = []
+        self.transactions = 0
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def fake_conn():
+    conn = FakeConnection()
+
+    @contextmanager
+    def connection():
+        yield conn
+
+    def fake_execute_values(cur, sql, rows, template=None, page_size=None, fetch=False):
+        conn.bulk.append((" ".join(sql.split()), list(rows)))
+        return [row[:1] for row in rows] if fetch else None
+
+    with patch.object(db, "connection", connection), \
+         patch.object(db, "execute_values", side_effect=fake_execute_values):
+        yield conn
+
+
+def _inserted_runs(conn):
+    return [rows for sql, rows in conn.bulk if sql.startswith("INSERT INTO doc_classification_run ")]
+
+
+class TestStaleQueries:
+    """Test suite for the SQL built per reason."""
+
+    def test_only_selected_reasons(self):
+        """Test the query only checks the requested reasons."""
+        sql = stale_select_sql(["codes"])
+        assert "hecho_code <> ALL(%(tipo_hecho)s)" in sql
+        assert "prompt_hash" not in sql and "model_name" not in sql
+        assert "r.doc_id > %(after)s::uuid" in sql
+        assert "ORDER BY r.doc_id" in sql
+
+    def test_count_has_one_column_per_reason(self):
+        """Test counts are reported per reason plus the total."""
+        sql = stale_count_sql(STALE_REASONS)
+        for reason in STALE_REASONS:
+            assert f"AS {reason}" in sql
+        assert "AS stale" in sql and "AS active" in sql
+
+    def test_current_versions(self):
+        """Test parameters carry the current hashes and ontology codes."""
+        params = current_versions()
+        assert params["prompt_hash"] == prompt_version()
+        assert params["ontology_hash"] == get_ontology().version
+        assert params["tipo_hecho"] == sorted(get_ontology().codes("tipo_hecho"))
+        assert isinstance(params["model_version"], str)
+
+    def test_invalid_reasons(self):
+        """Test unknown or empty reasons are rejected."""
+        with pytest.raises(ValueError):
+            StaleRunQueue(["model", "color"])
+        with pytest.raises(ValueError):
+            StaleRunQueue([])
+
+
+class TestStaleRunQueue:
+    """Test suite for the queue over stale runs."""
+
+    def test_claim_walks_by_doc_id(self, fake_conn):
+        """Test each page starts after the last doc_id of the previous one."""
+        fake_conn.results = [[_row(1), _row(2)], [_row(3)]]
+        queue = StaleRunQueue(["model"])
+        first = queue.claim(2)
+        second = queue.claim(2)
+        assert [job.doc_id for job in first + second] == [_doc(1), _doc(2), _doc(3)]
+        assert len({job.job_id for job in first + second}) == 3
+        params = [params for _, params in fake_conn.statements]
+        assert params[0]["after"] == "00000000-0000-0000-0000-000000000000"
+        assert params[1]["after"] == _doc(2)
+        assert params[1]["limit"] == 2
+        assert queue.claim(2) == []
+        assert queue.selected == 3
+
+    def test_claim_respects_limit(self, fake_conn):
+        """Test no more than `limit` documents are selected overall."""
+        fake_conn.results = [[_row(1), _row(2)], [_row(3)]]
+        queue = StaleRunQueue(limit=3)
+        queue.claim(2)
+        queue.claim(2)
+        assert fake_conn.statements[1][1]["limit"] == 1
+        assert queue.claim(2) == []
+        assert len(fake_conn.statements) == 2
+
+    def test_complete_replaces_in_one_transaction(self, fake_conn, valid_classification_response):
+        """Test new runs and the deactivation of the old ones are written together."""
+        fake_conn.results = [[_row(1), _row(2)], [("run-1",), ("run-2",)]]
+        queue = StaleRunQueue()
+        jobs = queue.claim(10)
+        done = queue.complete([(job, valid_classification_response) for job in jobs])
+        assert sorted(done) == [job.job_id for job in jobs]
+        still_active, deactivate = fake_conn.statements[1:]
+        assert still_active == (" ".join(STILL_ACTIVE_SQL.split()), (["run-1", "run-2"],))
+        assert deactivate[0].startswith("UPDATE doc_classification_run SET is_active = FALSE")
+        [runs] = _inserted_runs(fake_conn)
+        assert [row[1] for row in runs] == [_doc(1), _doc(2)]
+        assert fake_conn.transactions == 2  # claim + complete
+        assert (queue.replaced, queue.skipped) == (2, 0)
+
+    def test_complete_skips_runs_replaced_meanwhile(self, fake_conn, valid_classification_response):
+        """Test a document whose active run changed is not written."""
+        fake_conn.results = [[_row(1), _row(2)], [("run-2",)]]
+        queue = StaleRunQueue()
+        jobs = queue.claim(10)
+        done = queue.complete([(job, valid_classification_response) for job in jobs])
+        assert list(done) == [jobs[1].job_id]
+        [runs] = _inserted_runs(fake_conn)
+        assert [row[1] for row in runs] == [_doc(2)]
+        assert (queue.replaced, queue.skipped) == (1, 1)
+
+    def test_complete_nothing_active(self, fake_conn, valid_classification_response):
+        """Test nothing is written when every selected run was replaced."""
+        fake_conn.results = [[_row(1)], []]
+        queue = StaleRunQueue()
+        jobs = queue.claim(10)
+        assert queue.complete([(jobs[0], valid_classification_response)]) == {}
+        assert fake_conn.bulk == []
+        assert queue.skipped == 1
+
+    def test_fail_keeps_previous_run(self, fake_conn):
+        """Test failures are recorded and nothing is written."""
+        fake_conn.results = [[_row(1)]]
+        queue = StaleRunQueue()
+        [job] = queue.claim(10)
+        assert queue.fail([(job, "RuntimeError: x")]) == 1
+        assert queue.errors == [(_doc(1), "RuntimeError: x")]
+        assert len(fake_conn.statements) == 1
+
+
+class TestOperations:
+    """Test suite for stale_counts, enqueue_stale and reclassify_stale."""
+
+    def test_stale_counts(self, fake_conn):
+        """Test the count row is mapped to its reasons."""
+        fake_conn.results = [(10, 3, 4, 4)]
+        assert stale_counts(["model", "codes"]) == {"active": 10, "model": 3, "codes": 4, "stale": 4}
+
+    def test_enqueue_stale_pages(self, fake_conn):
+        """Test every stale document is enqueued, page by page."""
+        fake_conn.results = [[_row(1), _row(2)], [_row(3)]]
+
+        class Queue:
+            def __init__(self):
+                self.batches = []
+
+            def enqueue_documents(self, doc_ids):
+                self.batches.append(doc_ids)
+                return len(doc_ids)
+
+        queue = Queue()
+        assert enqueue_stale(["ontology"], queue=queue) == 3
+        assert queue.batches == [[_doc(1), _doc(2)], [_doc(3)]]
+
+    def test_reclassify_stale(self, fake_conn, valid_classification_response):
+        """Test stale documents are classified and replaced batch by batch."""
+        fake_conn.results = [[_row(1), _row(2)], [("run-1",), ("run-2",)], [_row(3)]]
+        classified = []
+
+        async def classify(text, source_system=None):
+            classified.append(text)
+            if text == "texto 3":
+                raise RuntimeError("boom")
+            return dict(valid_classification_response)
+
+        stats = asyncio.run(reclassify_stale(batch_size=2, classify=classify))
+        assert classified == ["texto 1", "texto 2", "texto 3"]
+        assert (stats["selected"], stats["replaced"], stats["failed"]) == (3, 2, 1)
+        assert stats["errors"] == [(_doc(3), "RuntimeError: boom")]
+        [runs] = _inserted_runs(fake_conn)
+        prompt_hash, ontology_hash = prompt_version(), get_ontology().version
+        assert all(row[5:] == (ontology_hash, prompt_hash) for row in runs)
@@ -0,0 +1,251 @@
+"""
+test_rescore.py
+Unit tests for priority.py and rescore.py modules.
+Tests configurable priority rules and the database re-scoring job with
+fake connections (no PostgreSQL needed).
+"""
+
+import sys
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import rescore
+from classifier import compute_priority
+from priority import PriorityRules, get_priority_rules, load_priority_rules, set_priority_rules
+from rescore import build_select_sql, quantize_score
+
+
+DEFAULT_RULES = [("tipo_hecho", "TH1", 0.4), ("tipo_hecho", "TH4", 0.2), ("ruteo", "RU1", 0.3), ("ruteo", "RU3", 0.1)]
+
+
+class FakeNamedCursor:
+    """Server-side cursor stand-in serving rows through fetchmany."""
+
+    def __init__(self, conn, rows):
+        self.conn = conn
+        self.rows = list(rows)
+        self.itersize = None
+        self.fetch_sizes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.queries.append(sql)
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class FakeConnection:
+    """Connection recording cursors, transactions and commits."""
+
+    def __init__(self, rows=()):
+        self.rows = rows
+        self.queries = []
+        self.cursor_names = []
+        self.commits = 0
+        self.named_cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commits += 1
+        return False
+
+    def cursor(self, name=None):
+        self.cursor_names.append(name)
+        if name is not None:
+            self.named_cursor = FakeNamedCursor(self, self.rows)
+            return self.named_cursor
+        return FakeWriteCursor()
+
+
+class FakeWriteCursor:
+    rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fake_db():
+    """Patch db.connection and execute_values; yield (read, write, updates)."""
+    read, write = FakeConnection(), FakeConnection()
+    conns = iter([read, write])
+    updates = []
+
+    @contextmanager
+    def fake_connection():
+        yield next(conns)
+
+    def fake_execute_values(cur, sql, rows, template=None, page_size=None):
+        updates.append((" ".join(sql.split()), list(rows), template))
+        cur.rowcount = len(rows)
+
+    with patch.object(rescore.db, "connection", side_effect=fake_connection), \
+         patch.object(rescore, "execute_values", side_effect=fake_execute_values):
+        yield read, write, updates
+
+
+@pytest.fixture(autouse=True)
+def reset_rules():
+    """Each test starts with the rules from the bundled file."""
+    set_priority_rules(None)
+    yield
+    set_priority_rules(None)
+
+
+class TestPriorityRules:
+    """Test suite for priority rule configuration."""
+
+    def test_bundled_rules_match_documented_weights(self):
+        """Test priority_rules.yaml holds the historical weights."""
+        rules = load_priority_rules()
+        assert [tuple(r) for r in rules] == DEFAULT_RULES
+        assert rules.max_score == 1.0
+
+    def test_compute_priority_uses_configured_rules(self):
+        """Test compute_priority follows the process-wide rules."""
+        pred = {"tipo_hecho": ["TH2"], "ruteo": "RU4"}
+        assert compute_priority(pred) == 0.0
+        set_priority_rules(PriorityRules([("tipo_hecho", "TH2", 0.7)]))
+        assert compute_priority(pred) == 0.7
+
+    def test_explicit_rules_argument(self):
+        """Test rules can be passed explicitly."""
+        rules = PriorityRules([("actores", "ACT1", 0.5), ("periodo", "PER2", 0.75)], max_score=1.0)
+        assert compute_priority({"actores": ["ACT1"], "periodo": "PER2"}, rules) == 1.0
+        assert compute_priority({"actores": ["ACT2"], "periodo": "PER2"}, rules) == 0.75
+
+    def test_env_var_selects_file(self, tmp_path, monkeypatch):
+        """Test UBPD_PRIORITY_RULES points to another rules file."""
+        path = tmp_path / "rules.yaml"
+        path.write_text("max_score: 0.5\nrules:\n  - {field: ruteo, code: RU2, weight: 0.9}\n", encoding="utf-8")
+        monkeypatch.setenv("UBPD_PRIORITY_RULES", str(path))
+        assert compute_priority({"ruteo": "RU2"}) == 0.5
+        assert get_priority_rules().max_score == 0.5
+
+    def test_invalid_rules_rejected(self):
+        """Test unknown fields and non-numeric weights are rejected."""
+        with pytest.raises(ValueError):
+            PriorityRules([("territorio", "Cauca", 0.1)])
+        with pytest.raises(ValueError):
+            PriorityRules([("ruteo", "RU1", "alto")])
+
+    def test_version_changes_with_weights(self):
+        """Test the rules version hash follows weight changes."""
+        a = PriorityRules(DEFAULT_RULES)
+        b = PriorityRules(DEFAULT_RULES[:-1] + [("ruteo", "RU3", 0.15)])
+        assert a.version == PriorityRules(DEFAULT_RULES).version
+        assert a.version != b.version
+
+
+class TestSelectSql:
+    """Test suite for build_select_sql."""
+
+    def test_only_needed_multi_label_tables(self):
+        """Test actores is only joined when a rule uses it."""
+        sql = build_select_sql(PriorityRules(DEFAULT_RULES))
+        assert "doc_classification_hecho" in sql
+        assert "doc_classification_actor" not in sql
+        sql = build_select_sql(PriorityRules([("actores", "ACT1", 0.1)]))
+        assert "doc_classification_actor" in sql
+        assert "doc_classification_hecho" not in sql
+
+    def test_active_only(self):
+        """Test inactive runs are skipped unless requested."""
+        rules = PriorityRules(DEFAULT_RULES)
+        assert "is_active" in build_select_sql(rules)
+        assert "is_active" not in build_select_sql(rules, active_only=False)
+
+
+class TestRescore:
+    """Test suite for the rescore job."""
+
+    def rows(self):
+        return [
+            ("run-1", "TD1", "PER2", "RU1", Decimal("0.7000"), ["TH1"]),  # unchanged
+            ("run-2", "TD1", "PER2", "RU1", Decimal("0.3000"), ["TH1"]),  # stale
+            ("run-3", "TD2", "PER3", "RU3", None, []),                    # never scored
+            ("run-4", "TD1", "PER2", "RU1", Decimal("0.9000"), ["TH1", "TH4"]),  # 0.9000000000000001
+        ]
+
+    def test_updates_only_changed_rows(self, fake_db):
+        """Test unchanged scores are not written."""
+        read, write, updates = fake_db
+        read.rows = self.rows()
+        stats = rescore.rescore(PriorityRules(DEFAULT_RULES), batch_size=10)
+        assert stats["scanned"] == 4
+        assert stats["changed"] == 2
+        assert stats["updated"] == 2
+        [(sql, rows, template)] = updates
+        assert rows == [("run-2", Decimal("0.7000")), ("run-3", Decimal("0.1000"))]
+        assert sql.startswith("UPDATE doc_classification_labels AS l SET priority_score = v.priority_score FROM (VALUES %s)")
+        assert "IS DISTINCT FROM" in sql
+        assert template == rescore.UPDATE_TEMPLATE
+
+    def test_streams_with_server_side_cursor(self, fake_db):
+        """Test rows are read in bounded batches from a named cursor."""
+        read, write, updates = fake_db
+        read.rows = self.rows() * 3
+        stats = rescore.rescore(PriorityRules(DEFAULT_RULES), batch_size=5)
+        assert read.cursor_names == [rescore.CURSOR_NAME]
+        assert read.named_cursor.itersize == 5
+        assert set(read.named_cursor.fetch_sizes) == {5}
+        assert stats["batches"] == 3
+        # One write transaction per batch with changes
+        assert write.commits == len(updates) == 3
+        assert read.commits == 1
+
+    def test_new_weights_change_scores(self, fake_db):
+        """Test tuned weights are applied to stored runs."""
+        read, write, updates = fake_db
+        read.rows = self.rows()
+        rules = PriorityRules([("tipo_hecho", "TH1", 0.5), ("ruteo", "RU1", 0.25)])
+        rescore.rescore(rules)
+        assert [rows for _, rows, _ in updates] == [[
+            ("run-1", Decimal("0.7500")), ("run-2", Decimal("0.7500")),
+            ("run-3", Decimal("0.0000")), ("run-4", Decimal("0.7500")),
+        ]]
+
+    def test_dry_run_writes_nothing(self, fake_db):
+        """Test dry runs only count changes."""
+        read, write, updates = fake_db
+        read.rows = self.rows()
+        stats = rescore.rescore(PriorityRules(DEFAULT_RULES), dry_run=True)
+        assert stats["changed"] == 2
+        assert stats["updated"] == 0
+        assert updates == []
+        assert write.commits == 0
+
+    def test_progress_callback(self, fake_db):
+        """Test progress is reported after each batch."""
+        read, _, _ = fake_db
+        read.rows = self.rows()
+        seen = []
+        rescore.rescore(PriorityRules(DEFAULT_RULES), batch_size=2, progress=seen.append)
+        assert [s["scanned"] for s in seen] == [2, 4]
+
+    def test_quantize_matches_numeric_column(self):
+        """Test scores are rounded like NUMERIC(5,4)."""
+        assert quantize_score(0.4 + 0.2 + 0.3) == Decimal("0.9000")
+        assert quantize_score(0.12345) == Decimal("0.1235")
+        assert quantize_score(1.0) == Decimal("1.0000")
@@ -14,7 +14,14 @@ from unittest.mock import patch
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
 
-from runner import read_text_from_file
+from runner import (
+    read_text_from_file,
+    iter_input_dir,
+    iter_manifest,
+    load_checkpoint,
+    percentile,
+    run_batch,
+)
 
 
 class TestReadTextFromFile:
@@ -210,3 +217,185 @@ class TestRunnerIntegration:
 
 
 # Import pytest
+
+
+def _fake_engine(fail_on=()):
+    """Build a fake classify_documents_async that fails on given texts."""
+    async def fake(texts, concurrency=1, source_system=None):
+        results = []
+        for i, text in enumerate(texts):
+            if text in fail_on:
+                results.append({"index": i, "classification": None,
+                                "error": "RuntimeError: boom", "elapsed_ms": 5.0})
+            else:
+                results.append({"index": i, "classification": {"tipo_documento": "TD1"},
+                                "error": None, "elapsed_ms": 10.0})
+        return results
+    return fake
+
+
+class TestBatchInputs:
+    """Test suite for --input-dir and --manifest enumeration."""
+
+    def test_iter_input_dir_sorted_and_recursive(self, tmp_path):
+        """Test that files are listed recursively in sorted order."""
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "b.txt").write_text("b", encoding="utf-8")
+        (tmp_path / "a.txt").write_text("a", encoding="utf-8")
+        (tmp_path / "sub" / "c.txt").write_text("c", encoding="utf-8")
+        (tmp_path / "ignored.json").write_text("{}", encoding="utf-8")
+        paths = [Path(item["path"]).name for item in iter_input_dir(str(tmp_path))]
+        assert paths == ["a.txt", "b.txt", "c.txt"]
+
+    def test_iter_manifest_plain_and_json_lines(self, tmp_path):
+        """Test manifest with plain paths, JSON entries and comments."""
+        manifest = tmp_path / "manifest.txt"
+        manifest.write_text(
+            "# comentario\n"
+            "doc1.txt\n"
+            "\n"
+            '{"path": "/abs/doc2.txt", "external_id": "EXT2"}\n',
+            encoding="utf-8",
+        )
+        items = list(iter_manifest(str(manifest)))
+        assert items[0] == {"path": str(tmp_path / "doc1.txt"), "external_id": None}
+        assert items[1] == {"path": "/abs/doc2.txt", "external_id": "EXT2"}
+
+
+class TestCheckpoint:
+    """Test suite for checkpoint loading."""
+
+    def test_missing_checkpoint_is_empty(self, tmp_path):
+        """Test that a missing checkpoint file means nothing is done."""
+        assert load_checkpoint(str(tmp_path / "none.jsonl")) == set()
+
+    def test_truncated_line_is_ignored(self, tmp_path):
+        """Test that a partially written last line is skipped."""
+        ckpt = tmp_path / "ckpt.jsonl"
+        ckpt.write_text('{"input": "a.txt"}\n{"input": "b.t', encoding="utf-8")
+        assert load_checkpoint(str(ckpt)) == {"a.txt"}
+
+
+class TestPercentile:
+    """Test suite for percentile helper."""
+
+    def test_percentile_empty(self):
+        assert percentile([], 50) == 0.0
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 100) == 100
+
+
+class TestRunBatch:
+    """Test suite for run_batch with a mocked classification engine."""
+
+    def _make_files(self, tmp_path, names):
+        for name in names:
+            (tmp_path / name).write_text(name, encoding="utf-8")
+        return list(iter_input_dir(str(tmp_path)))
+
+    def test_batch_summary_and_checkpoint(self, tmp_path):
+        """Test that successes are checkpointed and failures counted."""
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        items = self._make_files(docs, ["a.txt", "b.txt", "c.txt"])
+        ckpt = tmp_path / "ckpt.jsonl"
+        with patch("runner.classify_documents_async", new=_fake_engine(fail_on={"b.txt"})):
+            summary = run_batch(items, checkpoint_path=str(ckpt), concurrency=2)
+        assert summary["processed"] == 3
+        assert summary["failures"] == 1
+        assert summary["p50_ms"] == 10.0
+        done = load_checkpoint(str(ckpt))
+        assert done == {str(docs / "a.txt"), str(docs / "c.txt")}
+
+    def test_batch_resumes_from_checkpoint(self, tmp_path):
+        """Test that completed inputs are skipped on a second run."""
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        items = self._make_files(docs, ["a.txt", "b.txt"])
+        ckpt = tmp_path / "ckpt.jsonl"
+        with patch("runner.classify_documents_async", new=_fake_engine(fail_on={"b.txt"})):
+            run_batch(items, checkpoint_path=str(ckpt))
+        with patch("runner.classify_documents_async", new=_fake_engine()):
+            summary = run_batch(list(iter_input_dir(str(docs))), checkpoint_path=str(ckpt))
+        assert summary["skipped"] == 1
+        assert summary["processed"] == 1
+        assert summary["failures"] == 0
+
+    def test_batch_saves_with_metadata(self, tmp_path):
+        """Test that the bulk save receives file metadata and ids are recorded."""
+        items = self._make_files(tmp_path, ["a.txt", "b.txt"])
+        items[0]["external_id"] = "EXT1"
+        calls = []
+
+        def fake_save(docs):
+            calls.append(docs)
+            return [(f"doc-{i}", f"run-{i}") for i in range(len(docs))]
+
+        ckpt = tmp_path / "ckpt.jsonl"
+        with patch("runner.classify_documents_async", new=_fake_engine()):
+            run_batch(items, checkpoint_path=str(ckpt), save=fake_save, source_system="SRC")
+        assert len(calls) == 1  # one bulk save per chunk
+        assert calls[0][0]["external_id"] == "EXT1"
+        assert calls[0][0]["source_system"] == "SRC"
+        assert calls[0][0]["text"] == "a.txt"
+        assert '"doc_id": "doc-1"' in ckpt.read_text(encoding="utf-8")
+
+    def test_processes_use_pipeline_and_pass_spans(self, tmp_path):
+        """Test processes > 0 classifies through the CPU pool and saves its spans."""
+        items = self._make_files(tmp_path, ["a.txt", "b.txt"])
+        saved, pools = [], []
+
+        class FakePool:
+            batch_size = 4
+
+            def __init__(self, processes):
+                self.processes = processes
+                pools.append(self)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        async def fake_pipelined(texts, pool, concurrency=1, source_system=None, locate=False):
+            results = await _fake_engine()(texts)
+            for result in results:
+                result["spans"] = [] if locate else None
+            return results
+
+        def fake_save(docs):
+            saved.extend(docs)
+            return [(f"doc-{i}", f"run-{i}") for i in range(len(docs))]
+
+        with patch("runner.CPUPool", FakePool), \
+             patch("runner.classify_documents_pipelined", new=fake_pipelined), \
+             patch("runner.classify_documents_async", side_effect=AssertionError):
+            summary = run_batch(items, checkpoint_path=str(tmp_path / "ckpt.jsonl"), save=fake_save, processes=2)
+        assert summary["processed"] == 2
+        assert pools[0].processes == 2
+        assert [doc["spans"] for doc in saved] == [[], []]
+
+    def test_failed_save_is_not_checkpointed(self, tmp_path):
+        """Test that a failed bulk save leaves the chunk pending."""
+        items = self._make_files(tmp_path, ["a.txt"])
+
+        def failing_save(docs):
+            raise RuntimeError("db down")
+
+        ckpt = tmp_path / "ckpt.jsonl"
+        with patch("runner.classify_documents_async", new=_fake_engine()):
+            summary = run_batch(items, checkpoint_path=str(ckpt), save=failing_save)
+        assert summary["failures"] == 1
+        assert load_checkpoint(str(ckpt)) == set()
+
+    def test_unreadable_file_counts_as_failure(self, tmp_path):
+        """Test that a missing file does not abort the batch."""
+        items = [{"path": str(tmp_path / "missing.txt"), "external_id": None}]
+        with patch("runner.classify_documents_async", new=_fake_engine()):
+            summary = run_batch(items, checkpoint_path=str(tmp_path / "ckpt.jsonl"))
+        assert summary["failures"] == 1
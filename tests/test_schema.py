@@ -0,0 +1,220 @@
+"""
+test_schema.py
+Unit tests for schema.py module and the structured-output mode.
+Tests the JSON Schema generated from the ontology, the compiled validator,
+response_format in the OpenAI backend and batch requests, schema statistics
+in classifier.py and the malformed responses of the local server.
+"""
+
+import sys
+import json
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier
+from backends import OpenAIBackend, rule_based_prediction
+from batch_api import build_batch_request
+from cache import ClassificationCache
+from fake_server import MALFORMED_KINDS, malform, start_in_thread
+from ontology import CompiledOntology, get_ontology
+from schema import (
+    FIELDS,
+    SCHEMA_NAME,
+    build_response_schema,
+    get_validator,
+    is_valid_response,
+    response_format,
+    schema_errors,
+)
+
+
+@pytest.fixture
+def schema_stats():
+    """Reset classifier.SCHEMA_STATS around each test."""
+    classifier.SCHEMA_STATS.reset()
+    yield classifier.SCHEMA_STATS
+    classifier.SCHEMA_STATS.reset()
+
+
+class TestResponseSchema:
+    """Test suite for build_response_schema and response_format."""
+
+    def test_enums_follow_ontology(self):
+        """Test single and multi-label fields enumerate the ontology codes."""
+        ontology = get_ontology()
+        props = build_response_schema()["properties"]
+        assert list(props) == list(FIELDS)
+        for field in ("tipo_documento", "periodo", "ruteo"):
+            assert set(props[field]["enum"]) == ontology.codes(field)
+        for field in ("tipo_hecho", "actores"):
+            assert props[field]["type"] == "array"
+            assert set(props[field]["items"]["enum"]) == ontology.codes(field)
+        assert ontology.unknown_territorio in props["territorio"]["items"]["enum"]
+        assert props["highlights"]["items"] == {"type": "string"}
+
+    def test_strict_shape(self):
+        """Test every property is required and no extra keys are allowed."""
+        schema = build_response_schema()
+        assert schema["required"] == list(FIELDS)
+        assert schema["additionalProperties"] is False
+        fmt = response_format()
+        assert fmt["type"] == "json_schema"
+        assert fmt["json_schema"]["name"] == SCHEMA_NAME
+        assert fmt["json_schema"]["strict"] is True
+        assert fmt["json_schema"]["schema"] is schema
+
+    def test_built_once_per_ontology_version(self, sample_ontology):
+        """Test schema and validator are cached per ontology."""
+        assert build_response_schema() is build_response_schema()
+        assert get_validator() is get_validator()
+
+        extended = dict(sample_ontology, ruteo=dict(sample_ontology["ruteo"], RU9="Nuevo"))
+        compiled = CompiledOntology(extended)
+        assert "RU9" in build_response_schema(compiled)["properties"]["ruteo"]["enum"]
+        assert "RU9" not in build_response_schema()["properties"]["ruteo"]["enum"]
+        assert is_valid_response(dict(rule_based_prediction("texto"), ruteo="RU9"), compiled)
+
+
+class TestValidator:
+    """Test suite for schema_errors and is_valid_response."""
+
+    def test_valid_response(self, valid_classification_response):
+        """Test a well-formed prediction has no errors."""
+        assert schema_errors(valid_classification_response) == []
+        assert is_valid_response(valid_classification_response)
+
+    def test_rules_backend_output_is_valid(self, sample_victim_testimony, sample_non_testimonial):
+        """Test the local backend always produces schema-valid JSON."""
+        for text in (sample_victim_testimony, sample_non_testimonial):
+            assert schema_errors(rule_based_prediction(text)) == []
+
+    def test_invalid_response(self, invalid_classification_response):
+        """Test codes, types and extra or missing keys are reported by path."""
+        errors = schema_errors(invalid_classification_response)
+        for path in ("tipo_documento", "tipo_hecho/1", "territorio", "periodo", "actores", "ruteo", "highlights"):
+            assert any(e.startswith(f"{path}: ") for e in errors), path
+
+        pred = dict(invalid_classification_response, extra=1)
+        del pred["ruteo"]
+        errors = schema_errors(pred)
+        assert any("'extra'" in e for e in errors)
+        assert any("'ruteo' is a required property" in e for e in errors)
+
+
+class TestStructuredRequests:
+    """Test suite for response_format in outgoing requests."""
+
+    def test_backend_request_kwargs(self):
+        """Test response_format is only sent in structured mode."""
+        free = OpenAIBackend(api_key="x")._request_kwargs("s", "u")
+        structured = OpenAIBackend(api_key="x", structured_output=True)._request_kwargs("s", "u")
+        assert "response_format" not in free
+        assert structured["response_format"] == response_format()
+
+    def test_batch_request(self, monkeypatch):
+        """Test Batch API lines carry the schema in structured mode."""
+        assert "response_format" not in build_batch_request("doc-0", "texto")["body"]
+        monkeypatch.setattr(classifier, "STRUCTURED_OUTPUT", True)
+        assert build_batch_request("doc-0", "texto")["body"]["response_format"] == response_format()
+
+    def test_env_enables_structured_backend(self, monkeypatch):
+        """Test UBPD_STRUCTURED_OUTPUT reaches the OpenAI backend."""
+        monkeypatch.setenv("UBPD_LLM_BACKEND", "openai")
+        monkeypatch.setattr(classifier, "STRUCTURED_OUTPUT", True)
+        assert classifier.create_backend_from_env().structured_output is True
+
+    def test_cache_key_depends_on_mode(self, monkeypatch):
+        """Test free-form and structured responses do not share cache entries."""
+        before = classifier.make_cache_key("texto")
+        monkeypatch.setattr(classifier, "STRUCTURED_OUTPUT", True)
+        assert classifier.make_cache_key("texto") != before
+
+
+class TestSchemaStats:
+    """Test suite for the schema statistics kept by classifier.py."""
+
+    @patch("classifier.call_llm")
+    def test_counts_failures_and_violations(self, mock_llm, schema_stats, valid_classification_response):
+        """Test unparseable and off-schema responses are counted."""
+        mock_llm.side_effect = [
+            json.dumps(valid_classification_response),
+            json.dumps(dict(valid_classification_response, tipo_documento="Testimonio")),
+            '{"tipo_documento": "TD1",',
+        ]
+        classifier.classify_document("uno")
+        result = classifier.classify_document("dos")
+        with pytest.raises(ValueError):
+            classifier.classify_document("tres")
+        assert result["tipo_documento"] == "TD0"
+        stats = classifier.schema_stats()
+        assert (stats["responses"], stats["parse_failures"], stats["schema_violations"]) == (3, 1, 1)
+        assert stats["parse_failure_rate"] == pytest.approx(1 / 3)
+
+    @patch("classifier.call_llm")
+    def test_structured_mode_does_not_cache_violations(self, mock_llm, monkeypatch, schema_stats,
+                                                       valid_classification_response):
+        """Test off-schema responses are not cached when the schema was requested."""
+        cache = ClassificationCache(":memory:")
+        classifier.set_cache(cache)
+        monkeypatch.setattr(classifier, "STRUCTURED_OUTPUT", True)
+        try:
+            mock_llm.return_value = json.dumps(dict(valid_classification_response, ruteo="RU9"))
+            classifier.classify_document("uno")
+            assert cache.stats()["puts"] == 0
+            mock_llm.return_value = json.dumps(valid_classification_response)
+            classifier.classify_document("dos")
+            assert cache.stats()["puts"] == 1
+        finally:
+            classifier.set_cache(None)
+            cache.close()
+
+    @patch("classifier.call_llm")
+    def test_streamed_response_without_highlights_is_valid(self, mock_llm, monkeypatch, schema_stats,
+                                                           valid_classification_response):
+        """Test early-stopped streams are not counted as violations."""
+        monkeypatch.setattr(classifier, "LLM_STREAM", True)
+        monkeypatch.setattr(classifier, "STREAM_EARLY_STOP", True)
+        pred = dict(valid_classification_response)
+        del pred["highlights"]
+        mock_llm.return_value = json.dumps(pred)
+        classifier.classify_document("uno")
+        assert classifier.schema_stats()["schema_violations"] == 0
+
+
+class TestFakeServerStructuredOutput:
+    """Test suite for malformed free-form responses on the local server."""
+
+    def test_malform_kinds(self, valid_classification_response):
+        """Test each failure kind breaks parsing or the schema as intended."""
+        content = json.dumps(valid_classification_response)
+        for kind in ("truncated", "trailing_comma"):
+            with pytest.raises(ValueError):
+                classifier.parse_model_response(malform(content, kind))
+        pred = classifier.parse_model_response(malform(content, "label_instead_of_code"))
+        assert not is_valid_response(pred)
+        assert classifier.parse_model_response(malform(content, "prose")) == valid_classification_response
+        assert set(MALFORMED_KINDS) == {"truncated", "trailing_comma", "label_instead_of_code", "prose"}
+
+    def test_structured_requests_always_conform(self, sample_victim_testimony):
+        """Test the server only corrupts requests without response_format."""
+        from prompts import SYSTEM_PROMPT, build_user_prompt
+
+        server = start_in_thread(malformed_rate=1.0)
+        try:
+            prompt = build_user_prompt(sample_victim_testimony)
+            structured = OpenAIBackend(api_key="local", base_url=server.base_url, structured_output=True)
+            for _ in range(3):
+                assert schema_errors(json.loads(structured.complete(SYSTEM_PROMPT, prompt))) == []
+            assert server.structured_requests == 3
+            assert server.malformed == 0
+
+            free = OpenAIBackend(api_key="local", base_url=server.base_url)
+            free.complete(SYSTEM_PROMPT, prompt)
+            assert server.malformed == 1
+        finally:
+            server.shutdown()
+            server.server_close()
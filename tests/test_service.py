@@ -0,0 +1,267 @@
+"""
+test_service.py
+Unit tests for service.py module.
+Tests in-flight deduplication of identical documents, bounded admission with
+429 backpressure, persistence in a worker thread and the HTTP routes (driven
+through the ASGI interface, no server or HTTP client needed).
+"""
+
+import asyncio
+import json
+import sys
+import pytest
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+from service import ClassificationService, Overloaded, create_app
+
+
+class FakeClassifier:
+    """classify(text, source_system) that blocks until released."""
+
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.fail_on = set(fail_on)
+
+    async def __call__(self, text, source_system=None):
+        self.calls.append(text)
+        await self.release.wait()
+        if text in self.fail_on:
+            raise RuntimeError("boom")
+        return {"tipo_documento": "TD1", "highlights": [text[:5]]}
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class TestCoalescing:
+    """Test suite for in-flight deduplication."""
+
+    def test_identical_requests_share_one_call(self):
+        """Test concurrent identical documents trigger a single classification."""
+        async def scenario():
+            fake = FakeClassifier()
+            service = ClassificationService(classify=fake)
+            requests = [asyncio.ensure_future(service.classify({"text": "mismo texto"})) for _ in range(5)]
+            await _settle()
+            fake.release.set()
+            results = await asyncio.gather(*requests)
+            return fake, service, results
+
+        fake, service, results = _run(scenario())
+        assert fake.calls == ["mismo texto"]
+        assert service.coalesced == 4
+        assert all(r["classification"]["tipo_documento"] == "TD1" for r in results)
+        # Cada respuesta tiene su propia copia
+        results[0]["classification"]["highlights"].append("x")
+        assert results[1]["classification"]["highlights"] == ["mismo"]
+        assert service.pending == 0
+
+    def test_source_system_is_part_of_the_key(self):
+        """Test the same text from two sources is classified twice."""
+        async def scenario():
+            fake = FakeClassifier()
+            fake.release.set()
+            service = ClassificationService(classify=fake)
+            await asyncio.gather(
+                service.classify({"text": "t", "source_system": "A"}),
+                service.classify({"text": "t", "source_system": "B"}),
+            )
+            return fake
+
+        assert len(_run(scenario()).calls) == 2
+
+    def test_error_reaches_every_waiter(self):
+        """Test a failed shared call fails all coalesced requests."""
+        async def scenario():
+            fake = FakeClassifier(fail_on={"malo"})
+            service = ClassificationService(classify=fake)
+            requests = [asyncio.ensure_future(service.classify({"text": "malo"})) for _ in range(3)]
+            await _settle()
+            fake.release.set()
+            return service, await asyncio.gather(*requests, return_exceptions=True)
+
+        service, outcomes = _run(scenario())
+        assert all(isinstance(o, RuntimeError) for o in outcomes)
+        assert service.errors == 3
+        assert service.pending == 0
+
+
+class TestBackpressure:
+    """Test suite for bounded admission."""
+
+    def test_rejects_when_full(self):
+        """Test new documents beyond in-flight plus queue are rejected."""
+        async def scenario():
+            fake = FakeClassifier()
+            service = ClassificationService(classify=fake, max_in_flight=1, max_queue=1)
+            first = asyncio.ensure_future(service.classify({"text": "a"}))
+            second = asyncio.ensure_future(service.classify({"text": "b"}))
+            await _settle()
+            assert fake.calls == ["a"]  # b espera turno
+            with pytest.raises(Overloaded):
+                await service.classify({"text": "c"})
+            # Un duplicado de lo que ya está en curso no ocupa sitio
+            dup = asyncio.ensure_future(service.classify({"text": "b"}))
+            await _settle()
+            fake.release.set()
+            await asyncio.gather(first, second, dup)
+            return service
+
+        service = _run(scenario())
+        assert service.rejected == 1
+        assert service.llm_calls == 2
+
+    def test_batch_admission_is_all_or_nothing(self):
+        """Test a batch that does not fit is rejected as a whole."""
+        async def scenario():
+            fake = FakeClassifier()
+            fake.release.set()
+            service = ClassificationService(classify=fake, max_in_flight=1, max_queue=1)
+            with pytest.raises(Overloaded):
+                await service.classify_batch([{"text": t} for t in "abc"])
+            return fake
+
+        assert _run(scenario()).calls == []
+
+    def test_invalid_limits(self):
+        """Test limits are validated."""
+        with pytest.raises(ValueError):
+            ClassificationService(max_in_flight=0)
+
+
+class TestPersistence:
+    """Test suite for saving results."""
+
+    def test_single_save_runs_with_metadata(self):
+        """Test the single-document save receives the request metadata."""
+        saved = []
+
+        def fake_save(**kwargs):
+            saved.append(kwargs)
+            return "doc-1", "run-1"
+
+        async def scenario():
+            fake = FakeClassifier()
+            fake.release.set()
+            service = ClassificationService(classify=fake, save=fake_save)
+            return await service.classify({"text": "texto", "external_id": "EXT1", "source_system": "SRC"})
+
+        result = _run(scenario())
+        assert (result["doc_id"], result["run_id"]) == ("doc-1", "run-1")
+        assert saved[0]["external_id"] == "EXT1"
+        assert saved[0]["source_system"] == "SRC"
+
+    def test_db_error_keeps_classification(self):
+        """Test a failed save still returns the classification."""
+        def failing_save(**kwargs):
+            raise RuntimeError("db down")
+
+        async def scenario():
+            fake = FakeClassifier()
+            fake.release.set()
+            service = ClassificationService(classify=fake, save=failing_save)
+            return service, await service.classify({"text": "texto"})
+
+        service, result = _run(scenario())
+        assert result["classification"]["tipo_documento"] == "TD1"
+        assert "db down" in result["db_error"]
+        assert service.db_errors == 1
+
+    def test_batch_saves_successes_once(self):
+        """Test a batch saves only successful, save=True documents in one call."""
+        calls = []
+
+        def fake_save_batch(docs):
+            calls.append(docs)
+            return [(f"doc-{i}", f"run-{i}") for i in range(len(docs))]
+
+        async def scenario():
+            fake = FakeClassifier(fail_on={"malo"})
+            fake.release.set()
+            service = ClassificationService(classify=fake, save_batch=fake_save_batch)
+            return await service.classify_batch([
+                {"text": "uno"}, {"text": "malo"}, {"text": "dos", "save": False}, {"text": "uno"},
+            ])
+
+        response = _run(scenario())
+        results = response["results"]
+        assert len(calls) == 1
+        assert [doc["text"] for doc in calls[0]] == ["uno", "uno"]
+        assert results[1]["error"] == "RuntimeError: boom"
+        assert results[2]["doc_id"] is None
+        assert results[3]["doc_id"] == "doc-1"
+
+
+async def _asgi(app, method, path, body=None):
+    """Send one request through the ASGI interface; return (status, headers, json)."""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("test", 80), "client": ("test", 1),
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+    }
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    content = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return start["status"], headers, json.loads(content)
+
+
+class TestHTTP:
+    """Test suite for the FastAPI routes."""
+
+    def _app(self, **kwargs):
+        async def classify(text, source_system=None):
+            return {"tipo_documento": "TD1"}
+        return create_app(ClassificationService(classify=classify, **kwargs), warm=False)
+
+    def test_classify_route(self):
+        """Test POST /classify returns the classification."""
+        status, _, body = _run(_asgi(self._app(), "POST", "/classify", {"text": "hola"}))
+        assert status == 200
+        assert body["classification"] == {"tipo_documento": "TD1"}
+
+    def test_batch_route_and_validation(self):
+        """Test POST /classify/batch and request validation."""
+        app = self._app()
+        status, _, body = _run(_asgi(app, "POST", "/classify/batch",
+                                     {"documents": [{"text": "a"}, {"text": "b"}]}))
+        assert status == 200
+        assert [r["index"] for r in body["results"]] == [0, 1]
+        status, _, _ = _run(_asgi(app, "POST", "/classify", {"text": ""}))
+        assert status == 422
+
+    def test_overload_returns_429(self):
+        """Test rejected admissions map to 429 with Retry-After."""
+        app = self._app(max_in_flight=1, max_queue=0)
+        status, headers, _ = _run(_asgi(app, "POST", "/classify/batch",
+                                        {"documents": [{"text": "a"}, {"text": "b"}]}))
+        assert status == 429
+        assert headers["retry-after"] == "1"
+
+    def test_health(self):
+        """Test GET /health exposes the service counters."""
+        status, _, body = _run(_asgi(self._app(), "GET", "/health"))
+        assert status == 200
+        assert body["service"]["requests"] == 0
@@ -0,0 +1,278 @@
+"""
+test_streaming.py
+Unit tests for streaming.py module.
+Tests the incremental JSON parser (field events, early stop, recovery of
+the first balanced object) and the streaming mode of the backends.
+"""
+
+import sys
+import json
+import asyncio
+import time
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import classifier
+from backends import OpenAIBackend, RuleBasedBackend, StreamingLLMBackend
+from classifier import parse_model_response
+from prompts import SYSTEM_PROMPT, build_user_prompt
+from ratelimit import RateLimiter
+from streaming import REQUIRED_FIELDS, StreamingJSONParser, first_json_object, iter_chunks
+
+
+PREDICTION = {
+    "tipo_documento": "TD1",
+    "tipo_hecho": ["TH1", "TH3"],
+    "territorio": ["Antioquia"],
+    "periodo": "PER2",
+    "actores": ["ACT2"],
+    "ruteo": "RU1",
+    "highlights": ["se llevaron a mi esposo {sin volver}", "tuvimos que salir \"huyendo\""],
+}
+
+
+def feed_all(parser, text, size):
+    """Feed text in fixed-size chunks until the parser is done."""
+    for chunk in iter_chunks(text, size):
+        if parser.feed(chunk):
+            break
+    return parser
+
+
+class TestStreamingJSONParser:
+    """Test suite for StreamingJSONParser."""
+
+    @pytest.mark.parametrize("size", [1, 2, 7, 64, 10_000])
+    def test_any_chunking_gives_same_object(self, size):
+        """Test the result does not depend on how the text is split."""
+        text = "Claro, aquí va:\n```json\n" + json.dumps(PREDICTION, ensure_ascii=False, indent=2) + "\n```"
+        parser = feed_all(StreamingJSONParser(required=None), text, size)
+        assert parser.complete
+        assert parser.fields == PREDICTION
+        assert json.loads(parser.result_text()) == PREDICTION
+
+    def test_fields_reported_as_they_close(self):
+        """Test each top-level field is emitted once its value closes."""
+        seen = []
+        parser = StreamingJSONParser(required=None, on_field=lambda k, v: seen.append(k))
+        parser.feed('{"tipo_documento": "TD1", "tipo_hecho": ["TH1"')
+        assert seen == ["tipo_documento"]
+        parser.feed('], "periodo": "PER2"')
+        assert seen == ["tipo_documento", "tipo_hecho", "periodo"]
+
+    def test_numbers_and_literals(self):
+        """Test scalar values close on the following comma or brace."""
+        parser = StreamingJSONParser(required=None, validator=None)
+        parser.feed('{"a": 1.5, "b": true, "c": null, "d": -2}')
+        assert parser.fields == {"a": 1.5, "b": True, "c": None, "d": -2}
+
+    def test_early_stop_when_required_fields_present(self):
+        """Test the parser stops before highlights once required fields are in."""
+        text = json.dumps(PREDICTION)
+        parser = feed_all(StreamingJSONParser(), text, 5)
+        assert parser.satisfied and not parser.complete
+        assert parser.received < len(text)
+        result = json.loads(parser.result_text())
+        assert set(result) == set(REQUIRED_FIELDS)
+        assert result["tipo_hecho"] == ["TH1", "TH3"]
+
+    def test_validation_against_ontology(self):
+        """Test fields with codes outside the ontology are flagged."""
+        parser = StreamingJSONParser(required=None)
+        parser.feed('{"tipo_documento": "TD9", "tipo_hecho": ["TH1", "XX"], "ruteo": "RU1", "extra": 1}')
+        assert parser.invalid == ["tipo_documento", "tipo_hecho", "extra"]
+
+    def test_braces_inside_strings(self):
+        """Test braces and escaped quotes in strings do not confuse the scanner."""
+        text = '{"highlights": ["a } b", "c \\" { d", "e \\\\"], "ruteo": "RU2"}'
+        parser = feed_all(StreamingJSONParser(required=None), text, 3)
+        assert parser.fields == json.loads(text)
+
+    def test_incomplete_stream_returns_raw_text(self):
+        """Test a truncated response is returned as received."""
+        parser = StreamingJSONParser()
+        parser.feed('{"tipo_documento": "TD1", "highl')
+        assert not parser.done
+        assert parser.result_text() == '{"tipo_documento": "TD1", "highl'
+
+
+class TestFirstJsonObject:
+    """Test suite for first_json_object and parse_model_response recovery."""
+
+    def test_trailing_stray_braces(self):
+        """Test text after the object (with braces) is ignored."""
+        assert first_json_object('{"a": 1} y además {nota}') == '{"a": 1}'
+
+    def test_leading_non_json_braces(self):
+        """Test braces before the real object are skipped."""
+        assert first_json_object('Formato {campo}: {"a": {"b": [1]}}') == '{"a": {"b": [1]}}'
+
+    def test_no_object(self):
+        """Test a missing object raises ValueError."""
+        with pytest.raises(ValueError):
+            first_json_object('{"a": 1')
+
+    def test_parse_model_response_recovers(self):
+        """Test parse_model_response falls back to the first balanced object."""
+        raw = '{"tipo_documento": "TD1", "ruteo": "RU1"}\nNota: revisar {manualmente}.'
+        assert parse_model_response(raw) == {"tipo_documento": "TD1", "ruteo": "RU1"}
+
+
+class TestStreamingBackends:
+    """Test suite for complete_stream on the local backends."""
+
+    def test_rules_backend_streams_and_stops_early(self, sample_victim_testimony):
+        """Test the rules backend stops reading before the highlights."""
+        backend = RuleBasedBackend()
+        assert isinstance(backend, StreamingLLMBackend)
+        prompt = build_user_prompt(sample_victim_testimony)
+        full = json.loads(backend.complete(SYSTEM_PROMPT, prompt))
+        streamed = json.loads(backend.complete_stream(SYSTEM_PROMPT, prompt))
+        assert streamed == {k: full[k] for k in REQUIRED_FIELDS}
+        assert backend.stream_stats.early_stops == 1
+
+    def test_rules_backend_full_stream(self, sample_victim_testimony):
+        """Test required=None waits for the whole object."""
+        backend = RuleBasedBackend()
+        prompt = build_user_prompt(sample_victim_testimony)
+        raw = asyncio.run(backend.acomplete_stream(SYSTEM_PROMPT, prompt, required=None))
+        assert json.loads(raw) == json.loads(backend.complete(SYSTEM_PROMPT, prompt))
+
+    def test_classifier_uses_streaming_when_enabled(self, monkeypatch, sample_victim_testimony):
+        """Test UBPD_LLM_STREAM routes call_llm through complete_stream."""
+        backend = RuleBasedBackend()
+        classifier.set_backend(backend)
+        monkeypatch.setattr(classifier, "LLM_STREAM", True)
+        try:
+            result = classifier.classify_document(sample_victim_testimony)
+            results = classifier.classify_documents([sample_victim_testimony])
+        finally:
+            classifier.set_backend(None)
+        assert backend.stream_stats.streams == 2
+        assert backend.stream_stats.early_stops == 0
+        assert results[0]["classification"] == result
+
+    def test_stream_and_non_stream_same_highlights(self, monkeypatch, sample_victim_testimony):
+        """Test streaming without early stop returns the non-stream classification."""
+        classifier.set_backend(RuleBasedBackend())
+        try:
+            plain = classifier.classify_document(sample_victim_testimony)
+            monkeypatch.setattr(classifier, "LLM_STREAM", True)
+            streamed = classifier.classify_document(sample_victim_testimony)
+            streamed_async = classifier.classify_documents([sample_victim_testimony])[0]["classification"]
+        finally:
+            classifier.set_backend(None)
+        assert plain["highlights"]
+        assert streamed == plain
+        assert streamed_async == plain
+
+    def test_early_stop_is_opt_in(self, monkeypatch, sample_victim_testimony):
+        """Test UBPD_LLM_STREAM_EARLY_STOP cuts the stream and drops highlights."""
+        backend = RuleBasedBackend()
+        classifier.set_backend(backend)
+        monkeypatch.setattr(classifier, "LLM_STREAM", True)
+        monkeypatch.setattr(classifier, "STREAM_EARLY_STOP", True)
+        try:
+            result = classifier.classify_document(sample_victim_testimony)
+        finally:
+            classifier.set_backend(None)
+        assert backend.stream_stats.early_stops == 1
+        assert result["highlights"] == [] and result["tipo_documento"] == "TD2"
+
+
+class TestFakeServerStreaming:
+    """Test suite for SSE streaming against the local OpenAI-compatible server."""
+
+    @pytest.fixture
+    def server(self):
+        from fake_server import start_in_thread
+        server = start_in_thread(chunk_latency_s=0.01, stream_chunk_chars=8)
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def test_stream_is_cancelled_early(self, server, sample_victim_testimony):
+        """Test the OpenAI client stops the stream once required fields arrive."""
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url)
+        prompt = build_user_prompt(sample_victim_testimony)
+        start = time.perf_counter()
+        raw = backend.complete_stream(SYSTEM_PROMPT, prompt)
+        elapsed = time.perf_counter() - start
+        full = server.backend.respond(prompt)
+        total_chunks = -(-len(full) // 8)
+
+        assert set(json.loads(raw)) == set(REQUIRED_FIELDS)
+        assert backend.stream_stats.early_stops == 1
+        assert elapsed < total_chunks * 0.01
+        deadline = time.time() + 2
+        while server.streams_cancelled == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert server.streams_cancelled == 1
+        assert server.chunks_sent < total_chunks
+
+    def test_async_stream_complete_object(self, server, sample_non_testimonial):
+        """Test the async client can read the whole streamed object."""
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url)
+        prompt = build_user_prompt(sample_non_testimonial)
+        raw = asyncio.run(backend.acomplete_stream(SYSTEM_PROMPT, prompt, required=None))
+        assert json.loads(raw) == json.loads(server.backend.respond(prompt))
+
+
+class FakeStream:
+    """Chat completions stream yielding text deltas; reports the limiter load."""
+
+    def __init__(self, text, limiter, seen, fail_after=None):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))], usage=None)
+                       for part in iter_chunks(text, 8)]
+        self.limiter, self.seen, self.fail_after = limiter, seen, fail_after
+        self.closed = False
+
+    def __iter__(self):
+        for n, chunk in enumerate(self.chunks):
+            self.seen.append(self.limiter.stats()["in_flight"])
+            if self.fail_after is not None and n == self.fail_after:
+                raise TimeoutError("corte")
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamingWithLimiter:
+    """Test suite for streamed calls through the RateLimiter."""
+
+    def _backend(self, streams):
+        limiter = RateLimiter(rpm=1_000_000, tpm=1_000_000_000, backoff_base=0.001, backoff_cap=0.01)
+        backend = OpenAIBackend(api_key="local", limiter=limiter)
+        create = lambda **kwargs: streams.pop(0)
+        backend._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        return backend, limiter
+
+    def test_slot_held_until_stream_consumed(self):
+        """Test the concurrency slot covers the whole streamed body."""
+        seen = []
+        streams = []
+        backend, limiter = self._backend(streams)
+        streams.append(FakeStream(json.dumps(PREDICTION), limiter, seen))
+        raw = backend.complete_stream(SYSTEM_PROMPT, "DOCUMENTO: x", required=None)
+        assert json.loads(raw) == PREDICTION
+        assert seen and all(n == 1 for n in seen)
+        assert limiter.stats()["in_flight"] == 0
+        assert limiter.stats()["successes"] == 1
+
+    def test_error_mid_stream_is_retried(self):
+        """Test a stream cut while reading is retried by the limiter."""
+        seen = []
+        streams = []
+        backend, limiter = self._backend(streams)
+        first = FakeStream(json.dumps(PREDICTION), limiter, seen, fail_after=2)
+        streams.extend([first, FakeStream(json.dumps(PREDICTION), limiter, seen)])
+        raw = backend.complete_stream(SYSTEM_PROMPT, "DOCUMENTO: x", required=None)
+        assert json.loads(raw) == PREDICTION
+        assert first.closed
+        assert limiter.stats()["retries"] == 1
+
@@ -0,0 +1,156 @@
+"""
+test_usage.py
+Unit tests for usage.py module and the prompt layout for prefix caching.
+Tests token accounting from API usage objects, the per-call JSONL log and
+report, usage recording in the OpenAI backend and the simulated prefix
+cache of the local server.
+"""
+
+import sys
+import json
+import asyncio
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "ubpd_classifier"))
+
+import usage
+from backends import OpenAIBackend
+from prompts import SYSTEM_PROMPT, USER_PREFIX, build_user_prompt, extract_document
+from usage import Prices, UsageRecord, UsageStats, cost_usd, read_log, usage_counts, usage_report
+
+
+PRICES = Prices(input=1.0, cached_input=0.1, output=10.0)
+
+
+@pytest.fixture
+def server():
+    from fake_server import start_in_thread
+    server = start_in_thread(min_cached_tokens=0, stream_chunk_chars=8)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestPromptLayout:
+    """Test suite for the cache-friendly prompt layout."""
+
+    def test_document_goes_last(self):
+        """Test the user prompt is the fixed prefix followed by the document."""
+        prompt = build_user_prompt("  Texto del documento \n")
+        assert prompt == USER_PREFIX + "Texto del documento"
+        assert USER_PREFIX.rstrip().endswith("DOCUMENTO:")
+        assert extract_document(prompt) == "Texto del documento"
+
+    def test_prefix_is_identical_across_documents(self):
+        """Test everything before the document is byte-identical."""
+        a = SYSTEM_PROMPT + build_user_prompt("uno")
+        b = SYSTEM_PROMPT + build_user_prompt("otro documento")
+        common = len(SYSTEM_PROMPT) + len(USER_PREFIX)
+        assert a[:common] == b[:common]
+
+
+class TestUsageAccounting:
+    """Test suite for usage_counts, cost_usd and UsageStats."""
+
+    def test_usage_counts_from_sdk_and_dict(self):
+        """Test counts are read from SDK objects and plain dicts."""
+        sdk = SimpleNamespace(prompt_tokens=1200, completion_tokens=90,
+                              prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+        assert usage_counts(sdk) == (1200, 1024, 90)
+        assert usage_counts({"prompt_tokens": 10, "completion_tokens": 2}) == (10, 0, 2)
+        assert usage_counts(None) is None
+
+    def test_cost_charges_cached_tokens_at_their_price(self):
+        """Test cached prompt tokens use the cached price."""
+        assert cost_usd(1_000_000, 0, 0, PRICES) == pytest.approx(1.0)
+        assert cost_usd(1_000_000, 1_000_000, 100_000, PRICES) == pytest.approx(0.1 + 1.0)
+
+    def test_stats_totals_and_log(self, tmp_path):
+        """Test totals are accumulated and each call is logged as JSON."""
+        log = tmp_path / "usage.jsonl"
+        stats = UsageStats(str(log))
+        stats.record(UsageRecord("m", 1000, 800, 50, 120.0))
+        stats.record(UsageRecord("m", 1000, 0, 70, 80.0, stream=True))
+        stats.record_missing()
+        totals = stats.as_dict()
+        assert (totals["calls"], totals["calls_without_usage"]) == (2, 1)
+        assert totals["cached_ratio"] == pytest.approx(0.4)
+        assert totals["mean_latency_ms"] == pytest.approx(100.0)
+        assert read_log(str(log)) == [UsageRecord("m", 1000, 800, 50, 120.0), UsageRecord("m", 1000, 0, 70, 80.0, True)]
+
+    def test_env_var_enables_log(self, tmp_path, monkeypatch):
+        """Test UBPD_USAGE_LOG sets the log of the process-wide stats."""
+        monkeypatch.setenv("UBPD_USAGE_LOG", str(tmp_path / "u.jsonl"))
+        usage.set_usage(None)
+        try:
+            assert usage.get_usage().log_path == str(tmp_path / "u.jsonl")
+        finally:
+            usage.set_usage(None)
+
+
+class TestUsageReport:
+    """Test suite for usage_report."""
+
+    def test_report_per_1k_docs(self):
+        """Test ratios, per-1k scaling and costs with and without cache."""
+        records = [UsageRecord("m", 1000, 500, 100, 100.0), UsageRecord("m", 1000, 500, 100, 300.0)]
+        report = usage_report(records, docs=1, prices=PRICES)
+        assert report["cached_ratio"] == 0.5
+        assert report["per_1k_docs"]["prompt_tokens"] == 2_000_000
+        assert report["per_1k_docs"]["model_time_s"] == 400.0
+        assert report["per_1k_docs"]["cost_usd"] == pytest.approx(1000 * cost_usd(2000, 1000, 200, PRICES))
+        assert report["per_1k_docs"]["cost_usd_without_cache"] == pytest.approx(1000 * cost_usd(2000, 0, 200, PRICES))
+        assert report["latency_ms"]["p95"] == 300.0
+
+    def test_report_defaults_to_one_doc_per_call(self):
+        """Test docs default to the number of calls and prices are optional."""
+        report = usage_report([UsageRecord("m", 10, 0, 1, 1.0)] * 4)
+        assert report["docs"] == 4
+        assert "cost_usd" not in report["per_1k_docs"]
+
+
+class TestBackendUsage:
+    """Test suite for usage recording in OpenAIBackend against the local server."""
+
+    def test_cached_prefix_after_first_call(self, server, sample_victim_testimony, sample_non_testimonial):
+        """Test the shared prompt prefix is reported as cached on later calls."""
+        stats = UsageStats()
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url, usage=stats)
+        backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_victim_testimony))
+        assert stats.cached_tokens == 0
+        backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_non_testimonial))
+        assert stats.calls == 2
+        assert 0 < stats.cached_tokens <= (len(SYSTEM_PROMPT) + len(USER_PREFIX)) // 4
+
+    def test_minimum_cached_prefix(self, sample_victim_testimony):
+        """Test prefixes below the minimum are not served from the cache."""
+        from fake_server import start_in_thread
+        server = start_in_thread()  # mínimo de 1.024 tokens, como OpenAI
+        try:
+            stats = UsageStats()
+            backend = OpenAIBackend(api_key="local", base_url=server.base_url, usage=stats)
+            for _ in range(2):
+                backend.complete(SYSTEM_PROMPT, build_user_prompt(sample_victim_testimony))
+            assert stats.calls == 2 and stats.cached_tokens == 0
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_full_stream_reads_usage(self, server, sample_victim_testimony):
+        """Test a complete stream is drained to get the usage chunk."""
+        stats = UsageStats()
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url, usage=stats)
+        prompt = build_user_prompt(sample_victim_testimony)
+        raw = asyncio.run(backend.acomplete_stream(SYSTEM_PROMPT, prompt, required=None))
+        assert json.loads(raw) == json.loads(server.backend.respond(prompt))
+        assert stats.calls == 1 and stats.completion_tokens > 0
+
+    def test_early_stopped_stream_has_no_usage(self, server, sample_victim_testimony):
+        """Test a stream cut before the end is counted without usage."""
+        stats = UsageStats()
+        backend = OpenAIBackend(api_key="local", base_url=server.base_url, usage=stats)
+        backend.complete_stream(SYSTEM_PROMPT, build_user_prompt(sample_victim_testimony))
+        assert stats.calls == 0 and stats.calls_without_usage == 1